@@ -0,0 +1,82 @@
+#! /usr/bin/env python3
+"""
+Схлопывание повторов stdout (STDOUT_DEDUP) на выводе ffmpeg со сломанным входом: предупреждения
+h264/mpegts повторяются тысячи раз в минуту между строками статистики. Без схлопывания и с ним:
+цена на строку, сколько строк и байт попадает в буфер (и файловый лог) и сколько секунд истории
+помещается в буфер STDOUT_BUFFER_LEN.
+
+    python3 benchmarks/bench_dedup.py [lines] [lines per second]
+"""
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ff_wrapper'))
+
+from config import Config  # noqa: E402
+from dedup import StdoutDedup  # noqa: E402
+from stdoutbuffer import StdoutBuffer  # noqa: E402
+
+BATCH = 20  # Строк за одно чтение pipe
+
+
+def make_lines(count: int) -> list:
+    rnd = random.Random(1)
+    lines = []
+    for i in range(count):
+        kind = rnd.random()
+        if i % 100 == 0:
+            lines.append(b'frame=%5d fps= 25 q=28.0 size=%8dkB time=00:00:%02d.00 bitrate=1000.0kbits/s speed=1x'
+                         % (i, i * 3, i % 60))
+        elif kind < 0.5:
+            lines.append(b'[h264 @ 0x55d0c6a3%04x] error while decoding MB %d %d, bytestream -%d'
+                         % (rnd.randrange(4096), rnd.randrange(120), rnd.randrange(68), rnd.randrange(100)))
+        elif kind < 0.8:
+            lines.append(b'[mpegts @ 0x55d0c6a00000] Non-monotonous DTS in output stream 0:0; previous: %d, '
+                         b'current: %d; changing to %d. This may result incorrect timestamps in the output file.'
+                         % (i * 3600, i * 3600 - 1, i * 3600 + 1))
+        elif kind < 0.99:
+            lines.append(b'Past duration 0.%06d too large' % rnd.randrange(1000000))
+        else:
+            lines.append(b'[hls @ 0x55d0c6a11111] Opening \'/tmp/out/seg%d.ts\' for writing' % i)
+    return lines
+
+
+def run(lines: list, rate: float, stdout_dedup) -> dict:
+    cfg = Config()
+    buf = StdoutBuffer(cfg.STDOUT_BUFFER_LEN, cfg.STDOUT_BUFFER_ARENA_KBYTES * 1024)
+    appended = appended_bytes = 0
+    started = time.perf_counter()
+    for start in range(0, len(lines), BATCH):
+        wall_time = 1e9 + start / rate
+        batch = lines[start:start + BATCH]
+        if stdout_dedup is not None:
+            batch = stdout_dedup.process(batch, wall_time)
+        for line in batch:
+            buf.append_line(line, wall_time)
+            appended += 1
+            appended_bytes += len(line) + 1
+    elapsed = time.perf_counter() - started
+    stored = min(appended, buf.max)
+    # Сколько секунд вывода помнит буфер: доля строк, поместившихся в кольцо
+    history = len(lines) / rate * min(1.0, buf.max / appended)
+    return {
+        'dedup': stdout_dedup is not None,
+        'us_per_line': round(elapsed / len(lines) * 1e6, 3),
+        'buffer_lines': appended,
+        'buffer_bytes': appended_bytes,
+        'buffer_stored_lines': stored,
+        'buffer_history_s': round(history, 1),
+    }
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    rate = float(sys.argv[2]) if len(sys.argv) > 2 else 200
+    lines = make_lines(count)
+    cfg = Config()
+    print(json.dumps(dict(run(lines, rate, None), lines=count, lines_per_second=rate)))
+    print(json.dumps(dict(run(lines, rate, StdoutDedup(cfg.STDOUT_DEDUP_WINDOW, cfg.STDOUT_DEDUP_MAX_SIGNATURES)),
+                          lines=count, lines_per_second=rate)))
@@ -0,0 +1,365 @@
+#! /usr/bin/env python3
+"""
+Сквозные замеры враппера (ff_wrapper/main.py) с заглушкой ffmpeg (benchmarks/fake_ffmpeg.py) в PATH:
+    ingest  - пропускная способность: строк stdout и блоков -progress в секунду, потери и CPU враппера;
+    latency - задержка строки от записи в stderr заглушкой до файлового лога и до клиента follow (/last_stdout);
+    rss     - память враппера при старте и при заполненных буферах STDOUT_BUFFER_LEN / PROGRESS_BUFFER_LEN;
+    http    - задержка маршрутов API под конкурентной нагрузкой при идущем кодировании;
+    detect  - через сколько секунд после зависания, падения fps или падения ffmpeg враппер останавливает ffmpeg
+              и завершается (MANAGER_START_DELAY=1, ENCODING_CHECK_START_DELAY=1, пороги - по-ум. или из окружения);
+    warmup  - через сколько секунд после запуска останавливается ffmpeg с -r 25, который не выдает кадров или выдает
+              5 fps, с проверкой разгона (ENCODING_WARMUP) и без нее, задержки проверок - по-ум.;
+              здоровый поток не должен остановиться за seconds.
+
+Каждый результат - строка json, с output - еще и один json файл {"git", "python", "created", "results"}
+для сравнения между коммитами. Переменные окружения враппера (HTTP_SERVER_MODE, EVENT_LOOP, ...)
+передаются как есть.
+
+    python3 benchmarks/bench_e2e.py [scenarios через запятую] [seconds] [output.json]
+"""
+import asyncio
+import http.client
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import fake_ffmpeg
+from bench_http import _load, _percentile
+from bench_supervisor import MAIN_PATH, _proc_stat
+
+SCENARIOS = ('ingest', 'latency', 'rss', 'http', 'detect', 'warmup')
+INGEST_RATES = (1000, 10000, 0)  # строк stdout в секунду, блоков -progress - в 10 раз меньше, 0 - без пауз
+HTTP_PATHS = ('/last_stdout?count=100', '/last_progress?count=20&json', '/stats', '/metrics')
+DETECT_AFTER = 5  # seconds, когда заглушка имитирует сбой
+WARMUP_ARGS = ('-i', 'bench', '-r', '25', '-f', 'null', '-')
+
+
+def _free_port() -> int:
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def _ms(values: list, p: float):
+    return round(_percentile(values, p) * 1000, 2) if values else None
+
+
+class Wrapper:
+    """
+    Процесс main.py с заглушкой ffmpeg в своем WORKDIR
+    """
+
+    def __init__(self, base_dir: str, name: str, env: dict = None, args: tuple = ('-i', 'bench', '-f', 'null', '-'),
+                 **fake_options):
+        self.workdir = os.path.join(base_dir, name)
+        self.report_path = os.path.join(self.workdir, 'fake_report.json')
+        self.port = _free_port()
+        os.makedirs(self.workdir)
+        env = dict(os.environ, WORKDIR=self.workdir, LOGS_PATH=os.path.join(self.workdir, 'logs'),
+                   HTTP_HOST='127.0.0.1', HTTP_PORT=str(self.port), **(env or {}))
+        env = fake_ffmpeg.env_with_fake(os.path.join(base_dir, 'bin'), env, report=self.report_path, **fake_options)
+        self.process = subprocess.Popen([sys.executable, MAIN_PATH] + list(args), env=env,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def __enter__(self) -> 'Wrapper':
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            try:
+                self.get('/get_pid')
+                return self
+            except OSError:
+                time.sleep(0.05)
+        self.stop()
+        raise RuntimeError('wrapper did not start ({})'.format(self.workdir))
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        pid = self.ffmpeg_pid()
+        if pid and os.path.exists('/proc/{}'.format(pid)):
+            os.kill(pid, 9)
+
+    def get(self, path: str) -> bytes:
+        connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=10)
+        try:
+            connection.request('GET', path)
+            return connection.getresponse().read()
+        finally:
+            connection.close()
+
+    def metrics(self) -> dict:
+        # Значения метрики с разными метками (stdout, progress) суммируются
+        values = {}
+        for line in self.get('/metrics').decode('utf-8').splitlines():
+            if line and not line.startswith('#'):
+                name, _, value = line.rpartition(' ')
+                name = name.split('{')[0]
+                values[name] = values.get(name, 0) + float(value)
+        return values
+
+    def report(self) -> dict:
+        try:
+            with open(self.report_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def ffmpeg_pid(self) -> int:
+        try:
+            with open(os.path.join(self.workdir, 'status', 'FFMPEG_PID')) as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def log_path(self) -> str:
+        logs = os.path.join(self.workdir, 'logs')
+        for root, _, files in os.walk(logs):
+            for name in files:
+                if name.startswith('ffmpeg_') and name.endswith('.log'):
+                    return os.path.join(root, name)
+        return None
+
+
+def bench_ingest(base_dir: str, seconds: float) -> list:
+    results = []
+    for rate in INGEST_RATES:
+        name = 'ingest_{}'.format(rate or 'max')
+        with Wrapper(base_dir, name, {'ENCODING_DISABLE_CHECK': '1'}, line_rate=rate, progress_rate=rate // 10,
+                     stall_after=seconds) as wrapper:
+            cpu_started = _proc_stat(wrapper.process.pid)[0]
+            time.sleep(seconds + 1)
+            cpu = _proc_stat(wrapper.process.pid)[0] - cpu_started
+            report, metrics = wrapper.report(), wrapper.metrics()
+        lines, blocks = metrics.get('ffwrapper_stdout_lines_total', 0), metrics.get('ffwrapper_progress_blocks_total', 0)
+        results.append({
+            'scenario': 'ingest',
+            'rate_lines_s': rate or 'max',
+            'sent_lines': report.get('lines'),
+            'received_lines': int(lines),
+            'lines_s': round(lines / seconds),
+            'sent_blocks': report.get('blocks'),
+            'received_blocks': int(blocks),
+            'blocks_s': round(blocks / seconds),
+            'dropped_bytes': int(metrics.get('ffwrapper_ingest_dropped_bytes_total', 0)),
+            'wrapper_cpu_percent': round(cpu / seconds * 100, 1),
+        })
+    return results
+
+
+def _follow(wrapper: Wrapper, latencies: list, finish: list):
+    # Клиент follow: задержка = время получения строки - ts из строки заглушки
+    connection = http.client.HTTPConnection('127.0.0.1', wrapper.port, timeout=30)
+    connection.request('GET', '/last_stdout?follow=ndjson&count=0')
+    response = connection.getresponse()
+    while not finish[0]:
+        line = response.fp.readline()
+        if not line:
+            break
+        now = time.time()
+        item = json.loads(line.decode('utf-8'))
+        ts = item.get('line', '').rpartition(' ts=')[2]
+        if ts:
+            latencies.append(now - float(ts))
+    connection.close()
+
+
+def _tail(wrapper: Wrapper, latencies: list, finish: list):
+    # Опрос файлового лога раз в 1 мс: задержка = время, когда строка появилась в файле - ts
+    path = None
+    while path is None and not finish[0]:
+        path = wrapper.log_path()
+        time.sleep(0.01)
+    if path is None:
+        return
+    with open(path, 'rb') as f:
+        carry = b''
+        while not finish[0]:
+            data = f.read()
+            if not data:
+                time.sleep(0.001)
+                continue
+            now = time.time()
+            lines = (carry + data).split(b'\n')
+            carry = lines.pop()
+            for line in lines:
+                ts = line.rpartition(b' ts=')[2]
+                if ts:
+                    latencies.append(now - float(ts))
+
+
+def bench_latency(base_dir: str, seconds: float, rate: int = 100) -> list:
+    with Wrapper(base_dir, 'latency', {'ENCODING_DISABLE_CHECK': '1'}, line_rate=rate, stamp=1) as wrapper:
+        follow_latencies, file_latencies, finish = [], [], [False]
+        threads = [threading.Thread(target=_follow, args=(wrapper, follow_latencies, finish), daemon=True),
+                   threading.Thread(target=_tail, args=(wrapper, file_latencies, finish), daemon=True)]
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        finish[0] = True
+    return [{
+        'scenario': 'latency',
+        'rate_lines_s': rate,
+        'follow_lines': len(follow_latencies),
+        'follow_p50_ms': _ms(follow_latencies, 0.5),
+        'follow_p99_ms': _ms(follow_latencies, 0.99),
+        'file_log_lines': len(file_latencies),
+        'file_log_p50_ms': _ms(file_latencies, 0.5),
+        'file_log_p99_ms': _ms(file_latencies, 0.99),
+    }]
+
+
+def bench_rss(base_dir: str, seconds: float) -> list:
+    with Wrapper(base_dir, 'rss', {'ENCODING_DISABLE_CHECK': '1'}, line_rate=0, progress_rate=0) as wrapper:
+        rss_started = _proc_stat(wrapper.process.pid)[1]
+        stdout_len = int(os.environ.get('STDOUT_BUFFER_LEN', 100000))
+        progress_len = int(os.environ.get('PROGRESS_BUFFER_LEN', 100000))
+        started = time.monotonic()
+        metrics = {}
+        while time.monotonic() - started < max(seconds, 60):
+            metrics = wrapper.metrics()
+            if (metrics.get('ffwrapper_stdout_lines_total', 0) >= stdout_len
+                    and metrics.get('ffwrapper_progress_blocks_total', 0) >= progress_len):
+                break
+            time.sleep(0.2)
+        fill_seconds = time.monotonic() - started
+        rss_full = _proc_stat(wrapper.process.pid)[1]
+    return [{
+        'scenario': 'rss',
+        'stdout_buffer_len': stdout_len,
+        'progress_buffer_len': progress_len,
+        'stdout_lines': int(metrics.get('ffwrapper_stdout_lines_total', 0)),
+        'progress_blocks': int(metrics.get('ffwrapper_progress_blocks_total', 0)),
+        'fill_seconds': round(fill_seconds, 1),
+        'rss_start_mb': round(rss_started / 1024 / 1024, 1),
+        'rss_full_mb': round(rss_full / 1024 / 1024, 1),
+    }]
+
+
+def bench_http(base_dir: str, seconds: float, clients: int = 50) -> list:
+    results = []
+    with Wrapper(base_dir, 'http', {'ENCODING_DISABLE_CHECK': '1'}, line_rate=100, progress_rate=2) as wrapper:
+        time.sleep(2)
+        for path in HTTP_PATHS:
+            loop = asyncio.new_event_loop()
+            started = time.monotonic()
+            latencies, errors = loop.run_until_complete(_load(wrapper.port, path, clients, seconds))
+            elapsed = time.monotonic() - started
+            loop.close()
+            results.append({
+                'scenario': 'http',
+                'mode': os.environ.get('HTTP_SERVER_MODE', 'threading'),
+                'path': path,
+                'clients': clients,
+                'requests': len(latencies),
+                'errors': len(errors),
+                'rps': round(len(latencies) / elapsed, 1),
+                'p50_ms': _ms(latencies, 0.5),
+                'p99_ms': _ms(latencies, 0.99),
+            })
+    return results
+
+
+def bench_detect(base_dir: str, seconds: float) -> list:
+    results = []
+    env = {'MANAGER_START_DELAY': '1', 'ENCODING_CHECK_START_DELAY': '1'}
+    for fault, option in (('stall', 'stall_after'), ('drop', 'drop_after'), ('crash', 'crash_after')):
+        with Wrapper(base_dir, 'detect_' + fault, env, line_rate=25, progress_rate=2,
+                     **{option: DETECT_AFTER}) as wrapper:
+            pid = wrapper.ffmpeg_pid()
+            ffmpeg_stopped = wrapper_exited = None
+            deadline = time.monotonic() + DETECT_AFTER + 60
+            while wrapper_exited is None and time.monotonic() < deadline:
+                now = time.time()
+                if ffmpeg_stopped is None and pid and not os.path.exists('/proc/{}'.format(pid)):
+                    ffmpeg_stopped = now
+                if wrapper.process.poll() is not None:
+                    wrapper_exited = now
+                time.sleep(0.01)
+            event_time = wrapper.report().get('event_time')
+        results.append({
+            'scenario': 'detect',
+            'fault': fault,
+            'ffmpeg_stopped_s': round(ffmpeg_stopped - event_time, 2) if ffmpeg_stopped and event_time else None,
+            'wrapper_exit_s': round(wrapper_exited - event_time, 2) if wrapper_exited and event_time else None,
+        })
+    return results
+
+
+def _wait_ffmpeg_stopped(wrapper: Wrapper, timeout: float) -> float:
+    # Время остановки ffmpeg (time.time()) или None, если он работает дольше timeout
+    pid = wrapper.ffmpeg_pid()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if pid and not os.path.exists('/proc/{}'.format(pid)):
+            return time.time()
+        time.sleep(0.01)
+    return None
+
+
+def bench_warmup(base_dir: str, seconds: float) -> list:
+    results = []
+    faults = (('dead', {'drop_after': 0, 'drop_fps': 0}), ('slow_5fps', {'drop_after': 0, 'drop_fps': 5}))
+    for fault, options in faults:
+        for warmup in (False, True):
+            env = {'ENCODING_WARMUP': '1'} if warmup else {}
+            name = 'warmup_{}_{}'.format(fault, int(warmup))
+            with Wrapper(base_dir, name, env, WARMUP_ARGS, line_rate=25, progress_rate=2, **options) as wrapper:
+                stopped = _wait_ffmpeg_stopped(wrapper, 120)
+                started = wrapper.report().get('started')
+            results.append({
+                'scenario': 'warmup',
+                'fault': fault,
+                'warmup_check': warmup,
+                'ffmpeg_stopped_s': round(stopped - started, 2) if stopped and started else None,
+            })
+    with Wrapper(base_dir, 'warmup_healthy', {'ENCODING_WARMUP': '1'}, WARMUP_ARGS, line_rate=25,
+                 progress_rate=2) as wrapper:
+        stopped = _wait_ffmpeg_stopped(wrapper, seconds)
+    results.append({'scenario': 'warmup', 'fault': None, 'warmup_check': True, 'seconds': seconds,
+                    'false_stop': stopped is not None})
+    return results
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(MAIN_PATH),
+                                       stderr=subprocess.DEVNULL, universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    scenarios = sys.argv[1].split(',') if len(sys.argv) > 1 and sys.argv[1] else SCENARIOS
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    output = sys.argv[3] if len(sys.argv) > 3 else None
+    base_dir = tempfile.mkdtemp(prefix='ffw_bench_')
+    fake_ffmpeg.install(os.path.join(base_dir, 'bin'))
+    results = []
+    try:
+        for scenario in scenarios:
+            for result in globals()['bench_' + scenario](base_dir, seconds):
+                print(json.dumps(result), flush=True)
+                results.append(result)
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
+    if output:
+        with open(output, 'w') as f:
+            json.dump({'git': _git_revision(), 'python': platform.python_version(), 'created': time.time(),
+                       'results': results}, f, indent=1)
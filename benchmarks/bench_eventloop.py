@@ -0,0 +1,84 @@
+#! /usr/bin/env python3
+"""
+CPU, потоки и пробуждения враппера на простаивающий поток: опрос потоками (по умолчанию) против EVENT_LOOP=1,
+в режиме процесса на поток и в режиме супервизора. Заглушка ffmpeg (benchmarks/fake_ffmpeg.py) пишет строку stderr
+и блок -progress раз в interval секунд (по умолчанию 5 - почти простой). Пробуждения - сумма переключений контекста
+всех потоков враппера (/proc/<pid>/task/*/status) в секунду.
+
+    python3 benchmarks/bench_eventloop.py [streams] [seconds] [interval]
+"""
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import fake_ffmpeg
+from bench_supervisor import _proc_stat, _start
+
+
+def _ctxt_switches(pid: int) -> int:
+    total = 0
+    for path in glob.glob('/proc/{}/task/*/status'.format(pid)):
+        try:
+            with open(path) as f:
+                for line in f:
+                    if 'ctxt_switches:' in line:
+                        total += int(line.split(':')[1])
+        except OSError:
+            pass
+    return total
+
+
+def run(mode: str, event_loop: bool, streams: int, seconds: float, env: dict, base_dir: str) -> dict:
+    name = '{}_{}'.format(mode, 'loop' if event_loop else 'threads')
+    workdir = os.path.join(base_dir, name)
+    env = dict(env, EVENT_LOOP='1' if event_loop else '')
+    if mode == 'processes':
+        processes = [_start(os.path.join(workdir, str(i)), env, 19100 + i) for i in range(streams)]
+    else:
+        os.makedirs(workdir)
+        streams_config = os.path.join(workdir, 'streams.json')
+        with open(streams_config, 'w') as f:
+            json.dump([{'id': 's{}'.format(i), 'args': '-i bench{} -f null -'.format(i)} for i in range(streams)], f)
+        processes = [_start(workdir, env, 19000, streams_config)]
+    try:
+        time.sleep(5)
+        before = [(_proc_stat(p.pid), _ctxt_switches(p.pid)) for p in processes]
+        time.sleep(seconds)
+        after = [(_proc_stat(p.pid), _ctxt_switches(p.pid)) for p in processes]
+    finally:
+        for p in processes:
+            p.terminate()
+        for p in processes:
+            p.wait()
+        subprocess.run(['pkill', '-f', os.path.abspath(fake_ffmpeg.__file__)])
+    cpu = sum(a[0][0] - b[0][0] for a, b in zip(after, before))
+    wakeups = sum(a[1] - b[1] for a, b in zip(after, before))
+    return {
+        'mode': name,
+        'streams': streams,
+        'cpu_percent_per_stream': round(cpu / seconds * 100 / streams, 3),
+        'threads_per_stream': round(sum(a[0][2] for a in after) / streams, 2),
+        'wakeups_per_second_per_stream': round(wakeups / seconds / streams, 1),
+    }
+
+
+if __name__ == '__main__':
+    streams = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 20
+    interval = float(sys.argv[3]) if len(sys.argv) > 3 else 5
+    base_dir = tempfile.mkdtemp(prefix='ffw_bench_')
+    bin_dir = os.path.join(base_dir, 'bin')
+    fake_ffmpeg.install(bin_dir)
+    env = fake_ffmpeg.env_with_fake(bin_dir, line_rate=1 / interval, progress_rate=1 / interval)
+    env.update(PROGRESS_BUFFER_LEN='1000', STDOUT_BUFFER_LEN='1000', STDOUT_BUFFER_ARENA_KBYTES='128')
+    try:
+        for mode in ('processes', 'supervisor'):
+            for event_loop in (False, True):
+                print(json.dumps(run(mode, event_loop, streams, seconds, env, base_dir)))
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
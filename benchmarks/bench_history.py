@@ -0,0 +1,80 @@
+#! /usr/bin/env python3
+"""
+Буферы в файлах истории (PERSISTENT_HISTORY) против буферов в памяти:
+    1. стоимость добавления строки stdout и блока -progress (мкс);
+    2. открытие истории прошлого запуска и чтение последних строк (мс) против разбора текстового лога той же длины.
+
+    python3 benchmarks/bench_history.py [lines]
+"""
+import datetime
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ff_wrapper'))
+
+import history  # noqa: E402
+from progress import ProgressRecord  # noqa: E402
+from progressbuffer import ProgressBuffer  # noqa: E402
+from stdoutbuffer import StdoutBuffer  # noqa: E402
+
+LINE = b'frame= 1234 fps= 25 q=28.0 size=    1024kB time=00:00:49.36 bitrate=1024.5kbits/s speed=1.01x'
+RECORD = ProgressRecord.from_values({'frame': '1234', 'fps': '25.0', 'stream_0_0_q': '28.0', 'bitrate': '1024.5kbits/s',
+                                     'total_size': '1048576', 'out_time_us': '49360000', 'speed': '1.01x',
+                                     'progress': 'continue'}, 0.0)
+SIZE_MAX = 100000
+ARENA_SIZE = 16 * 1024 * 1024
+
+
+def append_us(buf, lines: int, append) -> float:
+    started = time.perf_counter()
+    for _ in range(lines):
+        append(buf)
+    return (time.perf_counter() - started) / lines * 1e6
+
+
+def reopen_ms(path: str) -> float:
+    started = time.perf_counter()
+    buf = StdoutBuffer.from_history(history.HistoryFile.open(path))
+    buf.get_last_items(1000)
+    return (time.perf_counter() - started) * 1000
+
+
+def text_log_ms(path: str, lines: int) -> float:
+    # Прежний путь: последние строки из текстового лога (чтение и разбор всего файла)
+    with open(path, 'wb') as f:
+        dt = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S').encode('utf-8')
+        f.write(b''.join(b'<' + dt + b'> ' + LINE + b'\n' for _ in range(lines)))
+    started = time.perf_counter()
+    with open(path, 'rb') as f:
+        parsed = [(line[1:20], line[22:]) for line in f.read().splitlines()]
+    parsed[-1000:]
+    return (time.perf_counter() - started) * 1000
+
+
+if __name__ == '__main__':
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    directory = tempfile.mkdtemp(prefix='ffw_bench_')
+    try:
+        stdout_path = os.path.join(directory, 'stdout.ring')
+        progress_path = os.path.join(directory, 'progress.ring')
+        stdout_mmap = history.create_stdout_buffer(stdout_path, SIZE_MAX, ARENA_SIZE)
+        progress_mmap = history.create_progress_buffer(progress_path, SIZE_MAX)
+        print(json.dumps({
+            'lines': lines,
+            'stdout_memory_us': round(append_us(StdoutBuffer(SIZE_MAX, ARENA_SIZE), lines,
+                                                lambda buf: buf.append_line(LINE, 0.0)), 3),
+            'stdout_mmap_us': round(append_us(stdout_mmap, lines, lambda buf: buf.append_line(LINE, 0.0)), 3),
+            'progress_memory_us': round(append_us(ProgressBuffer(SIZE_MAX), lines,
+                                                  lambda buf: buf.append_record(RECORD)), 3),
+            'progress_mmap_us': round(append_us(progress_mmap, lines, lambda buf: buf.append_record(RECORD)), 3),
+            'stdout_file_mbytes': round(os.path.getsize(stdout_path) / 1024 / 1024, 1),
+            'progress_file_mbytes': round(os.path.getsize(progress_path) / 1024 / 1024, 1),
+            'reopen_last_1000_ms': round(reopen_ms(stdout_path), 2),
+            'text_log_last_1000_ms': round(text_log_ms(os.path.join(directory, 'ffmpeg.log'), SIZE_MAX), 2),
+        }))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,176 @@
+#! /usr/bin/env python3
+"""
+Нагрузочный тест HTTP API: threading (HTTP/1.0, соединение на запрос) против asyncio (HTTP/1.1 keep-alive).
+Сервер запускается в отдельном процессе с заполненными буферами, клиенты - корутины asyncio в этом процессе.
+Второй прогон - та же нагрузка, пока отдельный клиент без остановки забирает весь буфер stdout
+(/last_stdout?count=0, каждый раз мимо кэша): задержка остальных клиентов во время тяжелого запроса.
+
+    python3 benchmarks/bench_http.py [clients] [seconds] [path]
+"""
+import asyncio
+import datetime
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+FF_WRAPPER_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ff_wrapper')
+sys.path.insert(0, FF_WRAPPER_PATH)
+
+PROGRESS_BLOCK = {'frame': '1', 'fps': '25.00', 'stream_0_0_q': '28.0', 'bitrate': '1024.5kbits/s',
+                  'total_size': '123456', 'out_time_us': '49360000', 'dup_frames': '0', 'drop_frames': '0',
+                  'speed': '1.01x', 'progress': 'continue'}
+
+
+class _StubFFMpeg:
+    """
+    Минимальный FFMpegProc для HTTP API: буферы, заполненные тестовыми данными
+    """
+
+    def __init__(self, lines: int):
+        from config import Config
+        from progressbuffer import ProgressBuffer
+        from stdoutbuffer import StdoutBuffer
+        cfg = Config()
+        self.args = '-i bench -f null -'
+        self.start_time = datetime.datetime.now()
+        self.finish = False
+        self._stdout_buf = StdoutBuffer(cfg.STDOUT_BUFFER_LEN, cfg.STDOUT_BUFFER_ARENA_KBYTES * 1024)
+        self._progress_buf = ProgressBuffer(cfg.PROGRESS_BUFFER_LEN)
+        for i in range(lines):
+            self._stdout_buf.append_line('[h264 @ 0x55d0c6a3c240] bench line {}'.format(i).encode('utf-8'))
+            self._progress_buf.append_values(PROGRESS_BLOCK)
+
+    def get_stdout_buf(self):
+        return self._stdout_buf
+
+    def get_progress_buf(self):
+        return self._progress_buf
+
+
+def serve(lines: int):
+    from http_server import get_http_server
+    server = get_http_server(_StubFFMpeg(lines))
+    print('ready', flush=True)
+    server.serve_forever()
+
+
+async def _read_response(reader: asyncio.StreamReader) -> bool:
+    # Возвращает True, если сервер оставил соединение открытым
+    head = await reader.readuntil(b'\r\n\r\n')
+    headers = {}
+    for line in head.decode('latin-1').split('\r\n')[1:]:
+        k, _, v = line.partition(':')
+        headers[k.strip().lower()] = v.strip()
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+        return headers.get('connection', '').lower() == 'keep-alive'
+    await reader.read()
+    return False
+
+
+async def _client(port: int, path: str, deadline: float, latencies: list, errors: list):
+    request = 'GET {} HTTP/1.1\r\nHost: localhost\r\n\r\n'.format(path).encode('latin-1')
+    reader = writer = None
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(request)
+            keep_alive = await _read_response(reader)
+        except (OSError, asyncio.IncompleteReadError) as e:
+            errors.append(str(e))
+            writer = None
+            continue
+        latencies.append(time.perf_counter() - started)
+        if not keep_alive:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def _dumper(port: int, deadline: float, durations: list):
+    # Полная выгрузка буфера stdout, уникальный параметр - мимо кэша ответов
+    reader = writer = None
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write('GET /last_stdout?count=0&n={} HTTP/1.1\r\nHost: localhost\r\n\r\n'.format(
+                len(durations)).encode('latin-1'))
+            keep_alive = await _read_response(reader)
+        except (OSError, asyncio.IncompleteReadError):
+            writer = None
+            await asyncio.sleep(0.01)
+            continue
+        durations.append(time.perf_counter() - started)
+        if not keep_alive:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def _load(port: int, path: str, clients: int, seconds: float, dump: bool) -> (list, list, list):
+    latencies, errors, dumps = [], [], []
+    deadline = time.monotonic() + seconds
+    tasks = [_client(port, path, deadline, latencies, errors) for _ in range(clients)]
+    if dump:
+        tasks.append(_dumper(port, deadline, dumps))
+    await asyncio.gather(*tasks)
+    return latencies, errors, dumps
+
+
+def _percentile(values: list, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run(mode: str, port: int, clients: int, seconds: float, path: str, lines: int, dump: bool = False) -> dict:
+    workdir = tempfile.mkdtemp(prefix='ffw_bench_')
+    env = dict(os.environ, WORKDIR=workdir, LOGS_PATH=os.path.join(workdir, 'logs'), NO_FILE_LOG='1',
+               HTTP_HOST='127.0.0.1', HTTP_PORT=str(port), HTTP_SERVER_MODE=mode)
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', str(lines)],
+                              env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+    try:
+        while server.stdout.readline().strip() != 'ready':
+            pass
+        loop = asyncio.new_event_loop()
+        started = time.monotonic()
+        latencies, errors, dumps = loop.run_until_complete(_load(port, path, clients, seconds, dump))
+        elapsed = time.monotonic() - started
+        loop.close()
+    finally:
+        server.kill()
+        server.wait()
+    return {
+        'mode': mode,
+        'path': path,
+        'lines': lines,
+        'dumps': len(dumps),
+        'dump_ms': round(sum(dumps) / len(dumps) * 1000, 1) if dumps else None,
+        'clients': clients,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(_percentile(latencies, 0.5) * 1000, 2) if latencies else None,
+        'p99_ms': round(_percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+    }
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--serve':
+        serve(int(sys.argv[2]))
+        sys.exit(0)
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    path = sys.argv[3] if len(sys.argv) > 3 else '/last_progress?count=20&json'
+    for port, mode in ((18480, 'threading'), (18580, 'asyncio')):
+        print(json.dumps(run(mode, port, clients, seconds, path, 1000)))
+    for port, mode in ((18680, 'threading'), (18780, 'asyncio')):
+        print(json.dumps(run(mode, port, clients, seconds, path, 100000, dump=True)))
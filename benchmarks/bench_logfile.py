@@ -0,0 +1,128 @@
+#! /usr/bin/env python3
+"""
+Файловый лог stdout: прежний путь (logging.Logger.info на каждую строку, strftime, RotatingFileHandler)
+против LogFile (строки отрисованы через кэш буфера, пачка - один os.write).
+    1. пропускная способность: строк в секунду при записи заполненного буфера;
+    2. CPU% при постоянном потоке строк (lines/s) от потока-писателя в буфер, как от stdout ffmpeg.
+
+    python3 benchmarks/bench_logfile.py [lines] [rate lines/s] [seconds]
+"""
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ff_wrapper'))
+
+from config import Config  # noqa: E402
+from logfile import LogFile  # noqa: E402
+from stdoutbuffer import StdoutBuffer  # noqa: E402
+
+LINE = b'frame= 1234 fps= 25 q=28.0 size=    1024kB time=00:00:49.36 bitrate=1024.5kbits/s speed=1.01x'
+BATCH = 1000
+MAX_KBYTES = 25000
+
+
+class LoggingWriter:
+    # Как ffmpeg._stdout_filelog_write до LogFile
+    def __init__(self, path: str):
+        self.logger = logging.getLogger('bench stdout')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.handler = RotatingFileHandler(path, maxBytes=MAX_KBYTES * 1024, backupCount=3)
+        self.handler.setFormatter(logging.Formatter('%(message)s'))
+        self.logger.addHandler(self.handler)
+
+    def write(self, cursor, timeout=None) -> int:
+        objs, lost = cursor.read(BATCH, timeout=timeout)
+        for dt, line in objs:
+            self.logger.info('<{}> {}'.format(dt.strftime('%Y-%m-%d %H:%M:%S'), line))
+        return len(objs)
+
+    def close(self):
+        self.logger.removeHandler(self.handler)
+        self.handler.close()
+
+
+class LogFileWriter:
+    def __init__(self, path: str):
+        cfg = Config({'LOG_ROTATION_MODE': 'size', 'LOG_ROTATION_MAX_KBYTES': str(MAX_KBYTES)})
+        self.log_file = LogFile(path, cfg)
+
+    def write(self, cursor, timeout=None) -> int:
+        lines, lost = cursor.render(BATCH, timeout=timeout)
+        self.log_file.write(lines)
+        return len(lines)
+
+    def close(self):
+        self.log_file.close()
+
+
+def throughput(writer_class, lines: int, directory: str) -> float:
+    buf = StdoutBuffer(lines, lines * (len(LINE) + 1))
+    now = time.time()
+    for i in range(lines):
+        buf.append_line(LINE, now + i / 1000.0)
+    writer = writer_class(os.path.join(directory, writer_class.__name__ + '.log'))
+    cursor = buf.cursor(0)
+    started = time.perf_counter()
+    while writer.write(cursor):
+        pass
+    elapsed = time.perf_counter() - started
+    writer.close()
+    return lines / elapsed
+
+
+def cpu_at_rate(writer_class, rate: int, seconds: float, directory: str) -> float:
+    # CPU только потока записи (thread_time текущего потока), источник строк - отдельный поток
+    buf = StdoutBuffer(100000, 16 * 1024 * 1024)
+    writer = writer_class(os.path.join(directory, writer_class.__name__ + '_rate.log'))
+    cursor = buf.cursor(0)
+    finish = [False]
+
+    def source():
+        started = time.monotonic()
+        sent = 0
+        while not finish[0]:
+            for _ in range(max(1, rate // 100)):
+                buf.append_line(LINE)
+                sent += 1
+            delay = started + sent / rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    thread = threading.Thread(target=source)
+    cpu_started = time.thread_time()
+    thread.start()
+    started = time.monotonic()
+    while time.monotonic() - started < seconds:
+        writer.write(cursor, timeout=0.5)
+    finish[0] = True
+    thread.join()
+    cpu = time.thread_time() - cpu_started
+    writer.close()
+    return cpu / seconds * 100
+
+
+if __name__ == '__main__':
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    rate = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 5
+    directory = tempfile.mkdtemp(prefix='ffw_bench_')
+    os.environ.setdefault('WORKDIR', directory)
+    try:
+        print(json.dumps({
+            'lines': lines,
+            'rate_lines_s': rate,
+            'logging_lines_s': round(throughput(LoggingWriter, lines, directory)),
+            'logfile_lines_s': round(throughput(LogFileWriter, lines, directory)),
+            'logging_writer_cpu_percent': round(cpu_at_rate(LoggingWriter, rate, seconds, directory), 2),
+            'logfile_writer_cpu_percent': round(cpu_at_rate(LogFileWriter, rate, seconds, directory), 2),
+        }))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
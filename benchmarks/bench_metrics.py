@@ -0,0 +1,71 @@
+#! /usr/bin/env python3
+"""
+Сбор fps/speed: /last_progress?json с разбором на стороне клиента против /metrics
+на буфере из N блоков -progress, и цена обновления метрик при разборе блока.
+
+    python3 benchmarks/bench_metrics.py [blocks]
+"""
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('WORKDIR', tempfile.mkdtemp(prefix='ffw_bench_'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ff_wrapper'))
+
+import http_server  # noqa: E402
+from ffmpeg import FFMpegProc  # noqa: E402
+
+BLOCK = (b'frame=1200\nfps=25.00\nstream_0_0_q=28.0\nbitrate=1000.0kbits/s\ntotal_size=1024\n'
+         b'out_time_us=48000000\nout_time_ms=48000000\nout_time=00:00:48.000000\ndup_frames=0\n'
+         b'drop_frames=2\nspeed=1.01x\nprogress=continue\n')
+
+
+def feed(proc: FFMpegProc, blocks: int) -> float:
+    started = time.perf_counter()
+    for i in range(blocks):
+        proc._progress_on_data(BLOCK, float(i))
+    return (time.perf_counter() - started) / blocks * 1e6
+
+
+def measure_ms(func, repeat: int = 5) -> float:
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best, 3)
+
+
+def scrape_last_progress(api: http_server._Api, proc: FFMpegProc):
+    # Новый блок, чтобы не попасть в кэш ответов, как при периодическом опросе
+    proc._progress_on_data(BLOCK, time.time())
+    records = json.loads(api.handle('/last_progress?count=0&json', {}).body.decode('utf-8'))
+    fps = [float(line.split('fps=')[1].split()[0]) for _, line in records]
+    return sum(fps) / len(fps)
+
+
+def scrape_metrics(api: http_server._Api, proc: FFMpegProc):
+    proc._progress_on_data(BLOCK, time.time())
+    return api.handle('/metrics', {}).body
+
+
+if __name__ == '__main__':
+    blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    logger = logging.getLogger('bench')
+    plain = FFMpegProc('-i bench -f null -', logger=logger)
+    plain.metrics.observe_progress = lambda record: None
+    proc = FFMpegProc('-i bench -f null -', logger=logger)
+    result = {
+        'blocks': blocks,
+        'parse_block_us_without_metrics': round(feed(plain, blocks), 2),
+        'parse_block_us_with_metrics': round(feed(proc, blocks), 2),
+    }
+    api = http_server._Api(proc)
+    result['last_progress_json_scrape_ms'] = measure_ms(lambda: scrape_last_progress(api, proc))
+    result['metrics_scrape_ms'] = measure_ms(lambda: scrape_metrics(api, proc))
+    result['metrics_body_bytes'] = len(scrape_metrics(api, proc))
+    print(json.dumps(result))
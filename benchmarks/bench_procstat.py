@@ -0,0 +1,49 @@
+#! /usr/bin/env python3
+"""
+Стоимость снимка состояния процесса: ps (как было в get_process_status и Config._get_pids) против /proc.
+
+    python3 benchmarks/bench_procstat.py [repeat]
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ff_wrapper'))
+
+import procstat  # noqa: E402
+
+
+def ps_status(pid: int):
+    process = subprocess.Popen(['ps', '-eo', 'pid,stat', str(pid)], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return process.communicate()[0]
+
+
+def ps_pids():
+    process = subprocess.Popen(['ps', '-eo', 'pid'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return [line.strip() for line in process.communicate()[0].decode('utf-8').splitlines()]
+
+
+def timed_us(func, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return round((time.perf_counter() - started) / repeat * 1e6, 1)
+
+
+if __name__ == '__main__':
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])
+    try:
+        print(json.dumps({
+            'processes_on_host': len(os.listdir('/proc')),
+            'ps_status_us': timed_us(lambda: ps_status(child.pid), repeat),
+            'proc_state_us': timed_us(lambda: procstat.read_proc_state(child.pid), repeat * 10),
+            'proc_full_sample_us': timed_us(lambda: procstat.read_proc_sample(child.pid), repeat * 10),
+            'ps_pid_list_us': timed_us(ps_pids, repeat),
+            'kill0_alive_us': timed_us(lambda: procstat.is_pid_alive(child.pid), repeat * 100),
+        }))
+    finally:
+        child.kill()
+        child.wait()
@@ -0,0 +1,54 @@
+#! /usr/bin/env python3
+"""
+Сравнение памяти LogBuffer[(datetime, str)] и ProgressBuffer при заполненном буфере -progress.
+
+    python3 benchmarks/bench_progress_memory.py [PROGRESS_BUFFER_LEN]
+"""
+import datetime
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ff_wrapper'))
+
+from logbuffer import LogBuffer  # noqa: E402
+from progressbuffer import ProgressBuffer  # noqa: E402
+
+
+PROGRESS_LINE = ('frame={} fps=25.00 stream_0_0_q=28.0 bitrate=1024.5kbits/s total_size={} '
+                 'out_time_us={} out_time_ms={} out_time=00:00:49.360000 '
+                 'dup_frames=0 drop_frames=0 speed=1.01x progress=continue')
+
+
+def _line(i):
+    return PROGRESS_LINE.format(i, i * 1000, i * 40000, i * 40000)
+
+
+def measure(buf_cls, size):
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    buf = buf_cls(size)
+    started = time.perf_counter()
+    for i in range(size):
+        buf.append((datetime.datetime.now(), _line(i)))
+    append_time = time.perf_counter() - started
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    started = time.perf_counter()
+    buf.get_all()
+    get_all_time = time.perf_counter() - started
+    return {
+        'buffer': buf_cls.__name__,
+        'size': size,
+        'memory_mb': round((after - before) / 1024 / 1024, 2),
+        'append_us': round(append_time / size * 1e6, 2),
+        'get_all_ms': round(get_all_time * 1000, 1),
+    }
+
+
+if __name__ == '__main__':
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    for cls in (LogBuffer, ProgressBuffer):
+        print(json.dumps(measure(cls, size)))
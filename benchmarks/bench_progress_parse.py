@@ -0,0 +1,66 @@
+#! /usr/bin/env python3
+"""
+Стоимость разбора одного блока -progress: старый путь (склейка строки в потоке чтения,
+повторный разбор строки менеджером) против однократного разбора в ProgressRecord.
+
+    python3 benchmarks/bench_progress_parse.py [blocks]
+"""
+import datetime
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ff_wrapper'))
+
+from logbuffer import progress_str_to_dict  # noqa: E402
+from progress import ProgressRecord  # noqa: E402
+
+
+BLOCK = (b'frame=1234\nfps=25.00\nstream_0_0_q=28.0\nbitrate=1024.5kbits/s\ntotal_size=123456\n'
+         b'out_time_us=49360000\nout_time_ms=49360000\nout_time=00:00:49.360000\n'
+         b'dup_frames=0\ndrop_frames=0\nspeed=1.01x\nprogress=continue\n').split(b'\n')[:-1]
+TEXT_BLOCK = [line.decode('utf-8') + '\n' for line in BLOCK]
+
+
+def before():
+    # ffmpeg._progress_start_piperead + _parse_progress_line_to_dict + менеджер
+    buffer = [line[:-1].replace(' ', '') for line in TEXT_BLOCK]
+    line = ' '.join([x for x in buffer if x])
+    dct = {}
+    for el in line.split(' '):
+        k, v = el.split('=')
+        dct[k] = v
+    dct['_time'] = datetime.datetime.now()
+    item = (datetime.datetime.now(), line)
+    progress = progress_str_to_dict(item[1])
+    return float(progress['fps']), float(progress['speed'].replace('x', ''))
+
+
+def after():
+    # ffmpeg._progress_on_lines, менеджер читает поля записи
+    block = {}
+    for line in BLOCK:
+        k, _, v = line.replace(b' ', b'').partition(b'=')
+        block[k] = v
+    record = ProgressRecord.from_block(block, time.time())
+    return record.fps, record.speed
+
+
+def measure(func, blocks, repeat=5):
+    # Лучший из repeat прогонов, чтобы уменьшить шум
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(blocks):
+            func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best / blocks * 1e6, 2)
+
+
+if __name__ == '__main__':
+    blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    assert before() == after()
+    print(json.dumps({'blocks': blocks, 'before_us_per_block': measure(before, blocks),
+                      'after_us_per_block': measure(after, blocks)}))
@@ -0,0 +1,88 @@
+#! /usr/bin/env python3
+"""
+График fps/speed за hours часов: /last_progress?count=0&json (все блоки буфера) против /progress_series
+(интервалы 1 мин): размер и время ответа, цена обновления рядов на блок -progress и их память.
+
+    python3 benchmarks/bench_progress_series.py [hours]
+"""
+import datetime
+import json
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ff_wrapper'))
+
+from config import Config  # noqa: E402
+from http_server import _Api  # noqa: E402
+from progress import ProgressRecord  # noqa: E402
+from progressbuffer import ProgressBuffer  # noqa: E402
+from series import ProgressSeries  # noqa: E402
+
+BLOCKS_PER_SECOND = 2
+
+
+class _StubFFMpeg:
+    """
+    Минимальный FFMpegProc для HTTP API: буфер -progress и ряды, заполненные одними блоками
+    """
+
+    def __init__(self, blocks: int, now: float):
+        cfg = Config()
+        self.args = '-i bench -f null -'
+        self.start_time = datetime.datetime.now()
+        self._progress_buf = ProgressBuffer(max(cfg.PROGRESS_BUFFER_LEN, blocks))
+        self.series = ProgressSeries(cfg.PROGRESS_SERIES_RESOLUTIONS, cfg.PROGRESS_SERIES_POINTS,
+                                     cfg.PROGRESS_SERIES_FIELDS)
+        records = []
+        for i in range(blocks):
+            block = {b'frame': str(i * 12).encode('utf-8'), b'fps': b'%.2f' % (25 + math.sin(i / 7.0)),
+                     b'speed': b'%.3fx' % (1 + math.sin(i / 11.0) / 20), b'bitrate': b'1000.0kbits/s',
+                     b'progress': b'continue'}
+            records.append(ProgressRecord.from_block(block, now - (blocks - i) / BLOCKS_PER_SECOND))
+        for record in records:
+            self._progress_buf.append_record(record)
+        started = time.perf_counter()
+        for record in records:
+            self.series.observe_progress(record)
+        self.update_us = (time.perf_counter() - started) / blocks * 1e6
+
+    def get_progress_buf(self):
+        return self._progress_buf
+
+    def get_previous_run(self):
+        return None
+
+
+def timed(api: _Api, path: str, repeat: int = 5) -> (int, float):
+    size, started = 0, time.perf_counter()
+    for _ in range(repeat):
+        # Кэш ответов не участвует: у каждого повтора свой путь
+        size = len(api.handle('{}&r={}'.format(path, time.perf_counter()), {}).body)
+    return size, round((time.perf_counter() - started) / repeat * 1000, 2)
+
+
+if __name__ == '__main__':
+    hours = float(sys.argv[1]) if len(sys.argv) > 1 else 14
+    blocks = int(hours * 3600 * BLOCKS_PER_SECOND)
+    ffmpeg = _StubFFMpeg(blocks, time.time())
+    api = _Api(ffmpeg)
+    progress_series = ffmpeg.series
+    memory = sum(rollup._slots.itemsize * len(rollup._slots)
+                 + sum(a.itemsize * len(a) for field in rollup._fields for a in field)
+                 for rollup in progress_series._rollups)
+    last_progress_bytes, last_progress_ms = timed(api, '/last_progress?count=0&json')
+    series_path = '/progress_series?field=fps,speed&from=-{}'.format(int(hours * 3600))
+    series_bytes, series_ms = timed(api, series_path)
+    print(json.dumps({
+        'hours': hours,
+        'blocks': blocks,
+        'series_update_us_per_block': round(ffmpeg.update_us, 2),
+        'series_memory_bytes': memory,
+        'last_progress_bytes': last_progress_bytes,
+        'last_progress_ms': last_progress_ms,
+        'progress_series_resolution': json.loads(api.handle(series_path, {}).body.decode('utf-8'))['resolution'],
+        'progress_series_bytes': series_bytes,
+        'progress_series_ms': series_ms,
+    }))
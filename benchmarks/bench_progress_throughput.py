@@ -0,0 +1,134 @@
+#! /usr/bin/env python3
+"""
+Пропускная способность разбора -progress (блоков в секунду) на записанном выводе ffmpeg:
+    1. чистый разбор: построчный путь (split_lines, строка за строкой в dict) против ProgressParser по байтам;
+    2. воспроизведение записи через pipe и PipeIngest с ускорением: блоки пишутся пачками раз в 10 мс
+       с заданной частотой (0 - без пауз), считаются доставленные блоки, задержка и CPU.
+
+Запись - вывод `ffmpeg ... -progress <файл>`, по умолчанию benchmarks/data/progress_2outputs.txt
+(формат ffmpeg 6, два выхода: ключи stream_0_0_q и stream_1_0_q, значения с выравниванием пробелами).
+
+    python3 benchmarks/bench_progress_throughput.py [recording] [seconds per rate]
+"""
+import json
+import logging
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'ff_wrapper'))
+
+from ingest import PipeIngest, split_lines  # noqa: E402
+from progress import ProgressParser, ProgressRecord  # noqa: E402
+
+RATES = (1000, 10000, 100000, 0)  # блоков в секунду
+CHUNK_SIZE = 65536
+WRITE_PERIOD = 0.01
+
+
+def split_blocks(data: bytes) -> list:
+    blocks, start = [], 0
+    while True:
+        pos = data.find(b'\nprogress=', start)
+        if pos < 0:
+            return blocks
+        end = data.find(b'\n', pos + 1) + 1
+        blocks.append(data[start:end])
+        start = end
+
+
+class LineParser:
+    # Прежний путь: PipeIngest делит на строки, ffmpeg._progress_on_lines собирает блок в dict
+    def __init__(self):
+        self._carry = b''
+        self._block = {}
+
+    def feed(self, data: bytes, wall_time: float) -> list:
+        lines, self._carry = split_lines(self._carry + data)
+        records = []
+        block = self._block
+        for line in lines:
+            line = line.replace(b' ', b'')
+            if not line:
+                continue
+            k, _, v = line.partition(b'=')
+            block[k] = v
+            if k == b'progress':
+                records.append(ProgressRecord.from_block(block, wall_time))
+                block.clear()
+        return records
+
+
+def parse_only(parser_class, data: bytes, repeat: int) -> float:
+    chunks = [data[i:i + CHUNK_SIZE] for i in range(0, len(data), CHUNK_SIZE)]
+    best = None
+    for _ in range(repeat):
+        parser = parser_class()
+        started = time.perf_counter()
+        count = 0
+        for chunk in chunks:
+            count += len(parser.feed(chunk, 0.0))
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return count / best
+
+
+def replay(blocks: list, rate: int, seconds: float) -> dict:
+    read_fd, write_fd = os.pipe()
+    parser = ProgressParser()
+    received = [0]
+    lags = []
+
+    def on_data(data, wall_time):
+        records = parser.feed(data, wall_time) if data is not None else parser.flush(wall_time)
+        received[0] += len(records)
+        if records:
+            lags.append(time.time() - records[-1].wall_time)
+
+    ingest = PipeIngest('progress', read_fd, None, logging.getLogger('bench'), read_size=CHUNK_SIZE, on_data=on_data)
+    ingest.start()
+    cpu_started = time.process_time()
+    started = time.monotonic()
+    sent = 0
+    per_write = max(1, int(rate * WRITE_PERIOD)) if rate else 256
+    while time.monotonic() - started < seconds:
+        batch = b''.join(blocks[(sent + i) % len(blocks)] for i in range(per_write))
+        os.write(write_fd, batch)
+        sent += per_write
+        if rate:
+            delay = started + sent / rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+    os.close(write_fd)
+    ingest.join(10)
+    elapsed = time.monotonic() - started
+    cpu = time.process_time() - cpu_started
+    os.close(read_fd)
+    lags.sort()
+    return {
+        'rate_blocks_s': rate or 'max',
+        'sent_blocks': sent,
+        'received_blocks': received[0],
+        'achieved_blocks_s': round(received[0] / elapsed),
+        'cpu_us_per_block': round(cpu / max(received[0], 1) * 1e6, 2),
+        'lag_p99_ms': round(lags[int(len(lags) * 0.99)] * 1000, 2) if lags else None,
+        'dropped_bytes': ingest.stats['dropped_bytes'],
+    }
+
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(BENCH_DIR, 'data', 'progress_2outputs.txt')
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 3
+    with open(path, 'rb') as f:
+        blocks = split_blocks(f.read())
+    data = b''.join(blocks) * max(1, 20000 // len(blocks))
+    print(json.dumps({
+        'recording': os.path.basename(path),
+        'blocks': len(data) and data.count(b'\nprogress='),
+        'bytes_per_block': round(len(data) / data.count(b'\nprogress=')),
+        'line_parser_blocks_s': round(parse_only(LineParser, data, 5)),
+        'bytes_parser_blocks_s': round(parse_only(ProgressParser, data, 5)),
+    }))
+    for rate in RATES:
+        print(json.dumps(replay(blocks, rate, seconds)))
@@ -0,0 +1,62 @@
+#! /usr/bin/env python3
+"""
+Стоимость ответа /last_stdout и /last_progress с count=0 на полном буфере:
+старая отрисовка (strftime и склейка на каждый запрос) против кэша отрисованных строк и кэша ответов.
+
+    python3 benchmarks/bench_render.py [lines]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('WORKDIR', tempfile.mkdtemp(prefix='ffw_bench_'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ff_wrapper'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import http_server  # noqa: E402
+from bench_http import _StubFFMpeg  # noqa: E402
+
+
+def before(buf, is_json: bool) -> bytes:
+    # _get_last_logs до кэширования
+    lines, _, _ = buf.read_from(buf.get_first_position())
+    if is_json:
+        return json.dumps([(dt.strftime(http_server.DT_FORMAT), line) for dt, line in lines]).encode('utf-8')
+    response = ''
+    for dt, line in lines:
+        response += '<{}> {}\n'.format(dt.strftime(http_server.DT_FORMAT), line)
+    return response.encode('utf-8')
+
+
+def measure(func) -> float:
+    started = time.perf_counter()
+    func()
+    return round((time.perf_counter() - started) * 1000, 2)
+
+
+if __name__ == '__main__':
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    stub = _StubFFMpeg(lines)
+    api = http_server._Api(stub)
+    for route, buf in (('/last_stdout', stub.get_stdout_buf()), ('/last_progress', stub.get_progress_buf())):
+        for is_json in (False, True):
+            path = route + '?count=0' + ('&json' if is_json else '')
+            result = {'path': path, 'before_ms': measure(lambda: before(buf, is_json))}
+            result['cold_ms'] = measure(lambda: api.handle(path, {}))
+            # Новая строка: кэш ответа устарел, отрисованные строки остаются в кэше
+            if buf is stub.get_stdout_buf():
+                buf.append_line(b'new line')
+            else:
+                buf.append_values({'frame': '1'})
+            result['new_line_ms'] = measure(lambda: api.handle(path, {}))
+            result['cached_ms'] = measure(lambda: api.handle(path, {}))
+            etag = dict(api.handle(path, {}).headers)['ETag']
+            result['not_modified_ms'] = measure(lambda: api.handle(path, {'if-none-match': etag}))
+            result['gzip_first_ms'] = measure(lambda: api.handle(path, {'accept-encoding': 'gzip'}))
+            result['gzip_cached_ms'] = measure(lambda: api.handle(path, {'accept-encoding': 'gzip'}))
+            body = api.handle(path, {}).body
+            gz_body = api.handle(path, {'accept-encoding': 'gzip'}).body
+            result['bytes'], result['gzip_bytes'] = len(body), len(gz_body)
+            print(json.dumps(result))
@@ -0,0 +1,112 @@
+#! /usr/bin/env python3
+"""
+Правила здоровья (HEALTH_RULES): цена вычисления на блок -progress и на строку stdout для 0/10/50 правил
+против пересчета каждого правила по буферу при каждом блоке. Цена RuleEngine не зависит от длины окна
+и размера буфера, пересчет растет вместе с ними.
+
+    python3 benchmarks/bench_rules.py [blocks]
+"""
+import json
+import logging
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ff_wrapper'))
+
+from progress import ProgressRecord  # noqa: E402
+from progressbuffer import ProgressBuffer  # noqa: E402
+from rules import RuleEngine, load_rules  # noqa: E402
+
+LOGGER = logging.getLogger('bench_rules')
+LOGGER.setLevel(logging.CRITICAL)  # Сработавшие правила не пишутся в вывод
+BLOCKS_PER_SECOND = 2
+STDOUT_LINES_PER_BLOCK = 10
+FIELD_RULES = (
+    {'field': 'speed', 'agg': 'p10', 'op': '<', 'value': 0.5},
+    {'field': 'fps', 'agg': 'mean', 'op': '<', 'value': 10},
+    {'field': 'drop_frames', 'agg': 'rate', 'op': '>', 'value': 5},
+    {'field': 'bitrate', 'agg': 'min', 'op': '<', 'value': 100},
+    {'field': 'fps', 'agg': 'last', 'op': '<', 'value': 1},
+)
+STDOUT_RULES = ('Connection timed out', 'Non-monotonous DTS', r'error while decoding MB \d+', 'Invalid data found',
+                '(?i)broken pipe')
+
+
+def make_rules(count: int, window: float) -> list:
+    specs = []
+    for i in range(count):
+        if i % 2 == 0:
+            spec = dict(FIELD_RULES[i // 2 % len(FIELD_RULES)], window=window + i)
+        else:
+            spec = {'stdout': STDOUT_RULES[i // 2 % len(STDOUT_RULES)], 'window': window + i, 'op': '>=', 'value': 3}
+        spec['name'] = 'rule{}'.format(i)
+        specs.append(spec)
+    return load_rules(json.dumps(specs))
+
+
+def make_records(blocks: int) -> list:
+    records = []
+    for i in range(blocks):
+        block = {b'frame': str(i * 12).encode('utf-8'), b'fps': b'%.2f' % (25 + math.sin(i / 7.0)),
+                 b'speed': b'%.3fx' % (1 + math.sin(i / 11.0) / 20), b'bitrate': b'1000.0kbits/s',
+                 b'drop_frames': str(i // 100).encode('utf-8'), b'progress': b'continue'}
+        records.append(ProgressRecord.from_block(block, 1e9 + i / BLOCKS_PER_SECOND))
+    return records
+
+
+def make_lines(count: int) -> list:
+    lines = []
+    for i in range(count):
+        if i % 50 == 49:
+            lines.append(b'[rtsp @ 0x5581] Connection timed out')
+        else:
+            lines.append(b'frame=%d fps=25 q=28.0 size=1024kB time=00:00:%02d.00 bitrate=1000.0kbits/s speed=1x'
+                         % (i, i % 60))
+    return lines
+
+
+def rescan(buf: ProgressBuffer, engine: RuleEngine, now: float):
+    # Каждое правило над полем - заново по блокам буфера за окно
+    records, _ = buf.get_last_records(buf.max)
+    for rule in engine.rules:
+        if rule.pattern is None:
+            values = sorted(getattr(r, rule.field) for r in records if r.wall_time > now - rule.window)
+            rule._compare(values[len(values) // 2] if values else 0, rule.threshold)
+
+
+def per_block_us(engine: RuleEngine, records: list, lines: list) -> (float, float):
+    started = time.perf_counter()
+    for record in records:
+        engine.observe_progress(record)
+    progress_us = (time.perf_counter() - started) / len(records) * 1e6
+    started = time.perf_counter()
+    for i, record in enumerate(records):
+        engine.observe_stdout(lines[i % 100 * STDOUT_LINES_PER_BLOCK:][:STDOUT_LINES_PER_BLOCK], record.wall_time)
+    stdout_us = (time.perf_counter() - started) / (len(records) * STDOUT_LINES_PER_BLOCK) * 1e6
+    return round(progress_us, 2), round(stdout_us, 3)
+
+
+if __name__ == '__main__':
+    blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    records = make_records(blocks)
+    lines = make_lines(100 * STDOUT_LINES_PER_BLOCK)
+    for window in (30, 300, 3000):
+        for count in (0, 10, 50):
+            progress_us, stdout_us = per_block_us(RuleEngine(make_rules(count, window), LOGGER), records, lines)
+            result = {'rules': count, 'window_s': window, 'engine_us_per_block': progress_us,
+                      'engine_us_per_stdout_line': stdout_us}
+            if count == 10:
+                # Пересчет по буферу с окном window: 200 блоков после заполнения буфера
+                buf = ProgressBuffer(int(window * BLOCKS_PER_SECOND) + 20)
+                engine = RuleEngine(make_rules(count, window), LOGGER)
+                for record in records[:buf.max]:
+                    buf.append_record(record)
+                tail = records[buf.max:buf.max + 200]
+                started = time.perf_counter()
+                for record in tail:
+                    buf.append_record(record)
+                    rescan(buf, engine, record.wall_time)
+                result['rescan_us_per_block'] = round((time.perf_counter() - started) / max(len(tail), 1) * 1e6, 2)
+            print(json.dumps(result))
@@ -0,0 +1,97 @@
+#! /usr/bin/env python3
+"""
+Поиск по буферу stdout (/search_stdout) на полном буфере STDOUT_BUFFER_LEN строк: запросы по компоненту
+и уровню через индекс (STDOUT_INDEX) и просмотром всего буфера, добавление строки с индексом и без него
+и цена индексации проходом менеджера: на строку и на один вызов update (UPDATE_MAX_LINES строк).
+
+    python3 benchmarks/bench_search_stdout.py [lines]
+"""
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ff_wrapper'))
+
+from config import Config  # noqa: E402
+from stdoutbuffer import StdoutBuffer  # noqa: E402
+from stdoutindex import StdoutIndex, search  # noqa: E402
+
+QUERIES = (
+    ('component=aac', ['aac'], [], None),
+    ('component=h264&level=error', ['h264'], ['error'], None),
+    ('level=warning&count=0', [], ['warning'], None),
+    ('component=hls&regex=seg9', ['hls'], [], b'seg9'),
+)
+
+
+def make_lines(count: int) -> list:
+    rnd = random.Random(1)
+    lines = []
+    for i in range(count):
+        kind = rnd.random()
+        if kind < 0.6:
+            lines.append(b'frame=%5d fps= 25 q=28.0 size=%8dkB time=00:00:%02d.00 bitrate=1000.0kbits/s speed=1x'
+                         % (i, i * 3, i % 60))
+        elif kind < 0.85:
+            lines.append(b'[hls @ 0x55d0c6a11111] Opening \'/tmp/out/seg%d.ts\' for writing' % i)
+        elif kind < 0.97:
+            lines.append(b'[mpegts @ 0x55d0c6a00000] Non-monotonous DTS in output stream 0:0; previous: %d, '
+                         b'current: %d; changing to %d.' % (i * 3600, i * 3600 - 1, i * 3600 + 1))
+        elif kind < 0.999:
+            lines.append(b'[h264 @ 0x55d0c6a3%04x] error while decoding MB %d %d'
+                         % (rnd.randrange(4096), rnd.randrange(120), rnd.randrange(68)))
+        else:
+            lines.append(b'[aac @ 0x55d0c6a22222] Queue input is backward in time')
+    return lines
+
+
+def fill(lines: list, indexed: bool) -> (StdoutBuffer, float):
+    cfg = Config()
+    buf = StdoutBuffer(cfg.STDOUT_BUFFER_LEN, cfg.STDOUT_BUFFER_ARENA_KBYTES * 1024)
+    if indexed:
+        buf.index = StdoutIndex(buf.max)
+    started = time.perf_counter()
+    for i, line in enumerate(lines):
+        buf.append_line(line, 1e9 + i / 100.0)
+    return buf, (time.perf_counter() - started) / len(lines) * 1e6
+
+
+def index_buffer(buf: StdoutBuffer) -> (float, float):
+    # Проходы менеджера до конца буфера: (мкс на строку, максимум мс на вызов)
+    updates = []
+    started = time.perf_counter()
+    while True:
+        update_started = time.perf_counter()
+        if not buf.index.update(buf):
+            break
+        updates.append(time.perf_counter() - update_started)
+    return (time.perf_counter() - started) / buf.get_current_position() * 1e6, max(updates) * 1000
+
+
+def timed_search(buf: StdoutBuffer, query: tuple, repeat: int = 5) -> dict:
+    _, components, levels, regex = query
+    pattern = None if regex is None else re.compile(regex)
+    count = 0 if 'count=0' in query[0] else 100
+    started = time.perf_counter()
+    for _ in range(repeat):
+        items, scanned, _ = search(buf, components, levels, pattern, buf.get_first_position(),
+                                   buf.get_current_position(), count)
+    return {'found': len(items), 'scanned': scanned,
+            'ms': round((time.perf_counter() - started) / repeat * 1000, 2)}
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    lines = make_lines(count)
+    plain, plain_us = fill(lines, False)
+    indexed, indexed_us = fill(lines, True)
+    update_us, update_max_ms = index_buffer(indexed)
+    print(json.dumps({'lines': count, 'append_us_per_line': round(plain_us, 3),
+                      'append_indexed_us_per_line': round(indexed_us, 3), 'update_us_per_line': round(update_us, 3),
+                      'update_max_ms': round(update_max_ms, 1)}))
+    for query in QUERIES:
+        print(json.dumps({'query': query[0], 'scan': timed_search(plain, query),
+                          'index': timed_search(indexed, query)}))
@@ -0,0 +1,105 @@
+#! /usr/bin/env python3
+"""
+Холодный старт враппера (новый процесс main.py на каждый запуск, заглушка ffmpeg - benchmarks/fake_ffmpeg.py)
+без FAST_START и с ним:
+    spawn_ms  - от запуска main.py до старта ffmpeg (время старта интерпретатора заглушки вычтено);
+    http_ms   - от запуска main.py до первого ответа HTTP API;
+    stages_ms - этапы старта по данным самого враппера (/debug/stats), медианы.
+Переменные окружения враппера (EVENT_LOOP, PERSISTENT_HISTORY, ...) передаются как есть.
+
+    python3 benchmarks/bench_startup.py [runs]
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import fake_ffmpeg
+from bench_e2e import Wrapper
+from bench_http import _percentile
+
+MODES = (('default', {}), ('fast_start', {'FAST_START': '1'}))
+READY_TIMEOUT = 10  # seconds
+
+
+def _read_started(report_path: str, timeout: float = READY_TIMEOUT) -> float:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with open(report_path) as f:
+                return json.load(f)['started']
+        except (OSError, ValueError, KeyError):
+            time.sleep(0.001)
+    raise RuntimeError('fake ffmpeg did not start ({})'.format(report_path))
+
+
+def interpreter_startup(base_dir: str, runs: int) -> float:
+    # Сколько проходит от exec шима заглушки до ее первой строки - вычитается из spawn_ms
+    values = []
+    for i in range(runs):
+        report_path = os.path.join(base_dir, 'baseline_{}.json'.format(i))
+        env = fake_ffmpeg.env_with_fake(os.path.join(base_dir, 'bin'), report=report_path, duration=0)
+        launched = time.time()
+        process = subprocess.Popen(['ffmpeg'], env=env, stderr=subprocess.DEVNULL)
+        values.append(_read_started(report_path) - launched)
+        process.wait()
+    return _percentile(values, 0.5)
+
+
+def cold_start(base_dir: str, name: str, env: dict, baseline: float) -> dict:
+    launched = time.time()
+    wrapper = Wrapper(base_dir, name, env, duration=5)
+    try:
+        deadline = time.monotonic() + READY_TIMEOUT
+        while True:
+            try:
+                wrapper.get('/get_pid')
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError('wrapper did not start ({})'.format(wrapper.workdir))
+                time.sleep(0.001)
+        http_ready = time.time() - launched
+        spawned = _read_started(wrapper.report_path) - launched - baseline
+        stages = json.loads(wrapper.get('/debug/stats').decode('utf-8'))['process']['startup']
+    finally:
+        wrapper.stop()
+    return {'spawn': spawned, 'http': http_ready,
+            'stages': {stage: info['duration'] for stage, info in stages.items()}}
+
+
+def _summary(mode: str, results: list) -> dict:
+    stages = {}
+    for result in results:
+        for stage, duration in result['stages'].items():
+            stages.setdefault(stage, []).append(duration)
+    return {
+        'mode': mode,
+        'runs': len(results),
+        'spawn_ms_p50': round(_percentile([r['spawn'] for r in results], 0.5) * 1000, 1),
+        'spawn_ms_p90': round(_percentile([r['spawn'] for r in results], 0.9) * 1000, 1),
+        'http_ms_p50': round(_percentile([r['http'] for r in results], 0.5) * 1000, 1),
+        'http_ms_p90': round(_percentile([r['http'] for r in results], 0.9) * 1000, 1),
+        'stages_ms': {stage: round(_percentile(values, 0.5) * 1000, 1) for stage, values in stages.items()},
+    }
+
+
+if __name__ == '__main__':
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    base_dir = tempfile.mkdtemp(prefix='ffw_bench_')
+    try:
+        fake_ffmpeg.install(os.path.join(base_dir, 'bin'))
+        baseline = interpreter_startup(base_dir, runs)
+        print(json.dumps({'fake_ffmpeg_interpreter_ms': round(baseline * 1000, 1)}))
+        results = {mode: [] for mode, _ in MODES}
+        for i in range(runs):
+            # Режимы чередуются, чтобы фоновая нагрузка машины влияла на оба одинаково
+            for mode, env in MODES:
+                results[mode].append(cold_start(base_dir, '{}_{}'.format(mode, i), env, baseline))
+        for mode, _ in MODES:
+            print(json.dumps(_summary(mode, results[mode])))
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
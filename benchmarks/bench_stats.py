@@ -0,0 +1,79 @@
+#! /usr/bin/env python3
+"""
+Скользящая статистика: цена обновления на блок -progress и цена запроса
+(перцентиль, тренд) против пересчета по буферу ProgressBuffer при каждом запросе.
+
+    python3 benchmarks/bench_stats.py [blocks] [window seconds]
+"""
+import json
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ff_wrapper'))
+
+from progress import ProgressRecord  # noqa: E402
+from progressbuffer import ProgressBuffer  # noqa: E402
+from stats import EncodingStats  # noqa: E402
+
+BLOCKS_PER_SECOND = 2
+
+
+def make_records(blocks: int) -> list:
+    records = []
+    # Блоки до текущего момента: EncodingStats при чтении сдвигает окна к time.time()
+    start = time.time() - blocks / BLOCKS_PER_SECOND
+    for i in range(blocks):
+        block = {b'fps': b'%.2f' % (25 + math.sin(i / 7.0)), b'speed': b'%.3fx' % (1 + math.sin(i / 11.0) / 20),
+                 b'bitrate': b'1000.0kbits/s', b'progress': b'continue'}
+        records.append(ProgressRecord.from_block(block, start + i / BLOCKS_PER_SECOND))
+    return records
+
+
+def rescan(buf: ProgressBuffer, window: float, now: float) -> (float, float):
+    # p10 speed и тренд по блокам буфера за окно - как без статистики
+    records, _ = buf.get_last_records(buf.max)
+    values = [(r.wall_time, r.speed) for r in records if r.wall_time > now - window]
+    speeds = sorted(v for _, v in values)
+    p10 = speeds[max(0, int(math.ceil(0.1 * len(speeds))) - 1)]
+    n = len(values)
+    st = sum(t - now for t, _ in values)
+    sv = sum(v for _, v in values)
+    stt = sum((t - now) ** 2 for t, _ in values)
+    stv = sum((t - now) * v for t, v in values)
+    return p10, (n * stv - st * sv) / (n * stt - st * st)
+
+
+def timed(func, repeat: int = 20) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return round((time.perf_counter() - started) / repeat * 1e6, 2)
+
+
+if __name__ == '__main__':
+    blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    window = float(sys.argv[2]) if len(sys.argv) > 2 else 300
+    records = make_records(blocks)
+    buf = ProgressBuffer(blocks)
+    stats = EncodingStats((10, 60, 300))
+    started = time.perf_counter()
+    for record in records:
+        buf.append_record(record)
+    append_us = (time.perf_counter() - started) / blocks * 1e6
+    started = time.perf_counter()
+    for record in records:
+        stats.observe_progress(record)
+    stats_us = (time.perf_counter() - started) / blocks * 1e6
+    now = records[-1].wall_time
+    print(json.dumps({
+        'blocks': blocks,
+        'window_s': window,
+        'buffer_append_us_per_block': round(append_us, 2),
+        'stats_update_us_per_block': round(stats_us, 2),
+        'query_rescan_buffer_us': timed(lambda: rescan(buf, window, now)),
+        'query_stats_us': timed(lambda: (stats.get('speed', window, lambda s: s.quantile(0.1)),
+                                         stats.get('speed', window, lambda s: s.trend)), 1000),
+        'to_dict_all_windows_us': timed(lambda: stats.to_dict(), 1000),
+    }))
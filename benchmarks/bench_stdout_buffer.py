@@ -0,0 +1,59 @@
+#! /usr/bin/env python3
+"""
+LogBuffer[(datetime, str)] против StdoutBuffer: стоимость добавления строки, память и выгрузка count=0.
+
+    python3 benchmarks/bench_stdout_buffer.py [STDOUT_BUFFER_LEN]
+"""
+import datetime
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ff_wrapper'))
+
+from logbuffer import LogBuffer  # noqa: E402
+from stdoutbuffer import StdoutBuffer  # noqa: E402
+
+
+LINE = b'[h264 @ 0x55d0c6a3c240] error while decoding MB 59 31, bytestream -5 (line {})'
+
+
+def measure(name, buf_factory, append, size):
+    lines = [LINE.replace(b'{}', str(i).encode()) for i in range(size)]
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    buf = buf_factory()
+    for line in lines:
+        append(buf, line)
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    buf = buf_factory()
+    started = time.perf_counter()
+    for line in lines:
+        append(buf, line)
+    append_time = time.perf_counter() - started
+    started = time.perf_counter()
+    buf.get_all()
+    get_all_time = time.perf_counter() - started
+    result = {
+        'buffer': name,
+        'size': size,
+        'memory_mb': round((after - before) / 1024 / 1024, 2),
+        'append_us': round(append_time / size * 1e6, 2),
+        'get_all_ms': round(get_all_time * 1000, 1),
+    }
+    if hasattr(buf, 'get_last_views'):
+        started = time.perf_counter()
+        buf.get_last_views(size)
+        result['get_views_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+
+if __name__ == '__main__':
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print(json.dumps(measure('LogBuffer', lambda: LogBuffer(size),
+                             lambda b, l: b.append((datetime.datetime.now(), l.decode('utf-8').strip())), size)))
+    print(json.dumps(measure('StdoutBuffer', lambda: StdoutBuffer(size, 16384 * 1024),
+                             lambda b, l: b.append_line(l.strip()), size)))
@@ -0,0 +1,97 @@
+#! /usr/bin/env python3
+"""
+Память и CPU враппера на поток: процесс на поток (main.py на каждый ffmpeg) против режима супервизора
+(STREAMS_CONFIG, все ffmpeg в одном процессе). Учитываются только процессы враппера, без ffmpeg.
+Вместо ffmpeg - заглушка benchmarks/fake_ffmpeg.py: строка stderr и блок -progress раз в 0.5 секунды.
+
+    python3 benchmarks/bench_supervisor.py [streams] [seconds] [small]
+
+small - маленькие буферы (1000 строк), чтобы сравнить накладные расходы без памяти буферов
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import fake_ffmpeg
+
+MAIN_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ff_wrapper', 'main.py')
+CLK_TCK = os.sysconf('SC_CLK_TCK')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+def _proc_stat(pid: int) -> (float, int, int):
+    # (cpu seconds, rss bytes, threads)
+    with open('/proc/{}/stat'.format(pid)) as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    cpu = (int(fields[11]) + int(fields[12])) / CLK_TCK
+    return cpu, int(fields[21]) * PAGE_SIZE, int(fields[17])
+
+
+def _start(workdir: str, env: dict, port: int, streams_config: str = None) -> subprocess.Popen:
+    env = dict(env, WORKDIR=workdir, LOGS_PATH=os.path.join(workdir, 'logs'), HTTP_PORT=str(port),
+               MANAGER_START_DELAY='1', ENCODING_CHECK_START_DELAY='1')
+    if streams_config:
+        env['STREAMS_CONFIG'] = streams_config
+    return subprocess.Popen([sys.executable, MAIN_PATH, '-i', 'bench', '-f', 'null', '-'], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def _measure(processes: list, warmup: float, seconds: float) -> dict:
+    time.sleep(warmup)
+    before = [_proc_stat(p.pid) for p in processes]
+    time.sleep(seconds)
+    after = [_proc_stat(p.pid) for p in processes]
+    return {
+        'cpu_percent': round(sum(a[0] - b[0] for a, b in zip(after, before)) / seconds * 100, 2),
+        'rss_mb': round(sum(a[1] for a in after) / 1024 / 1024, 1),
+        'threads': sum(a[2] for a in after),
+    }
+
+
+def run(mode: str, streams: int, seconds: float, env: dict, base_dir: str) -> dict:
+    workdir = os.path.join(base_dir, mode)
+    if mode == 'processes':
+        processes = [_start(os.path.join(workdir, str(i)), env, 19100 + i) for i in range(streams)]
+    else:
+        os.makedirs(workdir)
+        streams_config = os.path.join(workdir, 'streams.json')
+        with open(streams_config, 'w') as f:
+            json.dump([{'id': 's{}'.format(i), 'args': '-i bench{} -f null -'.format(i)} for i in range(streams)], f)
+        processes = [_start(workdir, env, 19000, streams_config)]
+    try:
+        result = _measure(processes, 5, seconds)
+    finally:
+        for p in processes:
+            p.terminate()
+        for p in processes:
+            p.wait()
+        subprocess.run(['pkill', '-f', os.path.abspath(fake_ffmpeg.__file__)])
+    result.update({
+        'mode': mode,
+        'streams': streams,
+        'rss_mb_per_stream': round(result['rss_mb'] / streams, 2),
+        'cpu_percent_per_stream': round(result['cpu_percent'] / streams, 3),
+        'threads_per_stream': round(result['threads'] / streams, 2),
+    })
+    return result
+
+
+if __name__ == '__main__':
+    streams = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    small = len(sys.argv) > 3 and sys.argv[3] == 'small'
+    base_dir = tempfile.mkdtemp(prefix='ffw_bench_')
+    bin_dir = os.path.join(base_dir, 'bin')
+    fake_ffmpeg.install(bin_dir)
+    env = fake_ffmpeg.env_with_fake(bin_dir, line_rate=2, progress_rate=2)
+    if small:
+        env.update(PROGRESS_BUFFER_LEN='1000', STDOUT_BUFFER_LEN='1000', STDOUT_BUFFER_ARENA_KBYTES='128')
+    try:
+        for mode in ('processes', 'supervisor'):
+            print(json.dumps(dict(run(mode, streams, seconds, env, base_dir), small_buffers=small)))
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
@@ -0,0 +1,167 @@
+#! /usr/bin/env python3
+"""
+Заглушка ffmpeg для бенчмарков: пишет строки статистики в stderr и блоки в -progress <fifo> с заданной частотой
+и умеет имитировать сбои. Устанавливается как `ffmpeg` в каталог из PATH (install), FFMpegProc._find_bin
+находит ее через shutil.which. Аргументы, кроме -progress, игнорируются, поведение задается переменными окружения
+(враппер передает свое окружение ffmpeg):
+
+    FAKE_FFMPEG_LINE_RATE      - строк stderr в секунду, по-ум. 2, 0 - без пауз
+    FAKE_FFMPEG_PROGRESS_RATE  - блоков -progress в секунду, по-ум. 2, 0 - без пауз
+    FAKE_FFMPEG_FPS            - fps и speed (fps / 25) в блоках и скорость роста frame, по-ум. 25
+    FAKE_FFMPEG_STAMP          - любое значение - дописывать в строку stderr ` ts=<unix time>` для замера задержки
+    FAKE_FFMPEG_STALL_AFTER    - через сколько секунд перестать писать, не завершаясь
+    FAKE_FFMPEG_DROP_AFTER     - через сколько секунд упасть до FAKE_FFMPEG_DROP_FPS (по-ум. 1, 0 - кадры встают)
+    FAKE_FFMPEG_CRASH_AFTER    - через сколько секунд завершиться с кодом 1
+    FAKE_FFMPEG_DURATION       - через сколько секунд завершиться с progress=end и кодом 0
+    FAKE_FFMPEG_REPORT         - файл, куда пишется json: время старта, сколько строк и блоков отправлено и время сбоя
+
+    python3 benchmarks/fake_ffmpeg.py -progress /tmp/progress.fifo -i x -f null -
+"""
+import json
+import os
+import sys
+import time
+
+STARTED = time.time()  # Время старта заглушки (для замера запуска ffmpeg враппером, bench_startup.py)
+TICK = 0.01  # seconds, шаг цикла записи
+MAX_BATCH = 10000  # Максимум строк и блоков за один шаг при частоте 0
+
+
+def install(bin_dir: str) -> str:
+    """
+    Создать bin_dir/ffmpeg, запускающий заглушку текущим интерпретатором. Возвращает путь
+    """
+    os.makedirs(bin_dir, exist_ok=True)
+    path = os.path.join(bin_dir, 'ffmpeg')
+    with open(path, 'w') as f:
+        f.write('#!/bin/sh\nexec {} {} "$@"\n'.format(sys.executable, os.path.abspath(__file__)))
+    os.chmod(path, 0o755)
+    return path
+
+
+def env_with_fake(bin_dir: str, env: dict = None, **options) -> dict:
+    """
+    Окружение враппера с заглушкой в PATH. options - параметры без префикса: line_rate=1000 -> FAKE_FFMPEG_LINE_RATE
+    """
+    env = dict(os.environ if env is None else env)
+    env['PATH'] = bin_dir + os.pathsep + env.get('PATH', '')
+    for name, value in options.items():
+        env['FAKE_FFMPEG_' + name.upper()] = str(value)
+    return env
+
+
+def _get_float(name: str, default: float = None) -> float:
+    value = os.environ.get('FAKE_FFMPEG_' + name)
+    return float(value) if value else default
+
+
+class FakeFFMpeg:
+
+    def __init__(self, progress_path: str = None):
+        self.line_rate = _get_float('LINE_RATE', 2)
+        self.progress_rate = _get_float('PROGRESS_RATE', 2)
+        self.fps = _get_float('FPS', 25)
+        self.drop_fps = _get_float('DROP_FPS', 1)
+        self.stamp = bool(os.environ.get('FAKE_FFMPEG_STAMP'))
+        self.stall_after = _get_float('STALL_AFTER')
+        self.drop_after = _get_float('DROP_AFTER')
+        self.crash_after = _get_float('CRASH_AFTER')
+        self.duration = _get_float('DURATION')
+        self.report_path = os.environ.get('FAKE_FFMPEG_REPORT')
+        # FIFO открывается на запись после того, как враппер открыл его на чтение
+        self._progress = open(progress_path, 'wb') if progress_path else None
+        self._stderr = sys.stderr.buffer
+        self.lines = 0
+        self.blocks = 0
+        self.frame = 0
+        self._frames = 0.0  # frame растет со скоростью текущего fps
+        self._frames_elapsed = 0.0
+        self.event = None
+        self.event_time = None
+
+    def _line(self, fps: float) -> bytes:
+        line = 'frame={:5d} fps={:.1f} q=28.0 size=    1024kB time=00:00:01.00 bitrate=1000.0kbits/s speed={:.2f}x'.format(
+            self.frame, fps, fps / 25)
+        if self.stamp:
+            line += ' ts={:.6f}'.format(time.time())
+        return line.encode('utf-8') + b'\n'
+
+    def _block(self, fps: float, progress: str = 'continue') -> bytes:
+        return ('frame={}\nfps={:.2f}\nstream_0_0_q=28.0\nbitrate=1000.0kbits/s\ntotal_size=1048576\n'
+                'out_time_us={}\ndup_frames=0\ndrop_frames=0\nspeed={:.3f}x\nprogress={}\n').format(
+            self.frame, fps, self.frame * 40000, fps / 25, progress).encode('utf-8')
+
+    def _due(self, rate: float, sent: int, elapsed: float) -> int:
+        if not rate:
+            return MAX_BATCH
+        return max(0, int(elapsed * rate) - sent)
+
+    def _set_event(self, event: str):
+        if self.event is None:
+            self.event = event
+            self.event_time = time.time()
+            self.report()
+
+    def report(self):
+        if not self.report_path:
+            return
+        tmp_path = self.report_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'started': STARTED, 'lines': self.lines, 'blocks': self.blocks, 'event': self.event,
+                       'event_time': self.event_time}, f)
+        os.replace(tmp_path, self.report_path)
+
+    def run(self) -> int:
+        self.report()
+        started = time.monotonic()
+        while True:
+            elapsed = time.monotonic() - started
+            if self.crash_after is not None and elapsed >= self.crash_after:
+                self._set_event('crash')
+                return 1
+            if self.duration is not None and elapsed >= self.duration:
+                if self._progress:
+                    self._progress.write(self._block(self.fps, 'end'))
+                self._set_event('end')
+                return 0
+            if self.stall_after is not None and elapsed >= self.stall_after:
+                self._set_event('stall')
+                time.sleep(TICK)
+                continue
+            fps = self.fps
+            if self.drop_after is not None and elapsed >= self.drop_after:
+                self._set_event('drop')
+                fps = self.drop_fps
+            self._write(fps, elapsed)
+            if self.line_rate and self.progress_rate:
+                time.sleep(TICK)
+
+    def _write(self, fps: float, elapsed: float):
+        self._frames += fps * (elapsed - self._frames_elapsed)
+        self._frames_elapsed = elapsed
+        self.frame = int(self._frames)
+        lines = self._due(self.line_rate, self.lines, elapsed)
+        if lines:
+            self._stderr.write(b''.join(self._line(fps) for _ in range(lines)))
+            self._stderr.flush()
+            self.lines += lines
+        blocks = self._due(self.progress_rate, self.blocks, elapsed)
+        if blocks and self._progress:
+            self._progress.write(b''.join(self._block(fps) for _ in range(blocks)))
+            self._progress.flush()
+            self.blocks += blocks
+
+
+def main(args: list) -> int:
+    progress_path = args[args.index('-progress') + 1] if '-progress' in args else None
+    fake = FakeFFMpeg(progress_path)
+    try:
+        return fake.run()
+    except (BrokenPipeError, KeyboardInterrupt):
+        return 1
+    finally:
+        fake.report()
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
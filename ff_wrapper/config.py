@@ -1,7 +1,7 @@
 import os
 import sys
 import typing
-from subprocess import Popen, PIPE
+from procstat import is_pid_alive
 
 
 class Config:
@@ -9,6 +9,11 @@ class Config:
     _first_run: bool = False
 
     def __new__(cls, *args, **kwargs):
+        if args or kwargs:
+            # Отдельный экземпляр - конфиг потока в режиме супервизора, синглтон не затрагивается
+            instance = super().__new__(cls)
+            instance._first_run = True
+            return instance
         if cls._instance is None:
             cls._instance = super().__new__(cls)
             cls._first_run = True
@@ -16,37 +21,78 @@ class Config:
             cls._first_run = False
         return cls._instance
 
-    def __init__(self, app_cfg: typing.Tuple[dict, None] = None):
+    def __init__(self, app_cfg: typing.Optional[dict] = None, stream_id: str = None):
+        """
+        app_cfg - параметры, переопределяющие переменные окружения (env потока из STREAMS_CONFIG)
+        stream_id - id потока в режиме супервизора: WORKDIR и LOGS_PATH становятся подкаталогами общих
+        """
         if not self._first_run:
             return
-        self.CONTAINER_NAME = os.getenv('CONTAINER_NAME', None)
+        self._env = dict(app_cfg or {})
+        self.STREAM_ID = stream_id
+        self.CONTAINER_NAME = self._getenv('CONTAINER_NAME', None)
         self.CONTAINER_ID = self._get_container_id()
         self.PID = str(os.getpid())
         self.FFMPEG_PID = ''
-        self.WORKDIR = os.getenv('WORKDIR', '/tmp/ff_wrapper')
+        self.WORKDIR = self._getenv('WORKDIR', '/tmp/ff_wrapper')
+        if stream_id and 'WORKDIR' not in self._env:
+            self.WORKDIR = os.path.join(self.WORKDIR, 'streams', stream_id)
         self.PROGRESS_FIFO_PATH = os.path.join(self.WORKDIR, 'pipes/')
-        self.LOGS_PATH_BASE = os.getenv('LOGS_PATH', '/var/log/ffmpeg/')
+        self.LOGS_PATH_BASE = self._getenv('LOGS_PATH', '/var/log/ffmpeg/')
         if self.CONTAINER_NAME:
             self.LOGS_PATH = os.path.join(self.LOGS_PATH_BASE, 'ff_wrapper_' + str(self.CONTAINER_NAME))
         elif self.CONTAINER_ID:
             self.LOGS_PATH = os.path.join(self.LOGS_PATH_BASE, 'ff_wrapper_' + str(self.CONTAINER_ID[:13]))
         else:
             self.LOGS_PATH = os.path.join(self.LOGS_PATH_BASE, 'ff_wrapper_' + str(self.PID))
+        if stream_id:
+            self.LOGS_PATH = os.path.join(self.LOGS_PATH, stream_id)
         self.STATUS_PATH = os.path.join(self.WORKDIR, 'status/')
-        # 100к строк ~= 14 часам логов и 120мб ram
+        self.SPILL_PATH = os.path.join(self.WORKDIR, 'spill/')
+        self.HISTORY_PATH = os.path.join(self.WORKDIR, 'history/')
+        self.BASELINES_PATH = os.path.join(self.WORKDIR, 'baselines/')
+        # 100к строк ~= 14 часам логов. progress хранится в колонках ProgressBuffer ~= 9мб ram
         self.PROGRESS_BUFFER_LEN = self._get_int_env('PROGRESS_BUFFER_LEN', 100000)
         self.STDOUT_BUFFER_LEN = self._get_int_env('STDOUT_BUFFER_LEN', 100000)
-        self.NO_FILE_LOG = os.getenv('NO_FILE_LOG', False)
-        self.LOG_ROTATION_MODE = os.getenv('LOG_ROTATION_MODE', 'days')  # days or size
+        # Размер байтовой арены под строки stdout, при нехватке места старые строки вытесняются раньше STDOUT_BUFFER_LEN
+        self.STDOUT_BUFFER_ARENA_KBYTES = self._get_int_env('STDOUT_BUFFER_ARENA_KBYTES', 16384)
+        # Любое значение - буферы stdout и progress в файлах WORKDIR/history (mmap), история прошлого запуска
+        #   доступна в /previous_run/... (см. README)
+        self.PERSISTENT_HISTORY = self._getenv('PERSISTENT_HISTORY', False)
+        # Чтение stdout и -progress: размер одного os.read и максимальный объем непрочитанных разборщиком данных
+        self.INGEST_READ_KBYTES = self._get_int_env('INGEST_READ_KBYTES', 64)
+        self.INGEST_MAX_BUFFER_KBYTES = self._get_int_env('INGEST_MAX_BUFFER_KBYTES', 16384)
+        # drop - выбрасывать самые старые данные при перегрузке, spill - дописывать их в WORKDIR/spill
+        self.INGEST_OVERLOAD_POLICY = self._getenv('INGEST_OVERLOAD_POLICY', 'drop')
+        self.NO_FILE_LOG = self._getenv('NO_FILE_LOG', False)
+        self.LOG_ROTATION_MODE = self._getenv('LOG_ROTATION_MODE', 'days')  # days or size
         self.LOG_ROTATION_DAYS = self._get_int_env('LOG_ROTATION_DAYS', 1)
         self.LOG_ROTATION_MAX_KBYTES = self._get_int_env('LOG_ROTATION_MAX_KBYTES', 25000)  # in kbytes
         self.LOG_ROTATION_BACKUP = self._get_int_env('LOG_ROTATION_BACKUP', 3)
-        self.IS_DEBUG = os.getenv('IS_DEBUG', False)
+        self.LOG_COMPRESSION = self._getenv('LOG_COMPRESSION', '')  # gzip, zstd или пусто - не сжимать
+        self.IS_DEBUG = self._getenv('IS_DEBUG', False)
+        self.NO_HTTP_SERVER = self._getenv('NO_HTTP_SERVER', False)
+        self.HTTP_HOST = self._getenv('HTTP_HOST', '0.0.0.0')
+        # Если порт занят - берется следующий свободный, итоговый порт записывается в WORKDIR/status/HTTP_PORT
+        self.HTTP_PORT = self._get_int_env('HTTP_PORT', 8080)
+        # threading - поток на запрос, HTTP/1.0; asyncio - один поток, HTTP/1.1 keep-alive
+        self.HTTP_SERVER_MODE = self._getenv('HTTP_SERVER_MODE', 'threading')
+        # Кэш готовых ответов /last_stdout и /last_progress, 0 - выключить
+        self.HTTP_RESPONSE_CACHE_KBYTES = self._get_int_env('HTTP_RESPONSE_CACHE_KBYTES', 32768)
+        # Любое значение - один поток на selectors вместо потоков чтения, записи логов и менеджера (см. README)
+        self.EVENT_LOOP = self._getenv('EVENT_LOOP', False)
+        # Любое значение - ffmpeg запускается до импорта модулей враппера, создания буферов, логгера и файлов статуса
+        #   (см. README). В режиме супервизора не используется
+        self.FAST_START = self._getenv('FAST_START', False)
+        # json файл со списком потоков - режим супервизора: все ffmpeg в одном процессе враппера
+        self.STREAMS_CONFIG = self._getenv('STREAMS_CONFIG', None)
+        # seconds, через сколько супервизор перезапускает завершившийся поток
+        self.STREAM_RESTART_DELAY = self._get_int_env('STREAM_RESTART_DELAY', 5)
         # seconds, задержка перед стартом менеджера проверок
         self.MANAGER_START_DELAY = self._get_int_env('MANAGER_START_DELAY', 5)
         # seconds, задержка перед стартом проверки кодирования
         self.ENCODING_CHECK_START_DELAY = self._get_int_env('ENCODING_CHECK_START_DELAY', 55)
-        self.ENCODING_DISABLE_CHECK = os.getenv('ENCODING_DISABLE_CHECK', False)
+        self.ENCODING_DISABLE_CHECK = self._getenv('ENCODING_DISABLE_CHECK', False)
         # Значение, ниже которого кодирование будет считаться ошибочным
         self.ENCODING_MIN_SPEED = self._get_float_env('ENCODING_MIN_SPEED', 0.80)
         # Если базовая скорость ниже, чем минимально возможная скорость - минимально возможная скорость становится равной
@@ -60,14 +106,63 @@ class Config:
         self.ENCODING_MAX_ERROR_TIME = self._get_int_env('ENCODING_MAX_ERROR_TIME', 10)
         # Сколько секунд может не обновляться stdout
         self.ENCODING_MAX_STDOUT_STUCK_TIME = self._get_int_env('ENCODING_MAX_STDOUT_STUCK_TIME', 15)
+        # Любое значение - проверять частоту кадров на разгоне (до ENCODING_CHECK_START_DELAY), см. README
+        self.ENCODING_WARMUP = self._getenv('ENCODING_WARMUP', False)
+        # Минимальный допуск вниз от ожидаемого fps на разгоне (доля), до него допуск сужается как 1/sqrt(блоков)
+        self.ENCODING_WARMUP_MIN_TOLERANCE = self._get_float_env('ENCODING_WARMUP_MIN_TOLERANCE', 0.2)
+        # Сколько блоков -progress с кадрами нужно до первого решения
+        self.ENCODING_WARMUP_MIN_SAMPLES = self._get_int_env('ENCODING_WARMUP_MIN_SAMPLES', 4)
+        # Сколько секунд частота на разгоне может быть ниже допуска до остановки стрима.
+        #   Без кадров стрим может быть ENCODING_CHECK_START_DELAY секунд с первого блока - подключение к источнику
+        self.ENCODING_WARMUP_MAX_ERROR_TIME = self._get_float_env('ENCODING_WARMUP_MAX_ERROR_TIME', 5)
+        # seconds, окно, по которому проверяются fps и speed. 0 - проверять по последнему блоку -progress
+        self.ENCODING_CHECK_WINDOW = self._get_float_env('ENCODING_CHECK_WINDOW', 0)
+        # Перцентиль fps и speed за ENCODING_CHECK_WINDOW, который сравнивается с порогами
+        self.ENCODING_CHECK_PERCENTILE = self._get_float_env('ENCODING_CHECK_PERCENTILE', 10)
+        # seconds, окна скользящей статистики fps/speed/bitrate (/stats), через запятую
+        self.STATS_WINDOWS = self._get_float_list_env('STATS_WINDOWS', '10,60,300')
+        # Любое значение - схлопывать повторы строк stdout (см. README "Схлопывание повторов stdout")
+        self.STDOUT_DEDUP = self._getenv('STDOUT_DEDUP', False)
+        # seconds, повтор строки позже - новая строка; серия повторов дольше - итог и новая серия.
+        #   Меньше ENCODING_MAX_STDOUT_STUCK_TIME, чтобы серия повторов не выглядела зависанием
+        self.STDOUT_DEDUP_WINDOW = self._get_float_env('STDOUT_DEDUP_WINDOW', 10)
+        # Сколько сигнатур строк помнить, давно не повторявшиеся вытесняются
+        self.STDOUT_DEDUP_MAX_SIGNATURES = self._get_int_env('STDOUT_DEDUP_MAX_SIGNATURES', 1000)
+        # Любое значение - вести индекс stdout по компонентам и уровням для /search_stdout, без него поиск
+        #   просматривает буфер
+        self.STDOUT_INDEX = self._getenv('STDOUT_INDEX', False)
+        # seconds, разрешения прореженных рядов -progress (/progress_series), через запятую
+        self.PROGRESS_SERIES_RESOLUTIONS = self._get_float_list_env('PROGRESS_SERIES_RESOLUTIONS', '1,10,60')
+        # Сколько интервалов хранить для каждого разрешения, 1440 - 24 минуты по 1с, 4 часа по 10с, сутки по 1мин.
+        #   ~24 байта на интервал и поле, 0 - не хранить
+        self.PROGRESS_SERIES_POINTS = self._get_int_env('PROGRESS_SERIES_POINTS', 1440)
+        # Поля -progress прореженных рядов, через запятую
+        self.PROGRESS_SERIES_FIELDS = [
+            f.strip() for f in str(self._getenv('PROGRESS_SERIES_FIELDS', 'fps,speed,bitrate')).split(',') if f.strip()]
+        # Правила здоровья потока (json или путь к json-файлу), см. README "Правила здоровья"
+        self.HEALTH_RULES = self._getenv('HEALTH_RULES', None)
+        # seconds, как часто снимать CPU/RSS/io ffmpeg из /proc (/process_stats), 0 - не снимать
+        self.PROCESS_SAMPLE_INTERVAL = self._get_float_env('PROCESS_SAMPLE_INTERVAL', 1)
+        # Сколько снимков хранить, 3600 ~= час при интервале 1с, ~250кб ram
+        self.PROCESS_SAMPLES_LEN = self._get_int_env('PROCESS_SAMPLES_LEN', 3600)
 
+        if self.FAST_START and not stream_id and not self.STREAMS_CONFIG:
+            # Остальные каталоги и файлы статуса - после запуска ffmpeg (main.py)
+            self.create_dirs(pipes_only=True)
+            self.exit_if_already_running()
+            return
         self.create_dirs()
         self.exit_if_already_running()
         self.save_status_to_files()
 
+    def _getenv(self, env_name: str, default=None):
+        if env_name in self._env:
+            return self._env[env_name]
+        return os.getenv(env_name, default)
+
     def _get_int_env(self, env_name: str, default) -> int:
         try:
-            env_var = os.getenv(env_name, default)
+            env_var = self._getenv(env_name, default)
             return int(env_var)
         except ValueError:
             print("Error. {} env parameter must be int ({})".format(env_name, env_var))
@@ -75,12 +170,20 @@ class Config:
 
     def _get_float_env(self, env_name: str, default) -> float:
         try:
-            env_var = os.getenv(env_name, default)
+            env_var = self._getenv(env_name, default)
             return float(env_var)
         except ValueError:
             print("Error. {} env parameter must be float ({})".format(env_name, env_var))
             os._exit(1)
 
+    def _get_float_list_env(self, env_name: str, default: str) -> typing.List[float]:
+        env_var = self._getenv(env_name, default)
+        try:
+            return [float(v) for v in str(env_var).split(',') if v.strip()]
+        except ValueError:
+            print("Error. {} env parameter must be comma separated floats ({})".format(env_name, env_var))
+            os._exit(1)
+
     def _get_container_id(self) -> str:
         id = ''
         with open('/proc/1/cpuset', 'r') as f:
@@ -91,38 +194,35 @@ class Config:
             id = ''
         return id
 
-    def _get_pids(self) -> list:
-        pids = []
-        process = Popen(['ps', '-eo', 'pid'], stdout=PIPE, stderr=PIPE)
-        stdout, _ = process.communicate()
-        for line in stdout.splitlines():
-            line = line.decode('utf-8')
-            pids.append(line.strip())
-        return pids
-
     def exit_if_already_running(self):
-        if self.PID == '1':
+        if self.PID == '1' or self.STREAM_ID:
+            # Потоки супервизора работают в том же процессе, WORKDIR процесса уже проверен
             return
         pid_path = os.path.join(self.STATUS_PATH, 'PID')
         if not os.path.exists:
             return
         try:
             with open(pid_path, 'r') as f:
-                already_running_pid = f.read()
-                pids = self._get_pids()
-                if self.PID != already_running_pid and already_running_pid in pids:
+                already_running_pid = f.read().strip()
+                if (self.PID != already_running_pid and already_running_pid.isdigit()
+                        and is_pid_alive(int(already_running_pid))):
                     print('WORKDIR {} is busy by process with pid {}'.format(self.WORKDIR, already_running_pid))
                     sys.exit(1)
         except OSError:
             print("PID check. Can't open file {}, creating new".format(pid_path))
 
-    def create_dirs(self):
+    def create_dirs(self, pipes_only: bool = False):
+        """
+        pipes_only - только каталог fifo, нужный для запуска ffmpeg (FAST_START)
+        """
         if not os.path.exists(self.PROGRESS_FIFO_PATH):
             try:
                 os.makedirs(self.PROGRESS_FIFO_PATH)
             except Exception as e:
                 print("Error while init app. Can't create pipes dir: {}".format(self.PROGRESS_FIFO_PATH))
                 raise e
+        if pipes_only:
+            return
         if not os.path.exists(self.STATUS_PATH):
             try:
                 os.makedirs(self.STATUS_PATH)
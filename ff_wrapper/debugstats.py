@@ -0,0 +1,117 @@
+import os
+import threading
+import time
+from metrics import Histogram
+from startup import TIMINGS
+
+
+# Границы гистограмм /debug/stats
+TIME_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)  # seconds
+READ_SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)  # bytes
+LINES_BUCKETS = (1, 10, 100, 1000, 10000, 100000)
+
+_started = time.time()
+
+
+def histogram_to_dict(histogram: Histogram) -> dict:
+    """
+    {count, sum, mean, buckets: {le: количество}} - количество по каждому интервалу, не накопленное
+    """
+    buckets = {'{:g}'.format(le): count for le, count in zip(histogram.buckets, histogram.counts)}
+    buckets['+Inf'] = histogram.counts[-1]
+    return {
+        'count': histogram.count,
+        'sum': histogram.sum,
+        'mean': histogram.sum / histogram.count if histogram.count else None,
+        'buckets': buckets,
+    }
+
+
+class StreamDebugStats:
+    """
+    Счетчики горячих путей потока, которых нет в StreamMetrics: запись файлового лога и проход менеджера.
+    Обновляются без блокировок (один писатель на поле), читаются только в /debug/stats
+    """
+
+    def __init__(self):
+        self.writer_batch_lines = Histogram(LINES_BUCKETS)  # Строк в пачке файлового лога
+        self.writer_lag_lines = Histogram(LINES_BUCKETS)  # Отставание записи от конца буфера перед пачкой
+        self.manager_tick_seconds = Histogram(TIME_BUCKETS)  # Длительность одного прохода проверок менеджера
+
+
+class RouteStats:
+    """
+    Количество запросов, ошибок (status >= 400) и время подготовки ответа по маршрутам HTTP API, одни на процесс.
+    Для follow учитывается только время до первого байта
+    """
+
+    def __init__(self):
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def observe(self, route: str, status: int, seconds: float):
+        stats = self._routes.get(route)
+        if stats is None:
+            with self._lock:
+                stats = self._routes.setdefault(route, [0, 0, Histogram(TIME_BUCKETS)])
+        stats[0] += 1
+        if status >= 400:
+            stats[1] += 1
+        stats[2].observe(seconds)
+
+    def to_dict(self) -> dict:
+        return {route: {'requests': requests, 'errors': errors, 'latency_seconds': histogram_to_dict(latency)}
+                for route, (requests, errors, latency) in sorted(self._routes.items())}
+
+
+def collect_process_debug_stats(route_stats: RouteStats) -> dict:
+    return {
+        'pid': os.getpid(),
+        'uptime_seconds': time.time() - _started,
+        'threads': threading.active_count(),
+        'startup': TIMINGS.to_dict(),  # Этапы старта: секунды от начала main.py до конца этапа и длительность
+        'http_routes': route_stats.to_dict(),
+    }
+
+
+def collect_stream_debug_stats(ffmpeg) -> dict:
+    """
+    Состояние горячих путей потока: чтение pipe, буферы, запись файлового лога, менеджер
+    """
+    debug = ffmpeg.debug_stats
+    metrics = ffmpeg.metrics
+    items = {'stdout': metrics.stdout_lines, 'progress': metrics.progress_blocks}
+    ingest = {}
+    for name, stats in ffmpeg.get_ingest_stats().items():
+        parsed = items.get(name, stats['lines'])
+        ingest[name] = dict(
+            stats,
+            read_size_bytes=histogram_to_dict(ffmpeg.get_ingest_read_sizes()[name]),
+            # Разбор, запись в буфер и метрики - в пересчете на строку stdout или блок -progress
+            parse_us_per_item=stats['parse_seconds'] / parsed * 1e6 if parsed else None,
+        )
+    buffers = {}
+    cursor = ffmpeg.get_stdout_writer_cursor()
+    for name, buf in (('stdout', ffmpeg.get_stdout_buf()), ('progress', ffmpeg.get_progress_buf())):
+        position, first = buf.get_current_position(), buf.get_first_position()
+        buffers[name] = {
+            'appended': position,
+            'stored': position - first,
+            'evicted': first,
+            # Вытеснено до записи в файловый лог (пишется только stdout)
+            'lost_before_persisted': cursor.lost if name == 'stdout' and cursor is not None else None,
+        }
+    log_file = ffmpeg.get_stdout_log_file()
+    return {
+        'ingest': ingest,
+        'buffers': buffers,
+        'log_writer': {
+            'batch_lines': histogram_to_dict(debug.writer_batch_lines),
+            'lag_lines': histogram_to_dict(debug.writer_lag_lines),
+            'backlog_lines': cursor.pending() if cursor is not None else None,
+            'file': dict(log_file.stats) if log_file is not None else None,
+        },
+        'manager': {
+            'tick_seconds': histogram_to_dict(debug.manager_tick_seconds),
+        },
+    }
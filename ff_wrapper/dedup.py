@@ -0,0 +1,109 @@
+import collections
+import datetime
+import re
+import typing
+
+
+# Изменчивые части строки: адреса ([h264 @ 0x55d0c6a3c240]) заменяются на #, цифры (MB 12 34, DTS 1234)
+#   удаляются - translate в разы дешевле регулярного выражения на каждую строку
+ADDRESS_RE = re.compile(rb'0x[0-9a-fA-F]+')
+DIGITS = b'0123456789'
+SIGNATURE_LEN = 256  # Сколько байт строки входит в сигнатуру
+# Строки статистики ffmpeg не схлопываются: по ним видно, что кодирование идет
+STATUS_PREFIXES = (b'frame=', b'size=')
+
+
+class _Repeat:
+    __slots__ = ('line', 'first', 'last', 'count')
+
+    def __init__(self, line: bytes, wall_time: float):
+        self.line = line  # Первая строка серии, попала в буфер как есть
+        self.first = wall_time
+        self.last = wall_time
+        self.count = 0  # Сколько повторов схлопнуто
+
+
+def _format_time(wall_time: float) -> str:
+    return datetime.datetime.fromtimestamp(wall_time).strftime('%H:%M:%S.%f')[:-3]
+
+
+class StdoutDedup:
+    """
+    Схлопывание повторов строк stdout (STDOUT_DEDUP) до записи в буфер: строки с одинаковой сигнатурой
+    (без адресов и цифр) в пределах window секунд от предыдущего повтора не попадают в буфер,
+    вместо них - одна строка-итог с количеством и временем первого и последнего повтора.
+    Итог пишется, когда повторы прекратились на window секунд, сигнатура вытеснена из таблицы
+    или серия длится дольше window (тогда следующий повтор снова попадает в буфер как есть) -
+    хотя бы одна строка за window секунд, проверка зависания stdout не срабатывает на серии повторов.
+    Таблица сигнатур - LRU не больше max_signatures, O(1) на строку.
+    Вызывается только потоком разбора stdout (и stop после его остановки)
+    """
+
+    def __init__(self, window: float, max_signatures: int):
+        self.window = window
+        self.max_signatures = max_signatures
+        self._table = collections.OrderedDict()  # сигнатура -> _Repeat, с начала - давно не повторявшиеся
+        self.suppressed = 0  # Сколько строк не попало в буфер
+        self.evicted = 0  # Сколько сигнатур вытеснено из таблицы (max_signatures)
+
+    def process(self, lines: typing.List[bytes], wall_time: float) -> typing.List[bytes]:
+        """
+        Строки для буфера: новые строки и итоги законченных серий
+        """
+        result = []
+        table = self._table
+        self._expire(wall_time, result)
+        for line in lines:
+            if not line or line.startswith(STATUS_PREFIXES):
+                result.append(line)
+                continue
+            signature = line[:SIGNATURE_LEN]
+            if b'0x' in signature:
+                signature = ADDRESS_RE.sub(b'#', signature)
+            signature = signature.translate(None, DIGITS)
+            repeat = table.get(signature)
+            if repeat is not None:
+                table.move_to_end(signature)
+                if wall_time - repeat.first < self.window:
+                    repeat.count += 1
+                    repeat.last = wall_time
+                    self.suppressed += 1
+                    continue
+                # Серия дольше window: итог и новая серия с этой строки
+                if repeat.count:
+                    result.append(self._summary(repeat))
+                repeat.line, repeat.first, repeat.last, repeat.count = line, wall_time, wall_time, 0
+                result.append(line)
+                continue
+            table[signature] = _Repeat(line, wall_time)
+            if len(table) > self.max_signatures:
+                _, evicted = table.popitem(last=False)
+                self.evicted += 1
+                if evicted.count:
+                    result.append(self._summary(evicted))
+            result.append(line)
+        return result
+
+    def _expire(self, wall_time: float, result: list):
+        # В начале таблицы - сигнатуры с самым старым последним повтором
+        table = self._table
+        border = wall_time - self.window
+        while table:
+            signature, repeat = next(iter(table.items()))
+            if repeat.last > border:
+                break
+            del table[signature]
+            if repeat.count:
+                result.append(self._summary(repeat))
+
+    def flush(self) -> typing.List[bytes]:
+        """
+        Итоги всех незаконченных серий (остановка ffmpeg)
+        """
+        result = [self._summary(repeat) for repeat in self._table.values() if repeat.count]
+        self._table.clear()
+        return result
+
+    def _summary(self, repeat: _Repeat) -> bytes:
+        return 'ff_wrapper: repeated {} times ({} - {}): '.format(
+            repeat.count, _format_time(repeat.first), _format_time(repeat.last)).encode('utf-8') + repeat.line
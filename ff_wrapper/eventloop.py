@@ -0,0 +1,244 @@
+import collections
+import heapq
+import itertools
+import logging
+import os
+import selectors
+import signal
+import subprocess
+import threading
+import time
+import typing
+from ingest import PipeIngest
+
+
+class Timer:
+
+    __slots__ = ('deadline', 'interval', 'callback', 'cancelled')
+
+    def __init__(self, deadline: float, interval: typing.Optional[float], callback: typing.Callable):
+        self.deadline = deadline
+        self.interval = interval
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class EventLoop:
+    """
+    Однопоточный цикл на selectors (EVENT_LOOP): stdout и -progress ffmpeg в неблокирующем режиме читаются
+    и разбираются в этом же потоке (интерфейс IngestHub: add/remove/notify), проверки менеджера и запись
+    файловых логов идут по таймерам и по приходу данных, завершение ffmpeg замечается сразу через pidfd
+    (или SIGCHLD). Без данных и таймеров поток спит в select и не просыпается.
+
+    Методы вызываются из потока цикла или до его запуска. Из других потоков - stop, call_soon_threadsafe,
+    а также remove и notify (PipeIngest.stop), которые сами передаются в поток цикла
+    """
+
+    PROCESS_POLL_INTERVAL = 1  # seconds, проверка завершения процессов, если нет ни pidfd, ни SIGCHLD
+
+    def __init__(self, logger: logging.Logger):
+        self._logger = logger
+        self._selector = selectors.DefaultSelector()
+        self._timers = []  # heap (deadline, seq, Timer)
+        self._seq = itertools.count()
+        self._ready = collections.OrderedDict()  # PipeIngest с данными для разбора
+        self._soon = collections.OrderedDict()  # callback -> None, вызываются после обработки событий
+        self._polled_processes = {}  # pid -> (Popen, callback), если pidfd недоступен
+        self._process_poll_timer = None
+        self._sigchld = False
+        self._finish = False
+        self._thread = None
+        self._thread_ident = None  # поток, в котором выполняется run
+        self._threadsafe = collections.deque()  # callbacks из других потоков
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        os.set_blocking(self._wakeup_r, False)
+        os.set_blocking(self._wakeup_w, False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ, self._on_wakeup)
+
+    # Интерфейс IngestHub
+
+    def start(self):
+        """
+        Запустить цикл в отдельном потоке (режим супервизора). В одиночном режиме - run() в главном потоке
+        """
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Остановить цикл, можно вызывать из любого потока
+        """
+        self._finish = True
+        self._wakeup()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def add(self, ingest: PipeIngest):
+        os.set_blocking(ingest.fd, False)
+        ingest._hub = self
+        self._selector.register(ingest.fd, selectors.EVENT_READ, ingest)
+
+    def remove(self, ingest: PipeIngest):
+        if self._is_foreign_thread():
+            self.call_soon_threadsafe(lambda: self.remove(ingest))
+            return
+        key = self._selector.get_map().get(ingest.fd)
+        if key is not None and key.data is ingest:
+            self._selector.unregister(ingest.fd)
+
+    def notify(self, ingest: PipeIngest):
+        if self._is_foreign_thread():
+            self.call_soon_threadsafe(lambda: self.notify(ingest))
+            return
+        self._ready[ingest] = None
+
+    # Таймеры и обработчики
+
+    def call_later(self, delay: float, callback: typing.Callable) -> Timer:
+        return self._add_timer(Timer(time.monotonic() + delay, None, callback))
+
+    def call_every(self, interval: float, callback: typing.Callable) -> Timer:
+        return self._add_timer(Timer(time.monotonic() + interval, interval, callback))
+
+    def _add_timer(self, timer: Timer) -> Timer:
+        heapq.heappush(self._timers, (timer.deadline, next(self._seq), timer))
+        return timer
+
+    def call_soon(self, callback: typing.Callable):
+        """
+        Вызвать после обработки текущих событий. Повторные вызовы с тем же callback до его выполнения схлопываются
+        """
+        self._soon[callback] = None
+
+    def call_soon_threadsafe(self, callback: typing.Callable):
+        self._threadsafe.append(callback)
+        self._wakeup()
+
+    def _is_foreign_thread(self) -> bool:
+        return self._thread_ident is not None and self._thread_ident != threading.get_ident()
+
+    def add_reader(self, fd: int, callback: typing.Callable):
+        self._selector.register(fd, selectors.EVENT_READ, callback)
+
+    def remove_reader(self, fd: int):
+        if fd in self._selector.get_map():
+            self._selector.unregister(fd)
+
+    def watch_process(self, process: subprocess.Popen, callback: typing.Callable):
+        """
+        callback(process) после завершения процесса: через pidfd (linux 5.3+, python 3.9+) без задержки,
+        иначе по SIGCHLD (если цикл создан в главном потоке) или проверкой раз в PROCESS_POLL_INTERVAL
+        """
+        pidfd_open = getattr(os, 'pidfd_open', None)
+        if pidfd_open is not None:
+            try:
+                pidfd = pidfd_open(process.pid)
+            except OSError:
+                pass
+            else:
+                def on_exit():
+                    self._selector.unregister(pidfd)
+                    os.close(pidfd)
+                    process.poll()
+                    callback(process)
+                self._selector.register(pidfd, selectors.EVENT_READ, on_exit)
+                return
+        self._polled_processes[process.pid] = (process, callback)
+        if not self._sigchld and threading.current_thread() is threading.main_thread():
+            try:
+                signal.set_wakeup_fd(self._wakeup_w)
+                signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+                self._sigchld = True
+            except (ValueError, OSError):
+                pass
+        if self._process_poll_timer is None:
+            # Страховка: SIGCHLD мог прийти до установки обработчика
+            self._process_poll_timer = self.call_every(self.PROCESS_POLL_INTERVAL, self._poll_processes)
+
+    def _poll_processes(self):
+        for pid, (process, callback) in list(self._polled_processes.items()):
+            if process.poll() is not None:
+                del self._polled_processes[pid]
+                callback(process)
+
+    def _wakeup(self):
+        try:
+            os.write(self._wakeup_w, b'\0')
+        except (BlockingIOError, OSError):
+            pass
+
+    def _on_wakeup(self):
+        try:
+            while os.read(self._wakeup_r, 4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+        while self._threadsafe:
+            self.call_soon(self._threadsafe.popleft())
+        if self._polled_processes:
+            self._poll_processes()
+
+    # Цикл
+
+    def run(self, until: typing.Callable[[], bool] = None):
+        """
+        until - проверяется после каждой итерации, True - выйти из цикла
+        """
+        self._thread_ident = threading.get_ident()
+        try:
+            while not self._finish:
+                self._run_once()
+                if until is not None and until():
+                    break
+        finally:
+            self._thread_ident = None
+
+    def _run_once(self):
+        timeout = None
+        if self._ready or self._soon:
+            timeout = 0
+        elif self._timers:
+            timeout = max(0, self._timers[0][0] - time.monotonic())
+        selector = self._selector
+        for key, _ in selector.select(timeout):
+            if selector.get_map().get(key.fd) is not key:
+                # fd удален обработчиком предыдущего события
+                continue
+            data = key.data
+            if isinstance(data, PipeIngest):
+                if data._finish or not data._read_once():
+                    selector.unregister(key.fd)
+                    data._set_eof()
+            else:
+                self._call(data)
+        while self._ready:
+            ingest, _ = self._ready.popitem(last=False)
+            try:
+                if not ingest._parse_step(wait=False):
+                    ingest._parse_done()
+            except Exception as e:
+                self._logger.error('{} ingest: parse error: {}'.format(ingest.name, e))
+        while self._soon:
+            callback, _ = self._soon.popitem(last=False)
+            self._call(callback)
+        now = time.monotonic()
+        while self._timers and self._timers[0][0] <= now:
+            _, _, timer = heapq.heappop(self._timers)
+            if timer.cancelled:
+                continue
+            if timer.interval is not None:
+                # Следующий запуск - по расписанию, при отставании больше интервала - от текущего времени
+                timer.deadline += timer.interval
+                if timer.deadline <= now:
+                    timer.deadline = now + timer.interval
+                self._add_timer(timer)
+            self._call(timer.callback)
+
+    def _call(self, callback: typing.Callable):
+        try:
+            callback()
+        except Exception as e:
+            self._logger.error('Event loop callback error: {}'.format(e))
@@ -1,38 +1,130 @@
 import subprocess
-import shutil
 import os
 import threading
+import time
 import datetime
 import logging
-import time
 import signal
 import re
 import typing
-from logbuffer import LogBuffer
-from logger import Logger, get_file_logger_handler
+from progress import ProgressParser
+from progressbuffer import ProgressBuffer
+from stdoutbuffer import StdoutBuffer
+from stdoutindex import StdoutIndex
+from history import (KIND_PROGRESS, KIND_STDOUT, CURRENT_SUFFIX, PreviousRun, create_progress_buffer,
+                     create_stdout_buffer, rotate_previous)
+from ingest import PipeIngest, IngestHub
+from logger import Logger
+from logfile import LogFile
+from render import TimestampFormatter, RENDER_TEXT, render_line
 from config import Config
+from metrics import StreamMetrics
+from debugstats import StreamDebugStats
+from dedup import StdoutDedup
+from rules import RuleEngine, load_rules
+from series import ProgressSeries
+from stats import EncodingStats
+from procstat import ProcSamples, read_proc_state
+from startup import Spawned, add_progress_to_cmd, create_progress_fifo, find_ffmpeg_bin
+
+
+_rollover_log_files = []  # Файловые логи stdout всех потоков процесса, ротируются по SIGHUP
+
+
+def _sighup_handler(signum, frame):
+    # Сама ротация - в потоке записи перед следующей пачкой строк
+    for log_file in list(_rollover_log_files):
+        log_file.request_rollover()
+
+
+def _register_rollover_log_file(log_file: LogFile):
+    if not _rollover_log_files:
+        try:
+            signal.signal(signal.SIGHUP, _sighup_handler)
+        except ValueError:
+            # Не главный поток (перезапуск потока супервизором) - обработчик уже установлен при первом запуске
+            pass
+    _rollover_log_files.append(log_file)
 
 
 class FFMpegProc:
 
-    def __init__(self, args: str):
+    STDOUT_WRITER_BATCH = 1000  # Максимум строк, записываемых в файл за одно чтение буфера
+    STDOUT_WRITER_TIMEOUT = 0.5  # Сколько ждать новых строк перед проверкой self.finish
+
+    def __init__(self, args: str, cfg: Config = None, logger: logging.Logger = None, io_hub: IngestHub = None,
+                 metrics: StreamMetrics = None, rotate_history: bool = True):
+        """
+        cfg, logger - конфиг и логгер потока (режим супервизора), по умолчанию - синглтоны процесса
+        io_hub - читать stdout и progress в общих потоках, файловый лог пишется через write_stdout_logs
+        metrics - метрики /metrics, переживающие перезапуск ffmpeg (режим супервизора), по умолчанию - свои
+        rotate_history - сделать файлы истории текущего запуска файлами прошлого (PERSISTENT_HISTORY).
+            False - перезапуск потока супервизором: прошлым остается запуск до старта враппера
+        """
         self.args = args
         self.first_fps_value = self._get_first_fps_value()
-        self.cfg = Config()
+        self.cfg = cfg or Config()
+        self._io_hub = io_hub
         self.bin = self._find_bin()
         self._progress_fifo_path = None  # setted in self._create_fifo
-        self._progress_logs_buf = LogBuffer(self.cfg.PROGRESS_BUFFER_LEN)  # (datetime.now, str)
+        self._logger = logger or Logger('FFmpegProc')
+        self._previous_run = None  # История прошлого запуска (PERSISTENT_HISTORY)
+        self._progress_logs_buf = None  # (datetime.now, str)
+        self._stdout_logsbuf = None
+        if self.cfg.PERSISTENT_HISTORY:
+            self._create_history_buffers(rotate_history)
+        if self._progress_logs_buf is None:
+            self._progress_logs_buf = ProgressBuffer(self.cfg.PROGRESS_BUFFER_LEN)
+            self._stdout_logsbuf = StdoutBuffer(self.cfg.STDOUT_BUFFER_LEN, self.cfg.STDOUT_BUFFER_ARENA_KBYTES * 1024)
+        if self.cfg.STDOUT_INDEX:
+            self._stdout_logsbuf.index = StdoutIndex(self._stdout_logsbuf.max)
         self._progressbuf_thread_object = None
-        self._stdoutbuf_thread_object = None
+        self._progress_ingest = None  # setted in _progress_start_piperead
+        self._progress_parser = ProgressParser()
+        self._progress_fifo_fds = []  # fd fifo, открытые самим враппером (режим io_hub)
+        self._stdout_ingest = None  # setted in _stdout_start_piperead_thread
+        self._stdout_dedup = None  # Схлопывание повторов строк stdout (STDOUT_DEDUP)
+        if self.cfg.STDOUT_DEDUP:
+            self._stdout_dedup = StdoutDedup(self.cfg.STDOUT_DEDUP_WINDOW, self.cfg.STDOUT_DEDUP_MAX_SIGNATURES)
         self._stdout_logs_writer_thread_object = None
-        self._stdout_logs_writer_logger = None  # setted in _stdout_filelog_start_writer
-        self._stdout_logsbuf = LogBuffer(self.cfg.STDOUT_BUFFER_LEN)  # (datetime.now, str)
+        self._stdout_log_file = None  # setted in _stdout_filelog_start_writer_thread
+        self._stdout_log_timestamps = TimestampFormatter()
+        self._stdout_writer_cursor = None  # Курсор файлового лога, setted in _stdout_filelog_start_writer_thread
         self.start_time = None  # setted in self.run
-        self.progress_last_state = {}  # Last string from progress
-        self._logger = Logger('FFmpegProc')
+        self.progress_last_state = None  # Last ProgressRecord from progress
+        self.metrics = metrics or StreamMetrics()
+        self.debug_stats = StreamDebugStats()  # /debug/stats: запись файлового лога, проход менеджера
+        # Скользящая статистика текущего запуска ffmpeg: окна /stats и окно проверки менеджера
+        windows = list(self.cfg.STATS_WINDOWS)
+        if self.cfg.ENCODING_CHECK_WINDOW > 0:
+            windows.append(self.cfg.ENCODING_CHECK_WINDOW)
+        self.stats = EncodingStats(windows)
+        self.series = self._create_series()  # Прореженные ряды полей -progress (/progress_series)
+        self.rules = self._create_rules()  # Правила здоровья (HEALTH_RULES), вычисляются по приходу данных
+        self.process_samples = ProcSamples(self.cfg.PROCESS_SAMPLES_LEN)  # Снимки /proc процесса ffmpeg
+        # Вызываются после разбора пачки блоков -progress / строк stdout (EVENT_LOOP: проверки и запись логов
+        #   по приходу данных). Вызываются в потоке разбора
+        self.on_progress = None
+        self.on_stdout = None
         self._finish = False
         self.process = None
 
+    def _create_series(self) -> ProgressSeries:
+        cfg = self.cfg
+        try:
+            return ProgressSeries(cfg.PROGRESS_SERIES_RESOLUTIONS, cfg.PROGRESS_SERIES_POINTS, cfg.PROGRESS_SERIES_FIELDS)
+        except ValueError as e:
+            self._logger.error('Progress series are disabled: {}'.format(e))
+            return ProgressSeries((), 0, ())
+
+    def _create_rules(self) -> RuleEngine:
+        try:
+            rules = load_rules(self.cfg.HEALTH_RULES)
+        except ValueError as e:
+            self._logger.error('Health rules are disabled: {}'.format(e))
+            rules = []
+        return RuleEngine(rules, self._logger)
+
     @property
     def finish(self):
         return self._finish
@@ -40,8 +132,8 @@ class FFMpegProc:
     def _join_threads(self):
         if self._progressbuf_thread_object:
             self._progressbuf_thread_object.join()
-        if self._stdoutbuf_thread_object:
-            self._stdoutbuf_thread_object.join()
+        if self._stdout_ingest:
+            self._stdout_ingest.join()
         if self._stdout_logs_writer_thread_object: 
             self._stdout_logs_writer_thread_object.join()
 
@@ -51,70 +143,192 @@ class FFMpegProc:
     def get_stdout_buf(self):
         return self._stdout_logsbuf
 
+    def update_stdout_index(self):
+        # Индексация новых строк stdout (STDOUT_INDEX), вызывается проходом менеджера
+        index = self._stdout_logsbuf.index
+        if index is not None:
+            index.catch_up(self._stdout_logsbuf)
+
+    def _create_history_buffers(self, rotate: bool):
+        # Файлы прошлого запуска (<name>.ring) переименовываются в <name>.prev.ring, текущий пишет в новые
+        path = self.cfg.HISTORY_PATH
+        info = {'args': self.args, 'pid': os.getpid(), 'stream_id': self.cfg.STREAM_ID}
+        try:
+            os.makedirs(path, exist_ok=True)
+            if rotate:
+                rotate_previous(path, (KIND_STDOUT, KIND_PROGRESS))
+            self._previous_run = PreviousRun(path, self._logger)
+            self._stdout_logsbuf = create_stdout_buffer(
+                os.path.join(path, KIND_STDOUT + CURRENT_SUFFIX),
+                self.cfg.STDOUT_BUFFER_LEN, self.cfg.STDOUT_BUFFER_ARENA_KBYTES * 1024, info)
+            self._progress_logs_buf = create_progress_buffer(
+                os.path.join(path, KIND_PROGRESS + CURRENT_SUFFIX),
+                self.cfg.PROGRESS_BUFFER_LEN, info)
+        except (OSError, ValueError) as e:
+            self._logger.error('Persistent history error, using memory buffers: {}'.format(e))
+            self._stdout_logsbuf = self._progress_logs_buf = None
+
+    def get_previous_run(self) -> typing.Optional[PreviousRun]:
+        return self._previous_run
+
+    def get_stdout_writer_cursor(self):
+        return self._stdout_writer_cursor
+
+    def get_stdout_log_file(self) -> typing.Optional[LogFile]:
+        return self._stdout_log_file
+
     def stop(self):
         self._finish = True
+        self._stdout_logsbuf.wakeup()
+        self._progress_logs_buf.wakeup()
+        for ingest in (self._progress_ingest, self._stdout_ingest):
+            if ingest:
+                ingest.stop()
         if self.process:
             self.process.kill()
             self.process.wait()
+        self._unblock_progress_fifo()
         self._join_threads()
+        for fd in self._progress_fifo_fds:
+            os.close(fd)
+        self._progress_fifo_fds = []
+        self._stdout_dedup_flush()
+        if self._stdout_log_file:
+            log_file = self._stdout_log_file
+            self._stdout_log_file = None
+            if log_file in _rollover_log_files:
+                _rollover_log_files.remove(log_file)
+            log_file.close()
+        # Файлы истории (PERSISTENT_HISTORY): супервизор создает FFMpegProc на каждый перезапуск
+        self._stdout_logsbuf.close_storage()
+        self._progress_logs_buf.close_storage()
+        if self._previous_run is not None:
+            self._previous_run.close()
+
+    def _stdout_dedup_flush(self):
+        # Итоги незаконченных серий повторов - в буфер и файловый лог, поток записи уже остановлен
+        summaries = self._stdout_dedup.flush() if self._stdout_dedup else None
+        if not summaries:
+            return
+        for line in summaries:
+            self._stdout_logsbuf.append_line(line, time.time())
+        cursor = self._stdout_writer_cursor
+        if self._stdout_log_file and cursor is not None:
+            while self._stdout_filelog_write(self._stdout_log_file, cursor) == self.STDOUT_WRITER_BATCH:
+                pass
+
+    def get_stdout_dedup(self) -> typing.Optional[StdoutDedup]:
+        return self._stdout_dedup
+
+    def _unblock_progress_fifo(self):
+        # Если ffmpeg так и не открыл fifo, поток чтения progress висит в open - открываем fifo на запись сами
+        if self._progress_ingest or not self._progress_fifo_path:
+            return
+        try:
+            fd = os.open(self._progress_fifo_path, os.O_WRONLY | os.O_NONBLOCK)
+            os.close(fd)
+        except OSError:
+            pass
 
     def _find_bin(self):
-        return shutil.which('ffmpeg')
+        return find_ffmpeg_bin()
 
     def _progress_start_piperead_thread(self, fifo_path: str):
+        if self._io_hub:
+            self._progress_start_piperead_hub(fifo_path)
+            return
         t = threading.Thread(target=self._progress_start_piperead, args=(fifo_path,), daemon=True)
         self._progressbuf_thread_object = t
         t.start()
         self._logger.info('FFMpeg progress thread started')
 
-    def _parse_progress_line_to_dict(self, line) -> dict:
-        dct = {}
-        if not line:
-            return dct
-        line = line.split(' ')
-        for el in line:
-            k, v = el.split('=')
-            dct[k] = v
-        dct['_time'] = datetime.datetime.now()
-        return dct
+    def _create_ingest(self, name: str, fd: int, on_lines, on_overload=None, on_data=None) -> PipeIngest:
+        spill_path = os.path.join(self.cfg.SPILL_PATH, '{}_{}.spill'.format(os.getpid(), name))
+        return PipeIngest(name, fd, on_lines, self._logger,
+                          read_size=self.cfg.INGEST_READ_KBYTES * 1024,
+                          max_buffered=self.cfg.INGEST_MAX_BUFFER_KBYTES * 1024,
+                          overload_policy=self.cfg.INGEST_OVERLOAD_POLICY,
+                          spill_path=spill_path,
+                          on_overload=on_overload,
+                          on_data=on_data)
+
+    def get_ingest_stats(self) -> dict:
+        stats = {}
+        for ingest in (self._progress_ingest, self._stdout_ingest):
+            if ingest:
+                stats[ingest.name] = dict(ingest.stats, buffered_bytes=ingest.get_buffered_bytes())
+        return stats
+
+    def get_ingest_read_sizes(self) -> dict:
+        return {ingest.name: ingest.read_sizes for ingest in (self._progress_ingest, self._stdout_ingest) if ingest}
 
     def _progress_start_piperead(self, fifo_path: str):
-        # В PIPE progress пишется последовательно по 12 элементов, после чего они повторяются
-        t = self._progressbuf_thread_object
-        with open(fifo_path, 'r') as fifo:
-            buffer = [None] * 30
-            n = 0
-            for line in fifo:
-                if self.finish:
-                    self._logger.info('FFMpeg progress thread stopped')
-                    break
-                if 'progress' not in line:
-                    # Вырезаем последний символ перевода строки через [:-1]
-                    buffer[n] = line[:-1].replace(' ', '')
-                    n += 1
-                else:
-                    buffer[n] = line[:-1].replace(' ', '')
-                    line = ' '.join([x for x in buffer if x])
-                    self._progress_logs_buf.append((datetime.datetime.now(), line))
-                    self.progress_last_state = self._parse_progress_line_to_dict(line)
-                    n = 0
+        # Открытие fifo блокируется, пока ffmpeg не откроет его на запись
+        try:
+            fd = os.open(fifo_path, os.O_RDONLY)
+        except OSError as e:
+            self._logger.error("Progress reader failed, can't open {}: {}".format(fifo_path, e))
+            return
+        ingest = self._create_ingest('progress', fd, None, self._progress_on_overload, self._progress_on_data)
+        self._progress_ingest = ingest
+        ingest.run()
+        os.close(fd)
+        self._logger.info('FFMpeg progress thread stopped')
 
-    def _stdout_start_piperead_thread(self, process: subprocess.Popen):
-        t = threading.Thread(target=self._stdout_start_piperead, args=(process,), daemon=True)
-        self._stdoutbuf_thread_object = t
-        t.start()
-        self._logger.info('FFMpeg stdout thread started')
+    def _progress_start_piperead_hub(self, fifo_path: str):
+        # Неблокирующее открытие не ждет ffmpeg. Свой конец на запись держит fifo открытым:
+        #   без писателя чтение сразу возвращало бы EOF. Чтение заканчивается в stop
+        fd = os.open(fifo_path, os.O_RDONLY | os.O_NONBLOCK)
+        self._progress_fifo_fds += [fd, os.open(fifo_path, os.O_WRONLY | os.O_NONBLOCK)]
+        ingest = self._create_ingest('progress', fd, None, self._progress_on_overload, self._progress_on_data)
+        self._progress_ingest = ingest
+        ingest.start(self._io_hub)
+        self._logger.info('FFMpeg progress reader started')
 
-    def _stdout_start_piperead(self, process: subprocess.Popen):
-        t = self._stdoutbuf_thread_object
+    def _progress_on_data(self, data: typing.Optional[bytes], wall_time: float):
+        # Байты из fifo как прочитаны, блоки key=value собирает ProgressParser. data=None - конец данных
+        parser = self._progress_parser
+        records = parser.feed(data, wall_time) if data is not None else parser.flush(wall_time)
+        if not records:
+            return
+        for record in records:
+            self._progress_logs_buf.append_record(record)
+            self.metrics.observe_progress(record)
+            self.stats.observe_progress(record)
+            self.series.observe_progress(record)
+            self.rules.observe_progress(record)
+        self.progress_last_state = records[-1]
+        if self.on_progress:
+            self.on_progress()
+
+    def _progress_on_overload(self, dropped: int):
+        self._progress_parser.reset()
+
+    def _stdout_start_piperead_thread(self, process: subprocess.Popen):
         if not process:
             self._logger.error("Stdout reader failed, no ffmpeg process")
             return
-        for line in process.stdout:
-            if self.finish:
-                self._logger.info('FFMpeg stdout thread stopped')
-                break
-            self._stdout_logsbuf.append((datetime.datetime.now(), line.strip()))
+        ingest = self._create_ingest('stdout', process.stdout.fileno(), self._stdout_on_lines, self._stdout_on_overload)
+        self._stdout_ingest = ingest
+        ingest.start(self._io_hub)
+        self._logger.info('FFMpeg stdout thread started')
+
+    def _stdout_on_lines(self, lines, wall_time: float):
+        append_line = self._stdout_logsbuf.append_line
+        if self._stdout_dedup is None:
+            for line in lines:
+                append_line(line.strip(), wall_time)
+        else:
+            for line in self._stdout_dedup.process([line.strip() for line in lines], wall_time):
+                append_line(line, wall_time)
+        self.metrics.observe_stdout_lines(len(lines))
+        self.rules.observe_stdout(lines, wall_time)
+        if self.on_stdout:
+            self.on_stdout()
+
+    def _stdout_on_overload(self, dropped_bytes: int):
+        self._stdout_logsbuf.append_line(
+            'ff_wrapper: stdout reader overloaded, {} bytes dropped'.format(dropped_bytes).encode('utf-8'))
 
     def get_stream_id(self):
         id_str = ''
@@ -137,65 +351,62 @@ class FFMpegProc:
         start_time = self.start_time.strftime('%Y_%m_%d__%H_%M_%S')
         log_path = os.path.join(self.cfg.LOGS_PATH, 'ffmpeg_{}.log'.format(start_time))
         self._logger.info('Logs - {}'.format(self.cfg.LOGS_PATH))
-        logger = logging.getLogger("FFMpeg stdout")
-        self._stdout_logs_writer_logger = logger
-        logger.setLevel(logging.INFO)
         try:
-            def handler_namer(filename):
-                log_directory = os.path.split(filename)[0]
-                filename = filename.split('/')[-1]
-                filename = filename[:filename.find('.log')]
-                filename = os.path.join(log_directory, filename)
-                if not os.path.exists('{}.log'.format(filename)):
-                    return '{}.log'.format(filename)
-                index = 0
-                f = '{}.log.{}'.format(filename, index)
-                while os.path.exists(f):
-                    index += 1
-                    f = '{}.log.{}'.format(filename, index)
-                return f
-            handler = get_file_logger_handler(log_path)
-            handler.namer = handler_namer
+            log_file = LogFile(log_path, self.cfg, self._logger)
         except PermissionError as e:
             self._logger.error('PermissionError:  Permission denied: {}'.format(log_path))
             raise e
-        formatter = logging.Formatter('%(message)s')
-        handler.setFormatter(formatter)
-        logger.addHandler(handler)
-        t = threading.Thread(target=self._stdout_filelog_start_writer, args=(logger,), daemon=True)
+        self._stdout_log_file = log_file
+        _register_rollover_log_file(log_file)
+        self._stdout_writer_cursor = self.get_stdout_buf().cursor(0)
+        if self._io_hub:
+            # Строки пишет общий поток супервизора через write_stdout_logs
+            return
+        t = threading.Thread(target=self._stdout_filelog_start_writer, args=(log_file, self._stdout_writer_cursor),
+                             daemon=True)
         self._stdout_logs_writer_thread_object = t
-
-        def sighup_handler(signum, frame):
-            handler.doRollover()
-
-        signal.signal(signal.SIGHUP, sighup_handler)
         self._logger.info('FFMpeg logs writer thread started')
         t.start()
 
-    def _stdout_filelog_start_writer(self, logger: logging.Logger):
-        t = self._stdout_logs_writer_thread_object
-        stdout_buf = self.get_stdout_buf()
-        last_position = 0
+    def _stdout_filelog_start_writer(self, log_file: LogFile, cursor):
         while True:
             if self.finish:
                 self._logger.info('FFMpeg logs writer thread stopped')
                 break
-            current_position = stdout_buf.get_current_position()
-            objs, last_position = stdout_buf.get_last_items(current_position - last_position)
-            if objs and len(objs[0]) == 2:
-                for dt, line in objs:
-                    logger.info('<{}> {}'.format(dt.strftime('%Y-%m-%d %H:%M:%S'), line))
-            time.sleep(0.5)
+            self._stdout_filelog_write(log_file, cursor, self.STDOUT_WRITER_TIMEOUT)
+
+    def _stdout_filelog_write(self, log_file: LogFile, cursor, timeout: float = None) -> int:
+        # Строки отрисовываются через кэш буфера (те же, что в /last_stdout) и пишутся одной пачкой
+        lines, lost = cursor.render(self.STDOUT_WRITER_BATCH, timeout=timeout)
+        count = len(lines)
+        if count:
+            debug_stats = self.debug_stats
+            debug_stats.writer_batch_lines.observe(count)
+            debug_stats.writer_lag_lines.observe(count + cursor.pending())
+        if lost:
+            lines.insert(0, render_line(self._stdout_log_timestamps, time.time(),
+                                        'ff_wrapper: {} lines were overwritten in buffer before written to log'.format(
+                                            lost), RENDER_TEXT))
+        log_file.write(lines)
+        return count
+
+    def write_stdout_logs(self):
+        """
+        Дописать в файловый лог накопившиеся строки stdout без ожидания (режим io_hub: вызывается общим потоком)
+        """
+        cursor = self._stdout_writer_cursor
+        log_file = self._stdout_log_file
+        if cursor is None or log_file is None or self._stdout_logs_writer_thread_object:
+            return
+        while self._stdout_filelog_write(log_file, cursor) == self.STDOUT_WRITER_BATCH:
+            pass
 
     def _create_fifo(self, name) -> str:
         """
         Возвращает путь к созданному fifo pipe
         """
-        path = os.path.join(self.cfg.PROGRESS_FIFO_PATH, '{}_{}'.format(os.getpid(), name))
-        if os.path.exists(path):
-            os.remove(path)
         try:
-            os.mkfifo(path)
+            path = create_progress_fifo(self.cfg.PROGRESS_FIFO_PATH, name)
         except OSError as e:
             self._logger.debug(str(e))
             return None
@@ -203,23 +414,23 @@ class FFMpegProc:
         return path
 
     def _add_progress_to_cmd(self, cmd: str, fifo_path: str) -> str:
-        cmd = cmd.split(' ')
-        cmd = ' '.join([cmd[0], '-progress {}'.format(fifo_path)] + cmd[1:])
-        return cmd
+        return add_progress_to_cmd(cmd, fifo_path)
 
     def get_process_status(self) -> typing.Tuple[str, str]:
-        pid, status = None, None
-        process = subprocess.Popen(['ps', '-eo', 'pid,stat', str(self.process.pid)], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        stdout, _ = process.communicate()
-        for line in stdout.splitlines()[1:]:
-            line = line.decode('utf-8').strip()
-            try:
-                _pid, _status = line.split(' ')
-                if _pid == str(self.process.pid):
-                    pid, status = _pid, _status
-            except Exception as e:
-                self._logger.debug("Error while splitting line ({}) with ps -eo pid,stat: {}".format(line, str(e)))
-        return pid, status
+        """
+        (pid, состояние из /proc/<pid>/stat: R, S, D, Z...), (None, None) - процесса нет
+        """
+        state = read_proc_state(self.process.pid)
+        if state is None:
+            return None, None
+        return str(self.process.pid), state
+
+    def sample_process(self):
+        """
+        Снять CPU/RSS/потоки/переключения контекста/io ffmpeg в process_samples
+        """
+        if self.process and self.process.returncode is None:
+            self.process_samples.sample(self.process.pid)
 
     def _get_first_fps_value(self) -> str:
         fps = []
@@ -237,13 +448,19 @@ class FFMpegProc:
             return
         return min(fps, key=lambda x: x[0])[1]
 
-    def run(self) -> subprocess.Popen:
+    def run(self, spawned: Spawned = None) -> subprocess.Popen:
         """
         После вызова метода требуется зациклить выполнение программы, т.к. после завершения основного потока кодирование остановится
+        spawned - ffmpeg, уже запущенный startup.spawn_ffmpeg (FAST_START): только запуск чтения и записи логов
         """
         if self.process:
             self._logger.warning("Already running")
             return self.process
+        if spawned is not None:
+            self._progress_fifo_path = spawned.fifo_path
+            self._progress_fifo_fds.append(spawned.fifo_fd)
+            self.start_time = spawned.start_time
+            return self._start_io(spawned.process, spawned.fifo_path)
         if not self.args:
             cmd = self.bin
             process = subprocess.run(cmd.split(' '), stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
@@ -256,7 +473,10 @@ class FFMpegProc:
             raise Exception(error)
         cmd = self._add_progress_to_cmd(cmd, fifo_path)
         self.start_time = datetime.datetime.now()
-        process = subprocess.Popen(cmd.split(' '), stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+        process = subprocess.Popen(cmd.split(' '), stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        return self._start_io(process, fifo_path)
+
+    def _start_io(self, process: subprocess.Popen, fifo_path: str) -> subprocess.Popen:
         self.process = process
         self._progress_start_piperead_thread(fifo_path)
         self._stdout_start_piperead_thread(process)
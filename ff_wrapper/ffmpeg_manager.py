@@ -2,21 +2,27 @@ import threading
 import time
 import os
 import datetime
+import logging
 from ffmpeg import FFMpegProc
 from config import Config
 from logger import Logger
-from logbuffer import progress_str_to_dict
+from progress import ProgressRecord, is_na
+from warmup import SOURCE_ARGS, SOURCE_BASELINE, Baselines, WarmupModel, get_output_fps
 
 
 class FFMpegManager:
 
-    def __init__(self, ffmpeg: FFMpegProc):
+    LOOP_TICK_INTERVAL = 1  # seconds, таймер проверок в EVENT_LOOP, остальные проверки - по приходу данных
+
+    def __init__(self, ffmpeg: FFMpegProc, cfg: Config = None, logger: logging.Logger = None):
         self.ffmpeg = ffmpeg
-        self.cfg = Config()
+        self.cfg = cfg or Config()
         self.THREAD_TIMEOUT = 0.5  # Время задержки while true главного цикла менеджера
         self._thread = None  # Setted in self.run()
         self._finish = False
-        self._logger = Logger("FFMpegManager")
+        self._logger = logger or Logger("FFMpegManager")
+        self._created_time = time.monotonic()
+        self._started = False  # MANAGER_START_DELAY прошла, проверки идут
         self._enc_last_error = False
         self._enc_last_check_time = None  # Setted in _check_encoding_state
         self._enc_check_started = False  # Setted in _check_encoding_state
@@ -26,42 +32,108 @@ class FFMpegManager:
         self._enc_min_speed = None  # Устанавливается в is_speed_valid
         # Устанавливается в момент возникновения первой ошибки и становится None при ее отсутствии
         self._enc_error_start_time = None
+        self._enc_error_last_time = None  # Время последней проверки в состоянии ошибки, для метрик
         self._stdout_stuck_last = None  # Устанавливается в _check_stdout_stuck
         self._stdout_stuck_start = None  # Устанавливается в _check_stdout_stuck
+        self._next_sample_time = 0  # time.monotonic(), когда снимать /proc ffmpeg
+        self._baselines = Baselines(self.cfg.BASELINES_PATH, self._logger)
+        self.warmup = self._create_warmup_model()  # Частота кадров на разгоне, до ENCODING_CHECK_START_DELAY
+        self._warmup_position = 0  # Позиция чтения блоков -progress для self.warmup
+        self._warmup_started = False
+
+    def _create_warmup_model(self) -> WarmupModel:
+        # Ожидаемый fps - частота выхода (-r после входов, fps=) из аргументов, иначе медиана прошлых запусков
+        #   с теми же входами
+        expected, source = get_output_fps(self.ffmpeg.args), SOURCE_ARGS
+        if expected is None:
+            expected = self._baselines.load(self.ffmpeg.args)
+            source = SOURCE_BASELINE if expected is not None else None
+        return WarmupModel(expected, source,
+                           min_tolerance=self.cfg.ENCODING_WARMUP_MIN_TOLERANCE,
+                           min_samples=self.cfg.ENCODING_WARMUP_MIN_SAMPLES,
+                           max_error_time=self.cfg.ENCODING_WARMUP_MAX_ERROR_TIME,
+                           max_no_frames_time=self.cfg.ENCODING_CHECK_START_DELAY)
 
     def shutdown_all(self):
         self.ffmpeg.stop()
         self.stop()
 
+    def attach(self, loop):
+        """
+        EVENT_LOOP: проверки по таймеру цикла и по приходу блоков -progress вместо своего потока,
+        завершение ffmpeg - сразу по событию цикла вместо process.poll()
+        """
+        loop.call_every(self.LOOP_TICK_INTERVAL, self.tick)
+        self.ffmpeg.on_progress = lambda: loop.call_soon(self.tick)
+        # После разбора последних данных из pipe, чтобы они попали в файловый лог
+        loop.watch_process(self.ffmpeg.process, lambda process: loop.call_soon(lambda: self.on_process_exit(process)))
+
     def run(self):
         t = threading.Thread(target=self._run, daemon=True)
         self._thread = t
         t.start()
 
     def _run(self):
-        first_run = True
-        while True:
-            if first_run:
-                time.sleep(self.cfg.MANAGER_START_DELAY)
-                first_run = False
-                self._logger.info("Manager thread started (with delay {}s)".format(self.cfg.MANAGER_START_DELAY))
-                self._logger.info("Encoding checker will be started in {}s ...".format(self.cfg.ENCODING_CHECK_START_DELAY))
-            if self._finish is True:
-                self._logger.info('Manager thread stopped')
-                break
-            self._check_running_state()
-            self._check_encoding_state()
+        while not self._finish:
+            self.tick()
             time.sleep(self.THREAD_TIMEOUT)
+        self._logger.info('Manager thread stopped')
+
+    def tick(self):
+        """
+        Один проход проверок. Вызывается из своего потока (run) или из общего потока супервизора
+        """
+        if self._finish:
+            return
+        started = time.perf_counter()
+        self._sample_process()
+        self.ffmpeg.update_stdout_index()
+        if not self._started:
+            if time.monotonic() - self._created_time < self.cfg.MANAGER_START_DELAY:
+                return
+            self._started = True
+            self._logger.info("Manager thread started (with delay {}s)".format(self.cfg.MANAGER_START_DELAY))
+            self._logger.info("Encoding checker will be started in {}s ...".format(self.cfg.ENCODING_CHECK_START_DELAY))
+        self._check_running_state()
+        self._check_health_rules()
+        self._check_warmup()
+        self._check_encoding_state()
+        self.ffmpeg.debug_stats.manager_tick_seconds.observe(time.perf_counter() - started)
+
+    def _sample_process(self):
+        # Снимки /proc идут с запуска ffmpeg, независимо от MANAGER_START_DELAY
+        interval = self.cfg.PROCESS_SAMPLE_INTERVAL
+        now = time.monotonic()
+        if interval <= 0 or now < self._next_sample_time:
+            return
+        # Расписание, а не "now + interval": интервал не растягивается до шага tick
+        self._next_sample_time += interval
+        if self._next_sample_time <= now:
+            self._next_sample_time = now + interval
+        self.ffmpeg.sample_process()
 
     def _check_running_state(self):
         if not self.ffmpeg.process or self.ffmpeg.process and self.ffmpeg.process.poll() == 0:
-            self._logger.info('FFMpeg is not running, exit...\n')
-            stdout_buf = self.ffmpeg.get_stdout_buf()
-            logs, _ = stdout_buf.get_last_items(100)
-            for item in logs:
-                dt, line = item[0], item[1]
-                print('{}  {}'.format(dt, line))
-            self.shutdown_all()
+            self._shutdown_not_running()
+
+    def on_process_exit(self, process):
+        """
+        Вызывается циклом событий (EVENT_LOOP) сразу после завершения ffmpeg с любым кодом
+        """
+        if self._finish or self.ffmpeg.finish:
+            return
+        self._logger.info('FFMpeg exited with code {}'.format(process.returncode))
+        self.ffmpeg.write_stdout_logs()
+        self._shutdown_not_running()
+
+    def _shutdown_not_running(self):
+        self._logger.info('FFMpeg is not running, exit...\n')
+        stdout_buf = self.ffmpeg.get_stdout_buf()
+        logs, _ = stdout_buf.get_last_items(100)
+        for item in logs:
+            dt, line = item[0], item[1]
+            print('{}  {}'.format(dt, line))
+        self.shutdown_all()
 
     def _is_stdout_stuck(self) -> bool:
         stdout_buf = self.ffmpeg.get_stdout_buf()
@@ -92,6 +164,49 @@ class FFMpegManager:
             self._stdout_stuck_start = None
         return False
 
+    def _check_health_rules(self):
+        # Правила с action kill срабатывают в потоках разбора, останавливает стрим менеджер
+        reason = self.ffmpeg.rules.kill_reason
+        if reason is None or self._finish:
+            return
+        self._logger.error('Stopping stream by health rule: {}'.format(reason))
+        self.ffmpeg.metrics.encoding_check_failures += 1
+        self.shutdown_all()
+
+    def _check_warmup(self):
+        """
+        До старта обычной проверки кодирования: частота кадров должна сойтись к ожидаемой (WarmupModel),
+        иначе стрим останавливается, не дожидаясь ENCODING_CHECK_START_DELAY
+        """
+        if self.cfg.ENCODING_DISABLE_CHECK or self._enc_check_started:
+            return
+        progress_buf = self.ffmpeg.get_progress_buf()
+        records, _, self._warmup_position = progress_buf.read_records_from(self._warmup_position)
+        warmup = self.warmup
+        for record in records:
+            warmup.observe(record)
+        if not self.cfg.ENCODING_WARMUP or warmup.expected_fps is None:
+            return
+        if not self._warmup_started:
+            self._warmup_started = True
+            self._logger.info("Encoding checker: warm-up expects fps={:g} ({}), exit if fps < {:g}% of it for {:g}s".format(
+                warmup.expected_fps, warmup.source, (1 - warmup.min_tolerance) * 100, warmup.max_error_time)
+                )
+        failure = warmup.failure()
+        if failure:
+            self.ffmpeg.metrics.encoding_check_failures += 1
+            self._logger.error("Encoding warm-up check failed: {}".format(failure))
+            self.shutdown_all()
+
+    def _finish_warmup(self):
+        # Частота, замеренная на разгоне, - baseline для следующих запусков с теми же входами
+        warmup = self.warmup
+        if warmup.rate and warmup.samples >= warmup.min_samples and not warmup.is_below_band():
+            self._baselines.save(self.ffmpeg.args, warmup.rate)
+        self._logger.info("Encoding checker: warm-up fps={}, samples={}, converged={}".format(
+            None if warmup.rate is None else round(warmup.rate, 2), warmup.samples, warmup.is_converged())
+            )
+
     def _check_encoding_state(self):
         if self.cfg.ENCODING_DISABLE_CHECK:
             return
@@ -101,27 +216,39 @@ class FFMpegManager:
             self._logger.info("Encoding checker started (with delay {}s)".format(
                 self.cfg.ENCODING_CHECK_START_DELAY + self.cfg.MANAGER_START_DELAY)
                 )
+            if self.cfg.ENCODING_CHECK_WINDOW > 0:
+                self._logger.info("Encoding checker: fps and speed are checked by p{:g} over {:g}s".format(
+                    self.cfg.ENCODING_CHECK_PERCENTILE, self.cfg.ENCODING_CHECK_WINDOW)
+                    )
             self._enc_check_started = True
+            self._finish_warmup()
         is_stdout_stuck = self._is_stdout_stuck()
         if is_stdout_stuck:
             self.shutdown_all()
         progress_buf = self.ffmpeg.get_progress_buf()
-        progress_items, _ = progress_buf.get_last_items(1)
+        progress_items, _ = progress_buf.get_last_records(1)
         if not progress_items:
             return
-        progress_dt, progress = progress_items[0]
+        progress = progress_items[0]
+        progress_dt = progress.wall_time
         if progress_dt and progress_dt == self._enc_last_check_time:
             self._logger.debug("Skip encoding check, same dt")
             return
         if not self._enc_last_check_time:
             self._enc_last_check_time = progress_dt
-        progress = progress_str_to_dict(progress)
-        is_fps_valid, fps = self._is_fps_valid(progress)
-        is_speed_valid, speed = self._is_speed_valid(progress)
+        fps, speed = self._get_check_values(progress)
+        is_fps_valid, fps = self._is_fps_valid(fps)
+        is_speed_valid, speed = self._is_speed_valid(speed)
+        now = datetime.datetime.now()
+        metrics = self.ffmpeg.metrics
+        if self._enc_error_start_time is not None:
+            metrics.encoding_error_seconds += (now - self._enc_error_last_time).total_seconds()
+            self._enc_error_last_time = now
         if not is_fps_valid and not is_speed_valid:
-            now = datetime.datetime.now()
             if self._enc_error_start_time is None:
                 self._enc_error_start_time = now
+                self._enc_error_last_time = now
+                metrics.encoding_check_failures += 1
                 self._logger.info("Error in encoding. fps={}, speed={}, start_time={}".format(
                     fps, speed, self._enc_error_start_time)
                     )
@@ -132,25 +259,43 @@ class FFMpegManager:
         else:
             self._enc_error_start_time = None
 
-    def _is_fps_valid(self, progress: dict) -> (bool, int):
-        current_fps = float(progress['fps'])
+    def _get_check_values(self, progress: ProgressRecord) -> (float, float):
+        """
+        fps и speed для проверки: последнего блока или перцентиль за ENCODING_CHECK_WINDOW,
+        чтобы единичный выброс не запускал отсчет ошибки
+        """
+        window = self.cfg.ENCODING_CHECK_WINDOW
+        if window <= 0:
+            return progress.fps, progress.speed
+        q = self.cfg.ENCODING_CHECK_PERCENTILE / 100
+        stats = self.ffmpeg.stats
+        return (stats.get('fps', window, lambda s: s.quantile(q)),
+                stats.get('speed', window, lambda s: s.quantile(q)))
+
+    def _is_fps_valid(self, current_fps: float) -> (bool, float):
+        if is_na(current_fps):
+            return False, current_fps
         if not self._enc_base_fps:
-            self._enc_base_fps = current_fps
-            if current_fps < self.cfg.ENCODING_MIN_BASE_FPS:
+            # fps из -progress включает время подключения к источнику - если частота на разгоне сошлась
+            #   к ожидаемой, базовой берется ожидаемая
+            base_fps = current_fps
+            if self.cfg.ENCODING_WARMUP and self.warmup.is_converged():
+                base_fps = self.warmup.expected_fps
+            self._enc_base_fps = base_fps
+            if base_fps < self.cfg.ENCODING_MIN_BASE_FPS:
                 self._enc_min_fps = self.cfg.ENCODING_MIN_BASE_FPS
             else:
-                self._enc_min_fps = current_fps - self.cfg.ENCODING_DELTA_FPS
+                self._enc_min_fps = base_fps - self.cfg.ENCODING_DELTA_FPS
             self._logger.info("Encoding checker: base fps={}, exit if fps < {}".format(
-                current_fps, self._enc_min_fps)
+                base_fps, self._enc_min_fps)
                 )
             return True, current_fps
         if current_fps < self._enc_min_fps:
             return False, current_fps
         return True, current_fps
 
-    def _is_speed_valid(self, progress: dict) -> (bool, float):
-        speed = float(progress['speed'].replace('x', ''))
-        if not speed:
+    def _is_speed_valid(self, speed: float) -> (bool, float):
+        if not speed or is_na(speed):
             return False, speed
         if not self._enc_min_speed:
             if speed < self.cfg.ENCODING_MIN_SPEED:
@@ -167,5 +312,7 @@ class FFMpegManager:
             return True, speed
 
     def stop(self):
+        if self._finish:
+            return
         self._logger.info('Stopping manager thread...')
         self._finish = True
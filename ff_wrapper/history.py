@@ -0,0 +1,237 @@
+import glob
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+import typing
+from progressbuffer import ProgressBuffer
+from stdoutbuffer import StdoutBuffer
+
+
+MAGIC = b'FFWHIST1'
+VERSION = 1
+HEADER = struct.Struct('<8sII')  # magic, версия, длина meta json
+STATE = struct.Struct('<qqqq')  # gen, next, first, write_vpos
+STATE_OFFSET = 16
+META_OFFSET = 64
+KIND_STDOUT = 'stdout'
+KIND_PROGRESS = 'progress'
+PREVIOUS_SUFFIX = '.prev.ring'
+CURRENT_SUFFIX = '.ring'
+
+
+def _align(value: int, alignment: int) -> int:
+    return (value + alignment - 1) // alignment * alignment
+
+
+class HistoryFile:
+    """
+    Кольцевой буфер в отображенном в память файле (PERSISTENT_HISTORY). Раскладка:
+        0   HEADER: magic b'FFWHIST1', версия, длина meta
+        16  STATE: gen, next, first, write_vpos - как поля буфера, gen нечетный во время записи (seqlock)
+        64  meta: json с типом буфера, размерами, аргументами ffmpeg и смещениями колонок
+        колонки по size_max значений (порядок байт - byteorder из meta), затем арена строк stdout
+    Запись идет напрямую в отображение, читатели (в том числе внешние процессы) видят данные без копирования
+    """
+
+    def __init__(self, path: str, fd: int, mm: mmap.mmap, meta: dict, writable: bool):
+        self.path = path
+        self._fd = fd
+        self._mmap = mm
+        self.meta = meta
+        self.writable = writable
+        self.kind = meta['kind']
+        self.size_max = meta['size_max']
+        self._columns = {column['name']: column for column in meta['columns']}
+        self._views = []
+
+    @classmethod
+    def create(cls, path: str, kind: str, size_max: int, columns: typing.Sequence[tuple], arena_size: int = 0,
+               info: dict = None) -> 'HistoryFile':
+        """
+        columns - [(имя, typecode)], info - дополнительные поля meta (аргументы ffmpeg, pid)
+        """
+        meta = dict(info or {}, kind=kind, size_max=size_max, byteorder=sys.byteorder, created=time.time())
+        header_size = mmap.PAGESIZE
+        while True:
+            offset = header_size
+            meta['columns'] = []
+            for name, typecode in columns:
+                itemsize = struct.calcsize(typecode)
+                meta['columns'].append({'name': name, 'typecode': typecode, 'offset': offset})
+                offset = _align(offset + itemsize * size_max, 8)
+            meta['arena_offset'] = offset
+            meta['arena_size'] = arena_size
+            meta_bytes = json.dumps(meta).encode('utf-8')
+            if META_OFFSET + len(meta_bytes) <= header_size:
+                break
+            header_size = _align(META_OFFSET + len(meta_bytes), mmap.PAGESIZE)
+        total_size = max(offset + arena_size, header_size)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, total_size)
+            mm = mmap.mmap(fd, total_size)
+        except Exception:
+            os.close(fd)
+            raise
+        mm[META_OFFSET:META_OFFSET + len(meta_bytes)] = meta_bytes
+        STATE.pack_into(mm, STATE_OFFSET, 0, 0, 0, 0)
+        # magic последним - файл без него не считается историей
+        HEADER.pack_into(mm, 0, MAGIC, VERSION, len(meta_bytes))
+        return cls(path, fd, mm, meta, True)
+
+    @classmethod
+    def open(cls, path: str) -> 'HistoryFile':
+        """
+        Открыть только для чтения (история прошлого запуска)
+        """
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            mm = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        except Exception:
+            os.close(fd)
+            raise
+        try:
+            magic, version, meta_len = HEADER.unpack_from(mm, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError('Wrong history file header ({})'.format(path))
+            meta = json.loads(mm[META_OFFSET:META_OFFSET + meta_len].decode('utf-8'))
+            if meta['byteorder'] != sys.byteorder:
+                raise ValueError('History file byteorder is {} ({})'.format(meta['byteorder'], path))
+        except Exception:
+            mm.close()
+            os.close(fd)
+            raise
+        return cls(path, fd, mm, meta, False)
+
+    def column(self, name: str, typecode: str) -> memoryview:
+        column = self._columns[name]
+        if column['typecode'] != typecode:
+            raise ValueError('History column {} has typecode {}, not {}'.format(name, column['typecode'], typecode))
+        offset = column['offset']
+        view = memoryview(self._mmap)[offset:offset + struct.calcsize(typecode) * self.size_max].cast(typecode)
+        self._views.append(view)
+        return view
+
+    def arena(self) -> memoryview:
+        offset = self.meta['arena_offset']
+        view = memoryview(self._mmap)[offset:offset + self.meta['arena_size']]
+        self._views.append(view)
+        return view
+
+    def set_state(self, gen: int, next_: int, first: int, write_vpos: int):
+        STATE.pack_into(self._mmap, STATE_OFFSET, gen, next_, first, write_vpos)
+
+    def get_state(self, wait: bool = False) -> (int, int, int):
+        """
+        (next, first, write_vpos). first уже учитывает строки, которые перезаписываются текущей записью,
+        поэтому для файла завершенного процесса достаточно последнего значения.
+        wait - согласованное значение по gen для файла работающего процесса
+        """
+        while True:
+            gen, next_, first, write_vpos = STATE.unpack_from(self._mmap, STATE_OFFSET)
+            if not wait or not gen & 1 and gen == STATE.unpack_from(self._mmap, STATE_OFFSET)[0]:
+                return next_, first, write_vpos
+            time.sleep(0)
+
+    def close(self):
+        for view in self._views:
+            view.release()
+        self._views = []
+        if self._mmap is not None:
+            mm, self._mmap = self._mmap, None
+            os.close(self._fd)
+            try:
+                mm.close()
+            except BufferError:
+                # Срезы отображения (get_last_views) еще у читателей - отображение освободит сборщик мусора
+                pass
+
+
+def create_stdout_buffer(path: str, size_max: int, arena_size: int, info: dict = None) -> StdoutBuffer:
+    storage = HistoryFile.create(path, KIND_STDOUT, size_max, StdoutBuffer.COLUMNS, arena_size, info)
+    return StdoutBuffer(size_max, arena_size, storage)
+
+
+def create_progress_buffer(path: str, size_max: int, info: dict = None) -> ProgressBuffer:
+    storage = HistoryFile.create(path, KIND_PROGRESS, size_max, ProgressBuffer.COLUMNS, 0, info)
+    return ProgressBuffer(size_max, storage)
+
+
+class PreviousRun:
+    """
+    История прошлого запуска ffmpeg: файлы <name>.prev.ring в WORKDIR/history, открываются при первом обращении.
+    Интерфейс буферов как у FFMpegProc - подходит для _Api (/previous_run/last_stdout, /previous_run/last_progress)
+    """
+
+    def __init__(self, directory: str, logger: logging.Logger = None):
+        self.directory = directory
+        self._logger = logger or logging.getLogger('PreviousRun')
+        self._files = None
+        self._buffers = {}
+        self._closed = False
+
+    def _load(self) -> typing.Dict[str, HistoryFile]:
+        if self._closed:
+            return {}
+        if self._files is None:
+            self._files = {}
+            for path in sorted(glob.glob(os.path.join(self.directory, '*' + PREVIOUS_SUFFIX))):
+                try:
+                    storage = HistoryFile.open(path)
+                except (OSError, ValueError, KeyError) as e:
+                    self._logger.error('Previous run history open error ({}): {}'.format(path, e))
+                    continue
+                self._files[storage.kind] = storage
+        return self._files
+
+    def exists(self) -> bool:
+        return bool(self._load())
+
+    def _get_buf(self, kind: str, buffer_class):
+        if kind not in self._buffers:
+            storage = self._load().get(kind)
+            self._buffers[kind] = buffer_class.from_history(storage) if storage is not None else None
+        return self._buffers[kind]
+
+    def get_stdout_buf(self) -> typing.Optional[StdoutBuffer]:
+        return self._get_buf(KIND_STDOUT, StdoutBuffer)
+
+    def get_progress_buf(self) -> typing.Optional[ProgressBuffer]:
+        return self._get_buf(KIND_PROGRESS, ProgressBuffer)
+
+    def info(self) -> dict:
+        info = {}
+        for kind, storage in self._load().items():
+            next_, first, _ = storage.get_state()
+            meta = storage.meta
+            info[kind] = {
+                'path': storage.path,
+                'args': meta.get('args'),
+                'pid': meta.get('pid'),
+                'created': meta.get('created'),
+                'first_position': first,
+                'current_position': next_,
+            }
+        return info
+
+    def close(self):
+        # После close файлы заново не открываются
+        self._closed = True
+        self._buffers = {}
+        for storage in (self._files or {}).values():
+            storage.close()
+        self._files = None
+
+
+def rotate_previous(directory: str, names: typing.Sequence[str]):
+    """
+    Файлы текущего запуска (<name>.ring) становятся файлами прошлого (<name>.prev.ring)
+    """
+    for name in names:
+        path = os.path.join(directory, name + CURRENT_SUFFIX)
+        if os.path.exists(path):
+            os.replace(path, os.path.join(directory, name + PREVIOUS_SUFFIX))
@@ -0,0 +1,170 @@
+import asyncio
+import concurrent.futures
+import http
+
+
+class _BadRequest(Exception):
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class AsyncHTTPServer:
+    """
+    HTTP/1.1 сервер на asyncio в одном потоке: keep-alive, последовательная обработка запросов
+    одного соединения (pipelining), follow режим через chunked transfer encoding.
+    Маршруты те же, что у потокового сервера (http_server._Api). Обработчики выполняются в пуле
+    из HANDLER_THREADS потоков, чтобы отрисовка и сжатие больших ответов не останавливали остальные
+    соединения и follow; в цикле событий отдаются только готовые ответы из кэша (api.handle_cached)
+    """
+
+    KEEPALIVE_TIMEOUT = 60  # seconds, сколько держать простаивающее keep-alive соединение
+    FOLLOW_POLL_INTERVAL = 0.2  # seconds, как часто проверять новые строки в follow режиме
+    MAX_HEADERS_SIZE = 65536
+    BACKLOG = 1024
+    HANDLER_THREADS = 4
+
+    def __init__(self, server_address: tuple, api):
+        self.server_address = server_address
+        self.api = api
+        self._loop = None
+        self._server = None
+        self._executor = None
+
+    def serve_forever(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._loop = loop
+        self._executor = concurrent.futures.ThreadPoolExecutor(self.HANDLER_THREADS, thread_name_prefix='http')
+        host, port = self.server_address
+        self._server = loop.run_until_complete(asyncio.start_server(
+            self._handle_connection, host, port, limit=self.MAX_HEADERS_SIZE,
+            reuse_address=True, backlog=self.BACKLOG))
+        try:
+            loop.run_forever()
+        finally:
+            self._server.close()
+            loop.run_until_complete(self._server.wait_closed())
+            loop.close()
+            self._executor.shutdown(wait=False)
+
+    def shutdown(self):
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), self.KEEPALIVE_TIMEOUT)
+                except _BadRequest as e:
+                    await self._write_error(writer, e.status, str(e))
+                    break
+                if request is None:
+                    break
+                method, path, version, headers = request
+                connection = headers.get('connection', '').lower()
+                if version == 'HTTP/1.1':
+                    keep_alive = connection != 'close'
+                else:
+                    keep_alive = connection == 'keep-alive'
+                if method not in ('GET', 'HEAD'):
+                    await self._write_error(writer, 405, 'Method not allowed\n', keep_alive)
+                else:
+                    response = self.api.handle_cached(path, headers)
+                    if response is None:
+                        response = await self._loop.run_in_executor(self._executor, self.api.handle, path,
+                                                                    headers, False)
+                    if response.stream is not None and version != 'HTTP/1.1':
+                        # Без chunked конец потока - закрытие соединения
+                        keep_alive = False
+                    await self._write_response(reader, writer, response, keep_alive, method == 'HEAD')
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        """
+        Возвращает (method, path, version, headers) или None, если клиент закрыл соединение
+        """
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.IncompleteReadError as e:
+            if not e.partial.strip():
+                return None
+            raise
+        except asyncio.LimitOverrunError:
+            raise _BadRequest(431, 'Request header fields too large\n')
+        lines = head.lstrip(b'\r\n').decode('latin-1').split('\r\n')
+        request_line = lines[0].split(' ')
+        if len(request_line) != 3 or not request_line[2].startswith('HTTP/'):
+            raise _BadRequest(400, 'Bad request line\n')
+        method, path, version = request_line
+        headers = {}
+        for line in lines[1:]:
+            if not line:
+                continue
+            k, sep, v = line.partition(':')
+            if not sep:
+                raise _BadRequest(400, 'Bad header\n')
+            headers[k.strip().lower()] = v.strip()
+        if 'transfer-encoding' in headers:
+            raise _BadRequest(501, 'Request body transfer encoding is not supported\n')
+        length = headers.get('content-length')
+        if length:
+            # Тело запроса не используется, но его нужно вычитать, чтобы не сломать следующий запрос
+            try:
+                await reader.readexactly(int(length))
+            except ValueError:
+                raise _BadRequest(400, 'Bad content-length\n')
+        return method, path, version, headers
+
+    def _head(self, status: int, headers: list, keep_alive: bool) -> list:
+        head = ['HTTP/1.1 {} {}'.format(status, http.HTTPStatus(status).phrase)]
+        head.extend('{}: {}'.format(k, v) for k, v in headers)
+        head.append('Connection: {}'.format('keep-alive' if keep_alive else 'close'))
+        return head
+
+    async def _write_error(self, writer: asyncio.StreamWriter, status: int, message: str, keep_alive: bool = False):
+        body = message.encode('utf-8')
+        head = self._head(status, [('Content-type', 'text/plain'), ('Content-Length', len(body))], keep_alive)
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+
+    async def _write_response(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, response,
+                              keep_alive: bool, is_head: bool):
+        if response.stream is None:
+            head = self._head(response.status, response.headers + [('Content-Length', len(response.body))], keep_alive)
+            writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+            if not is_head:
+                writer.write(response.body)
+            await writer.drain()
+            return
+        chunked = keep_alive
+        headers = response.headers + ([('Transfer-Encoding', 'chunked')] if chunked else [])
+        writer.write(('\r\n'.join(self._head(response.status, headers, keep_alive)) + '\r\n\r\n').encode('latin-1'))
+        if is_head:
+            response.stream.close()
+            await writer.drain()
+            return
+        try:
+            for chunk in response.stream:
+                if reader.at_eof() or writer.transport.is_closing():
+                    # Клиент закрыл соединение: без проверки это выяснилось бы только при записи heartbeat
+                    return
+                if not chunk:
+                    await asyncio.sleep(self.FOLLOW_POLL_INTERVAL)
+                    continue
+                if chunked:
+                    chunk = b'%x\r\n%s\r\n' % (len(chunk), chunk)
+                writer.write(chunk)
+                await writer.drain()
+        finally:
+            response.stream.close()
+        if chunked:
+            writer.write(b'0\r\n\r\n')
+            await writer.drain()
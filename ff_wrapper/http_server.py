@@ -5,161 +5,697 @@ try:
 except ImportError:
     from http.server import HTTPServer as HTTPServer
     print("Warning - python lower than 3.7 and HTTP Server running in one-thread mode")
+import collections
+import gzip
+import itertools
 import json
+import re
+import datetime
+import threading
+import time
+import typing
+import urllib.parse
+import zlib
 from ffmpeg import FFMpegProc
 from config import Config
+from http_async import AsyncHTTPServer
+from procstat import samples_to_dicts
+from debugstats import RouteStats, collect_process_debug_stats, collect_stream_debug_stats
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Exposition, collect_ffmpeg_metrics
+from render import DT_FORMAT, RENDER_JSON, RENDER_TEXT, TimestampFormatter, join_rendered, render_line
+from stdoutindex import LEVELS, search as search_stdout
 
 
-DT_FORMAT = '%Y-%m-%d %H:%M:%S'
+class Response:
+    """
+    Ответ API, не зависящий от реализации сервера.
+    body - тело целиком, stream - генератор bytes для follow режима (b'' - новых данных пока нет)
+    """
 
+    def __init__(self, status: int, body: bytes = b'', content_type: str = 'text/plain',
+                 headers: typing.List[tuple] = None, stream: typing.Iterator[bytes] = None):
+        self.status = status
+        self.body = body
+        self.stream = stream
+        self.headers = [('Content-type', content_type)] + (headers or [])
 
-class _ThreadingHTTPServer(HTTPServer):
 
-    def __init__(self, *args, ffmpeg=None, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.ffmpeg = ffmpeg
-        self.cfg = Config()
+_api_ids = itertools.count()
+_route_stats = RouteStats()  # /debug/stats: запросы и время ответа по маршрутам, все API процесса
 
 
-class _Handler(http.server.BaseHTTPRequestHandler):
+def _error(status: int, message: str) -> Response:
+    return Response(status, message.encode('utf-8'))
 
-    protocol_version = 'HTTP/1.0'
 
-    def do_GET(self):
-        if self.path.startswith('/last_stdout'):
-            return self._get_last_stdout()
-        elif self.path.startswith('/last_progress'):
-            return self._get_last_progress()
-        elif self.path.startswith('/start_time'):
-            return self._get_start_time()
-        elif self.path.startswith('/cmd'):
-            return self._get_cmd()
-        elif self.path.startswith('/get_container_id'):
-            return self._get_container_id()
-        elif self.path.startswith('/get_pid'):
-            return self._get_pid()
-        elif self.path.startswith('/get_ffmpeg_pid'):
-            return self._get_ffmpeg_pid()
-
-    def _parse_params(self, path) -> dict:
-        params = {}
-        if '?' in path:
-            params_src = self.path.split('?')[1]
-            params_src = params_src.split('&')
-            for param in params_src:
-                if '=' in param:
-                    k, v = param.split('=')
-                    params[k] = v
-                else:
-                    params[param] = True
-        return params
+def _accepts_gzip(headers: dict) -> bool:
+    for encoding in headers.get('accept-encoding', '').split(','):
+        name, _, params = encoding.partition(';')
+        if name.strip().lower() in ('gzip', '*'):
+            return params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000')
+    return False
+
+
+class _CachedResponse:
+
+    __slots__ = ('position', 'etag', 'body', 'content_type', 'headers', 'gzip_body')
+
+    def __init__(self, position: int, etag: str, body: bytes, content_type: str, headers: typing.List[tuple]):
+        self.position = position
+        self.etag = etag
+        self.body = body
+        self.content_type = content_type
+        self.headers = headers
+        self.gzip_body = None
+
+    def size(self) -> int:
+        return len(self.body) + len(self.gzip_body or b'')
+
+
+class _ResponseCache:
+    """
+    Готовые ответы /last_* по (буфер, параметры запроса). Ответ действителен, пока позиция буфера не изменилась,
+    на каждый набор параметров хранится только последний ответ. Размер ограничен max_bytes (LRU)
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = collections.OrderedDict()  # key -> (_CachedResponse, учтенный размер)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, position: int) -> typing.Optional[_CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0].position != position:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: tuple, response: _CachedResponse):
+        # Повторный put того же ответа пересчитывает размер (например, после добавления gzip_body)
+        size = response.size()
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (response, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+
+def parse_query(path: str) -> dict:
+    """
+    Параметры без значения (?json) -> True, значения декодируются из url
+    """
+    params = {}
+    query = urllib.parse.urlsplit(path).query
+    for k, v in urllib.parse.parse_qsl(query, keep_blank_values=True):
+        params[k] = v if v != '' else True
+    return params
+
+
+_RESOLUTION_UNITS = {'s': 1, 'm': 60, 'h': 3600}  # /progress_series?resolution=10s, 1m
+
+
+class _Api:
+    """
+    Маршруты HTTP API. Используются и потоковым, и asyncio сервером
+    """
+
+    FOLLOW_HEARTBEAT = 15  # seconds, как часто слать heartbeat в follow режиме, если нет новых строк
+    FOLLOW_BATCH = 1000  # Максимум строк за одну отправку в follow режиме
+    GZIP_MIN_SIZE = 16384  # bytes, ответы меньше не сжимаются
+    GZIP_LEVEL = 5
+    ROUTES = (
+        ('/last_stdout', '_get_last_stdout'),
+        ('/last_progress', '_get_last_progress'),
+        ('/start_time', '_get_start_time'),
+        ('/cmd', '_get_cmd'),
+        ('/get_container_id', '_get_container_id'),
+        ('/get_pid', '_get_pid'),
+        ('/get_ffmpeg_pid', '_get_ffmpeg_pid'),
+        ('/metrics', '_get_metrics'),
+        ('/stats', '_get_stats'),
+        ('/process_stats', '_get_process_stats'),
+        ('/health', '_get_health'),
+        ('/progress_series', '_get_progress_series'),
+        ('/search_stdout', '_get_search_stdout'),
+        ('/debug/stats', '_get_debug_stats'),
+    )
+    # Маршруты /previous_run/<маршрут>: буферы прошлого запуска из файлов истории (PERSISTENT_HISTORY)
+    PREVIOUS_RUN_ROUTES = ('/last_stdout', '/last_progress', '/search_stdout')
+
+    def __init__(self, ffmpeg: FFMpegProc, response_cache: '_ResponseCache' = None):
+        """
+        response_cache - общий кэш ответов (режим супервизора), по умолчанию - свой
+        """
+        self.ffmpeg = ffmpeg
+        if response_cache is None:
+            response_cache = _ResponseCache(Config().HTTP_RESPONSE_CACHE_KBYTES * 1024)
+        self._response_cache = response_cache
+        # Позиции буферов начинаются с нуля при каждом запуске ffmpeg, поэтому ключ кэша и ETag
+        #   включают время создания и номер API
+        self._etag_base = '{:x}-{:x}'.format(int(time.time() * 1000), next(_api_ids))
+        self._previous_run_api = None  # _Api поверх PreviousRun, создается при первом запросе
+
+    def handle(self, path: str, headers: dict, blocking: bool = True) -> Response:
+        """
+        headers - заголовки запроса с ключами в нижнем регистре
+        blocking - False для asyncio сервера: follow генератор не ждет новых строк, а отдает b''
+        """
+        started = time.perf_counter()
+        route, response = self._dispatch(path, headers, blocking)
+        _route_stats.observe(route, response.status, time.perf_counter() - started)
+        return response
+
+    def _dispatch(self, path: str, headers: dict, blocking: bool) -> (str, Response):
+        # (маршрут для /debug/stats, ответ)
+        route = urllib.parse.urlsplit(path).path
+        if route.startswith('/previous_run/'):
+            return '/previous_run', self._get_previous_run(path[len('/previous_run'):], route[len('/previous_run'):],
+                                                           headers, blocking)
+        for prefix, method in self.ROUTES:
+            if route.startswith(prefix):
+                return prefix, getattr(self, method)(parse_query(path), headers, blocking)
+        return 'not_found', _error(404, 'Not found\n')
+
+    def _get_previous_run(self, path: str, route: str, headers: dict, blocking: bool) -> Response:
+        """
+        /previous_run/info - аргументы, pid и позиции буферов прошлого запуска
+        /previous_run/last_stdout, /previous_run/last_progress, /previous_run/search_stdout - как маршруты
+            текущего запуска, без follow
+        """
+        previous_run = self.ffmpeg.get_previous_run()
+        if previous_run is None or not previous_run.exists():
+            return _error(404, 'Previous run history not found\n')
+        if route.rstrip('/') == '/info':
+            return Response(200, json.dumps(previous_run.info()).encode('utf-8'), 'text/json')
+        if not route.startswith(self.PREVIOUS_RUN_ROUTES):
+            return _error(404, 'Not found\n')
+        if parse_query(path).get('follow', False):
+            return _error(400, 'follow is not available for previous run\n')
+        buf = previous_run.get_progress_buf() if route.startswith('/last_progress') else previous_run.get_stdout_buf()
+        if buf is None:
+            return _error(404, 'Previous run history not found\n')
+        api = self._previous_run_api
+        if api is None or api.ffmpeg is not previous_run:
+            api = self._previous_run_api = _Api(previous_run, self._response_cache)
+        return api._dispatch(path, headers, blocking)[1]
 
-    def _get_last_stdout(self):
-        buf = self.server.ffmpeg.get_stdout_buf()
-        self._get_last_logs(buf)
+    def _get_last_stdout(self, params: dict, headers: dict, blocking: bool) -> Response:
+        buf = self.ffmpeg.get_stdout_buf()
+        return self._get_last_logs(buf, params, headers, blocking)
 
-    def _get_last_progress(self):
-        buf = self.server.ffmpeg.get_progress_buf()
-        self._get_last_logs(buf)
+    def _get_last_progress(self, params: dict, headers: dict, blocking: bool) -> Response:
+        buf = self.ffmpeg.get_progress_buf()
+        return self._get_last_logs(buf, params, headers, blocking)
 
-    def _get_last_logs(self, buf):
+    def _get_last_logs(self, buf, params: dict, headers: dict, blocking: bool) -> Response:
         """
         params: count <int> - количество последних строк
                 json <bool> - [ [<dt>, <line>] ]
-                range <str> - 0-10000
+                fields <bool> - вместе с json, только для progress: [ {<поле ProgressRecord>: <значение>} ]
+                follow <sse|ndjson> - не закрывать соединение и отправлять новые строки по мере появления
+                cursor <int> - вместе с follow, позиция, с которой продолжить чтение
+                since <int> - только строки начиная с позиции (X-Log-Position из прошлого ответа)
+                range <str> - 0-10000, строки с позиции по позицию (не включая)
+                from, to <unix time|%Y-%m-%d %H:%M:%S> - строки за период времени
         """
         count = 20
-        params = self._parse_params(self.path)
         if 'count' in params:
             try:
                 count = int(params['count'])
             except ValueError:
-                content = 'count must be int\n'.encode('utf-8')
-                self.send_response(400)
-                self.send_header('Content-type', 'text/plain')
-                self.end_headers()
-                self.wfile.write(content)
-                return
+                return _error(400, 'count must be int\n')
+        if params.get('follow', False):
+            return self._follow_logs(buf, params, headers, count, blocking)
+        position_now = buf.get_current_position()
+        try:
+            pos_from, pos_to = self._get_logs_window(buf, params, count)
+        except ValueError as e:
+            return _error(400, '{}\n'.format(e))
         is_json = params.get('json', False)
-        if count > 0:
-            lines, _ = buf.get_last_items(count)
+        is_records = is_json and params.get('fields', False) and hasattr(buf, 'read_records_from')
+        cache_key, etag = self._get_logs_cache_key(buf, params, position_now)
+        response = self._get_cached_logs(cache_key, etag, position_now, headers, True)
+        if response is not None:
+            return response
+        try:
+            cached = self._render_logs(buf, pos_from, pos_to, is_json, is_records)
+        except ValueError:
+            return _error(500, 'error while dumps json\n')
+        cached.etag = etag
+        if buf.get_current_position() == position_now:
+            # Во время отрисовки могли прийти новые строки - тогда ответ не соответствует position_now
+            cached.position = position_now
+            self._response_cache.put(cache_key, cached)
+        return self._cached_response(cache_key, cached, _accepts_gzip(headers))
+
+    def _get_logs_cache_key(self, buf, params: dict, position_now: int) -> (tuple, str):
+        # Ответ определяется параметрами и текущей позицией буфера: пока новых строк нет,
+        #   он отдается из кэша, а клиенту с тем же ETag - 304 без тела
+        cache_key = (self._etag_base, id(buf), tuple(sorted((k, str(v)) for k, v in params.items())))
+        etag = '"{}-{:x}-{}"'.format(self._etag_base, zlib.crc32(repr(cache_key).encode('utf-8')), position_now)
+        return cache_key, etag
+
+    def _get_cached_logs(self, cache_key: tuple, etag: str, position_now: int, headers: dict,
+                         compress: bool) -> typing.Optional[Response]:
+        """
+        304 по If-None-Match или ответ из кэша, None - ответ нужно отрисовать.
+        compress=False - None и тогда, когда закэшированный ответ еще нужно сжать
+        """
+        gzip_etag = etag[:-1] + '-gz"'
+        if_none_match = headers.get('if-none-match', '')
+        if if_none_match:
+            for tag in if_none_match.split(','):
+                tag = tag.strip()
+                if tag.startswith('W/'):
+                    tag = tag[2:]
+                if tag in (etag, gzip_etag, '*'):
+                    return Response(304, headers=[('ETag', etag if tag == '*' else tag), ('Vary', 'Accept-Encoding')])
+        cached = self._response_cache.get(cache_key, position_now)
+        if cached is None:
+            return None
+        use_gzip = _accepts_gzip(headers)
+        if not compress and use_gzip and cached.gzip_body is None and len(cached.body) >= self.GZIP_MIN_SIZE:
+            return None
+        return self._cached_response(cache_key, cached, use_gzip)
+
+    def handle_cached(self, path: str, headers: dict) -> typing.Optional[Response]:
+        """
+        Ответ /last_stdout и /last_progress без отрисовки и сжатия (304 или из кэша), иначе None.
+        asyncio сервер отдает такие ответы прямо в цикле событий, остальные выполняет в пуле потоков
+        """
+        started = time.perf_counter()
+        route = urllib.parse.urlsplit(path).path
+        if route.startswith('/last_stdout'):
+            prefix, buf = '/last_stdout', self.ffmpeg.get_stdout_buf()
+        elif route.startswith('/last_progress'):
+            prefix, buf = '/last_progress', self.ffmpeg.get_progress_buf()
         else:
-            lines, _ = buf.get_all()
-        if is_json:
-            response = []
-            for dt, line in lines:
-                response.append(('{}'.format(dt.strftime(DT_FORMAT)), line))
-            try:
-                response = json.dumps(response).encode('utf-8')
-            except ValueError:
-                self.send_response(500)
-                self.send_header('content-type', 'text/plain')
-                self.end_headers()
-                self.wfile.write('error while dumps json from: \n {}\n'.format(str(lines)).encode('utf-8'))
-                return
+            return None
+        params = parse_query(path)
+        if params.get('follow', False):
+            return None
+        position_now = buf.get_current_position()
+        cache_key, etag = self._get_logs_cache_key(buf, params, position_now)
+        response = self._get_cached_logs(cache_key, etag, position_now, headers, False)
+        if response is not None:
+            _route_stats.observe(prefix, response.status, time.perf_counter() - started)
+        return response
+
+    def _render_logs(self, buf, pos_from: int, pos_to: typing.Optional[int], is_json: bool,
+                     is_records: bool) -> _CachedResponse:
+        if pos_to is not None and pos_to <= pos_from:
+            lines, lost, position = [], 0, max(pos_from, buf.get_first_position())
+        elif is_records:
+            lines, lost, position = buf.read_records_from(pos_from, 0 if pos_to is None else pos_to - pos_from)
         else:
-            response = ''
-            for dt, line in lines:
-                response += '<{}> {}\n'.format(dt.strftime(DT_FORMAT), line)
-            response = response.encode('utf-8')
-
-        self.send_response(200)
-        if is_json:
-            self.send_header('Content-type', 'text/json')
+            fmt = RENDER_JSON if is_json else RENDER_TEXT
+            lines, lost, position = buf.render_from(pos_from, 0 if pos_to is None else pos_to - pos_from, fmt)
+        # X-Log-Position - позиция для следующего запроса с since, X-Log-Lost - сколько строк с since уже вытеснено
+        position_headers = [('X-Log-Position', str(position)), ('X-Log-Lost', str(lost))]
+        if is_records:
+            # Записи отдаются без восстановления строки -progress
+            body = json.dumps([record.to_dict() for record in lines]).encode('utf-8')
         else:
-            self.send_header('Content-type', 'text/plain')
-        self.end_headers()
-        self.wfile.write(response)
+            body = join_rendered(lines, RENDER_JSON if is_json else RENDER_TEXT)
+        return _CachedResponse(None, '', body, 'text/json' if is_json else 'text/plain', position_headers)
+
+    def _cached_response(self, cache_key: tuple, cached: _CachedResponse, use_gzip: bool) -> Response:
+        headers = cached.headers + [('Vary', 'Accept-Encoding')]
+        if not use_gzip or len(cached.body) < self.GZIP_MIN_SIZE:
+            return Response(200, cached.body, cached.content_type, headers + [('ETag', cached.etag)])
+        if cached.gzip_body is None:
+            cached.gzip_body = gzip.compress(cached.body, self.GZIP_LEVEL)
+            if cached.position is not None:
+                self._response_cache.put(cache_key, cached)
+        headers += [('Content-Encoding', 'gzip'), ('ETag', cached.etag[:-1] + '-gz"')]
+        return Response(200, cached.gzip_body, cached.content_type, headers)
+
+    def _get_logs_window(self, buf, params: dict, count: int) -> (int, int):
+        """
+        Возвращает (начальная позиция, конечная позиция или None - до конца буфера)
+        """
+        if 'since' in params:
+            try:
+                pos_from = int(params['since'])
+            except ValueError:
+                raise ValueError('since must be int')
+            pos_to = pos_from + count if 'count' in params and count > 0 else None
+            return pos_from, pos_to
+        if 'range' in params:
+            try:
+                pos_from, pos_to = [int(x) for x in params['range'].split('-')]
+            except ValueError:
+                raise ValueError('range must be <int>-<int>')
+            return max(pos_from, buf.get_first_position()), pos_to
+        if 'from' in params or 'to' in params:
+            # Поиск позиций бинарным поиском по времени строк в буфере
+            pos_from = buf.get_first_position()
+            pos_to = None
+            if 'from' in params:
+                pos_from = buf.position_at_time(_parse_time_param(params['from']))
+            if 'to' in params:
+                pos_to = buf.position_at_time(_parse_time_param(params['to']), after=True)
+            if 'count' in params and count > 0:
+                pos_to = min(pos_to, pos_from + count) if pos_to is not None else pos_from + count
+            return pos_from, pos_to
+        first = buf.get_first_position()
+        if count > 0:
+            return max(first, buf.get_current_position() - count), None
+        return first, None
+
+    def _follow_logs(self, buf, params: dict, headers: dict, count: int, blocking: bool) -> Response:
+        """
+        Отправка новых строк по мере появления в буфере, пока клиент не закроет соединение.
+        sse    - Server-Sent Events: id = позиция строки, data = '<dt> line' или json [dt, line]
+        ndjson - по одному json объекту {"position", "time", "line"} на строку
+        Для продолжения после обрыва: cursor=<последняя полученная позиция + 1> или заголовок Last-Event-ID (sse).
+        При потере строк (клиент не успевал читать) отправляется event: lost / {"lost": N}
+        Если новых строк нет дольше FOLLOW_HEARTBEAT секунд - отправляется heartbeat
+        """
+        mode = params['follow']
+        if mode is True:
+            mode = 'sse' if 'text/event-stream' in headers.get('accept', '') else 'ndjson'
+        if mode not in ('sse', 'ndjson'):
+            return _error(400, 'follow must be sse or ndjson\n')
+        position = None
+        try:
+            if 'cursor' in params:
+                position = int(params['cursor'])
+            elif headers.get('last-event-id'):
+                position = int(headers['last-event-id']) + 1
+        except ValueError:
+            return _error(400, 'cursor must be int\n')
+        if position is None:
+            position = max(0, buf.get_current_position() - max(count, 0))
+        cursor = buf.cursor(position)
+        is_sse = mode == 'sse'
+        stream = self._follow_stream(cursor, is_sse, params.get('json', False), blocking)
+        return Response(200, content_type='text/event-stream' if is_sse else 'application/x-ndjson',
+                        headers=[('Cache-Control', 'no-cache')], stream=stream)
 
-    def _get_start_time(self):
-        start_time = self.server.ffmpeg.start_time
+    def _follow_stream(self, cursor, is_sse: bool, is_json: bool, blocking: bool) -> typing.Iterator[bytes]:
+        ffmpeg = self.ffmpeg
+        last_sent = time.monotonic()
+        while not ffmpeg.finish:
+            items, lost = cursor.read(self.FOLLOW_BATCH, timeout=self.FOLLOW_HEARTBEAT if blocking else None)
+            position = cursor.position - len(items)
+            response = []
+            if lost:
+                if is_sse:
+                    response.append('event: lost\ndata: {}\n\n'.format(lost))
+                else:
+                    response.append(json.dumps({'lost': lost}) + '\n')
+            for dt, line in items:
+                dt = dt.strftime(DT_FORMAT)
+                if is_sse and is_json:
+                    response.append('id: {}\ndata: {}\n\n'.format(position, json.dumps((dt, line))))
+                elif is_sse:
+                    response.append('id: {}\ndata: <{}> {}\n\n'.format(position, dt, line))
+                else:
+                    response.append(json.dumps({'position': position, 'time': dt, 'line': line}) + '\n')
+                position += 1
+            now = time.monotonic()
+            if not response:
+                if not blocking and now - last_sent < self.FOLLOW_HEARTBEAT:
+                    yield b''
+                    continue
+                if is_sse:
+                    response.append(': heartbeat {}\n\n'.format(cursor.position))
+                else:
+                    response.append(json.dumps({'heartbeat': cursor.position}) + '\n')
+            last_sent = now
+            yield ''.join(response).encode('utf-8')
+
+    def _get_start_time(self, params: dict, headers: dict, blocking: bool) -> Response:
+        start_time = self.ffmpeg.start_time
         if not start_time:
-            self.send_response(500)
-            self.send_header('content-type', 'text/plain')
-            self.end_headers()
-            self.wfile.write('Stream is not started'.encode('utf-8'))
-            return
-        self.send_response(200)
-        self.send_header('Content-type', 'text/plain')
-        self.end_headers()
-        self.wfile.write(start_time.strftime(DT_FORMAT).encode('utf-8'))
+            return _error(500, 'Stream is not started')
+        return Response(200, start_time.strftime(DT_FORMAT).encode('utf-8'))
 
-    def _get_cmd(self):
-        args = self.server.ffmpeg.args
+    def _get_cmd(self, params: dict, headers: dict, blocking: bool) -> Response:
+        args = self.ffmpeg.args
         if not args:
-            self.send_response(500)
-            self.send_header('content-type', 'text/plain')
-            self.end_headers()
-            self.wfile.write('Args is empty'.encode('utf-8'))
-            return
-        self.send_response(200)
-        self.send_header('Content-type', 'text/plain')
-        self.end_headers()
-        self.wfile.write(args.encode('utf-8'))
+            return _error(500, 'Args is empty')
+        return Response(200, args.encode('utf-8'))
 
-    def _get_container_id(self):
-        cfg = Config()
-        container_id = cfg.CONTAINER_ID
-        self.send_response(200)
-        self.send_header('Content-type', 'text/plain')
-        self.end_headers()
-        self.wfile.write(container_id.encode('utf-8'))
+    def _get_container_id(self, params: dict, headers: dict, blocking: bool) -> Response:
+        return Response(200, self.ffmpeg.cfg.CONTAINER_ID.encode('utf-8'))
+
+    def _get_pid(self, params: dict, headers: dict, blocking: bool) -> Response:
+        return Response(200, self.ffmpeg.cfg.PID.encode('utf-8'))
+
+    def _get_ffmpeg_pid(self, params: dict, headers: dict, blocking: bool) -> Response:
+        return Response(200, self.ffmpeg.cfg.FFMPEG_PID.encode('utf-8'))
+
+    def _get_metrics(self, params: dict, headers: dict, blocking: bool) -> Response:
+        exposition = Exposition()
+        stream_id = self.ffmpeg.cfg.STREAM_ID
+        collect_ffmpeg_metrics(exposition, self.ffmpeg, {'stream': stream_id} if stream_id else None)
+        return Response(200, exposition.render(), METRICS_CONTENT_TYPE)
+
+    def _get_stats(self, params: dict, headers: dict, blocking: bool) -> Response:
+        stats = self.ffmpeg.stats
+        try:
+            windows = [float(w) for w in str(params['window']).split(',')] if 'window' in params else None
+            quantiles = [float(q) / 100 for q in str(params.get('q', '10,50,90')).split(',')]
+        except ValueError:
+            return _error(400, 'window and q must be comma separated numbers\n')
+        if any(not 0 <= q <= 1 for q in quantiles):
+            return _error(400, 'q must be between 0 and 100\n')
+        if windows is not None and any(w not in stats.windows for w in windows):
+            return _error(400, 'Available windows: {}\n'.format(','.join('{:g}'.format(w) for w in stats.windows)))
+        body = json.dumps(stats.to_dict(windows, quantiles))
+        return Response(200, body.encode('utf-8'), 'text/json')
+
+    def _get_process_stats(self, params: dict, headers: dict, blocking: bool) -> Response:
+        try:
+            count = int(params.get('count', 60))
+        except ValueError:
+            return _error(400, 'count must be int\n')
+        samples = self.ffmpeg.process_samples.get_last(count)
+        return Response(200, json.dumps(samples_to_dicts(samples)).encode('utf-8'), 'text/json')
+
+    def _get_progress_series(self, params: dict, headers: dict, blocking: bool) -> Response:
+        series = self.ffmpeg.series
+        if not series.resolutions:
+            return _error(404, 'Progress series are disabled\n')
+        fields = str(params.get('field', series.fields[0])).split(',')
+        if any(field not in series.fields for field in fields):
+            return _error(400, 'Available fields: {}\n'.format(','.join(series.fields)))
+        try:
+            # from/to - unix time, <= 0 - секунды назад от текущего времени
+            now = time.time()
+            times = [float(params[key]) if key in params else None for key in ('from', 'to')]
+            from_time, to_time = [now + t if t is not None and t <= 0 else t for t in times]
+            resolution = params.get('resolution')
+            if resolution is not None:
+                resolution = str(resolution)
+                multiplier = _RESOLUTION_UNITS.get(resolution[-1:])
+                resolution = float(resolution[:-1]) * multiplier if multiplier else float(resolution)
+        except ValueError:
+            return _error(400, 'from, to and resolution must be numbers\n')
+        if resolution is None:
+            # Без from - все кольцо самого мелкого разрешения
+            resolution = series.resolutions[0] if from_time is None else series.choose_resolution(
+                from_time, to_time if to_time is not None else now)
+        if resolution not in series.resolutions:
+            return _error(400, 'Available resolutions: {}\n'.format(','.join('{:g}s'.format(r) for r in series.resolutions)))
+        body = json.dumps(series.to_dict(fields, resolution, from_time, to_time), separators=(',', ':'))
+        return Response(200, body.encode('utf-8'), 'text/json')
+
+    def _get_search_stdout(self, params: dict, headers: dict, blocking: bool) -> Response:
+        """
+        params: component <str> - компонент ffmpeg ([h264 @ ...] -> h264), несколько через запятую
+                level <error|warning> - уровень строки и более серьезные
+                regex <str> - регулярное выражение (re.search по строке)
+                from, to <unix time|%Y-%m-%d %H:%M:%S> - строки за период времени
+                count <int> - количество последних найденных строк, 0 - все (по умолчанию 100)
+                json <bool> - [ [<dt>, <line>] ]
+                components <bool> - {<компонент>: <количество строк в буфере>} вместо поиска
+        """
+        buf = self.ffmpeg.get_stdout_buf()
+        index = getattr(buf, 'index', None)
+        if params.get('components', False):
+            if index is None:
+                return _error(404, 'Stdout index is disabled (STDOUT_INDEX)\n')
+            return Response(200, json.dumps(index.get_components(buf.get_first_position())).encode('utf-8'),
+                            'text/json')
+        components = [c for c in str(params.get('component', '')).split(',') if c] if 'component' in params else []
+        levels = [str(params['level'])] if 'level' in params else []
+        if any(level not in LEVELS for level in levels):
+            return _error(400, 'level must be one of: {}\n'.format(', '.join(LEVELS)))
+        pattern = None
+        if 'regex' in params:
+            try:
+                pattern = re.compile(str(params['regex']).encode('utf-8'))
+            except re.error as e:
+                return _error(400, 'Invalid regex: {}\n'.format(e))
+        try:
+            count = int(params.get('count', 100))
+        except ValueError:
+            return _error(400, 'count must be int\n')
+        position = buf.get_current_position()
+        pos_from, pos_to = buf.get_first_position(), position
+        try:
+            if 'from' in params:
+                pos_from = buf.position_at_time(_parse_time_param(params['from']))
+            if 'to' in params:
+                pos_to = buf.position_at_time(_parse_time_param(params['to']), after=True)
+        except ValueError as e:
+            return _error(400, '{}\n'.format(e))
+        items, scanned, skipped = search_stdout(buf, components, levels, pattern, pos_from, pos_to, count)
+        fmt = RENDER_JSON if params.get('json', False) else RENDER_TEXT
+        timestamps = TimestampFormatter()
+        body = join_rendered([render_line(timestamps, wall_time, line, fmt) for _, wall_time, line in items], fmt)
+        # X-Log-Position - позиция для /last_stdout?since, X-Search-Scanned - сколько строк просмотрено,
+        #   X-Search-Skipped - сколько непроиндексированных строк не просмотрено (индекс отстал, результат неполный)
+        return Response(200, body, 'text/json' if fmt == RENDER_JSON else 'text/plain',
+                        [('X-Log-Position', str(position)), ('X-Search-Scanned', str(scanned)),
+                         ('X-Search-Skipped', str(skipped))])
+
+    def _get_health(self, params: dict, headers: dict, blocking: bool) -> Response:
+        return Response(200, json.dumps(self.ffmpeg.rules.to_dict()).encode('utf-8'), 'text/json')
+
+    def _get_debug_stats(self, params: dict, headers: dict, blocking: bool) -> Response:
+        stats = {'process': collect_process_debug_stats(_route_stats), 'stream': collect_stream_debug_stats(self.ffmpeg)}
+        return Response(200, json.dumps(stats).encode('utf-8'), 'text/json')
+
+
+class _StreamsApi:
+    """
+    Маршруты режима супервизора: /streams - список потоков, /streams/<id>/<маршрут _Api> - маршруты потока.
+    Кэш ответов общий для всех потоков
+    """
+
+    def __init__(self, supervisor):
+        self.supervisor = supervisor
+        self._response_cache = _ResponseCache(Config().HTTP_RESPONSE_CACHE_KBYTES * 1024)
+        self._apis = {}  # id потока -> _Api текущего FFMpegProc потока
+        self._lock = threading.Lock()
+
+    def handle(self, path: str, headers: dict, blocking: bool = True) -> Response:
+        started = time.perf_counter()
+        route = urllib.parse.urlsplit(path).path
+        if route.startswith('/streams/'):
+            # Маршруты потока учитывает _Api потока
+            return self._handle_stream(path, headers, blocking)
+        if route.rstrip('/') == '/streams':
+            streams = [stream.to_dict() for stream in self.supervisor.streams.values()]
+            response = Response(200, json.dumps(streams).encode('utf-8'), 'text/json')
+        elif route == '/get_pid':
+            response = Response(200, Config().PID.encode('utf-8'))
+        elif route == '/metrics':
+            response = self._get_metrics()
+        elif route == '/debug/stats':
+            response = self._get_debug_stats()
+        else:
+            route = 'not_found'
+            response = _error(404, 'Not found\n')
+        _route_stats.observe(route.rstrip('/'), response.status, time.perf_counter() - started)
+        return response
+
+    def handle_cached(self, path: str, headers: dict) -> typing.Optional[Response]:
+        # См. _Api.handle_cached: только маршруты потока /streams/<id>/last_*
+        if not path.startswith('/streams/'):
+            return None
+        stream_id, _, stream_path = path[len('/streams/'):].partition('/')
+        stream = self.supervisor.get_stream(stream_id.split('?')[0])
+        api = self._get_api(stream) if stream is not None else None
+        return api.handle_cached('/' + stream_path, headers) if api is not None else None
+
+    def _handle_stream(self, path: str, headers: dict, blocking: bool) -> Response:
+        stream_id, _, stream_path = path[len('/streams/'):].partition('/')
+        stream_id = stream_id.split('?')[0]
+        stream = self.supervisor.get_stream(stream_id)
+        if stream is None:
+            return _error(404, 'Stream {} not found\n'.format(stream_id))
+        api = self._get_api(stream)
+        if api is None:
+            return _error(503, 'Stream {} is not started\n'.format(stream_id))
+        return api.handle('/' + stream_path, headers, blocking)
+
+    def _get_metrics(self) -> Response:
+        # Метрики всех потоков с меткой stream
+        exposition = Exposition()
+        for stream in list(self.supervisor.streams.values()):
+            labels = {'stream': stream.id}
+            exposition.add('ffwrapper_stream_restarts_total', 'counter', 'Stream restarts by the supervisor', labels,
+                           stream.restarts)
+            ffmpeg = stream.ffmpeg
+            if ffmpeg is None:
+                exposition.add('ffwrapper_up', 'gauge', 'ffmpeg process is running', labels, False)
+                continue
+            collect_ffmpeg_metrics(exposition, ffmpeg, labels)
+        return Response(200, exposition.render(), METRICS_CONTENT_TYPE)
+
+    def _get_debug_stats(self) -> Response:
+        streams = {stream.id: collect_stream_debug_stats(stream.ffmpeg)
+                   for stream in list(self.supervisor.streams.values()) if stream.ffmpeg is not None}
+        stats = {'process': collect_process_debug_stats(_route_stats), 'streams': streams}
+        return Response(200, json.dumps(stats).encode('utf-8'), 'text/json')
+
+    def _get_api(self, stream) -> typing.Optional[_Api]:
+        ffmpeg = stream.ffmpeg
+        if ffmpeg is None:
+            return None
+        with self._lock:
+            api = self._apis.get(stream.id)
+            if api is None or api.ffmpeg is not ffmpeg:
+                # Поток перезапущен - новые буферы
+                api = self._apis[stream.id] = _Api(ffmpeg, self._response_cache)
+            return api
 
-    def _get_pid(self):
-        cfg = Config()
-        pid = cfg.PID
-        self.send_response(200)
-        self.send_header('Content-type', 'text/plain')
-        self.end_headers()
-        self.wfile.write(pid.encode('utf-8'))
 
-    def _get_ffmpeg_pid(self):
-        cfg = Config()
-        pid = cfg.FFMPEG_PID
-        self.send_response(200)
-        self.send_header('Content-type', 'text/plain')
+class _ThreadingHTTPServer(HTTPServer):
+
+    def __init__(self, *args, api=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.api = api
+        self.cfg = Config()
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.0'
+
+    def do_GET(self):
+        headers = {k.lower(): v for k, v in self.headers.items()}
+        response = self.server.api.handle(self.path, headers)
+        self.send_response(response.status)
+        for k, v in response.headers:
+            self.send_header(k, v)
         self.end_headers()
-        self.wfile.write(pid.encode('utf-8'))
+        if response.stream is None:
+            self.wfile.write(response.body)
+            return
+        try:
+            for chunk in response.stream:
+                if chunk:
+                    self.wfile.write(chunk)
+                    self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            response.stream.close()
+
+
+def _parse_time_param(value: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.datetime.strptime(value, DT_FORMAT).timestamp()
+    except ValueError:
+        raise ValueError('from/to must be unix time or "{}"'.format(DT_FORMAT))
 
 
 def _is_port_in_use(host, port):
@@ -167,7 +703,11 @@ def _is_port_in_use(host, port):
         return s.connect_ex(('localhost', port)) == 0
 
 
-def get_http_server(ffmpeg: FFMpegProc):
+def get_http_server(ffmpeg: FFMpegProc = None, supervisor=None):
+    """
+    Возвращает сервер с методом serve_forever (блокирующий) в зависимости от HTTP_SERVER_MODE.
+    supervisor - режим нескольких потоков, маршруты /streams/<id>/...
+    """
     cfg = Config()
     max_errors = 100  # Максимальное количество попыток поиска открытого порта
     while True:
@@ -183,6 +723,14 @@ def get_http_server(ffmpeg: FFMpegProc):
         break
     cfg.save_status_to_files()
     server_address = (cfg.HTTP_HOST, int(cfg.HTTP_PORT))
-    if ffmpeg is None:
+    if supervisor is not None:
+        api = _StreamsApi(supervisor)
+    elif ffmpeg is not None:
+        api = _Api(ffmpeg)
+    else:
         raise Exception("Error. Init HTTP Server without ffmpeg")
-    return _ThreadingHTTPServer(server_address, _Handler, ffmpeg=ffmpeg)
+    if cfg.HTTP_SERVER_MODE == 'asyncio':
+        return AsyncHTTPServer(server_address, api)
+    if cfg.HTTP_SERVER_MODE != 'threading':
+        raise Exception('Wrong HTTP_SERVER_MODE value ({})'.format(cfg.HTTP_SERVER_MODE))
+    return _ThreadingHTTPServer(server_address, _Handler, api=api)
@@ -0,0 +1,386 @@
+import array
+import collections
+import fcntl
+import logging
+import os
+import selectors
+import termios
+import threading
+import time
+import typing
+from debugstats import READ_SIZE_BUCKETS
+from metrics import Histogram
+
+
+F_GETPIPE_SZ = getattr(fcntl, 'F_GETPIPE_SZ', 1032)  # linux
+DEFAULT_PIPE_SIZE = 65536
+OVERLOAD_DROP = 'drop'
+OVERLOAD_SPILL = 'spill'
+
+
+def get_pipe_capacity(fd: int) -> int:
+    try:
+        return fcntl.fcntl(fd, F_GETPIPE_SZ)
+    except OSError:
+        return DEFAULT_PIPE_SIZE
+
+
+def get_pending_bytes(fd: int) -> int:
+    # Сколько байт ffmpeg уже записал в pipe, но мы еще не прочитали
+    buf = array.array('i', [0])
+    try:
+        fcntl.ioctl(fd, termios.FIONREAD, buf, True)
+    except OSError:
+        return 0
+    return buf[0]
+
+
+def split_lines(data: bytes) -> (typing.List[bytes], bytes):
+    """
+    Делит байты на строки по '\\n', '\\r' и '\\r\\n'. Возвращает строки и незаконченный остаток
+    """
+    tail = b''
+    if data.endswith(b'\r'):
+        # Возможно, '\n' от '\r\n' придет в следующем блоке
+        data, tail = data[:-1], b'\r'
+    lines = data.replace(b'\r\n', b'\n').replace(b'\r', b'\n').split(b'\n')
+    return lines[:-1], lines[-1] + tail
+
+
+class PipeIngest:
+    """
+    Вычитывает pipe большими блоками (os.read) в отдельном потоке и как можно быстрее отдает место в pipe ffmpeg.
+    Разбор строк и запись в буферы идут в другом потоке через ограниченную очередь блоков.
+    Если разборщик не успевает и очередь больше max_buffered байт, срабатывает политика перегрузки:
+        drop  - самые старые блоки выбрасываются (считаются в stats)
+        spill - самые старые блоки дописываются в spill_path и выбрасываются из очереди
+    Если после чтения в pipe остается больше половины его емкости - это событие back-pressure:
+    ffmpeg вот-вот упрется в заполненный pipe
+    """
+
+    BACKPRESSURE_LOG_INTERVAL = 10  # seconds, как часто писать в лог о back-pressure/перегрузке
+    MAX_LINE_LEN = 65536  # Строка без перевода строки длиннее этого значения отдается как есть
+
+    def __init__(self, name: str, fd: int, on_lines: typing.Callable, logger: logging.Logger,
+                 read_size: int = 65536, max_buffered: int = 16 * 1024 * 1024,
+                 overload_policy: str = OVERLOAD_DROP, spill_path: str = None,
+                 on_overload: typing.Callable = None, on_data: typing.Callable = None):
+        if overload_policy not in (OVERLOAD_DROP, OVERLOAD_SPILL):
+            raise Exception('Wrong overload policy ({})'.format(overload_policy))
+        if overload_policy == OVERLOAD_SPILL and not spill_path:
+            raise Exception('Spill overload policy requires spill_path')
+        self.name = name
+        self.fd = fd
+        self.read_size = read_size
+        self.max_buffered = max_buffered
+        self.overload_policy = overload_policy
+        self.spill_path = spill_path
+        self._on_lines = on_lines  # on_lines(lines: List[bytes], wall_time: float)
+        self._on_overload = on_overload  # on_overload(dropped_bytes: int)
+        # on_data(data: bytes, wall_time: float) - вместо on_lines, блоки как прочитаны, без деления на строки.
+        #   data=None - конец данных
+        self._on_data = on_data
+        self._logger = logger
+        self._chunks = collections.deque()
+        self._buffered = 0
+        self._cond = threading.Condition(threading.Lock())
+        self._eof = False
+        self._finish = False
+        self._resync = False  # Начало очереди выброшено - остаток прошлой строки больше не актуален
+        self._dropped_since_resync = 0
+        self._spill_file = None
+        self._carry = b''  # Незаконченная строка из прошлого блока
+        self._parse_finished = False
+        self._hub = None  # IngestHub, если чтение и разбор идут в общих потоках
+        self._reader_thread = None
+        self._parser_thread = None
+        self._last_warning_time = 0
+        self.pipe_capacity = get_pipe_capacity(fd)
+        self.stats = {
+            'reads': 0,
+            'bytes_read': 0,
+            'lines': 0,
+            'max_read_size': 0,
+            'max_pending_bytes': 0,
+            'backpressure_events': 0,
+            'overload_events': 0,
+            'dropped_bytes': 0,
+            'spilled_bytes': 0,
+            'parse_batches': 0,
+            'parse_seconds': 0.0,  # Разбор и обработчики on_lines/on_data (запись в буфер, метрики)
+        }
+        self.read_sizes = Histogram(READ_SIZE_BUCKETS)  # Размеры прочитанных блоков (/debug/stats)
+
+    def start(self, hub: 'IngestHub' = None):
+        """
+        hub - читать и разбирать в общих потоках IngestHub вместо двух своих
+        """
+        if hub is not None:
+            hub.add(self)
+            return
+        self._reader_thread = threading.Thread(target=self._read_loop, daemon=True)
+        self._parser_thread = threading.Thread(target=self._parse_loop, daemon=True)
+        self._parser_thread.start()
+        self._reader_thread.start()
+
+    def run(self):
+        """
+        Чтение в текущем потоке (до EOF или stop), разбор - в отдельном
+        """
+        self._parser_thread = threading.Thread(target=self._parse_loop, daemon=True)
+        self._parser_thread.start()
+        self._read_loop()
+        self._parser_thread.join()
+
+    def stop(self):
+        with self._cond:
+            self._finish = True
+            self._cond.notify_all()
+        if self._hub is not None:
+            self._hub.remove(self)
+            self._hub.notify(self)
+
+    def join(self, timeout: float = None):
+        for t in (self._reader_thread, self._parser_thread):
+            if t and t is not threading.current_thread():
+                t.join(timeout)
+
+    def get_buffered_bytes(self) -> int:
+        return self._buffered
+
+    def _warn(self, msg: str):
+        now = time.monotonic()
+        if now - self._last_warning_time < self.BACKPRESSURE_LOG_INTERVAL:
+            return
+        self._last_warning_time = now
+        self._logger.warning('{} ingest: {} (stats: {})'.format(self.name, msg, self.stats))
+
+    def _read_loop(self):
+        while not self._finish and self._read_once():
+            pass
+        self._set_eof()
+
+    def _read_once(self) -> bool:
+        """
+        Одно чтение из pipe. False - EOF или ошибка, читать больше нечего
+        """
+        stats = self.stats
+        try:
+            chunk = os.read(self.fd, self.read_size)
+        except BlockingIOError:
+            # Неблокирующий fd (IngestHub): данных пока нет
+            return True
+        except OSError as e:
+            self._logger.error('{} ingest: read error: {}'.format(self.name, e))
+            return False
+        if not chunk:
+            return False
+        wall_time = time.time()
+        pending = get_pending_bytes(self.fd)
+        stats['reads'] += 1
+        stats['bytes_read'] += len(chunk)
+        self.read_sizes.observe(len(chunk))
+        if len(chunk) > stats['max_read_size']:
+            stats['max_read_size'] = len(chunk)
+        if pending > stats['max_pending_bytes']:
+            stats['max_pending_bytes'] = pending
+        if pending >= self.pipe_capacity // 2:
+            stats['backpressure_events'] += 1
+            self._warn('pipe back-pressure, {} of {} bytes pending'.format(pending, self.pipe_capacity))
+        with self._cond:
+            self._chunks.append((wall_time, chunk))
+            self._buffered += len(chunk)
+            if self._buffered > self.max_buffered:
+                self._handle_overload()
+            self._cond.notify()
+        if self._hub is not None:
+            self._hub.notify(self)
+        return True
+
+    def _set_eof(self):
+        with self._cond:
+            self._eof = True
+            self._cond.notify_all()
+        if self._hub is not None:
+            self._hub.notify(self)
+        self._logger.info('FFMpeg {} reader stopped'.format(self.name))
+
+    def _handle_overload(self):
+        # Вызывается под self._cond
+        self.stats['overload_events'] += 1
+        while self._buffered > self.max_buffered and len(self._chunks) > 1:
+            _, chunk = self._chunks.popleft()
+            self._buffered -= len(chunk)
+            if self.overload_policy == OVERLOAD_SPILL:
+                self._spill(chunk)
+            self.stats['dropped_bytes'] += len(chunk)
+            self._dropped_since_resync += len(chunk)
+            self._resync = True
+        self._warn('parser is too slow, oldest data {}'.format(
+            'spilled to {}'.format(self.spill_path) if self.overload_policy == OVERLOAD_SPILL else 'dropped'))
+
+    def _spill(self, chunk: bytes):
+        try:
+            if self._spill_file is None:
+                os.makedirs(os.path.dirname(self.spill_path), exist_ok=True)
+                self._spill_file = open(self.spill_path, 'ab')
+            self._spill_file.write(chunk)
+            self.stats['spilled_bytes'] += len(chunk)
+        except OSError as e:
+            self._logger.error('{} ingest: spill error: {}'.format(self.name, e))
+
+    def _parse_loop(self):
+        more = True
+        while more:
+            # Ошибка обработчика (on_lines/on_data) не останавливает разбор, как в IngestHub
+            try:
+                more = self._parse_step(wait=True)
+                if not more:
+                    self._parse_done()
+            except Exception as e:
+                self._logger.error('{} ingest: parse error: {}'.format(self.name, e))
+
+    def _parse_step(self, wait: bool) -> bool:
+        """
+        Разбирает все накопленные блоки. wait - ждать новых блоков, если очередь пуста.
+        Возвращает False, если данных больше не будет (EOF или stop) и очередь пуста
+        """
+        with self._cond:
+            while wait and not self._chunks and not self._eof and not self._finish:
+                self._cond.wait()
+            batch = list(self._chunks)
+            self._chunks.clear()
+            self._buffered = 0
+            resync, dropped = self._resync, self._dropped_since_resync
+            self._resync, self._dropped_since_resync = False, 0
+        if batch:
+            started = time.perf_counter()
+            self._parse_batch(batch, resync, dropped)
+            stats = self.stats
+            stats['parse_seconds'] += time.perf_counter() - started
+            stats['parse_batches'] += 1
+        with self._cond:
+            return bool(self._chunks) or not (self._eof or self._finish)
+
+    def _parse_batch(self, batch: list, resync: bool, dropped: int):
+        if self._on_data is not None:
+            if resync and self._on_overload:
+                self._on_overload(dropped)
+            for wall_time, chunk in batch:
+                self.stats['lines'] += chunk.count(b'\n')
+                self._on_data(chunk, wall_time)
+            return
+        carry = self._carry
+        if resync:
+            if self._on_overload:
+                self._on_overload(dropped)
+            # Начало первого блока - продолжение выброшенной строки
+            carry = b''
+            wall_time, chunk = batch[0]
+            pos = chunk.find(b'\n')
+            batch[0] = (wall_time, chunk[pos + 1:] if pos >= 0 else b'')
+        for wall_time, chunk in batch:
+            lines, carry = split_lines(carry + chunk)
+            if len(carry) > self.MAX_LINE_LEN:
+                lines.append(carry)
+                carry = b''
+            if lines:
+                self.stats['lines'] += len(lines)
+                self._on_lines(lines, wall_time)
+        self._carry = carry
+
+    def _parse_done(self):
+        if self._parse_finished:
+            return
+        self._parse_finished = True
+        carry = self._carry.strip(b'\r')
+        self._carry = b''
+        if not self._finish:
+            if self._on_data is not None:
+                self._on_data(None, time.time())
+            elif carry:
+                self.stats['lines'] += 1
+                self._on_lines([carry], time.time())
+        if self._spill_file:
+            self._spill_file.close()
+
+
+class IngestHub:
+    """
+    Общие потоки для многих PipeIngest (режим супервизора): один поток ждет данные во всех pipe
+    через selectors и читает их, второй разбирает прочитанное. Количество потоков не зависит
+    от количества ffmpeg, очередь, back-pressure и политика перегрузки у каждого PipeIngest свои
+    """
+
+    SELECT_TIMEOUT = 0.5  # seconds, как часто проверять остановку
+
+    def __init__(self, logger: logging.Logger):
+        self._logger = logger
+        self._selector = selectors.DefaultSelector()
+        self._lock = threading.Lock()  # регистрация fd и чтение по событиям
+        self._ready = collections.OrderedDict()  # PipeIngest с данными для разбора, без повторов
+        self._cond = threading.Condition(threading.Lock())
+        self._finish = False
+        self._threads = []
+
+    def start(self):
+        for target in (self._read_loop, self._parse_loop):
+            t = threading.Thread(target=target, daemon=True)
+            self._threads.append(t)
+            t.start()
+
+    def stop(self):
+        self._finish = True
+        with self._cond:
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join()
+
+    def add(self, ingest: PipeIngest):
+        os.set_blocking(ingest.fd, False)
+        ingest._hub = self
+        with self._lock:
+            self._selector.register(ingest.fd, selectors.EVENT_READ, ingest)
+
+    def remove(self, ingest: PipeIngest):
+        # После возврата чтение из ingest.fd не идет, fd можно закрывать
+        with self._lock:
+            key = self._selector.get_map().get(ingest.fd)
+            if key is not None and key.data is ingest:
+                self._selector.unregister(ingest.fd)
+
+    def notify(self, ingest: PipeIngest):
+        with self._cond:
+            self._ready[ingest] = None
+            self._cond.notify()
+
+    def _read_loop(self):
+        selector = self._selector
+        while not self._finish:
+            if not selector.get_map():
+                time.sleep(self.SELECT_TIMEOUT)
+                continue
+            events = selector.select(self.SELECT_TIMEOUT)
+            with self._lock:
+                for key, _ in events:
+                    ingest = key.data
+                    if selector.get_map().get(key.fd) is not key:
+                        # fd удален, пока шел select
+                        continue
+                    if ingest._finish or not ingest._read_once():
+                        selector.unregister(key.fd)
+                        ingest._set_eof()
+
+    def _parse_loop(self):
+        while True:
+            with self._cond:
+                while not self._ready and not self._finish:
+                    self._cond.wait()
+                if self._finish:
+                    break
+                ingest, _ = self._ready.popitem(last=False)
+            try:
+                if not ingest._parse_step(wait=False):
+                    ingest._parse_done()
+            except Exception as e:
+                self._logger.error('{} ingest: parse error: {}'.format(ingest.name, e))
@@ -1,4 +1,8 @@
+import array
+import itertools
+import threading
 from typing import List
+from render import LineCache, TimestampFormatter, RENDER_TEXT, render_line
 
 
 def progress_str_to_dict(progress_log: str) -> dict:
@@ -10,16 +14,212 @@ def progress_str_to_dict(progress_log: str) -> dict:
     return result
 
 
+class LogCursor:
+    """
+    Позиция читателя в буфере. Читает пачками только новые элементы и считает,
+    сколько элементов было вытеснено до того, как читатель успел их прочитать
+    """
+
+    def __init__(self, buf: 'LogBuffer', position: int):
+        self.buf = buf
+        self.position = position
+        self.lost = 0  # Всего пропущено элементов за время жизни курсора
+
+    def pending(self) -> int:
+        return self.buf.get_current_position() - self.position
+
+    def read(self, max_items: int = 0, timeout: float = None) -> (list, int):
+        """
+        max_items - максимальный размер пачки, 0 - все доступные
+        timeout - сколько секунд ждать новых элементов, None - не ждать
+        Возвращает список элементов и количество пропущенных (вытесненных) перед ними
+        """
+        if timeout is not None:
+            self.buf.wait_new_items(self.position, timeout)
+        items, lost, self.position = self.buf.read_from(self.position, max_items)
+        self.lost += lost
+        return items, lost
+
+    def render(self, max_items: int = 0, timeout: float = None, fmt: str = RENDER_TEXT) -> (List[bytes], int):
+        """
+        Как read, но возвращает отрисованные строки (render_from): для текста - b'<dt> line\\n'
+        """
+        if timeout is not None:
+            self.buf.wait_new_items(self.position, timeout)
+        lines, lost, self.position = self.buf.render_from(self.position, max_items, fmt)
+        self.lost += lost
+        return lines, lost
+
+
 class LogBuffer:
 
     def __init__(self, size_max):
         self._next = 0
         self.max = size_max
         self._data = [None] * size_max
+        self._init_waiters()
+
+    def _new_column(self, name: str, typecode: str):
+        """
+        Колонка на size_max значений: array в памяти или memoryview отображенного файла (self._storage, history.py)
+        """
+        storage = getattr(self, '_storage', None)
+        if storage is not None:
+            return storage.column(name, typecode)
+        return array.array(typecode, bytes(array.array(typecode).itemsize * self.max))
+
+    @staticmethod
+    def _copy_column(column):
+        # Копия колонки файла истории (memoryview) в памяти - перед закрытием файла
+        copy = array.array(column.format)
+        copy.frombytes(column.tobytes())
+        return copy
+
+    def _column_range(self, column, pos_from: int, pos_to: int):
+        # Значения колонки для позиций [pos_from, pos_to): срез или, при завороте, два среза подряд
+        slot_from, slot_to = pos_from % self.max, pos_to % self.max
+        if pos_to - pos_from == 0:
+            return column[:0]
+        if slot_from < slot_to:
+            return column[slot_from:slot_to]
+        return itertools.chain(column[slot_from:], column[:slot_to])
+
+    def _init_waiters(self):
+        self._new_items = threading.Condition(threading.Lock())
+        self._waiters = 0
+        self._line_caches = {}  # формат -> LineCache, создается при первом запросе в этом формате
+        self._timestamps = TimestampFormatter()
+
+    def _wakeup_waiters(self):
+        # Вызывается после append. Блокировка берется, только если кто-то ждет
+        if self._waiters:
+            with self._new_items:
+                self._new_items.notify_all()
+
+    def wakeup(self):
+        """
+        Разбудить всех ждущих читателей (например, при остановке)
+        """
+        with self._new_items:
+            self._new_items.notify_all()
 
     def append(self, item):
         self._data[self._next % self.max] = item
         self._next += 1
+        self._wakeup_waiters()
+
+    def wait_new_items(self, position: int, timeout: float) -> bool:
+        """
+        Ждет, пока в буфере появятся элементы после position. Возвращает True, если они есть
+        """
+        if self._next > position:
+            return True
+        with self._new_items:
+            self._waiters += 1
+            try:
+                if self._next <= position:
+                    self._new_items.wait(timeout)
+            finally:
+                self._waiters -= 1
+        return self._next > position
+
+    def cursor(self, position: int = None) -> LogCursor:
+        """
+        position - с какой позиции читать, None - только новые элементы, 0 - с самого старого доступного
+        """
+        if position is None:
+            position = self.get_current_position()
+        return LogCursor(self, position)
+
+    def get_first_position(self) -> int:
+        # Позиция самого старого элемента, который еще хранится в буфере
+        return max(0, self._next - self.max)
+
+    def _get_range(self, pos_from: int, pos_to: int) -> list:
+        if pos_to <= pos_from:
+            return []
+        slot_from, slot_to = pos_from % self.max, pos_to % self.max
+        if slot_from < slot_to:
+            return self._data[slot_from:slot_to]
+        return self._data[slot_from:] + self._data[:slot_to]
+
+    def read_from(self, position: int, max_items: int = 0) -> (list, int, int):
+        """
+        Прочитать элементы, начиная с позиции position
+        Возвращает список элементов, количество вытесненных элементов до них и следующую позицию для чтения
+        """
+        return self._read_from(position, max_items, self._get_range)
+
+    def _read_from(self, position: int, max_items: int, get_range) -> (list, int, int):
+        first = self.get_first_position()
+        next_ = self.get_current_position()
+        lost = 0
+        if position < first:
+            lost = first - position
+            position = first
+        position = min(position, next_)
+        pos_to = next_ if max_items <= 0 else min(next_, position + max_items)
+        items = get_range(position, pos_to)
+        # Писатель мог перезаписать начало диапазона во время копирования
+        first = self.get_first_position()
+        if first > position:
+            overwritten = min(first, pos_to) - position
+            items = items[overwritten:]
+            lost += overwritten
+        return items, lost, pos_to
+
+    def render_from(self, position: int, max_items: int = 0, fmt: str = RENDER_TEXT) -> (List[bytes], int, int):
+        """
+        Как read_from, но возвращает строки, отрисованные для HTTP ответа (render.render_line).
+        Каждая строка отрисовывается один раз и дальше берется из кэша по позиции
+        """
+        return self._read_from(position, max_items, lambda pos_from, pos_to: self._render_range(pos_from, pos_to, fmt))
+
+    def _render_range(self, pos_from: int, pos_to: int, fmt: str) -> List[bytes]:
+        cache = self._line_caches.get(fmt)
+        if cache is None:
+            cache = self._line_caches.setdefault(fmt, LineCache(self.max))
+        get = cache.get
+        rendered = [get(position) for position in range(pos_from, pos_to)]
+        try:
+            first_missing = rendered.index(None)
+        except ValueError:
+            return rendered
+        # Обычно не хватает только последних строк, поэтому исходные строки берутся с первой пропущенной
+        timestamps = self._timestamps
+        position = pos_from + first_missing
+        for i, (wall_time, line) in enumerate(self._get_plain_range(position, pos_to), first_missing):
+            if rendered[i] is None:
+                rendered[i] = render_line(timestamps, wall_time, line, fmt)
+                cache.put(pos_from + i, rendered[i])
+        return rendered
+
+    def _get_plain_range(self, pos_from: int, pos_to: int):
+        # [(unix time, str|bytes)] для отрисовки
+        return [(dt.timestamp(), line) for dt, line in self._get_range(pos_from, pos_to)]
+
+    def _time_key_at(self, position: int) -> float:
+        # Ключ для поиска по времени. Элементы LogBuffer - (datetime, ...)
+        return self._data[position % self.max][0].timestamp()
+
+    def _wall_to_time_key(self, wall_time: float) -> float:
+        return wall_time
+
+    def position_at_time(self, wall_time: float, after: bool = False) -> int:
+        """
+        Бинарный поиск по хранимым элементам (время в буфере растет вместе с позицией)
+        Возвращает первую позицию, время которой >= wall_time (after=True: > wall_time)
+        """
+        key = self._wall_to_time_key(wall_time)
+        lo, hi = self.get_first_position(), self.get_current_position()
+        while lo < hi:
+            mid = (lo + hi) // 2
+            mid_key = self._time_key_at(mid)
+            if mid_key < key or after and mid_key == key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
 
     def get_last_items(self, n) -> (List[str], int):
         # Получить n количество последних строк
@@ -0,0 +1,234 @@
+import gzip
+import logging
+import os
+import queue
+import re
+import shutil
+import threading
+import time
+import typing
+from config import Config
+
+
+COMPRESSION_GZIP = 'gzip'
+COMPRESSION_ZSTD = 'zstd'
+_EXTENSIONS = {COMPRESSION_GZIP: '.gz', COMPRESSION_ZSTD: '.zst'}
+
+
+def _zstd_open(path: str, mode: str):
+    try:
+        from compression import zstd  # python 3.14+
+        return zstd.open(path, mode)
+    except ImportError:
+        import zstandard
+        return zstandard.open(path, mode)
+
+
+def is_zstd_available() -> bool:
+    try:
+        from compression import zstd  # noqa: F401
+        return True
+    except ImportError:
+        pass
+    try:
+        import zstandard  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _open_compressed(path: str, compression: str):
+    if compression == COMPRESSION_ZSTD:
+        return _zstd_open(path, 'wb')
+    return gzip.open(path, 'wb', compresslevel=6)
+
+
+class _Compressor:
+    """
+    Фоновый поток сжатия ротированных логов, один на процесс. Поток с пониженным приоритетом (nice 19),
+    чтобы сжатие не отнимало CPU и диск у чтения pipe ffmpeg
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, path: str, compression: str, logger: logging.Logger):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        self._queue.put((path, compression, logger))
+
+    def join(self):
+        self._queue.join()
+
+    def _run(self):
+        get_native_id = getattr(threading, 'get_native_id', None)
+        if get_native_id is not None:
+            try:
+                os.setpriority(os.PRIO_PROCESS, get_native_id(), 19)
+            except OSError:
+                pass
+        while True:
+            path, compression, logger = self._queue.get()
+            try:
+                self._compress(path, compression)
+            except Exception as e:
+                logger.error('Log compression error ({}): {}'.format(path, e))
+            finally:
+                self._queue.task_done()
+
+    @staticmethod
+    def _compress(path: str, compression: str):
+        target = path + _EXTENSIONS[compression]
+        tmp_path = target + '.tmp'
+        try:
+            with open(path, 'rb') as src, _open_compressed(tmp_path, compression) as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+        except FileNotFoundError:
+            # Файл уже удален как лишняя резервная копия
+            return
+        os.rename(tmp_path, target)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # Копия удалена как лишняя, пока сжималась
+            os.remove(target)
+
+
+compressor = _Compressor()
+
+
+class LogFile:
+    """
+    Файловый лог stdout ffmpeg без logging: строки приходят уже отрисованными (b'<dt> line\\n'),
+    пачка пишется одним os.write. Ротация по времени (LOG_ROTATION_MODE=days), по размеру (size)
+    и по запросу (SIGHUP, request_rollover) выполняется в потоке записи перед очередной пачкой.
+    Ротированный файл переименовывается в <path>.<n> (n растет) и сжимается в фоне (LOG_COMPRESSION),
+    хранятся LOG_ROTATION_BACKUP последних ротированных файлов (0 - все)
+    """
+
+    ERROR_LOG_INTERVAL = 10  # seconds, как часто писать в лог об ошибках записи
+
+    def __init__(self, path: str, cfg: Config = None, logger: logging.Logger = None):
+        cfg = cfg or Config()
+        if cfg.LOG_ROTATION_MODE not in ('days', 'size'):
+            raise Exception('Wrong LOG_ROTATION_MODE value ({})'.format(cfg.LOG_ROTATION_MODE))
+        self.path = path
+        self.mode = cfg.LOG_ROTATION_MODE
+        self.interval = cfg.LOG_ROTATION_DAYS * 24 * 60 * 60
+        self.max_bytes = cfg.LOG_ROTATION_MAX_KBYTES * 1024
+        self.backup_count = cfg.LOG_ROTATION_BACKUP
+        self._logger = logger or logging.getLogger('LogFile')
+        self.compression = cfg.LOG_COMPRESSION
+        if self.compression and self.compression not in _EXTENSIONS:
+            raise Exception('Wrong LOG_COMPRESSION value ({})'.format(self.compression))
+        if self.compression == COMPRESSION_ZSTD and not is_zstd_available():
+            self._logger.error('zstd is not available (python 3.14+ or zstandard package), using gzip')
+            self.compression = COMPRESSION_GZIP
+        self._rollover_requested = False
+        self._last_error_time = 0
+        self._backups = self._find_backups()
+        self._fd = None
+        self._open()
+        self.stats = {
+            'lines': 0,
+            'bytes': 0,
+            'writes': 0,
+            'rollovers': 0,
+        }
+
+    def _find_backups(self) -> typing.List[int]:
+        # Номера уже существующих ротированных файлов - один раз при открытии, дальше список ведется в памяти
+        directory, name = os.path.split(self.path)
+        pattern = re.compile(r'^{}\.(\d+)(\.gz|\.zst)?$'.format(re.escape(name)))
+        numbers = set()
+        for filename in os.listdir(directory or '.'):
+            match = pattern.match(filename)
+            if match:
+                numbers.add(int(match.group(1)))
+        return sorted(numbers)
+
+    def _open(self):
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._size = os.fstat(self._fd).st_size
+        self._rollover_at = time.time() + self.interval
+
+    def request_rollover(self):
+        """
+        Ротация перед следующей записью. Безопасно вызывать из обработчика сигнала
+        """
+        self._rollover_requested = True
+
+    def write(self, lines: typing.List[bytes]):
+        """
+        lines - готовые строки с переводом строки. Пустой список - только проверить ротацию
+        """
+        if self._fd is None:
+            return
+        if self._rollover_requested or (self.mode == 'days' and time.time() >= self._rollover_at):
+            self._rollover()
+        if not lines:
+            return
+        data = b''.join(lines)
+        if self.mode == 'size' and self._size and self._size + len(data) > self.max_bytes:
+            self._rollover()
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(self._fd, view):]
+        except OSError as e:
+            self._error('Log write error ({}): {}'.format(self.path, e))
+            return
+        self._size += len(data)
+        stats = self.stats
+        stats['lines'] += len(lines)
+        stats['bytes'] += len(data)
+        stats['writes'] += 1
+
+    def _rollover(self):
+        self._rollover_requested = False
+        number = self._backups[-1] + 1 if self._backups else 0
+        backup_path = '{}.{}'.format(self.path, number)
+        try:
+            os.rename(self.path, backup_path)
+        except FileNotFoundError:
+            # Файл удален или перемещен снаружи (logrotate) - просто открываем новый
+            backup_path = None
+        except OSError as e:
+            self._error('Log rotation error ({}): {}'.format(self.path, e))
+            self._rollover_at = time.time() + self.interval
+            return
+        os.close(self._fd)
+        self._open()
+        self.stats['rollovers'] += 1
+        if backup_path is None:
+            return
+        self._backups.append(number)
+        if self.compression:
+            compressor.submit(backup_path, self.compression, self._logger)
+        while 0 < self.backup_count < len(self._backups):
+            self._remove_backup(self._backups.pop(0))
+
+    def _remove_backup(self, number: int):
+        path = '{}.{}'.format(self.path, number)
+        for suffix in ('',) + tuple(_EXTENSIONS.values()):
+            try:
+                os.remove(path + suffix)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                self._error('Log backup remove error ({}): {}'.format(path + suffix, e))
+
+    def _error(self, msg: str):
+        now = time.monotonic()
+        if now - self._last_error_time >= self.ERROR_LOG_INTERVAL:
+            self._last_error_time = now
+            self._logger.error(msg)
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
@@ -5,8 +5,8 @@ import datetime
 from logging.handlers import TimedRotatingFileHandler, RotatingFileHandler
 
 
-def get_file_logger_handler(log_path: str) -> logging.Handler:
-    cfg = Config()
+def get_file_logger_handler(log_path: str, cfg: Config = None) -> logging.Handler:
+    cfg = cfg or Config()
     if cfg.LOG_ROTATION_MODE == 'days':
         handler = TimedRotatingFileHandler(log_path,
                                            when="d",
@@ -30,6 +30,11 @@ class Logger(logging.Logger):
     _first_run: bool = False
 
     def __new__(cls, *args, **kwargs):
+        if kwargs.get('cfg') is not None:
+            # Логгер потока в режиме супервизора - отдельный экземпляр со своим файлом
+            instance = super().__new__(cls)
+            instance._first_run = True
+            return instance
         if cls._instance is None:
             cls._instance = super().__new__(cls)
             cls._first_run = True
@@ -37,11 +42,11 @@ class Logger(logging.Logger):
             cls._first_run = False
         return cls._instance
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, cfg: Config = None, **kwargs):
         if not self._first_run:
             return
         super().__init__(*args, **kwargs)
-        self.cfg = Config()
+        self.cfg = cfg or Config()
         self.start_time = datetime.datetime.now()
         if self.cfg.IS_DEBUG:
             self.setLevel('DEBUG')
@@ -49,12 +54,17 @@ class Logger(logging.Logger):
             self.setLevel('INFO')
 
         std_handler = logging.StreamHandler()
-        formatter = logging.Formatter("[%(asctime)s] %(message)s", "%Y-%m-%d %H:%M:%S %Z")
+        if self.cfg.STREAM_ID:
+            # Потоки супервизора пишут в общий stderr - нужен id потока
+            fmt = "[%(asctime)s] [{}] %(message)s".format(self.cfg.STREAM_ID.replace('%', '%%'))
+        else:
+            fmt = "[%(asctime)s] %(message)s"
+        formatter = logging.Formatter(fmt, "%Y-%m-%d %H:%M:%S %Z")
         std_handler.setFormatter(formatter)
         self.addHandler(std_handler)
 
         start_time = self.start_time.strftime('%Y_%m_%d__%H_%M_%S')
         log_path = os.path.join(self.cfg.LOGS_PATH, 'manager_{}.log'.format(start_time))
-        file_handler = get_file_logger_handler(log_path)
+        file_handler = get_file_logger_handler(log_path, self.cfg)
         file_handler.setFormatter(formatter)
         self.addHandler(file_handler)
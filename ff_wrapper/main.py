@@ -2,23 +2,115 @@
 
 import sys
 import time
-from ffmpeg import FFMpegProc
+import threading
+from startup import TIMINGS, find_ffmpeg_bin, spawn_ffmpeg
 from config import Config
-from ffmpeg_manager import FFMpegManager
 
+# Остальные модули тянут asyncio, http.server, logging.handlers (~80мс на импорт) и импортируются в run_*:
+#   при FAST_START ffmpeg запускается до них
 
-if __name__ == "__main__":
-    args = ' '.join(sys.argv[1:])
-    cfg = Config()
+
+def fast_spawn(args: str, cfg: Config):
+    """
+    FAST_START: запустить ffmpeg сразу после чтения конфига. None - запускать обычным путем (FFMpegProc.run)
+    """
+    bin_path = find_ffmpeg_bin()
+    if not args or not bin_path:
+        return None
+    try:
+        spawned = spawn_ffmpeg(bin_path, args, cfg.PROGRESS_FIFO_PATH)
+    except OSError as e:
+        print('Fast start failed, ffmpeg will be started after init: {}'.format(e))
+        return None
+    TIMINGS.mark('spawn')
+    # Каталоги логов и статуса нужны логгеру FFMpegProc, файлы статуса пишутся после запуска чтения
+    cfg.create_dirs()
+    return spawned
+
+
+def run_supervisor(cfg: Config):
+    # Режим супервизора: все потоки из STREAMS_CONFIG в одном процессе, общий HTTP сервер
+    from http_server import get_http_server
+    from supervisor import Supervisor, load_streams
+    supervisor = Supervisor(load_streams(cfg.STREAMS_CONFIG))
+    supervisor.start()
+    if not cfg.NO_HTTP_SERVER:
+        http_server = get_http_server(supervisor=supervisor)
+        threading.Thread(target=http_server.serve_forever, daemon=True).start()
+    while True:
+        try:
+            time.sleep(60)
+        except KeyboardInterrupt:
+            break
+    supervisor.stop()
+    sys.exit(1)
+
+
+def run_event_loop(args: str, cfg: Config, spawned=None):
+    # EVENT_LOOP: чтение pipe, проверки менеджера, запись логов и прием HTTP соединений - в главном потоке
+    import socketserver
+    from eventloop import EventLoop
+    from ffmpeg import FFMpegProc
+    from ffmpeg_manager import FFMpegManager
+    from http_server import get_http_server
+    from logger import Logger
+    TIMINGS.mark('imports')
+    logger = Logger('EventLoop')
+    loop = EventLoop(logger)
+    ffmpeg = FFMpegProc(args, io_hub=loop)
+    TIMINGS.mark('init')
+    process = ffmpeg.run(spawned)
+    if process is None:
+        ffmpeg.stop()
+        sys.exit(1)
+    TIMINGS.mark('readers')
+    cfg.FFMPEG_PID = str(process.pid)
+    cfg.save_status_to_files()
+    TIMINGS.mark('status_files')
+    ffmpeg.on_stdout = lambda: loop.call_soon(ffmpeg.write_stdout_logs)
+    ffmpeg_manager = FFMpegManager(ffmpeg)
+    ffmpeg_manager.attach(loop)
+    if not cfg.NO_HTTP_SERVER:
+        http_server = get_http_server(ffmpeg)
+        if isinstance(http_server, socketserver.ThreadingMixIn):
+            # Соединения принимает цикл, запросы обрабатываются в потоках сервера
+            loop.add_reader(http_server.fileno(), http_server._handle_request_noblock)
+        else:
+            threading.Thread(target=http_server.serve_forever, daemon=True).start()
+    TIMINGS.mark('manager_http')
+    logger.info('Startup timings: {}'.format(TIMINGS.format()))
+    try:
+        loop.run(until=lambda: ffmpeg.finish)
+    except KeyboardInterrupt:
+        pass
+    ffmpeg.stop()
+    ffmpeg_manager.stop()
+    sys.exit(1)
+
+
+def run_threads(args: str, cfg: Config, spawned=None):
+    from ffmpeg import FFMpegProc
+    from ffmpeg_manager import FFMpegManager
+    from http_server import get_http_server
+    from logger import Logger
+    TIMINGS.mark('imports')
     ffmpeg = FFMpegProc(args)
-    process = ffmpeg.run()
+    TIMINGS.mark('init')
+    process = ffmpeg.run(spawned)
     if process is None:
         ffmpeg.stop()
         sys.exit(1)
+    TIMINGS.mark('readers')
     cfg.FFMPEG_PID = str(process.pid)
     cfg.save_status_to_files()
+    TIMINGS.mark('status_files')
     ffmpeg_manager = FFMpegManager(ffmpeg)
     ffmpeg_manager.run()
+    if not cfg.NO_HTTP_SERVER:
+        http_server = get_http_server(ffmpeg)
+        threading.Thread(target=http_server.serve_forever, daemon=True).start()
+    TIMINGS.mark('manager_http')
+    Logger('main').info('Startup timings: {}'.format(TIMINGS.format()))
     while True:
         try:
             time.sleep(0.5)
@@ -30,3 +122,15 @@ if __name__ == "__main__":
     ffmpeg_manager.stop()
     time.sleep(1)
     sys.exit(1)
+
+
+if __name__ == "__main__":
+    args = ' '.join(sys.argv[1:])
+    cfg = Config()
+    TIMINGS.mark('config')
+    if cfg.STREAMS_CONFIG:
+        run_supervisor(cfg)
+    spawned = fast_spawn(args, cfg) if cfg.FAST_START else None
+    if cfg.EVENT_LOOP:
+        run_event_loop(args, cfg, spawned)
+    run_threads(args, cfg, spawned)
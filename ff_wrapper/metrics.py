@@ -0,0 +1,218 @@
+import bisect
+import collections
+import math
+import typing
+from progress import ProgressRecord, is_na
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+FPS_BUCKETS = (1, 5, 10, 15, 20, 24, 25, 30, 50, 60, 120)
+SPEED_BUCKETS = (0.5, 0.8, 0.9, 0.95, 1, 1.05, 1.1, 1.5, 2, 5)
+BITRATE_BUCKETS = (100, 250, 500, 1000, 2000, 3000, 5000, 8000, 15000, 30000)  # kbits/s
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными границами (le) в формате Prometheus. observe - O(log buckets)
+    """
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: typing.Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # последний - больше всех границ (+Inf)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        if value != value:
+            # N/A
+            return
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class StreamMetrics:
+    """
+    Метрики потока, обновляемые по мере поступления данных (поток разбора progress/stdout, менеджер).
+    Стоимость /metrics не зависит от размера буферов
+    """
+
+    def __init__(self):
+        self.progress_blocks = 0
+        self.stdout_lines = 0
+        self.last_progress = None  # ProgressRecord
+        self.fps = Histogram(FPS_BUCKETS)
+        self.speed = Histogram(SPEED_BUCKETS)
+        self.bitrate = Histogram(BITRATE_BUCKETS)
+        self.encoding_check_failures = 0  # Сколько раз менеджер фиксировал ошибку кодирования
+        self.encoding_error_seconds = 0.0  # Сколько времени менеджер провел в состоянии ошибки
+
+    def observe_progress(self, record: ProgressRecord):
+        self.progress_blocks += 1
+        self.last_progress = record
+        self.fps.observe(record.fps)
+        self.speed.observe(record.speed)
+        self.bitrate.observe(record.bitrate)
+
+    def observe_stdout_lines(self, count: int):
+        self.stdout_lines += count
+
+
+def _format_value(value) -> str:
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, int):
+        return str(value)
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                          for k, v in labels.items()) + '}'
+
+
+class Exposition:
+    """
+    Сборка ответа /metrics в текстовом формате Prometheus. Сэмплы одной метрики разных потоков
+    группируются под одним # HELP/# TYPE
+    """
+
+    def __init__(self):
+        self._families = collections.OrderedDict()  # name -> (type, help, [строки])
+
+    def _family(self, name: str, metric_type: str, help_text: str) -> list:
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = (metric_type, help_text, [])
+        return family[2]
+
+    def add(self, name: str, metric_type: str, help_text: str, labels: dict, value):
+        if value is None or (not isinstance(value, bool) and is_na(value)):
+            # N/A в ProgressRecord - сэмпл пропускается
+            return
+        self._family(name, metric_type, help_text).append(
+            '{}{} {}'.format(name, _format_labels(labels), _format_value(value)))
+
+    def add_histogram(self, name: str, help_text: str, labels: dict, histogram: Histogram):
+        lines = self._family(name, 'histogram', help_text)
+        cumulative = 0
+        for le, count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+            cumulative += count
+            bucket_labels = collections.OrderedDict(labels)
+            bucket_labels['le'] = _format_value(float(le))
+            lines.append('{}_bucket{} {}'.format(name, _format_labels(bucket_labels), cumulative))
+        lines.append('{}_sum{} {}'.format(name, _format_labels(labels), _format_value(histogram.sum)))
+        lines.append('{}_count{} {}'.format(name, _format_labels(labels), histogram.count))
+
+    def render(self) -> bytes:
+        out = []
+        for name, (metric_type, help_text, lines) in self._families.items():
+            out.append('# HELP {} {}'.format(name, help_text))
+            out.append('# TYPE {} {}'.format(name, metric_type))
+            out.extend(lines)
+        return ('\n'.join(out) + '\n').encode('utf-8')
+
+
+def collect_ffmpeg_metrics(exposition: Exposition, ffmpeg, labels: dict = None):
+    """
+    Метрики потока: накопленные StreamMetrics и состояние враппера (буферы, файловый лог, чтение pipe)
+    """
+    labels = labels or {}
+    metrics = ffmpeg.metrics
+    add = exposition.add
+    add('ffwrapper_up', 'gauge', 'ffmpeg process is running', labels, not ffmpeg.finish)
+    add('ffwrapper_progress_blocks_total', 'counter', 'Parsed -progress blocks', labels, metrics.progress_blocks)
+    add('ffwrapper_stdout_lines_total', 'counter', 'Lines read from ffmpeg stdout/stderr', labels,
+        metrics.stdout_lines)
+    record = metrics.last_progress
+    if record is not None:
+        add('ffwrapper_progress_last_timestamp_seconds', 'gauge', 'Time of the last -progress block', labels,
+            record.wall_time)
+        add('ffwrapper_fps_current', 'gauge', 'Last reported fps', labels, record.fps)
+        add('ffwrapper_speed_current', 'gauge', 'Last reported speed', labels, record.speed)
+        add('ffwrapper_bitrate_kbits_current', 'gauge', 'Last reported bitrate, kbits/s', labels, record.bitrate)
+        add('ffwrapper_frames_total', 'counter', 'Encoded frames', labels, record.frame)
+        add('ffwrapper_drop_frames_total', 'counter', 'Dropped frames reported by ffmpeg', labels,
+            record.drop_frames)
+        add('ffwrapper_dup_frames_total', 'counter', 'Duplicated frames reported by ffmpeg', labels,
+            record.dup_frames)
+    exposition.add_histogram('ffwrapper_fps', 'fps of -progress blocks', labels, metrics.fps)
+    exposition.add_histogram('ffwrapper_speed', 'speed of -progress blocks', labels, metrics.speed)
+    exposition.add_histogram('ffwrapper_bitrate_kbits', 'bitrate of -progress blocks, kbits/s', labels,
+                             metrics.bitrate)
+    add('ffwrapper_encoding_check_failures_total', 'counter', 'Times the manager detected an encoding error',
+        labels, metrics.encoding_check_failures)
+    add('ffwrapper_encoding_error_seconds_total', 'counter', 'Time spent by the manager in the encoding error state',
+        labels, metrics.encoding_error_seconds)
+    states = ffmpeg.rules.get_states()
+    if states:
+        add('ffwrapper_health_degraded', 'gauge', 'A health rule with action degraded or kill is firing', labels,
+            ffmpeg.rules.degraded)
+    for name, action, state, fired in states:
+        rule_labels = collections.OrderedDict(labels)
+        rule_labels['rule'] = name
+        rule_labels['action'] = action
+        add('ffwrapper_health_rule_firing', 'gauge', 'Health rule is firing', rule_labels, state == 'firing')
+        add('ffwrapper_health_rule_fired_total', 'counter', 'Times the health rule fired', rule_labels, fired)
+    for name, buf in (('stdout', ffmpeg.get_stdout_buf()), ('progress', ffmpeg.get_progress_buf())):
+        buf_labels = collections.OrderedDict(labels)
+        buf_labels['buffer'] = name
+        position = buf.get_current_position()
+        first = buf.get_first_position()
+        add('ffwrapper_buffer_lines', 'gauge', 'Lines stored in the buffer', buf_labels, position - first)
+        add('ffwrapper_buffer_capacity_lines', 'gauge', 'Buffer capacity, lines', buf_labels, buf.max)
+        add('ffwrapper_buffer_appended_lines_total', 'counter', 'Lines appended to the buffer', buf_labels, position)
+        add('ffwrapper_buffer_evicted_lines_total', 'counter', 'Lines overwritten in the buffer', buf_labels, first)
+    dedup = ffmpeg.get_stdout_dedup()
+    if dedup is not None:
+        add('ffwrapper_stdout_dedup_suppressed_lines_total', 'counter',
+            'Repeated stdout lines collapsed into summaries (STDOUT_DEDUP)', labels, dedup.suppressed)
+        add('ffwrapper_stdout_dedup_evicted_total', 'counter', 'Line signatures evicted from the dedup table',
+            labels, dedup.evicted)
+    stdout_buf = ffmpeg.get_stdout_buf()
+    add('ffwrapper_stdout_arena_bytes', 'gauge', 'Bytes of stdout lines stored in the buffer arena', labels,
+        stdout_buf.get_arena_used())
+    add('ffwrapper_stdout_arena_capacity_bytes', 'gauge', 'Stdout buffer arena size, bytes', labels,
+        stdout_buf.arena_size)
+    samples = ffmpeg.process_samples.get_last(1)
+    if samples:
+        sample = samples[0]
+        add('ffwrapper_ffmpeg_cpu_seconds_total', 'counter', 'ffmpeg user + system CPU time', labels,
+            sample.utime + sample.stime)
+        add('ffwrapper_ffmpeg_rss_bytes', 'gauge', 'ffmpeg resident memory', labels, sample.rss)
+        add('ffwrapper_ffmpeg_threads', 'gauge', 'ffmpeg threads', labels, sample.threads)
+        for kind in ('voluntary', 'nonvoluntary'):
+            kind_labels = collections.OrderedDict(labels)
+            kind_labels['type'] = kind
+            add('ffwrapper_ffmpeg_context_switches_total', 'counter', 'ffmpeg context switches', kind_labels,
+                getattr(sample, kind + '_ctxt_switches'))
+        for direction in ('read', 'write'):
+            io_labels = collections.OrderedDict(labels)
+            io_labels['direction'] = direction
+            add('ffwrapper_ffmpeg_io_bytes_total', 'counter', 'ffmpeg storage I/O', io_labels,
+                getattr(sample, direction + '_bytes'))
+    cursor = ffmpeg.get_stdout_writer_cursor()
+    if cursor is not None:
+        add('ffwrapper_log_writer_backlog_lines', 'gauge', 'Stdout lines not yet written to the file log', labels,
+            cursor.pending())
+        add('ffwrapper_log_writer_lost_lines_total', 'counter',
+            'Stdout lines overwritten in the buffer before written to the file log', labels, cursor.lost)
+    for name, stats in ffmpeg.get_ingest_stats().items():
+        ingest_labels = collections.OrderedDict(labels)
+        ingest_labels['reader'] = name
+        add('ffwrapper_ingest_bytes_total', 'counter', 'Bytes read from the pipe', ingest_labels, stats['bytes_read'])
+        add('ffwrapper_ingest_buffered_bytes', 'gauge', 'Bytes read but not yet parsed', ingest_labels,
+            stats['buffered_bytes'])
+        add('ffwrapper_ingest_backpressure_events_total', 'counter', 'Reads that left the pipe more than half full',
+            ingest_labels, stats['backpressure_events'])
+        add('ffwrapper_ingest_dropped_bytes_total', 'counter', 'Bytes dropped or spilled on parser overload',
+            ingest_labels, stats['dropped_bytes'])
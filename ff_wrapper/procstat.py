@@ -0,0 +1,173 @@
+import array
+import collections
+import os
+import threading
+import time
+import typing
+
+
+CLK_TCK = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+NA = -1
+
+ProcSample = collections.namedtuple('ProcSample', (
+    'time',  # time.time() снятия
+    'state',  # R, S, D, Z, T... из /proc/<pid>/stat
+    'utime',  # seconds
+    'stime',  # seconds
+    'rss',  # bytes
+    'threads',
+    'voluntary_ctxt_switches',
+    'nonvoluntary_ctxt_switches',
+    'read_bytes',  # /proc/<pid>/io, NA если нет прав
+    'write_bytes',
+))
+
+
+def is_pid_alive(pid: int) -> bool:
+    """
+    Существует ли процесс, без запуска ps. Зомби считается живым, пока его не дождался родитель
+    """
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Процесс есть, но принадлежит другому пользователю
+        return True
+    return True
+
+
+def _read(path: str) -> str:
+    with open(path, 'r') as f:
+        return f.read()
+
+
+def read_proc_state(pid: int) -> typing.Optional[str]:
+    """
+    Состояние процесса (R, S, D, Z...) или None, если процесса нет
+    """
+    try:
+        return _read('/proc/{}/stat'.format(pid)).rsplit(')', 1)[1].split(None, 1)[0]
+    except (OSError, IndexError):
+        return None
+
+
+def read_proc_sample(pid: int) -> typing.Optional[ProcSample]:
+    """
+    Снимок процесса из /proc/<pid>/stat, status и io. None, если процесса уже нет
+    """
+    now = time.time()
+    try:
+        # comm в скобках может содержать пробелы и скобки - режем по последней ')'
+        fields = _read('/proc/{}/stat'.format(pid)).rsplit(')', 1)[1].split()
+        status = _read('/proc/{}/status'.format(pid))
+    except (OSError, IndexError):
+        return None
+    ctxt = {}
+    for line in status.splitlines():
+        if 'ctxt_switches:' in line:
+            key, _, value = line.partition(':')
+            ctxt[key] = int(value)
+    read_bytes = write_bytes = NA
+    try:
+        for line in _read('/proc/{}/io'.format(pid)).splitlines():
+            key, _, value = line.partition(':')
+            if key == 'read_bytes':
+                read_bytes = int(value)
+            elif key == 'write_bytes':
+                write_bytes = int(value)
+    except OSError:
+        pass
+    return ProcSample(
+        now,
+        fields[0],
+        int(fields[11]) / CLK_TCK,
+        int(fields[12]) / CLK_TCK,
+        int(fields[21]) * PAGE_SIZE,
+        int(fields[17]),
+        ctxt.get('voluntary_ctxt_switches', NA),
+        ctxt.get('nonvoluntary_ctxt_switches', NA),
+        read_bytes,
+        write_bytes,
+    )
+
+
+# (поле ProcSample, typecode array)
+_COLUMNS = (
+    ('time', 'd'),
+    ('state', 'B'),
+    ('utime', 'd'),
+    ('stime', 'd'),
+    ('rss', 'q'),
+    ('threads', 'q'),
+    ('voluntary_ctxt_switches', 'q'),
+    ('nonvoluntary_ctxt_switches', 'q'),
+    ('read_bytes', 'q'),
+    ('write_bytes', 'q'),
+)
+
+
+class ProcSamples:
+    """
+    Кольцевой буфер ProcSample в колонках array: ~70 байт на снимок.
+    Пишет один поток (менеджер или общий поток супервизора), читает HTTP
+    """
+
+    def __init__(self, size_max: int):
+        self.max = size_max
+        self._next = 0
+        self._columns = [array.array(typecode, bytes(array.array(typecode).itemsize * size_max))
+                         for _, typecode in _COLUMNS]
+        self._lock = threading.Lock()
+
+    def append(self, sample: ProcSample):
+        slot = self._next % self.max
+        values = sample._replace(state=ord(sample.state[0]) if sample.state else 0)
+        with self._lock:
+            for column, value in zip(self._columns, values):
+                column[slot] = value
+            self._next += 1
+
+    def sample(self, pid: int) -> typing.Optional[ProcSample]:
+        sample = read_proc_sample(pid)
+        if sample is not None:
+            self.append(sample)
+        return sample
+
+    def get_current_position(self) -> int:
+        return self._next
+
+    def get_last(self, n: int = 0) -> typing.List[ProcSample]:
+        """
+        n последних снимков (0 - все), от старых к новым
+        """
+        with self._lock:
+            available = min(self._next, self.max)
+            n = available if n <= 0 else min(n, available)
+            slots = [(self._next - n + i) % self.max for i in range(n)]
+            rows = [[column[slot] for column in self._columns] for slot in slots]
+        return [ProcSample._make(row[:1] + [chr(row[1]) if row[1] else ''] + row[2:]) for row in rows]
+
+
+def samples_to_dicts(samples: typing.List[ProcSample]) -> typing.List[dict]:
+    """
+    Снимки для json: cpu_percent считается по разнице utime + stime с предыдущим снимком
+    """
+    result = []
+    previous = None
+    for sample in samples:
+        item = collections.OrderedDict(zip(ProcSample._fields, sample))
+        cpu_percent = None
+        if previous is not None and sample.time > previous.time:
+            cpu = sample.utime + sample.stime - previous.utime - previous.stime
+            cpu_percent = round(cpu / (sample.time - previous.time) * 100, 2)
+        item['cpu_percent'] = cpu_percent
+        for key in ('read_bytes', 'write_bytes', 'voluntary_ctxt_switches', 'nonvoluntary_ctxt_switches'):
+            if item[key] == NA:
+                item[key] = None
+        result.append(item)
+        previous = sample
+    return result
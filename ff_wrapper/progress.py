@@ -0,0 +1,252 @@
+import collections
+import datetime
+import math
+import typing
+
+
+NA_INT = -1
+NA_FLOAT = float('nan')
+
+# (имя поля ProgressRecord, typecode array, ключ в выводе -progress)
+PROGRESS_COLUMNS = (
+    ('frame', 'q', 'frame'),
+    ('fps', 'd', 'fps'),
+    ('q', 'd', 'stream_0_0_q'),
+    ('bitrate', 'd', 'bitrate'),
+    ('total_size', 'q', 'total_size'),
+    ('out_time_us', 'q', 'out_time_us'),
+    ('dup_frames', 'q', 'dup_frames'),
+    ('drop_frames', 'q', 'drop_frames'),
+    ('speed', 'd', 'speed'),
+)
+
+
+def _parse_int(value) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return NA_INT
+
+
+def _parse_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return NA_FLOAT
+
+
+def _parse_float_suffix(suffix: str):
+    suffix_bytes = suffix.encode('utf-8')
+
+    def parse(value) -> float:
+        # '1024.5kbits/s', b'1.01x'
+        if value is None:
+            return NA_FLOAT
+        if isinstance(value, bytes):
+            if value.endswith(suffix_bytes):
+                value = value[:-len(suffix_bytes)]
+        elif value.endswith(suffix):
+            value = value[:-len(suffix)]
+        return _parse_float(value)
+    return parse
+
+
+def _fmt_int(value: int) -> str:
+    if value == NA_INT:
+        return 'N/A'
+    return str(value)
+
+
+def _fmt_float(value: float, fmt: str) -> str:
+    if math.isnan(value):
+        return 'N/A'
+    return fmt % value
+
+
+def _fmt_speed(speed: float) -> str:
+    # 1.01x, 123.4x: без потери значащих цифр, лишние нули в конце отбрасываются
+    if math.isnan(speed):
+        return 'N/A'
+    return ('%.3f' % speed).rstrip('0').rstrip('.') + 'x'
+
+
+def _to_bytes(value) -> bytes:
+    return value if isinstance(value, bytes) else str(value).encode('utf-8')
+
+
+def _fmt_out_time(out_time_us: int) -> str:
+    if out_time_us == NA_INT:
+        return 'N/A'
+    sign = '-' if out_time_us < 0 else ''
+    us = abs(out_time_us)
+    secs, us = divmod(us, 1000000)
+    mins, secs = divmod(secs, 60)
+    hours, mins = divmod(mins, 60)
+    return '{}{:02d}:{:02d}:{:02d}.{:06d}'.format(sign, hours, mins, secs, us)
+
+
+def is_na(value) -> bool:
+    """
+    Значение N/A в ProgressRecord: NA_INT для целых полей, nan для дробных
+    """
+    return value == NA_INT or value != value
+
+
+_SUFFIXES = {'bitrate': 'kbits/s', 'speed': 'x'}
+_PARSERS = tuple(
+    (key, _parse_int if typecode == 'q' else _parse_float_suffix(_SUFFIXES[key]) if key in _SUFFIXES else _parse_float)
+    for _, typecode, key in PROGRESS_COLUMNS
+)
+_BYTES_PARSERS = tuple((key.encode('utf-8'), parse) for key, parse in _PARSERS)
+# Ключи, которые восстанавливаются из колонок (out_time_ms и out_time - из out_time_us), остальные - extra
+_NOT_SEPARATORS = bytes(b for b in range(256) if b not in b'=\n')  # Для bytes.translate: оставить '=' и '\n'
+_KNOWN_KEYS = frozenset([key for key, _ in _BYTES_PARSERS] + [b'out_time_ms', b'out_time', b'progress'])
+
+
+class ProgressRecord(collections.namedtuple('ProgressRecord', ('wall_time',)
+                                            + tuple(name for name, _, _ in PROGRESS_COLUMNS)
+                                            + ('ended', 'extra'))):
+    """
+    Один разобранный блок -progress. Разбирается один раз в потоке чтения,
+    дальше менеджер, буфер и HTTP работают с полями напрямую.
+    Значения N/A: NA_INT для целых полей, nan для дробных (см. is_na).
+    extra - ((ключ, значение) bytes) остальных ключей блока в порядке вывода ffmpeg, например stream_1_0_q
+    каждого следующего выходного потока
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_values(cls, values: dict, wall_time: float) -> 'ProgressRecord':
+        """
+        values - {ключ -progress: значение str или bytes}, например {'fps': '25.00', 'speed': b'1.01x'}
+        """
+        get = values.get
+        ended = get('progress') in ('end', b'end')
+        pairs = ((_to_bytes(key), value) for key, value in values.items())
+        extra = tuple((key, _to_bytes(value)) for key, value in pairs if key and key not in _KNOWN_KEYS)
+        return cls(wall_time, *[parse(get(key)) for key, parse in _PARSERS], ended, extra)
+
+    @classmethod
+    def from_block(cls, block: dict, wall_time: float) -> 'ProgressRecord':
+        """
+        block - {bytes: bytes} как читается из fifo, без декодирования: {b'fps': b'25.00'}
+        """
+        get = block.get
+        extra = ()
+        if not _KNOWN_KEYS.issuperset(block):
+            extra = tuple((key, value) for key, value in block.items() if key and key not in _KNOWN_KEYS)
+        return cls(wall_time, *[parse(get(key)) for key, parse in _BYTES_PARSERS], get(b'progress') == b'end', extra)
+
+    @property
+    def dt(self) -> datetime.datetime:
+        return datetime.datetime.fromtimestamp(self.wall_time)
+
+    def to_line(self) -> str:
+        # Строка в формате, который получался склейкой блока -progress (без пробелов). Ключи extra
+        #   stream_<i>_<j>_q идут за stream_0_0_q, остальные - перед progress, как их выводит ffmpeg
+        out_time_us = _fmt_int(self.out_time_us)
+        streams = [key.decode('utf-8', 'replace') + '=' + value.decode('utf-8', 'replace')
+                   for key, value in self.extra if key.startswith(b'stream_')]
+        others = [key.decode('utf-8', 'replace') + '=' + value.decode('utf-8', 'replace')
+                  for key, value in self.extra if not key.startswith(b'stream_')]
+        return ' '.join([
+            'frame=' + _fmt_int(self.frame),
+            'fps=' + _fmt_float(self.fps, '%.2f'),
+            'stream_0_0_q=' + _fmt_float(self.q, '%.1f')] + streams + [
+            'bitrate=' + _fmt_float(self.bitrate, '%.1fkbits/s'),
+            'total_size=' + _fmt_int(self.total_size),
+            'out_time_us=' + out_time_us,
+            'out_time_ms=' + out_time_us,
+            'out_time=' + _fmt_out_time(self.out_time_us),
+            'dup_frames=' + _fmt_int(self.dup_frames),
+            'drop_frames=' + _fmt_int(self.drop_frames),
+            'speed=' + _fmt_speed(self.speed)] + others + [
+            'progress=' + ('end' if self.ended else 'continue'),
+        ])
+
+    def to_dict(self) -> dict:
+        # Для json: N/A -> None
+        result = {}
+        for name, value in zip(self._fields, self):
+            if name == 'extra':
+                value = {key.decode('utf-8', 'replace'): value.decode('utf-8', 'replace') for key, value in value}
+            elif name != 'ended' and is_na(value):
+                value = None
+            result[name] = value
+        return result
+
+
+class ProgressParser:
+    """
+    Инкрементальный разбор вывода -progress прямо из прочитанных байтов: блоки key=value любой длины
+    (сколько угодно ключей, например stream_<i>_<j>_q на каждый выходной поток), незаконченный блок
+    переносится в следующий вызов feed. Блок заканчивается строкой progress=continue|end
+    """
+
+    MAX_BLOCK_LEN = 1024 * 1024  # Данные без строки progress= длиннее этого значения выбрасываются
+
+    def __init__(self):
+        self._carry = b''
+        self.stats = {
+            'blocks': 0,
+            'max_keys': 0,
+            'dropped_bytes': 0,
+        }
+
+    def feed(self, data: bytes, wall_time: float) -> typing.List[ProgressRecord]:
+        if self._carry:
+            data = self._carry + data
+        records = []
+        find = data.find
+        start = 0
+        pos = find(b'progress=')
+        while pos >= 0:
+            if pos != start and data[pos - 1] != 10:  # 10 - '\n': ключ только в начале строки
+                pos = find(b'progress=', pos + 9)
+                continue
+            eol = find(b'\n', pos)
+            if eol < 0:
+                break
+            records.append(self._parse_block(data[start:eol], wall_time))
+            start = eol + 1
+            pos = find(b'progress=', start)
+        carry = data[start:]
+        if len(carry) > self.MAX_BLOCK_LEN:
+            self.stats['dropped_bytes'] += len(carry)
+            carry = b''
+        self._carry = carry
+        return records
+
+    def flush(self, wall_time: float) -> typing.List[ProgressRecord]:
+        """
+        Конец данных: последняя строка progress= могла прийти без перевода строки
+        """
+        records = self.feed(b'\n', wall_time) if self._carry else []
+        self._carry = b''
+        return records
+
+    def reset(self):
+        """
+        Данные перед следующим feed потеряны (перегрузка) - незаконченный блок больше не актуален
+        """
+        self.stats['dropped_bytes'] += len(self._carry)
+        self._carry = b''
+
+    def _parse_block(self, block: bytes, wall_time: float) -> ProgressRecord:
+        # ffmpeg выравнивает значения пробелами (bitrate=  12.3kbits/s) - убираем их сразу во всем блоке
+        block = block.replace(b' ', b'').replace(b'\r', b'')
+        parts = block.replace(b'\n', b'=').split(b'=')
+        # Ровно один '=' в каждой строке - разделители в блоке чередуются '=', '\n', ..., '=', тогда ключи
+        #   и значения в parts чередуются. Одного количества '=' мало: строка без '=' и строка с двумя дают столько же
+        if block.translate(None, _NOT_SEPARATORS) == b'=\n' * (len(parts) // 2 - 1) + b'=':
+            values = dict(zip(parts[::2], parts[1::2]))
+        else:
+            values = {}
+            for line in block.split(b'\n'):
+                key, _, value = line.partition(b'=')
+                values[key] = value
+        stats = self.stats
+        stats['blocks'] += 1
+        if len(values) > stats['max_keys']:
+            stats['max_keys'] = len(values)
+        return ProgressRecord.from_block(values, wall_time)
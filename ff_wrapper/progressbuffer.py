@@ -0,0 +1,153 @@
+import datetime
+import time
+from typing import List
+from logbuffer import LogBuffer
+from progress import PROGRESS_COLUMNS, ProgressRecord
+
+
+class ProgressBuffer(LogBuffer):
+    """
+    Кольцевой буфер блоков -progress, хранящий поля ProgressRecord в типизированных колонках (array).
+    get_last_records - записи как есть, строка восстанавливается только в get_last_items/get_all,
+    контракт которых совпадает с LogBuffer: [(datetime, str)], позиция
+
+    Писатель один, читателей может быть несколько. Запись занимает несколько колонок, поэтому писатель
+    сдвигает _first до перезаписи слота: после копирования читатель отбрасывает позиции до _first -
+    их слоты могли быть перезаписаны (частично) во время копирования, как в StdoutBuffer
+    """
+
+    # (имя, typecode) всех колонок - и раскладка файла истории (PERSISTENT_HISTORY)
+    COLUMNS = (('wall', 'd'), ('mono', 'd'), ('ended', 'b')) + tuple(
+        (name, typecode) for name, typecode, _ in PROGRESS_COLUMNS)
+
+    def __init__(self, size_max, storage=None):
+        """
+        storage - HistoryFile (history.py): колонки лежат в отображенном файле, запись - обычная запись в память
+        """
+        self._next = 0
+        self._first = 0
+        self.max = size_max
+        self._storage = storage
+        self._stored_time = False  # Буфер прошлого запуска: монотонное время несравнимо с текущим
+        self._wall = self._new_column('wall', 'd')
+        self._mono = self._new_column('mono', 'd')
+        self._ended = self._new_column('ended', 'b')
+        self._init_waiters()
+        self._columns = [self._new_column(name, typecode) for name, typecode, _ in PROGRESS_COLUMNS]
+        # ProgressRecord.extra: ссылки на кортежи записей, только в памяти - в файл истории не пишутся
+        self._extra = [()] * size_max
+
+    @classmethod
+    def from_history(cls, storage) -> 'ProgressBuffer':
+        """
+        Буфер только для чтения поверх файла истории прошлого запуска
+        """
+        buf = cls(storage.size_max, storage)
+        buf._next, buf._first, _ = storage.get_state()
+        buf._stored_time = True
+        return buf
+
+    def close_storage(self):
+        """
+        Перенести колонки из файла истории в память и закрыть файл: буфер остается доступным для чтения
+        после остановки ffmpeg, отображение и fd не держатся
+        """
+        storage = self._storage
+        if storage is None:
+            return
+        self._wall, self._mono, self._ended = (self._copy_column(c) for c in (self._wall, self._mono, self._ended))
+        self._columns = [self._copy_column(column) for column in self._columns]
+        self._storage = None
+        storage.close()
+
+    def append(self, item):
+        """
+        item - (datetime, str) как в LogBuffer, строка вида 'frame=1 fps=0.00 ... progress=continue'
+        """
+        dt, line = item
+        values = {}
+        for el in line.split(' '):
+            k, _, v = el.partition('=')
+            values[k] = v
+        self.append_values(values, dt.timestamp())
+
+    def append_values(self, values: dict, wall_time: float = None):
+        self.append_record(ProgressRecord.from_values(values, time.time() if wall_time is None else wall_time))
+
+    def append_record(self, record: ProgressRecord):
+        next_ = self._next
+        slot = next_ % self.max
+        if next_ >= self.max:
+            # Слот самой старой записи перезаписывается - она вытесняется до записи
+            self._first = next_ - self.max + 1
+        storage = self._storage
+        if storage is not None:
+            storage.set_state(next_ * 2 + 1, next_, self._first, 0)
+        self._wall[slot] = record.wall_time
+        self._mono[slot] = time.monotonic()
+        self._ended[slot] = record.ended
+        # Поля записи после wall_time идут в порядке PROGRESS_COLUMNS
+        for column, value in zip(self._columns, record[1:]):
+            column[slot] = value
+        self._extra[slot] = record.extra
+        self._next = next_ + 1
+        if storage is not None:
+            storage.set_state(self._next * 2, self._next, self._first, 0)
+        self._wakeup_waiters()
+
+    def _get_records(self, pos_from: int, pos_to: int) -> List[ProgressRecord]:
+        columns = [self._column_range(column, pos_from, pos_to) for column in self._columns]
+        walls = self._column_range(self._wall, pos_from, pos_to)
+        ended = self._column_range(self._ended, pos_from, pos_to)
+        extras = self._column_range(self._extra, pos_from, pos_to)
+        make = ProgressRecord._make
+        return [make((wall,) + values + (bool(is_end), extra))
+                for wall, is_end, extra, values in zip(walls, ended, extras, zip(*columns))]
+
+    def _get_range(self, pos_from: int, pos_to: int) -> List[tuple]:
+        fromtimestamp = datetime.datetime.fromtimestamp
+        return [(fromtimestamp(record.wall_time), record.to_line()) for record in self._get_records(pos_from, pos_to)]
+
+    def _get_plain_range(self, pos_from: int, pos_to: int):
+        return [(record.wall_time, record.to_line()) for record in self._get_records(pos_from, pos_to)]
+
+    def read_records_from(self, position: int, max_items: int = 0) -> (List[ProgressRecord], int, int):
+        # Как read_from, но возвращает ProgressRecord без восстановления строк
+        return self._read_from(position, max_items, self._get_records)
+
+    def _get_last(self, n, get_range) -> (list, int):
+        pos_to = self._next
+        pos_from = min(max(self._first, pos_to - max(n, 0)), pos_to)
+        items = get_range(pos_from, pos_to)
+        # Записи, вытесненные писателем во время копирования, могли быть перезаписаны
+        lost = self._first - pos_from
+        if lost > 0:
+            items = items[lost:]
+        return items, pos_to
+
+    def get_last_records(self, n) -> (List[ProgressRecord], int):
+        return self._get_last(n, self._get_records)
+
+    def get_last_items(self, n) -> (List[tuple], int):
+        # Получить n последних блоков в виде [(datetime, str)] и текущую позицию
+        return self._get_last(n, self._get_range)
+
+    def get_all(self) -> (List[tuple], int):
+        return self.get_last_items(self.max)
+
+    def _time_key_at(self, position: int) -> float:
+        if self._stored_time:
+            return self._wall[position % self.max]
+        return self._mono[position % self.max]
+
+    def _wall_to_time_key(self, wall_time: float) -> float:
+        # Поиск идет по монотонному времени, которое не прыгает при переводе системных часов
+        if self._stored_time:
+            return wall_time
+        return wall_time - time.time() + time.monotonic()
+
+    def get_first_position(self) -> int:
+        return self._first
+
+    def get_current_position(self) -> int:
+        return self._next
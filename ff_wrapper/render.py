@@ -0,0 +1,73 @@
+import datetime
+import json
+
+
+DT_FORMAT = '%Y-%m-%d %H:%M:%S'
+RENDER_TEXT = 'text'
+RENDER_JSON = 'json'
+
+
+class TimestampFormatter:
+    """
+    strftime(DT_FORMAT) с запоминанием последней секунды: строки буфера идут по времени подряд,
+    поэтому форматирование выполняется примерно раз в секунду, а не на каждую строку
+    """
+
+    def __init__(self):
+        self._last = (None, '', b'')
+
+    def _format(self, wall_time: float) -> tuple:
+        sec = int(wall_time)
+        last = self._last
+        if sec != last[0]:
+            value = datetime.datetime.fromtimestamp(sec).strftime(DT_FORMAT)
+            # Кортеж присваивается целиком - безопасно при вызове из нескольких потоков
+            last = self._last = (sec, value, '<{}> '.format(value).encode('utf-8'))
+        return last
+
+    def __call__(self, wall_time: float) -> str:
+        return self._format(wall_time)[1]
+
+    def text_prefix(self, wall_time: float) -> bytes:
+        # b'<dt> ' для текстового формата
+        return self._format(wall_time)[2]
+
+
+def render_line(timestamps: TimestampFormatter, wall_time: float, line, fmt: str) -> bytes:
+    """
+    Одна строка ответа /last_*: text - b'<dt> line\\n', json - b'["dt", "line"]'.
+    Ответ json собирается как b'[' + b', '.join(строки) + b']' и совпадает с json.dumps списка
+    """
+    if fmt == RENDER_JSON:
+        if not isinstance(line, str):
+            line = str(line, 'utf-8', 'replace')
+        return json.dumps((timestamps(wall_time), line)).encode('utf-8')
+    if isinstance(line, str):
+        line = line.encode('utf-8')
+    return b''.join((timestamps.text_prefix(wall_time), line, b'\n'))
+
+
+def join_rendered(lines: list, fmt: str) -> bytes:
+    if fmt == RENDER_JSON:
+        return b'[' + b', '.join(lines) + b']'
+    return b''.join(lines)
+
+
+class LineCache:
+    """
+    Кольцевой кэш отрисованных строк по позиции в буфере. Строки буфера не изменяются после записи,
+    поэтому строка отрисовывается один раз при первом запросе, а вытесненные позиции просто перезаписываются
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._slots = [None] * size  # (позиция, bytes) - одним объектом, чтобы чтение без блокировки было консистентным
+
+    def get(self, position: int):
+        slot = self._slots[position % self.size]
+        if slot is not None and slot[0] == position:
+            return slot[1]
+        return None
+
+    def put(self, position: int, value: bytes):
+        self._slots[position % self.size] = (position, value)
@@ -0,0 +1,298 @@
+import collections
+import json
+import logging
+import operator
+import re
+import threading
+import typing
+from progress import PROGRESS_COLUMNS, ProgressRecord, is_na
+from stats import RollingStats
+
+
+FIELDS = tuple(name for name, _, _ in PROGRESS_COLUMNS)
+OPS = {'>': operator.gt, '>=': operator.ge, '<': operator.lt, '<=': operator.le, '==': operator.eq, '!=': operator.ne}
+# Агрегаты поля -progress за окно (RollingStats), pNN - перцентиль. last - значение текущего блока, окно не нужно
+FIELD_AGGREGATES = ('last', 'mean', 'min', 'max', 'ewma', 'delta', 'rate')
+QUANTILE_RE = re.compile(r'^p(\d+(\.\d+)?)$')
+GLOBAL_FLAGS_RE = re.compile(br'^\(\?([imsx]+)\)')
+# Агрегаты строк stdout: count - совпадений за окно, rate - совпадений в секунду
+STDOUT_AGGREGATES = ('count', 'rate')
+ACTION_LOG = 'log'
+ACTION_DEGRADED = 'degraded'
+ACTION_KILL = 'kill'
+ACTIONS = (ACTION_LOG, ACTION_DEGRADED, ACTION_KILL)
+STATE_OK = 'ok'
+STATE_PENDING = 'pending'  # Условие выполняется, но еще не дольше for
+STATE_FIRING = 'firing'
+
+
+class Rule:
+    """
+    Правило здоровья потока, разобранное из HEALTH_RULES:
+        {"name": "drops", "field": "drop_frames", "agg": "rate", "window": 30, "op": ">", "value": 1,
+         "for": 10, "action": "degraded"}
+        {"name": "timeouts", "stdout": "Connection timed out", "window": 60, "op": ">=", "value": 3, "action": "kill"}
+    field - поле ProgressRecord, stdout - регулярное выражение по строкам stdout (одно из двух).
+    agg - агрегат за window секунд (по-ум. last для field и count для stdout), rate поля - наклон регрессии
+    (единиц в секунду, для счетчиков drop_frames, out_time_us), delta - последнее минус первое значение в окне.
+    for - сколько секунд условие должно выполняться подряд, action - log, degraded или kill
+    """
+
+    def __init__(self, spec: dict):
+        if not isinstance(spec, dict):
+            raise ValueError('Rule must be an object ({})'.format(spec))
+        self.name = str(spec.get('name', ''))
+        if not self.name:
+            raise ValueError('Rule has no name ({})'.format(spec))
+        self.field = spec.get('field')
+        stdout = spec.get('stdout')
+        if (self.field is None) == (stdout is None):
+            raise ValueError('Rule {}: exactly one of field and stdout is required'.format(self.name))
+        self.pattern = None
+        if stdout is not None:
+            try:
+                self.pattern = re.compile(str(stdout).encode('utf-8'))
+            except re.error as e:
+                raise ValueError('Rule {}: wrong stdout regex: {}'.format(self.name, e))
+        elif self.field not in FIELDS:
+            raise ValueError('Rule {}: unknown field {}, available: {}'.format(self.name, self.field, ', '.join(FIELDS)))
+        self.agg = str(spec.get('agg', 'count' if self.pattern else 'last'))
+        self.quantile = None
+        if self.pattern:
+            if self.agg not in STDOUT_AGGREGATES:
+                raise ValueError('Rule {}: agg for stdout must be one of {}'.format(self.name, ', '.join(STDOUT_AGGREGATES)))
+        elif self.agg not in FIELD_AGGREGATES:
+            match = QUANTILE_RE.match(self.agg)
+            if not match or float(match.group(1)) > 100:
+                raise ValueError('Rule {}: agg must be one of {} or p0..p100'.format(self.name, ', '.join(FIELD_AGGREGATES)))
+            self.quantile = float(match.group(1)) / 100
+        self.window = self._number(spec, 'window', None)
+        if self.agg != 'last' and (self.window is None or self.window <= 0):
+            raise ValueError('Rule {}: window (seconds) is required for agg {}'.format(self.name, self.agg))
+        self.op = spec.get('op')
+        if self.op not in OPS:
+            raise ValueError('Rule {}: op must be one of {}'.format(self.name, ' '.join(OPS)))
+        self._compare = OPS[self.op]
+        self.threshold = self._number(spec, 'value', None)
+        if self.threshold is None:
+            raise ValueError('Rule {}: value is required'.format(self.name))
+        self.duration = self._number(spec, 'for', 0)
+        self.action = spec.get('action', ACTION_LOG)
+        if self.action not in ACTIONS:
+            raise ValueError('Rule {}: action must be one of {}'.format(self.name, ', '.join(ACTIONS)))
+        # Состояние
+        self.state = STATE_OK
+        self.value = None  # Последнее вычисленное значение агрегата
+        self.since = None  # wall_time, с которого условие выполняется подряд
+        self.fired = 0  # Сколько раз правило срабатывало
+        self.last_fired = None  # wall_time последнего срабатывания
+        self._matches = collections.deque()  # stdout: (wall_time, совпадений в пачке строк)
+        self._match_count = 0
+
+    def _number(self, spec: dict, key: str, default):
+        value = spec.get(key, default)
+        if value is None:
+            return None
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            raise ValueError('Rule {}: {} must be a number ({})'.format(self.name, key, value))
+
+    def describe(self) -> str:
+        source = self.field if self.pattern is None else 'stdout /{}/'.format(self.pattern.pattern.decode('utf-8'))
+        window = ' over {:g}s'.format(self.window) if self.window and self.agg != 'last' else ''
+        return '{} {}{} {} {:g}'.format(source, self.agg, window, self.op, self.threshold)
+
+    def to_dict(self) -> dict:
+        return collections.OrderedDict((
+            ('name', self.name),
+            ('rule', self.describe()),
+            ('action', self.action),
+            ('for', self.duration),
+            ('state', self.state),
+            ('value', self.value),
+            ('since', self.since),
+            ('fired', self.fired),
+            ('last_fired', self.last_fired),
+        ))
+
+
+def load_rules(value: typing.Optional[str]) -> typing.List[Rule]:
+    """
+    HEALTH_RULES: json со списком правил (или {"rules": [...]}) прямо в значении или путь к файлу с ним
+    """
+    if not value:
+        return []
+    value = str(value).strip()
+    try:
+        if value.startswith(('[', '{')):
+            specs = json.loads(value)
+        else:
+            with open(value, 'r') as f:
+                specs = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ValueError("Can't load rules: {}".format(e))
+    if isinstance(specs, dict):
+        specs = specs.get('rules', [])
+    if not isinstance(specs, list):
+        raise ValueError('Rules must be a list')
+    rules = [Rule(spec) for spec in specs]
+    names = [rule.name for rule in rules]
+    duplicates = sorted(set(name for name in names if names.count(name) > 1))
+    if duplicates:
+        raise ValueError('Duplicate rule names: {}'.format(', '.join(duplicates)))
+    return rules
+
+
+def _group(pattern: bytes) -> bytes:
+    # Шаблон как группа общего выражения: флаги в начале шаблона (?i) действуют только на свою группу (?i:...)
+    if GLOBAL_FLAGS_RE.match(pattern):
+        return GLOBAL_FLAGS_RE.sub(br'(?\1:', pattern) + b')'
+    return b'(?:' + pattern + b')'
+
+
+class RuleEngine:
+    """
+    Вычисление правил по мере прихода данных: каждый блок -progress и каждая пачка строк stdout обновляют
+    только агрегаты своих правил - амортизированно O(1) на правило, без перечитывания буферов.
+    Правила над одним полем и окном делят один RollingStats. Строки stdout сначала проверяются одним общим
+    выражением из всех шаблонов, отдельные шаблоны - только для совпавших строк.
+    Правила stdout пересчитываются и по блокам -progress: окно сдвигается, даже если строк больше нет.
+    Обновляется потоками разбора stdout и -progress, читается менеджером и HTTP - под одной блокировкой
+    """
+
+    def __init__(self, rules: typing.List[Rule], logger: logging.Logger = None):
+        self.rules = rules
+        self._logger = logger or logging.getLogger('RuleEngine')
+        self._lock = threading.Lock()
+        self._stats = {}  # (field, window) -> RollingStats
+        self._progress_rules = []  # (rule, RollingStats или None для last)
+        self._stdout_rules = [rule for rule in rules if rule.pattern is not None]
+        for rule in rules:
+            if rule.pattern is None:
+                stats = None
+                if rule.agg != 'last':
+                    stats = self._stats.setdefault((rule.field, rule.window), RollingStats(rule.window))
+                self._progress_rules.append((rule, stats))
+        self._by_field = collections.defaultdict(list)
+        for (field, _), stats in self._stats.items():
+            self._by_field[field].append(stats)
+        self._stdout_filter = None
+        if len(self._stdout_rules) > 1:
+            try:
+                self._stdout_filter = re.compile(b'|'.join(_group(rule.pattern.pattern) for rule in self._stdout_rules))
+            except re.error:
+                # Шаблоны не объединяются (флаги не в начале) - каждая строка проверяется всеми шаблонами
+                pass
+        self.kill_reason = None  # Первое сработавшее правило с action kill, выполняет менеджер
+
+    @property
+    def degraded(self) -> bool:
+        return any(rule.state == STATE_FIRING and rule.action != ACTION_LOG for rule in self.rules)
+
+    def observe_progress(self, record: ProgressRecord):
+        if not self.rules:
+            return
+        t = record.wall_time
+        with self._lock:
+            for field, windows in self._by_field.items():
+                value = getattr(record, field)
+                if is_na(value):
+                    continue
+                bucket = windows[0].bucket(value)
+                for stats in windows:
+                    stats.add(t, value, bucket)
+            for rule, stats in self._progress_rules:
+                self._evaluate(rule, self._field_value(rule, stats, record, t), t)
+            for rule in self._stdout_rules:
+                self._evaluate(rule, self._stdout_value(rule, t), t)
+
+    def observe_stdout(self, lines: typing.List[bytes], wall_time: float):
+        if not self._stdout_rules:
+            return
+        stdout_filter = self._stdout_filter
+        counts = {}
+        for line in lines:
+            if stdout_filter is not None and stdout_filter.search(line) is None:
+                continue
+            for rule in self._stdout_rules:
+                if rule.pattern.search(line) is not None:
+                    counts[rule] = counts.get(rule, 0) + 1
+        with self._lock:
+            for rule in self._stdout_rules:
+                count = counts.get(rule)
+                if count:
+                    rule._matches.append((wall_time, count))
+                    rule._match_count += count
+                self._evaluate(rule, self._stdout_value(rule, wall_time), wall_time)
+
+    def _field_value(self, rule: Rule, stats: typing.Optional[RollingStats], record: ProgressRecord,
+                     t: float) -> float:
+        if stats is None:
+            value = getattr(record, rule.field)
+            return float('nan') if is_na(value) else value
+        stats.evict(t)
+        agg = rule.agg
+        if rule.quantile is not None:
+            return stats.quantile(rule.quantile)
+        if agg == 'delta':
+            return stats.last - stats.first if stats.count else float('nan')
+        if agg == 'rate':
+            return stats.trend
+        if agg == 'last':
+            return stats.last
+        return getattr(stats, agg)
+
+    def _stdout_value(self, rule: Rule, t: float) -> float:
+        border = t - rule.window
+        matches = rule._matches
+        while matches and matches[0][0] <= border:
+            rule._match_count -= matches.popleft()[1]
+        if rule.agg == 'rate':
+            return rule._match_count / rule.window
+        return rule._match_count
+
+    def _evaluate(self, rule: Rule, value: float, t: float):
+        # Вызывается под self._lock
+        if value != value:
+            # N/A или пустое окно - состояние не меняется
+            return
+        rule.value = value
+        if not rule._compare(value, rule.threshold):
+            if rule.state == STATE_FIRING:
+                self._logger.info('Health rule {} resolved: {} ({})'.format(rule.name, rule.describe(), value))
+            rule.state = STATE_OK
+            rule.since = None
+            return
+        if rule.since is None:
+            rule.since = t
+        if rule.state == STATE_FIRING or t - rule.since < rule.duration:
+            if rule.state == STATE_OK:
+                rule.state = STATE_PENDING
+            return
+        rule.state = STATE_FIRING
+        rule.fired += 1
+        rule.last_fired = t
+        message = 'Health rule {} fired ({}): {} ({}) for {:.1f}s'.format(
+            rule.name, rule.action, rule.describe(), value, t - rule.since)
+        if rule.action == ACTION_KILL:
+            self._logger.error(message)
+            if self.kill_reason is None:
+                self.kill_reason = message
+        else:
+            self._logger.warning(message)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return collections.OrderedDict((
+                ('degraded', self.degraded),
+                ('kill_reason', self.kill_reason),
+                ('rules', [rule.to_dict() for rule in self.rules]),
+            ))
+
+    def get_states(self) -> typing.List[tuple]:
+        """
+        [(name, action, state, fired)] для /metrics
+        """
+        with self._lock:
+            return [(rule.name, rule.action, rule.state, rule.fired) for rule in self.rules]
@@ -0,0 +1,157 @@
+import array
+import collections
+import threading
+import typing
+from progress import PROGRESS_COLUMNS, ProgressRecord, is_na
+
+
+FIELDS = tuple(name for name, _, _ in PROGRESS_COLUMNS)
+MAX_AUTO_POINTS = 1500  # Сколько точек максимум при выборе разрешения по диапазону (/progress_series без resolution)
+
+
+class _Rollup:
+    """
+    Кольцо из points интервалов по resolution секунд: для каждого поля min, max, сумма, количество
+    и последнее значение за интервал. Интервал - номер слота int(t // resolution), ячейка - slot % points:
+    старые интервалы перезаписываются новыми без сдвигов и выделения памяти.
+    min/max/last - float32, сумма - float64, ~24 байта на интервал и поле
+    """
+
+    def __init__(self, resolution: float, points: int, fields_count: int):
+        self.resolution = resolution
+        self.points = points
+        self.last_slot = -1
+        self._slots = array.array('q', [-1]) * points
+        self._fields = [
+            (array.array('f', [0]) * points, array.array('f', [0]) * points, array.array('d', [0]) * points,
+             array.array('I', [0]) * points, array.array('f', [0]) * points)
+            for _ in range(fields_count)]
+
+    def add(self, t: float, values: typing.List[float]):
+        slot = int(t // self.resolution)
+        i = slot % self.points
+        slots = self._slots
+        if slots[i] != slot:
+            if slot < slots[i]:
+                # Время ушло назад дальше, чем хранит кольцо
+                return
+            slots[i] = slot
+            for _, _, _, counts, _ in self._fields:
+                counts[i] = 0
+        if slot > self.last_slot:
+            self.last_slot = slot
+        for field_values, value in zip(self._fields, values):
+            if value != value:
+                continue
+            mins, maxs, sums, counts, lasts = field_values
+            if counts[i]:
+                if value < mins[i]:
+                    mins[i] = value
+                if value > maxs[i]:
+                    maxs[i] = value
+                sums[i] += value
+                counts[i] += 1
+            else:
+                mins[i] = maxs[i] = sums[i] = value
+                counts[i] = 1
+            lasts[i] = value
+
+    def first_slot(self) -> int:
+        return self.last_slot - self.points + 1
+
+    def get(self, field_indexes: typing.List[int], from_time: float, to_time: float) -> (list, list):
+        """
+        ([начало интервала], [(min, max, avg, last) или None по каждому полю]) для интервалов с данными
+        """
+        first = max(int(from_time // self.resolution), self.first_slot())
+        last = min(int(to_time // self.resolution), self.last_slot)
+        times = []
+        columns = [[] for _ in field_indexes]
+        slots = self._slots
+        fields = [self._fields[index] for index in field_indexes]
+        for slot in range(first, last + 1):
+            i = slot % self.points
+            if slots[i] != slot:
+                continue
+            row = []
+            for mins, maxs, sums, counts, lasts in fields:
+                count = counts[i]
+                row.append((mins[i], maxs[i], sums[i] / count, lasts[i]) if count else None)
+            if not any(row):
+                continue
+            times.append(slot * self.resolution)
+            for column, point in zip(columns, row):
+                column.append(point)
+        return times, columns
+
+
+class ProgressSeries:
+    """
+    Прореженные ряды полей -progress (/progress_series) для графиков любой длины: кольца интервалов
+    для каждого разрешения из PROGRESS_SERIES_RESOLUTIONS (по-ум. 1с, 10с, 1мин). Обновляются потоком
+    разбора -progress - O(разрешений * полей) на блок, запрос читает только интервалы из диапазона.
+    Обновляется и читается под одной блокировкой
+    """
+
+    def __init__(self, resolutions: typing.Iterable[float], points: int, fields: typing.Iterable[str]):
+        self.fields = tuple(fields)
+        unknown = [field for field in self.fields if field not in FIELDS]
+        if unknown:
+            raise ValueError('Unknown progress fields: {}, available: {}'.format(', '.join(unknown), ', '.join(FIELDS)))
+        # points=0 - ряды выключены
+        self.resolutions = tuple(sorted(set(r for r in resolutions if r > 0))) if points > 0 else ()
+        self.points = points
+        self._rollups = [_Rollup(resolution, points, len(self.fields)) for resolution in self.resolutions]
+        self._lock = threading.Lock()
+
+    def observe_progress(self, record: ProgressRecord):
+        if not self._rollups:
+            return
+        values = []
+        for field in self.fields:
+            value = getattr(record, field)
+            values.append(float('nan') if is_na(value) else value)
+        t = record.wall_time
+        with self._lock:
+            for rollup in self._rollups:
+                rollup.add(t, values)
+
+    def choose_resolution(self, from_time: float, to_time: float) -> typing.Optional[float]:
+        """
+        Самое мелкое разрешение, которое хранит from_time и дает не больше MAX_AUTO_POINTS точек
+        """
+        for rollup in self._rollups:
+            with self._lock:
+                first_time = rollup.first_slot() * rollup.resolution
+            if first_time <= from_time and (to_time - from_time) / rollup.resolution <= MAX_AUTO_POINTS:
+                return rollup.resolution
+        return self.resolutions[-1] if self.resolutions else None
+
+    def to_dict(self, fields: typing.List[str], resolution: float, from_time: float = None,
+                to_time: float = None) -> dict:
+        """
+        {"resolution", "from", "to", "t": [начала интервалов], "fields": {поле: {"min", "max", "avg", "last"}}},
+        значения поля null, если в интервале блоков было только N/A
+        """
+        rollup = self._rollups[self.resolutions.index(resolution)]
+        indexes = [self.fields.index(field) for field in fields]
+        with self._lock:
+            if from_time is None:
+                from_time = rollup.first_slot() * resolution
+            if to_time is None:
+                to_time = (rollup.last_slot + 1) * resolution
+            times, columns = rollup.get(indexes, from_time, to_time)
+        result = collections.OrderedDict((
+            ('resolution', resolution),
+            ('from', from_time),
+            ('to', to_time),
+            ('t', times),
+            ('fields', collections.OrderedDict()),
+        ))
+        for field, column in zip(fields, columns):
+            values = collections.OrderedDict((name, []) for name in ('min', 'max', 'avg', 'last'))
+            for point in column:
+                for name, value in zip(values, point or (None, None, None, None)):
+                    values[name].append(None if value is None else round(value, 3))
+            result['fields'][field] = values
+        return result
@@ -0,0 +1,82 @@
+import collections
+import datetime
+import os
+import shutil
+import subprocess
+import time
+
+
+# Запущенный до инициализации враппера ffmpeg (FAST_START), передается в FFMpegProc.run
+Spawned = collections.namedtuple('Spawned', (
+    'process',  # subprocess.Popen
+    'fifo_path',  # fifo -progress
+    'fifo_fd',  # Читатель-заглушка fifo, закрывается в FFMpegProc.stop
+    'start_time',  # datetime.now() перед Popen
+))
+
+
+class StartupTimings:
+    """
+    Время этапов старта враппера: секунды от импорта модуля (начало main.py) до конца этапа.
+    Пишется в лог после старта и отдается в /debug/stats
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.stages = []  # [(этап, секунды от started)]
+
+    def mark(self, stage: str):
+        self.stages.append((stage, time.monotonic() - self.started))
+
+    def to_dict(self) -> dict:
+        result = {}
+        previous = 0
+        for stage, elapsed in self.stages:
+            result[stage] = {'at': elapsed, 'duration': elapsed - previous}
+            previous = elapsed
+        return result
+
+    def format(self) -> str:
+        return ', '.join('{} {:.1f}ms'.format(stage, info['duration'] * 1000) for stage, info in self.to_dict().items())
+
+
+TIMINGS = StartupTimings()
+
+
+def find_ffmpeg_bin() -> str:
+    return shutil.which('ffmpeg')
+
+
+def create_progress_fifo(directory: str, name: str = 'progress') -> str:
+    """
+    Возвращает путь к созданному fifo pipe. OSError - не удалось создать
+    """
+    path = os.path.join(directory, '{}_{}'.format(os.getpid(), name))
+    if os.path.exists(path):
+        os.remove(path)
+    os.mkfifo(path)
+    return path
+
+
+def add_progress_to_cmd(cmd: str, fifo_path: str) -> str:
+    cmd = cmd.split(' ')
+    cmd = ' '.join([cmd[0], '-progress {}'.format(fifo_path)] + cmd[1:])
+    return cmd
+
+
+def spawn_ffmpeg(bin_path: str, args: str, fifo_dir: str) -> Spawned:
+    """
+    FAST_START: запустить ffmpeg с -progress до импорта остальных модулей, создания буферов и логгера.
+    Пока поток чтения не открыл fifo, его держит открытым заглушка - ffmpeg не ждет враппер в open,
+    а записанное им остается в fifo
+    """
+    fifo_path = create_progress_fifo(fifo_dir)
+    fd = os.open(fifo_path, os.O_RDONLY | os.O_NONBLOCK)
+    cmd = add_progress_to_cmd('{} {}'.format(bin_path, args), fifo_path)
+    start_time = datetime.datetime.now()
+    try:
+        process = subprocess.Popen(cmd.split(' '), stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    except Exception:
+        os.close(fd)
+        raise
+    return Spawned(process, fifo_path, fd, start_time)
@@ -0,0 +1,233 @@
+import collections
+import math
+import threading
+import time
+import typing
+from progress import ProgressRecord
+
+
+STATS_FIELDS = ('fps', 'speed', 'bitrate')
+DEFAULT_QUANTILES = (0.1, 0.5, 0.9)
+
+
+class RollingStats:
+    """
+    Статистика значений за скользящее окно window секунд. add - амортизированно O(1):
+        ewma - экспоненциальное среднее с постоянной времени window (по времени, а не по числу значений)
+        min/max - монотонные очереди
+        quantile - лог-бакеты с относительной ошибкой ~relative_error (счетчики уменьшаются при вытеснении)
+        trend - наклон линейной регрессии значений по времени (в единицах в секунду), по накопленным суммам
+    Значения N/A (nan) пропускаются
+    """
+
+    ZERO_BUCKET = -(1 << 30)  # Бакет для значений <= 0 (speed=0x, fps=0)
+    REBASE_WINDOWS = 10
+
+    def __init__(self, window: float, relative_error: float = 0.01):
+        self.window = window
+        self._gamma = (1 + relative_error) / (1 - relative_error)
+        self._log_gamma = math.log(self._gamma)
+        self._values = collections.deque()  # (time, value, bucket)
+        self._min = collections.deque()  # (time, value), значения возрастают
+        self._max = collections.deque()  # (time, value), значения убывают
+        self._buckets = {}  # бакет -> количество значений в окне
+        self._t0 = None  # Начало отсчета времени для сумм регрессии, чтобы не терять точность
+        self._sum_t = self._sum_v = self._sum_tt = self._sum_tv = 0.0
+        self.ewma = float('nan')
+        self.last = float('nan')
+        self._last_time = None
+
+    def bucket(self, value: float) -> int:
+        if value <= 0:
+            return self.ZERO_BUCKET
+        return int(math.ceil(math.log(value) / self._log_gamma))
+
+    def _bucket_value(self, bucket: int) -> float:
+        if bucket == self.ZERO_BUCKET:
+            return 0.0
+        # Середина бакета (gamma^(i-1), gamma^i]
+        return 2 * self._gamma ** bucket / (self._gamma + 1)
+
+    def add(self, t: float, value: float, bucket: int = None):
+        """
+        bucket - готовый self.bucket(value), если одно значение добавляется в несколько окон
+        """
+        if value != value:
+            return
+        if self._last_time is None:
+            self.ewma = value
+        elif t > self._last_time:
+            alpha = 1 - math.exp(-(t - self._last_time) / self.window)
+            self.ewma += alpha * (value - self.ewma)
+        self._last_time = t
+        self.last = value
+        self.evict(t)
+        if self._t0 is None or t - self._t0 > self.REBASE_WINDOWS * self.window:
+            # Сдвигаем начало отсчета и пересчитываем суммы, чтобы ошибка округления не накапливалась.
+            #   Раз в REBASE_WINDOWS окон - амортизированно O(1)
+            self._rebase(t)
+        if bucket is None:
+            bucket = self.bucket(value)
+        self._values.append((t, value, bucket))
+        self._buckets[bucket] = self._buckets.get(bucket, 0) + 1
+        x = t - self._t0
+        self._sum_t += x
+        self._sum_v += value
+        self._sum_tt += x * x
+        self._sum_tv += x * value
+        while self._min and self._min[-1][1] >= value:
+            self._min.pop()
+        self._min.append((t, value))
+        while self._max and self._max[-1][1] <= value:
+            self._max.pop()
+        self._max.append((t, value))
+
+    def _rebase(self, t0: float):
+        self._t0 = t0
+        self._sum_t = self._sum_v = self._sum_tt = self._sum_tv = 0.0
+        for t, value, _ in self._values:
+            x = t - t0
+            self._sum_t += x
+            self._sum_v += value
+            self._sum_tt += x * x
+            self._sum_tv += x * value
+
+    def evict(self, now: float):
+        """
+        Вытеснить значения старше now - window
+        """
+        border = now - self.window
+        values = self._values
+        while values and values[0][0] <= border:
+            t, value, bucket = values.popleft()
+            count = self._buckets[bucket] - 1
+            if count:
+                self._buckets[bucket] = count
+            else:
+                del self._buckets[bucket]
+            x = t - self._t0
+            self._sum_t -= x
+            self._sum_v -= value
+            self._sum_tt -= x * x
+            self._sum_tv -= x * value
+        while self._min and self._min[0][0] <= border:
+            self._min.popleft()
+        while self._max and self._max[0][0] <= border:
+            self._max.popleft()
+
+    @property
+    def count(self) -> int:
+        return len(self._values)
+
+    @property
+    def first(self) -> float:
+        # Самое старое значение в окне
+        return self._values[0][1] if self._values else float('nan')
+
+    @property
+    def min(self) -> float:
+        return self._min[0][1] if self._min else float('nan')
+
+    @property
+    def max(self) -> float:
+        return self._max[0][1] if self._max else float('nan')
+
+    @property
+    def mean(self) -> float:
+        return self._sum_v / len(self._values) if self._values else float('nan')
+
+    @property
+    def trend(self) -> float:
+        n = len(self._values)
+        if n < 2:
+            return float('nan')
+        denominator = n * self._sum_tt - self._sum_t * self._sum_t
+        if denominator <= 1e-12 * max(1.0, n * self._sum_tt):
+            return float('nan')
+        return (n * self._sum_tv - self._sum_t * self._sum_v) / denominator
+
+    def quantile(self, q: float) -> float:
+        """
+        q - 0..1. Стоимость - O(количество занятых бакетов), не зависит от числа значений в окне
+        """
+        n = len(self._values)
+        if not n:
+            return float('nan')
+        rank = max(1, int(math.ceil(q * n)))
+        if rank == 1:
+            return self.min
+        if rank == n:
+            return self.max
+        seen = 0
+        for bucket in sorted(self._buckets):
+            seen += self._buckets[bucket]
+            if seen >= rank:
+                value = self._bucket_value(bucket)
+                # Точные min/max известны - значение бакета не выходит за них
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def to_dict(self, quantiles: typing.Sequence[float] = DEFAULT_QUANTILES) -> dict:
+        result = collections.OrderedDict((
+            ('count', self.count),
+            ('last', self.last),
+            ('ewma', self.ewma),
+            ('mean', self.mean),
+            ('min', self.min),
+            ('max', self.max),
+        ))
+        for q in quantiles:
+            result['p{:g}'.format(q * 100)] = self.quantile(q)
+        result['trend'] = self.trend
+        return collections.OrderedDict((k, None if v != v else v) for k, v in result.items())
+
+
+class EncodingStats:
+    """
+    RollingStats полей -progress (fps, speed, bitrate) для каждого окна из STATS_WINDOWS.
+    Обновляется потоком разбора -progress, читается менеджером и HTTP - под одной блокировкой
+    """
+
+    def __init__(self, windows: typing.Iterable[float]):
+        self.windows = tuple(sorted(set(windows)))
+        self._stats = {
+            (field, window): RollingStats(window) for field in STATS_FIELDS for window in self.windows}
+        self._by_field = [(field, [self._stats[(field, window)] for window in self.windows])
+                          for field in STATS_FIELDS]
+        self._lock = threading.Lock()
+
+    def observe_progress(self, record: ProgressRecord):
+        t = record.wall_time
+        with self._lock:
+            for field, windows in self._by_field:
+                value = getattr(record, field)
+                if value != value:
+                    continue
+                bucket = windows[0].bucket(value)
+                for stats in windows:
+                    stats.add(t, value, bucket)
+
+    def get(self, field: str, window: float, func: typing.Callable[[RollingStats], float]) -> float:
+        """
+        Значение func(RollingStats) под блокировкой, например get('speed', 30, lambda s: s.quantile(0.1)).
+        Окно сдвигается к текущему времени: без новых блоков -progress старые значения не остаются в окне
+        """
+        with self._lock:
+            stats = self._stats[(field, window)]
+            stats.evict(time.time())
+            return func(stats)
+
+    def to_dict(self, windows: typing.Iterable[float] = None,
+                quantiles: typing.Sequence[float] = DEFAULT_QUANTILES) -> dict:
+        windows = self.windows if windows is None else windows
+        result = collections.OrderedDict()
+        with self._lock:
+            now = time.time()
+            for field in STATS_FIELDS:
+                result[field] = field_result = collections.OrderedDict()
+                for window in windows:
+                    stats = self._stats.get((field, window))
+                    if stats is not None:
+                        stats.evict(now)
+                        field_result['{:g}'.format(window)] = stats.to_dict(quantiles)
+        return result
@@ -0,0 +1,227 @@
+import datetime
+import time
+import typing
+from typing import List
+from logbuffer import LogBuffer
+
+
+class StdoutBuffer(LogBuffer):
+    """
+    Кольцевой буфер строк stdout поверх заранее выделенной байтовой арены.
+    Строка хранится один раз как байты в арене, индекс - (виртуальное смещение, длина, время) в array.
+    Строки вытесняются либо по количеству (size_max), либо при нехватке места в арене (arena_size).
+
+    Писатель один (поток чтения stdout), читателей может быть несколько. Пара (_first, _next)
+    читается консистентно через счетчик поколений _gen (seqlock): нечетное значение - идет запись.
+    Записанные строки не изменяются до вытеснения, поэтому после копирования достаточно проверить,
+    что _first не ушел дальше начала прочитанного диапазона.
+    """
+
+    # (имя, typecode) колонок индекса - и раскладка файла истории (PERSISTENT_HISTORY)
+    COLUMNS = (('vstart', 'q'), ('length', 'q'), ('wall', 'd'), ('mono', 'd'))
+
+    def __init__(self, size_max, arena_size, storage=None):
+        """
+        storage - HistoryFile (history.py): индекс и арена лежат в отображенном файле,
+            (_gen, _next, _first, _write_vpos) дублируются в его заголовок
+        """
+        self._next = 0
+        self._first = 0
+        self._gen = 0
+        self.max = size_max
+        self.arena_size = arena_size
+        self._storage = storage
+        self._stored_time = False  # Буфер прошлого запуска: монотонное время несравнимо с текущим
+        if storage is not None:
+            self._arena = storage.arena()
+            self._view = self._arena
+        else:
+            self._arena = bytearray(arena_size)
+            self._view = memoryview(self._arena)
+        self._write_vpos = 0  # Виртуальное (без учета заворота) смещение конца последней строки
+        self._vstarts = self._new_column('vstart', 'q')
+        self._lengths = self._new_column('length', 'q')
+        self._wall = self._new_column('wall', 'd')
+        self._mono = self._new_column('mono', 'd')
+        self.index = None  # StdoutIndex (stdoutindex.py, STDOUT_INDEX), обновляется менеджером
+        self._init_waiters()
+
+    @classmethod
+    def from_history(cls, storage) -> 'StdoutBuffer':
+        """
+        Буфер только для чтения поверх файла истории прошлого запуска
+        """
+        buf = cls(storage.size_max, storage.meta['arena_size'], storage)
+        buf._next, buf._first, buf._write_vpos = storage.get_state()
+        buf._stored_time = True
+        return buf
+
+    def close_storage(self):
+        """
+        Перенести индекс и арену из файла истории в память и закрыть файл: буфер остается доступным
+        для чтения после остановки ffmpeg, отображение и fd не держатся
+        """
+        storage = self._storage
+        if storage is None:
+            return
+        self._arena = bytearray(self._arena)
+        self._view = memoryview(self._arena)
+        self._vstarts, self._lengths, self._wall, self._mono = (
+            self._copy_column(c) for c in (self._vstarts, self._lengths, self._wall, self._mono))
+        self._storage = None
+        storage.close()
+
+    def append(self, item):
+        """
+        item - (datetime, str|bytes), совместимо с LogBuffer
+        """
+        dt, line = item
+        if isinstance(line, str):
+            line = line.encode('utf-8')
+        self.append_line(line, dt.timestamp())
+
+    def append_line(self, line: bytes, wall_time: float = None):
+        size = self.arena_size
+        length = len(line)
+        if length > size:
+            line = line[:size]
+            length = size
+        self._gen += 1
+        vpos = self._write_vpos
+        offset = vpos % size
+        if offset + length > size:
+            # Строка не помещается в хвост арены - пишем с начала, хвост пропускаем
+            vpos += size - offset
+            offset = 0
+        vend = vpos + length
+        first, next_ = self._first, self._next
+        while first < next_ and self._vstarts[first % self.max] < vend - size:
+            first += 1
+        if next_ - first >= self.max:
+            first = next_ - self.max + 1
+        self._first = first
+        storage = self._storage
+        if storage is not None:
+            # Внешний читатель файла видит вытесняемые строки уже за пределами first
+            storage.set_state(self._gen, next_, first, vpos)
+        slot = next_ % self.max
+        self._arena[offset:offset + length] = line
+        self._vstarts[slot] = vpos
+        self._lengths[slot] = length
+        self._wall[slot] = time.time() if wall_time is None else wall_time
+        self._mono[slot] = time.monotonic()
+        self._write_vpos = vend
+        self._next = next_ + 1
+        self._gen += 1
+        if storage is not None:
+            storage.set_state(self._gen, next_ + 1, first, vend)
+        self._wakeup_waiters()
+
+    def _snapshot(self) -> (int, int):
+        while True:
+            gen = self._gen
+            if gen & 1:
+                time.sleep(0)
+                continue
+            first, next_ = self._first, self._next
+            if gen == self._gen:
+                return first, next_
+
+    def _get_views(self, n) -> (List[tuple], int, int):
+        first, next_ = self._snapshot()
+        pos_from = max(first, next_ - max(n, 0))
+        return self._get_range_views(pos_from, next_), pos_from, next_
+
+    def _get_range_views(self, pos_from: int, next_: int) -> List[tuple]:
+        size = self.arena_size
+        view = self._view
+        items = []
+        append = items.append
+        for wall, vstart, length in zip(self._column_range(self._wall, pos_from, next_),
+                                        self._column_range(self._vstarts, pos_from, next_),
+                                        self._column_range(self._lengths, pos_from, next_)):
+            offset = vstart % size
+            append((wall, view[offset:offset + length]))
+        return items
+
+    def get_last_views(self, n) -> (List[tuple], int):
+        """
+        Возвращает [(unix time, memoryview)] без копирования и текущую позицию.
+        memoryview ссылается на арену и валиден, пока строка не вытеснена: is_valid(позиция первой строки)
+        """
+        items, _, next_ = self._get_views(n)
+        return items, next_
+
+    def get_lines(self, positions: typing.Iterable[int]) -> List[tuple]:
+        """
+        [(позиция, unix time, bytes)] для позиций по возрастанию. Строки, вытесненные до или во время
+        копирования, отбрасываются
+        """
+        size = self.arena_size
+        view = self._view
+        vstarts, lengths, wall = self._vstarts, self._lengths, self._wall
+        max_ = self.max
+        items = []
+        append = items.append
+        for position in positions:
+            slot = position % max_
+            offset = vstarts[slot] % size
+            append((position, wall[slot], bytes(view[offset:offset + lengths[slot]])))
+        first = self._snapshot()[0]
+        if items and items[0][0] < first:
+            items = [item for item in items if item[0] >= first]
+        return items
+
+    def is_valid(self, position: int) -> bool:
+        return position >= self._first
+
+    def get_first_position(self) -> int:
+        return self._snapshot()[0]
+
+    def get_arena_used(self) -> int:
+        """
+        Сколько байт арены занято строками буфера (с учетом пропущенных хвостов при завороте)
+        """
+        while True:
+            gen = self._gen
+            first, next_, vend = self._first, self._next, self._write_vpos
+            vstart = self._vstarts[first % self.max]
+            if not gen & 1 and gen == self._gen:
+                return vend - vstart if first < next_ else 0
+            time.sleep(0)
+
+    def _get_range(self, pos_from: int, pos_to: int) -> List[tuple]:
+        fromtimestamp = datetime.datetime.fromtimestamp
+        return [(fromtimestamp(wall), str(line, 'utf-8', 'replace'))
+                for wall, line in self._get_range_views(pos_from, pos_to)]
+
+    def _get_plain_range(self, pos_from: int, pos_to: int) -> List[tuple]:
+        return self._get_range_views(pos_from, pos_to)
+
+    def get_last_items(self, n) -> (List[tuple], int):
+        # Получить n последних строк в виде [(datetime, str)] и текущую позицию
+        first, next_ = self._snapshot()
+        pos_from = max(first, next_ - max(n, 0))
+        items = self._get_range(pos_from, next_)
+        # Строки, вытесненные писателем во время копирования, могли быть перезаписаны
+        lost = self._first - pos_from
+        if lost > 0:
+            items = items[lost:]
+        return items, next_
+
+    def get_all(self) -> (List[tuple], int):
+        return self.get_last_items(self.max)
+
+    def _time_key_at(self, position: int) -> float:
+        if self._stored_time:
+            return self._wall[position % self.max]
+        return self._mono[position % self.max]
+
+    def _wall_to_time_key(self, wall_time: float) -> float:
+        # Поиск идет по монотонному времени, которое не прыгает при переводе системных часов
+        if self._stored_time:
+            return wall_time
+        return wall_time - time.time() + time.monotonic()
+
+    def get_current_position(self) -> int:
+        return self._next
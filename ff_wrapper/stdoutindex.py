@@ -0,0 +1,265 @@
+import array
+import bisect
+import re
+import threading
+import time
+import typing
+from dedup import STATUS_PREFIXES
+
+
+# [h264 @ 0x55d0c6a3c240], [vist#0:0/h264 @ 0x...] -> h264, [out#0/flv @ 0x...] -> flv
+COMPONENT_RE = re.compile(rb'\[(?:[^\]\s@]*/)?([^\]\s@/]+) @ ')
+LEVEL_ERROR = 'error'
+LEVEL_WARNING = 'warning'
+LEVELS = (LEVEL_ERROR, LEVEL_WARNING)  # По убыванию серьезности: level=warning - предупреждения и ошибки
+# -loglevel +level: ffmpeg сам помечает строки уровнем
+LEVEL_TAGS = ((b'[fatal]', LEVEL_ERROR), (b'[panic]', LEVEL_ERROR), (b'[error]', LEVEL_ERROR),
+              (b'[warning]', LEVEL_WARNING))
+# Без -loglevel +level уровень определяется по словам строки (в нижнем регистре)
+ERROR_WORDS = (b'error', b'failed', b'invalid', b'could not', b'cannot', b'unable to', b'fatal', b'corrupt',
+               b'no such file', b'connection refused', b'timed out', b'broken pipe')
+WARNING_WORDS = (b'warning', b'non-monotonous', b'past duration', b'deprecated', b'discard', b'missing',
+                 b'concealing', b'too large', b'skipping', b'backward in time', b'overread')
+MAX_COMPONENTS = 256  # Больше разных компонентов не индексируется, поиск по ним - просмотром буфера
+SEARCH_CHUNK = 1024  # Сколько строк копируется из буфера за раз при поиске и индексации
+UPDATE_MAX_LINES = 4096  # Сколько новых строк индексируется за один вызов update (~20-30 мс)
+UPDATE_BUDGET = 0.1  # seconds, сколько catch_up может индексировать за проход менеджера
+# Больше непроиндексированных строк поиск не просматривает: индекс отстал (stdout быстрее UPDATE_BUDGET),
+#   более старые из них пропускаются и считаются в skipped
+MAX_TAIL_SCAN = 16384
+COMPONENT = 'component'
+LEVEL = 'level'
+
+
+def get_component(line: bytes) -> typing.Optional[bytes]:
+    if not line.startswith(b'['):
+        return None
+    match = COMPONENT_RE.match(line)
+    return match.group(1) if match else None
+
+
+def get_level(line: bytes) -> typing.Optional[str]:
+    if line.startswith(STATUS_PREFIXES):
+        return None
+    lower = line.lower()
+    for tag, level in LEVEL_TAGS:
+        if tag in lower:
+            return level
+    for word in ERROR_WORDS:
+        if word in lower:
+            return LEVEL_ERROR
+    for word in WARNING_WORDS:
+        if word in lower:
+            return LEVEL_WARNING
+    return None
+
+
+def get_levels(level: str) -> typing.Tuple[str]:
+    """
+    Уровни, которые входят в запрос level: сам уровень и более серьезные
+    """
+    return LEVELS[:LEVELS.index(level) + 1]
+
+
+class _Postings:
+    """
+    Возрастающие позиции строк в array (8 байт на позицию). Вытесненные из буфера позиции
+    отрезаются сдвигом начала, массив сжимается, когда начало ушло дальше половины
+    """
+
+    __slots__ = ('positions', 'head')
+
+    def __init__(self):
+        self.positions = array.array('q')
+        self.head = 0
+
+    def __len__(self) -> int:
+        return len(self.positions) - self.head
+
+    def trim(self, first: int):
+        positions = self.positions
+        self.head = head = bisect.bisect_left(positions, first, self.head)
+        if head > 1024 and head * 2 > len(positions):
+            del positions[:head]
+            self.head = 0
+
+    def range(self, pos_from: int, pos_to: int) -> typing.List[int]:
+        positions = self.positions
+        lo = bisect.bisect_left(positions, pos_from, self.head)
+        hi = bisect.bisect_left(positions, pos_to, lo)
+        return positions[lo:hi].tolist()
+
+
+class StdoutIndex:
+    """
+    Инвертированный индекс буфера stdout (STDOUT_INDEX): компонент ffmpeg ([h264 @ ...]) и уровень
+    (error, warning) -> позиции строк, поиск по компоненту или уровню не просматривает весь буфер.
+    Строки индексируются не при добавлении в буфер, а проходом менеджера (catch_up): пачками по
+    UPDATE_MAX_LINES, пока индекс не догонит буфер, но не дольше UPDATE_BUDGET, вне чтения stdout ffmpeg
+    и вне HTTP запросов. Строки после indexed_position поиск просматривает сам, не больше MAX_TAIL_SCAN.
+    Позиции, вытесненные из буфера, отрезаются пачкой, когда начало буфера сдвинулось на 1/16 его размера:
+    амортизированно O(1) на строку, память - не больше ~1/16 буфера сверх хранимых позиций
+    """
+
+    def __init__(self, size_max: int):
+        self._postings = {}  # (COMPONENT|LEVEL, имя) -> _Postings, имя компонента - bytes
+        self._components = 0
+        self._lock = threading.Lock()
+        self._update_lock = threading.Lock()
+        self._trim_step = max(1, size_max // 16)
+        self._trimmed_first = 0
+        self._next = 0  # Строки до этой позиции (не включая) проиндексированы
+
+    def indexed_position(self) -> int:
+        return self._next
+
+    def update(self, buf, max_lines: int = UPDATE_MAX_LINES) -> int:
+        """
+        Проиндексировать не больше max_lines строк буфера buf, добавленных после прошлого вызова.
+        Возвращает количество проиндексированных позиций
+        """
+        with self._update_lock:
+            first = buf.get_first_position()
+            pos_from = max(self._next, first)
+            pos_to = min(buf.get_current_position(), pos_from + max_lines)
+            for start in range(pos_from, pos_to, SEARCH_CHUNK):
+                keys = [(position, get_component(line), get_level(line)) for position, _, line in
+                        buf.get_lines(range(start, min(pos_to, start + SEARCH_CHUNK)))]
+                with self._lock:
+                    for position, component, level in keys:
+                        if component is not None:
+                            self._add((COMPONENT, component), position)
+                        if level is not None:
+                            self._add((LEVEL, level), position)
+            with self._lock:
+                if first - self._trimmed_first >= self._trim_step:
+                    self._trim(first)
+                self._next = max(self._next, pos_to)
+            return pos_to - pos_from
+
+    def catch_up(self, buf, budget: float = UPDATE_BUDGET) -> int:
+        """
+        update пачками по UPDATE_MAX_LINES, пока индекс не догонит буфер или не пройдет budget секунд.
+        Возвращает количество проиндексированных позиций
+        """
+        deadline = time.perf_counter() + budget
+        total = 0
+        while True:
+            indexed = self.update(buf)
+            total += indexed
+            if not indexed or time.perf_counter() >= deadline:
+                return total
+
+    def _add(self, key: tuple, position: int):
+        postings = self._postings.get(key)
+        if postings is None:
+            if key[0] == COMPONENT:
+                if self._components >= MAX_COMPONENTS:
+                    return
+                self._components += 1
+            postings = self._postings[key] = _Postings()
+        postings.positions.append(position)
+
+    def _trim(self, first: int):
+        self._trimmed_first = first
+        for postings in self._postings.values():
+            postings.trim(first)
+
+    def has_component(self, component: bytes) -> bool:
+        return (COMPONENT, component) in self._postings
+
+    def is_complete(self) -> bool:
+        """
+        False - компонентов больше MAX_COMPONENTS, часть не индексируется
+        """
+        return self._components < MAX_COMPONENTS
+
+    def get_components(self, first: int) -> typing.Dict[str, int]:
+        """
+        Компонент -> количество проиндексированных хранимых строк (позиции >= first)
+        """
+        with self._lock:
+            return {name.decode('utf-8', 'replace'): len(postings.range(first, 1 << 62))
+                    for (kind, name), postings in self._postings.items() if kind == COMPONENT}
+
+    def positions(self, components: typing.List[bytes], levels: typing.List[str], pos_from: int,
+                  pos_to: int) -> typing.List[int]:
+        """
+        Возрастающие позиции из [pos_from, pos_to) строк любого из components и любого из levels
+        (пустой список - без условия, но хотя бы одно условие должно быть задано)
+        """
+        groups = []
+        with self._lock:
+            for kind, names in ((COMPONENT, components), (LEVEL, levels)):
+                if not names:
+                    continue
+                group = []
+                for name in names:
+                    postings = self._postings.get((kind, name))
+                    if postings is not None:
+                        group.extend(postings.range(pos_from, pos_to))
+                if len(names) > 1:
+                    group.sort()
+                groups.append(group)
+        groups.sort(key=len)
+        result = groups[0]
+        for group in groups[1:]:
+            group = set(group)
+            result = [position for position in result if position in group]
+        return result
+
+
+def _matches(line: bytes, components: typing.List[bytes], levels: typing.List[str]) -> bool:
+    if components and get_component(line) not in components:
+        return False
+    return not levels or get_level(line) in levels
+
+
+def search(buf, components: typing.List[str], levels: typing.List[str], pattern: typing.Optional[typing.Pattern],
+           pos_from: int, pos_to: int, count: int = 0) -> (typing.List[tuple], int, int):
+    """
+    Последние count (0 - все) строк буфера stdout из [pos_from, pos_to), подходящих под все условия:
+    компонент - один из components, уровень - один из levels или серьезнее, pattern - регулярное выражение (bytes).
+    Позиции по компоненту и уровню до indexed_position берутся из индекса буфера (buf.index), последние
+    MAX_TAIL_SCAN строк после нее и все строки без индекса (STDOUT_INDEX не задан, буфер прошлого запуска)
+    просматриваются. Регулярное выражение проверяется только на отобранных строках.
+    Возвращает ([(позиция, unix time, bytes)] по возрастанию позиций, сколько строк скопировано из буфера,
+    сколько непроиндексированных строк пропущено - результат неполный, если не 0)
+    """
+    components = [component.encode('utf-8') for component in components]
+    levels = sorted(set(included for level in levels for included in get_levels(level)))
+    pos_to = max(pos_from, pos_to)
+    index = getattr(buf, 'index', None)
+    # (позиции, нужна ли проверка компонента и уровня) по возрастанию позиций
+    segments = [(range(pos_from, pos_to), True)]
+    gap = 0  # Непроиндексированные строки сверх MAX_TAIL_SCAN - между индексом и просматриваемым хвостом
+    if index is not None and (components or levels) and (
+            index.is_complete() or all(index.has_component(component) for component in components)):
+        indexed = min(max(pos_from, index.indexed_position()), pos_to)
+        tail_from = max(indexed, pos_to - MAX_TAIL_SCAN)
+        gap = tail_from - indexed
+        segments = [(index.positions(components, levels, pos_from, indexed), False),
+                    (range(tail_from, pos_to), True)]
+    chunks = []
+    found = scanned = skipped = 0
+    for i, (candidates, check) in enumerate(reversed(segments)):
+        if i and (count <= 0 or found < count):
+            # Хвоста не хватило - строки между индексом и хвостом не просмотрены
+            skipped = gap
+        end = len(candidates)
+        while end > 0 and (count <= 0 or found < count):
+            start = max(0, end - SEARCH_CHUNK)
+            chunk = []
+            for item in buf.get_lines(candidates[start:end]):
+                line = item[2]
+                if check and not _matches(line, components, levels):
+                    continue
+                if pattern is not None and pattern.search(line) is None:
+                    continue
+                chunk.append(item)
+            scanned += end - start
+            found += len(chunk)
+            chunks.append(chunk)
+            end = start
+    items = [item for chunk in reversed(chunks) for item in chunk]
+    return items[-count:] if count > 0 else items, scanned, skipped
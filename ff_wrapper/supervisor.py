@@ -0,0 +1,186 @@
+import collections
+import json
+import re
+import threading
+import time
+import typing
+from config import Config
+from eventloop import EventLoop
+from ffmpeg import FFMpegProc
+from ffmpeg_manager import FFMpegManager
+from ingest import IngestHub
+from logger import Logger
+from metrics import StreamMetrics
+
+
+STREAM_ID_RE = re.compile(r'^[A-Za-z0-9_.-]+$')
+
+
+def load_streams(path: str) -> typing.List[dict]:
+    """
+    STREAMS_CONFIG: [{"id": "cam1", "args": "-i ... -f flv rtmp://...", "env": {"ENCODING_MIN_SPEED": "0.9"}}]
+    или {"streams": [...]}. env - параметры потока поверх переменных окружения процесса
+    """
+    with open(path, 'r') as f:
+        streams = json.load(f)
+    if isinstance(streams, dict):
+        streams = streams.get('streams', [])
+    ids = set()
+    for stream in streams:
+        stream_id = str(stream.get('id', ''))
+        if not STREAM_ID_RE.match(stream_id):
+            raise Exception('Wrong stream id ({}), allowed: {}'.format(stream_id, STREAM_ID_RE.pattern))
+        if stream_id in ids:
+            raise Exception('Duplicate stream id ({})'.format(stream_id))
+        if not stream.get('args'):
+            raise Exception('Stream {} has no args'.format(stream_id))
+        ids.add(stream_id)
+    return streams
+
+
+class Stream:
+    """
+    Поток супервизора: свои Config и Logger, текущие FFMpegProc и FFMpegManager (меняются при перезапуске)
+    """
+
+    def __init__(self, stream_id: str, args: str, env: dict = None):
+        self.id = stream_id
+        self.args = args
+        self.cfg = Config(env or {}, stream_id=stream_id)
+        self.logger = Logger('FFmpegProc', cfg=self.cfg)
+        self.ffmpeg = None
+        self.manager = None
+        self.metrics = StreamMetrics()  # Общие для всех запусков ffmpeg потока
+        self.restarts = 0
+        self.restart_time = None  # time.monotonic(), когда перезапустить остановившийся поток
+
+    def to_dict(self) -> dict:
+        ffmpeg = self.ffmpeg
+        return {
+            'id': self.id,
+            'args': self.args,
+            'running': ffmpeg is not None and not ffmpeg.finish,
+            'ffmpeg_pid': self.cfg.FFMPEG_PID,
+            'start_time': ffmpeg.start_time.timestamp() if ffmpeg and ffmpeg.start_time else None,
+            'restarts': self.restarts,
+            'degraded': ffmpeg is not None and ffmpeg.rules.degraded,
+        }
+
+
+class Supervisor:
+    """
+    Режим нескольких ffmpeg в одном процессе враппера (STREAMS_CONFIG).
+    Потоки не зависят от количества ffmpeg: чтение и разбор stdout/progress - в IngestHub,
+    запись файловых логов, проверки менеджеров и перезапуск завершившихся ffmpeg - в одном общем потоке
+    """
+
+    HOUSEKEEPING_INTERVAL = 0.5  # seconds, как часто писать логи и выполнять проверки менеджеров
+    # EVENT_LOOP: логи пишутся и проверки идут по приходу данных, таймер - для проверок по времени
+    LOOP_HOUSEKEEPING_INTERVAL = 1
+
+    def __init__(self, streams: typing.List[dict]):
+        self.cfg = Config()
+        self._logger = Logger('Supervisor')
+        # EVENT_LOOP - чтение, разбор и обслуживание потоков в одном потоке цикла событий
+        self._loop = EventLoop(self._logger) if self.cfg.EVENT_LOOP else None
+        self._hub = self._loop or IngestHub(self._logger)
+        # OrderedDict: порядок потоков как в STREAMS_CONFIG (dict упорядочен только с python3.7)
+        self.streams = collections.OrderedDict(
+            (str(s['id']), Stream(str(s['id']), s['args'], s.get('env'))) for s in streams)
+        self._finish = False
+        self._thread = None
+
+    def get_stream(self, stream_id: str) -> typing.Optional[Stream]:
+        return self.streams.get(stream_id)
+
+    def start(self):
+        if self._loop:
+            # Потоки регистрируются в цикле до его запуска, дальше цикл меняется только из своего потока
+            for stream in self.streams.values():
+                self._start_stream(stream)
+            self._loop.call_every(self.LOOP_HOUSEKEEPING_INTERVAL, self._housekeeping_all)
+            self._loop.start()
+        else:
+            self._hub.start()
+            for stream in self.streams.values():
+                self._start_stream(stream)
+            self._thread = threading.Thread(target=self._housekeeping_loop, daemon=True)
+            self._thread.start()
+        self._logger.info('Supervisor started, {} streams'.format(len(self.streams)))
+
+    def stop(self):
+        self._finish = True
+        if self._thread:
+            self._thread.join()
+        if self._loop:
+            self._loop.stop()
+        for stream in self.streams.values():
+            self._stop_stream(stream)
+        if not self._loop:
+            self._hub.stop()
+
+    def _start_stream(self, stream: Stream):
+        stream.restart_time = None
+        # История прошлого запуска - запуск до старта враппера, перезапуски потока ее не перезаписывают
+        ffmpeg = FFMpegProc(stream.args, cfg=stream.cfg, logger=stream.logger, io_hub=self._hub,
+                            metrics=stream.metrics, rotate_history=stream.restarts == 0)
+        try:
+            process = ffmpeg.run()
+        except Exception as e:
+            stream.logger.error('Stream start failed: {}'.format(e))
+            process = None
+        if process is None:
+            ffmpeg.stop()
+            self._schedule_restart(stream)
+            return
+        stream.cfg.FFMPEG_PID = str(process.pid)
+        stream.cfg.save_status_to_files()
+        stream.ffmpeg = ffmpeg
+        stream.manager = FFMpegManager(ffmpeg, cfg=stream.cfg, logger=stream.logger)
+        if self._loop:
+            loop, manager = self._loop, stream.manager
+            ffmpeg.on_stdout = lambda: loop.call_soon(ffmpeg.write_stdout_logs)
+            ffmpeg.on_progress = lambda: loop.call_soon(manager.tick)
+            # Перезапуск сразу после завершения ffmpeg, а не на следующем проходе
+            loop.watch_process(process, lambda p: loop.call_soon(lambda: self._housekeeping(stream)))
+
+    def _stop_stream(self, stream: Stream):
+        if stream.manager:
+            stream.manager.stop()
+        if stream.ffmpeg:
+            stream.ffmpeg.write_stdout_logs()
+            stream.ffmpeg.stop()
+        stream.manager = None
+
+    def _schedule_restart(self, stream: Stream):
+        stream.restarts += 1
+        stream.restart_time = time.monotonic() + stream.cfg.STREAM_RESTART_DELAY
+        stream.logger.warning('Stream stopped, restart in {}s'.format(stream.cfg.STREAM_RESTART_DELAY))
+
+    def _housekeeping_loop(self):
+        while not self._finish:
+            started = time.monotonic()
+            self._housekeeping_all()
+            time.sleep(max(0, self.HOUSEKEEPING_INTERVAL - (time.monotonic() - started)))
+
+    def _housekeeping_all(self):
+        for stream in self.streams.values():
+            try:
+                self._housekeeping(stream)
+            except Exception as e:
+                stream.logger.error('Supervisor housekeeping error: {}'.format(e))
+
+    def _housekeeping(self, stream: Stream):
+        if stream.restart_time is not None:
+            if time.monotonic() >= stream.restart_time:
+                self._start_stream(stream)
+            return
+        ffmpeg = stream.ffmpeg
+        if ffmpeg is None:
+            return
+        ffmpeg.write_stdout_logs()
+        stream.manager.tick()
+        if ffmpeg.finish or ffmpeg.process.poll() is not None:
+            self._stop_stream(stream)
+            self._schedule_restart(stream)
+
@@ -0,0 +1,199 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import time
+import typing
+from progress import ProgressRecord, is_na
+
+
+SOURCE_ARGS = 'args'
+SOURCE_BASELINE = 'baseline'
+FPS_FILTER_RE = re.compile(r'(?:^|[\s,;\'"\]])fps=(?:fps=)?(\d+(?:\.\d+)?(?:/\d+)?)')
+
+
+def get_inputs(args: str) -> typing.List[str]:
+    """
+    Значения всех -i из аргументов ffmpeg
+    """
+    parts = args.split(' ') if args else []
+    return [parts[i + 1] for i, part in enumerate(parts[:-1]) if part == '-i']
+
+
+def _parse_rate(value: str) -> typing.Optional[float]:
+    # 25, 29.97, 30000/1001
+    num, _, den = value.partition('/')
+    try:
+        rate = float(num) / float(den) if den else float(num)
+    except (ValueError, ZeroDivisionError):
+        return None
+    return rate if rate > 0 else None
+
+
+def get_output_fps(args: str) -> typing.Optional[float]:
+    """
+    Частота кадров выхода из аргументов ffmpeg: -r после последнего -i (до -i это частота входа)
+    или фильтр fps=N
+    """
+    parts = args.split(' ') if args else []
+    inputs_end = max([i + 2 for i, part in enumerate(parts) if part == '-i'] or [0])
+    for i in range(inputs_end, len(parts) - 1):
+        if parts[i] == '-r':
+            rate = _parse_rate(parts[i + 1])
+            if rate is not None:
+                return rate
+    match = FPS_FILTER_RE.search(args or '')
+    return _parse_rate(match.group(1)) if match else None
+
+
+class WarmupModel:
+    """
+    Ожидаемая частота кадров на разгоне ffmpeg, пока обычная проверка кодирования еще не началась
+    (ENCODING_CHECK_START_DELAY). fps из -progress - среднее с запуска ffmpeg вместе с подключением к источнику,
+    поэтому частота меряется по приросту frame между блоками, начиная с первого блока с кадрами.
+    Допуск вниз от ожидаемой частоты сужается с количеством блоков: max(min_tolerance, 1 / sqrt(блоков)) -
+    первые блоки почти ничего не решают, дальше частота должна сойтись к ожидаемой.
+    Сбой - частота ниже допуска дольше max_error_time секунд подряд или нет ни одного кадра дольше
+    max_no_frames_time секунд с первого блока (по времени блоков): подключение и разбор входа могут быть долгими
+    """
+
+    def __init__(self, expected_fps: typing.Optional[float], source: str = None, min_tolerance: float = 0.2,
+                 min_samples: int = 4, max_error_time: float = 5, max_no_frames_time: float = 55):
+        self.expected_fps = expected_fps  # None - ожидаемая частота неизвестна, только замер (для baseline)
+        self.source = source  # SOURCE_ARGS или SOURCE_BASELINE
+        self.min_tolerance = min_tolerance
+        self.min_samples = min_samples
+        self.max_error_time = max_error_time
+        self.max_no_frames_time = max_no_frames_time
+        self.samples = 0  # Блоков с первого блока с кадрами
+        self.rate = None  # Кадров в секунду с первого блока с кадрами
+        self._first_block_time = None
+        self._first_frame = None  # (frame, wall_time) первого блока с кадрами
+        self._error_start_time = None  # wall_time первого блока ниже допуска подряд
+        self._last_time = None
+
+    def observe(self, record: ProgressRecord):
+        frame, wall_time = record.frame, record.wall_time
+        if is_na(frame) or wall_time is None:
+            return
+        self._last_time = wall_time
+        if self._first_block_time is None:
+            self._first_block_time = wall_time
+        if self._first_frame is None:
+            if frame > 0:
+                self._first_frame = (frame, wall_time)
+            return
+        first_frame, first_time = self._first_frame
+        if wall_time <= first_time:
+            return
+        self.samples += 1
+        self.rate = (frame - first_frame) / (wall_time - first_time)
+        if self.is_below_band():
+            if self._error_start_time is None:
+                self._error_start_time = wall_time
+        else:
+            self._error_start_time = None
+
+    def tolerance(self) -> float:
+        if not self.samples:
+            return 1.0
+        return max(self.min_tolerance, 1 / math.sqrt(self.samples))
+
+    def lower_bound(self) -> typing.Optional[float]:
+        if self.expected_fps is None:
+            return None
+        return self.expected_fps * (1 - self.tolerance())
+
+    def is_below_band(self) -> bool:
+        if self.expected_fps is None or self.rate is None or self.samples < self.min_samples:
+            return False
+        return self.rate < self.lower_bound()
+
+    def is_converged(self) -> bool:
+        """
+        Частота замерена с минимальным допуском и не ниже него
+        """
+        return (self.expected_fps is not None and self.samples >= self.min_samples
+                and self.tolerance() <= self.min_tolerance and not self.is_below_band())
+
+    def failure(self) -> typing.Optional[str]:
+        """
+        Причина сбоя разгона или None
+        """
+        if self.expected_fps is None or self._last_time is None:
+            return None
+        if self._first_frame is None:
+            if self._last_time - self._first_block_time > self.max_no_frames_time:
+                return 'no frames for {:.1f}s'.format(self._last_time - self._first_block_time)
+            return None
+        if self._error_start_time is not None and self._last_time - self._error_start_time > self.max_error_time:
+            return 'fps={:.2f} is below {:.2f} (expected {:g} from {}) for {:.1f}s'.format(
+                self.rate, self.lower_bound(), self.expected_fps, self.source, self._last_time - self._error_start_time)
+        return None
+
+    def to_dict(self) -> dict:
+        return {
+            'expected_fps': self.expected_fps,
+            'source': self.source,
+            'samples': self.samples,
+            'rate': self.rate,
+            'tolerance': self.tolerance(),
+            'lower_bound': self.lower_bound(),
+            'converged': self.is_converged(),
+        }
+
+
+class Baselines:
+    """
+    Частота кадров прошлых запусков по набору входов ffmpeg: WORKDIR/baselines/<sha1 входов>.json.
+    Хранятся последние KEEP замеров разгона, ожидаемая частота - их медиана
+    """
+
+    KEEP = 5
+
+    def __init__(self, directory: str, logger: logging.Logger = None):
+        self.directory = directory
+        self._logger = logger or logging.getLogger('Baselines')
+
+    def _path(self, args: str) -> typing.Optional[str]:
+        inputs = get_inputs(args)
+        if not inputs:
+            return None
+        key = hashlib.sha1('\n'.join(inputs).encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.directory, key + '.json')
+
+    def _read(self, path: str) -> dict:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            self._logger.error('Baseline read error ({}): {}'.format(path, e))
+            return {}
+
+    def load(self, args: str) -> typing.Optional[float]:
+        path = self._path(args)
+        values = sorted(self._read(path).get('fps', [])) if path else []
+        if not values:
+            return None
+        return values[len(values) // 2]
+
+    def save(self, args: str, fps: float):
+        path = self._path(args)
+        if not path:
+            return
+        baseline = self._read(path)
+        baseline['inputs'] = get_inputs(args)
+        baseline['fps'] = (baseline.get('fps', []) + [round(fps, 3)])[-self.KEEP:]
+        baseline['updated'] = time.time()
+        tmp_path = path + '.tmp'
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp_path, 'w') as f:
+                json.dump(baseline, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            self._logger.error('Baseline write error ({}): {}'.format(path, e))
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Модули ff_wrapper импортируют друг друга без пакета (см. .env: PYTHONPATH=ff_wrapper)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ff_wrapper'))
@@ -0,0 +1,48 @@
+import json
+import logging
+import os
+from ff_wrapper import config
+from ff_wrapper import debugstats
+from ff_wrapper import ffmpeg
+from ff_wrapper import ffmpeg_manager
+from ff_wrapper import http_server
+from ff_wrapper import logfile
+from ff_wrapper import metrics
+
+
+def test_histogram_to_dict():
+    histogram = metrics.Histogram((1, 10))
+    for value in (0.5, 5, 50):
+        histogram.observe(value)
+    assert debugstats.histogram_to_dict(histogram) == {
+        'count': 3, 'sum': 55.5, 'mean': 18.5, 'buckets': {'1': 1, '10': 1, '+Inf': 1}}
+
+
+def test_debug_stats_endpoint(tmp_path, monkeypatch):
+    monkeypatch.setenv('WORKDIR', str(tmp_path))
+    monkeypatch.setenv('LOGS_PATH', str(tmp_path / 'logs'))
+    cfg = config.Config({'MANAGER_START_DELAY': '0', 'ENCODING_DISABLE_CHECK': '1'}, stream_id='cam1')
+    logger = logging.getLogger('test_debugstats')
+    proc = ffmpeg.FFMpegProc('-i x -f null -', cfg=cfg, logger=logger)
+    read_fd, write_fd = os.pipe()
+    proc._stdout_ingest = proc._create_ingest('stdout', read_fd, proc._stdout_on_lines)
+    proc._stdout_ingest.start()
+    os.write(write_fd, b'line 1\nline 2\nline 3\n')
+    os.close(write_fd)
+    proc._stdout_ingest.join(5)
+    os.close(read_fd)
+    ffmpeg_manager.FFMpegManager(proc, cfg=cfg, logger=logger).tick()
+    log_file = logfile.LogFile(str(tmp_path / 'ffmpeg.log'), cfg, logger)
+    proc._stdout_log_file, proc._stdout_writer_cursor = log_file, proc.get_stdout_buf().cursor(0)
+    proc._stdout_filelog_write(log_file, proc._stdout_writer_cursor)
+    api = http_server._Api(proc)
+    api.handle('/nope', {})
+    stats = json.loads(api.handle('/debug/stats', {}).body.decode('utf-8'))
+    log_file.close()
+    stream = stats['stream']
+    assert stream['ingest']['stdout']['lines'] == 3 and stream['ingest']['stdout']['read_size_bytes']['count'] == 1
+    assert stream['ingest']['stdout']['parse_us_per_item'] > 0
+    assert stream['buffers']['stdout'] == {'appended': 3, 'stored': 3, 'evicted': 0, 'lost_before_persisted': 0}
+    assert stream['log_writer']['batch_lines']['sum'] == 3 and stream['log_writer']['file']['lines'] == 3
+    assert stream['manager']['tick_seconds']['count'] == 1
+    assert stats['process']['http_routes']['not_found']['errors'] >= 1
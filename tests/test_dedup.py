@@ -0,0 +1,56 @@
+import logging
+from ff_wrapper import config
+from ff_wrapper import dedup
+from ff_wrapper import ffmpeg
+from ff_wrapper import logfile
+
+
+def test_dedup_collapses_runs_and_near_repeats():
+    stdout_dedup = dedup.StdoutDedup(window=10, max_signatures=100)
+    lines = [b'[h264 @ 0x55d0c6a3c240] error while decoding MB 12 34',
+             b'frame=  100 fps= 25 q=28.0 size=    1024kB',
+             b'[h264 @ 0x55d0c6a3c880] error while decoding MB 7 1',
+             b'[mpegts @ 0x55d0c6a00000] Non-monotonous DTS in output stream 0:0; previous: 100, current: 99',
+             b'[h264 @ 0x55d0c6a3c240] error while decoding MB 40 2',
+             b'frame=  101 fps= 25 q=28.0 size=    1030kB']
+    assert stdout_dedup.process(lines, 1000.0) == [lines[0], lines[1], lines[3], lines[5]]
+    assert stdout_dedup.process([lines[3]] * 5, 1005.0) == []
+    assert stdout_dedup.suppressed == 7
+    # Повторы прекратились дольше window назад - итоги серий перед новыми строками
+    result = stdout_dedup.process([b'Past duration 0.99 too large'], 1015.5)
+    assert len(result) == 3 and result[-1] == b'Past duration 0.99 too large'
+    assert result[0].startswith(b'ff_wrapper: repeated 2 times (') and result[0].endswith(lines[0])
+    assert result[1].startswith(b'ff_wrapper: repeated 5 times (') and result[1].endswith(lines[3])
+    # Серия дольше window: итог и строка снова попадает в буфер
+    for i in range(10):
+        assert stdout_dedup.process([b'Past duration 0.5 too large'], 1016.0 + i) == []
+    result = stdout_dedup.process([b'Past duration 0.7 too large'], 1026.0)
+    assert result[0].startswith(b'ff_wrapper: repeated 10 times') and result[1] == b'Past duration 0.7 too large'
+    stdout_dedup.process([b'Past duration 0.8 too large'], 1027.0)
+    assert len(stdout_dedup.flush()) == 1 and stdout_dedup.flush() == []
+
+
+def test_dedup_signature_table_is_bounded():
+    stdout_dedup = dedup.StdoutDedup(window=60, max_signatures=2)
+    stdout_dedup.process([b'warning a', b'warning a', b'warning b'], 1000.0)
+    # warning b повторялась последней - вытесняется warning a вместе с итогом
+    result = stdout_dedup.process([b'warning b', b'warning c'], 1001.0)
+    assert result[0].startswith(b'ff_wrapper: repeated 1 times') and result[0].endswith(b'warning a')
+    assert result[1] == b'warning c' and stdout_dedup.evicted == 1
+    assert stdout_dedup.process([b'warning b'], 1002.0) == []
+
+
+def test_dedup_in_stdout_path(tmp_path, monkeypatch):
+    monkeypatch.setenv('WORKDIR', str(tmp_path))
+    monkeypatch.setenv('LOGS_PATH', str(tmp_path / 'logs'))
+    cfg = config.Config({'STDOUT_DEDUP': '1'}, stream_id='cam1')
+    proc = ffmpeg.FFMpegProc('-i rtsp://cam/1 -f null -', cfg=cfg, logger=logging.getLogger('test_dedup'))
+    proc._stdout_log_file = log_file = logfile.LogFile(str(tmp_path / 'ffmpeg.log'), cfg, logging.getLogger('test'))
+    proc._stdout_writer_cursor = proc.get_stdout_buf().cursor(0)
+    proc._stdout_on_lines([b'[hls @ 0x1] Opening seg1.ts for writing\n'] * 1000, 1000.0)
+    assert proc.get_stdout_buf().get_current_position() == 1
+    assert proc.metrics.stdout_lines == 1000
+    proc.stop()
+    with open(log_file.path) as f:
+        lines = f.read().splitlines()
+    assert len(lines) == 2 and 'ff_wrapper: repeated 999 times' in lines[1]
@@ -0,0 +1,55 @@
+import logging
+import os
+import subprocess
+import sys
+import time
+from ff_wrapper import eventloop
+
+
+def _loop() -> eventloop.EventLoop:
+    return eventloop.EventLoop(logging.getLogger('test_eventloop'))
+
+
+def test_event_loop_reads_pipe_ingest():
+    loop = _loop()
+    read_fd, write_fd = os.pipe()
+    received = []
+    # eventloop импортирует ingest как модуль верхнего уровня - берем тот же класс
+    pipe_ingest = eventloop.PipeIngest('test', read_fd, lambda lines, _: received.extend(lines),
+                                       logging.getLogger('test_eventloop'), read_size=4)
+    pipe_ingest.start(loop)
+    os.write(write_fd, b'first line\nsecond\r\nthird')
+    os.close(write_fd)
+    deadline = time.monotonic() + 5
+    loop.run(until=lambda: pipe_ingest._parse_finished or time.monotonic() > deadline)
+    os.close(read_fd)
+    assert received == [b'first line', b'second', b'third'], f"Wrong lines ({received})"
+
+
+def test_event_loop_timers_and_call_soon():
+    loop = _loop()
+    calls = []
+    loop.call_every(0.01, lambda: calls.append('every'))
+    cancelled = loop.call_later(0.01, lambda: calls.append('cancelled'))
+    cancelled.cancel()
+    loop.call_later(0.05, loop.stop)
+    callback = lambda: calls.append('soon')  # noqa: E731
+    loop.call_soon(callback)
+    loop.call_soon(callback)
+    loop.run()
+    assert calls[0] == 'soon' and calls.count('soon') == 1
+    assert 'cancelled' not in calls and calls.count('every') >= 3
+
+
+def test_event_loop_watch_process_and_threadsafe_stop():
+    loop = _loop()
+    exited = []
+    process = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(0.1)'])
+    loop.watch_process(process, lambda p: exited.append(p.returncode))
+    loop.start()
+    deadline = time.monotonic() + 5
+    while not exited and time.monotonic() < deadline:
+        time.sleep(0.01)
+    loop.stop()
+    assert exited == [0]
+    assert not loop._thread.is_alive()
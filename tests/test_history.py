@@ -0,0 +1,92 @@
+import datetime
+import json
+import logging
+import os
+from ff_wrapper import config
+from ff_wrapper import ffmpeg
+from ff_wrapper import history
+from ff_wrapper import http_server
+
+
+def test_stdout_history_reopened_read_only(tmp_path):
+    path = str(tmp_path / 'stdout.ring')
+    buf = history.create_stdout_buffer(path, 4, 64, {'args': '-i x -f null -'})
+    for i in range(6):
+        buf.append_line(b'line %d' % i * 3, 1000.0 + i)
+    previous = history.StdoutBuffer.from_history(history.HistoryFile.open(path))
+    # Арена на 64 байта вмещает три строки по 18 байт - старые вытеснены и после переоткрытия
+    items, position = previous.get_last_items(10)
+    assert position == 6
+    assert [line for _, line in items] == [l for _, l in buf.get_last_items(10)[0]]
+    assert [line for _, line in items] == ['line 3' * 3, 'line 4' * 3, 'line 5' * 3]
+    assert previous.position_at_time(1004.0) == 4
+    assert previous.get_first_position() == 3
+
+
+def test_progress_history_wraps(tmp_path):
+    path = str(tmp_path / 'progress.ring')
+    buf = history.create_progress_buffer(path, 3)
+    for i in range(5):
+        buf.append_values({'frame': str(i), 'fps': '25.0', 'progress': 'continue'}, 1000.0 + i)
+    previous = history.ProgressBuffer.from_history(history.HistoryFile.open(path))
+    records, position = previous.get_last_records(10)
+    assert position == 5
+    assert [record.frame for record in records] == [2, 3, 4]
+    assert records[0].wall_time == 1002.0 and records[0].fps == 25.0
+
+
+class _StubFFMpeg:
+
+    def __init__(self, previous_run):
+        self.previous_run = previous_run
+
+    def get_previous_run(self):
+        return self.previous_run
+
+
+def test_previous_run_api(tmp_path):
+    buf = history.create_stdout_buffer(str(tmp_path / 'stdout.ring'), 100, 4096, {'args': '-i x', 'pid': 1})
+    buf.append((datetime.datetime.now(), 'last line of previous run'))
+    history.rotate_previous(str(tmp_path), ('stdout', 'progress'))
+    api = http_server._Api(_StubFFMpeg(history.PreviousRun(str(tmp_path))))
+    response = api.handle('/previous_run/last_stdout?json', {})
+    assert response.status == 200
+    assert [line for _, line in json.loads(response.body.decode('utf-8'))] == ['last line of previous run']
+    info = json.loads(api.handle('/previous_run/info', {}).body.decode('utf-8'))
+    assert info['stdout']['args'] == '-i x' and info['stdout']['current_position'] == 1
+    assert api.handle('/previous_run/last_progress', {}).status == 404
+    assert api.handle('/previous_run/last_stdout?follow=ndjson', {}).status == 400
+    assert http_server._Api(_StubFFMpeg(None)).handle('/previous_run/info', {}).status == 404
+
+
+def test_ffmpeg_proc_keeps_previous_run(tmp_path, monkeypatch):
+    monkeypatch.setenv('WORKDIR', str(tmp_path))
+    monkeypatch.setenv('LOGS_PATH', str(tmp_path / 'logs'))
+    cfg = config.Config({'PERSISTENT_HISTORY': '1'}, stream_id='cam1')
+    proc = ffmpeg.FFMpegProc('-i first -f null -', cfg=cfg, logger=logging.getLogger('test_history'))
+    proc._progress_on_data(b'frame=7\nprogress=continue\n', 1000.0)
+    proc._stdout_on_lines([b'first run'], 1000.0)
+    proc = ffmpeg.FFMpegProc('-i second -f null -', cfg=cfg, logger=logging.getLogger('test_history'))
+    previous = proc.get_previous_run()
+    assert previous.info()['progress']['args'] == '-i first -f null -'
+    assert previous.get_progress_buf().get_last_records(1)[0][0].frame == 7
+    assert [line for _, line in previous.get_stdout_buf().get_last_items(1)[0]] == ['first run']
+    assert proc.get_stdout_buf().get_current_position() == 0
+
+
+def test_ffmpeg_proc_stop_closes_history(tmp_path, monkeypatch):
+    monkeypatch.setenv('WORKDIR', str(tmp_path))
+    monkeypatch.setenv('LOGS_PATH', str(tmp_path / 'logs'))
+    cfg = config.Config({'PERSISTENT_HISTORY': '1'}, stream_id='cam1')
+    ffmpeg.FFMpegProc('-i first -f null -', cfg=cfg, logger=logging.getLogger('test_history')).stop()
+    fds = len(os.listdir('/proc/self/fd'))
+    proc = ffmpeg.FFMpegProc('-i second -f null -', cfg=cfg, logger=logging.getLogger('test_history'))
+    assert proc.get_previous_run().exists()
+    proc._progress_on_data(b'frame=7\nprogress=continue\n', 1000.0)
+    proc._stdout_on_lines([b'second run'], 1000.0)
+    proc.stop()
+    # Файлы истории и прошлого запуска закрыты, буферы читаются из памяти
+    assert len(os.listdir('/proc/self/fd')) == fds
+    assert not proc.get_previous_run().exists()
+    assert [line for _, line in proc.get_stdout_buf().get_last_items(1)[0]] == ['second run']
+    assert proc.get_progress_buf().get_last_records(1)[0][0].frame == 7
@@ -0,0 +1,204 @@
+import datetime
+import gzip
+import json
+import socket
+import threading
+
+from ff_wrapper import http_server
+from ff_wrapper.http_async import AsyncHTTPServer
+from ff_wrapper.progressbuffer import ProgressBuffer
+from ff_wrapper.stdoutbuffer import StdoutBuffer
+
+
+class _StubFFMpeg:
+
+    def __init__(self):
+        self.args = '-i x -f null -'
+        self.start_time = datetime.datetime.now()
+        self.finish = False
+        self.stdout_buf = StdoutBuffer(100, 65536)
+        self.progress_buf = ProgressBuffer(100)
+        for i in range(5):
+            self.stdout_buf.append_line('line {}'.format(i).encode('utf-8'))
+
+    def get_stdout_buf(self):
+        return self.stdout_buf
+
+    def get_progress_buf(self):
+        return self.progress_buf
+
+    def get_previous_run(self):
+        return None
+
+
+class TestApi:
+
+    def test_unknown_route(self):
+        response = http_server._Api(_StubFFMpeg()).handle('/nope', {})
+        assert response.status == 404
+
+    def test_last_stdout_json(self):
+        response = http_server._Api(_StubFFMpeg()).handle('/last_stdout?count=2&json', {})
+        assert response.status == 200
+        assert [line for _, line in json.loads(response.body.decode('utf-8'))] == ['line 3', 'line 4']
+        assert ('X-Log-Position', '5') in response.headers
+
+
+class TestFollow:
+
+    def _follow(self, stub, path: str, headers: dict = None):
+        response = http_server._Api(stub).handle(path, headers or {}, blocking=False)
+        assert response.status == 200
+        return response, response.stream
+
+    def test_sse_new_lines_and_stop(self):
+        stub = _StubFFMpeg()
+        response, stream = self._follow(stub, '/last_stdout?follow=sse&count=2')
+        assert dict(response.headers)['Content-type'] == 'text/event-stream'
+        events = next(stream).decode('utf-8').split('\n\n')[:-1]
+        assert [event.split('\n')[0] for event in events] == ['id: 3', 'id: 4']
+        assert events[1].endswith('> line 4')
+        # Новых строк нет: без блокировки - пустой кусок до heartbeat
+        assert next(stream) == b''
+        stub.stdout_buf.append_line(b'line 5')
+        event = next(stream).decode('utf-8')
+        assert event.startswith('id: 5\ndata: <') and event.endswith('> line 5\n\n')
+        # ffmpeg остановлен - поток закрывается
+        stub.finish = True
+        assert list(stream) == []
+
+    def test_sse_resume_by_last_event_id(self):
+        stub = _StubFFMpeg()
+        _, stream = self._follow(stub, '/last_stdout?follow&json',
+                                 {'accept': 'text/event-stream', 'last-event-id': '2'})
+        events = next(stream).decode('utf-8').split('\n\n')[:-1]
+        assert [event.split('\n')[0] for event in events] == ['id: 3', 'id: 4']
+        assert json.loads(events[0].split('data: ', 1)[1])[1] == 'line 3'
+
+    def test_ndjson_lost_lines_after_overflow(self):
+        stub = _StubFFMpeg()
+        _, stream = self._follow(stub, '/last_stdout?follow=ndjson&cursor=1')
+        for i in range(5, 205):
+            stub.stdout_buf.append_line('line {}'.format(i).encode('utf-8'))
+        objects = [json.loads(line) for line in next(stream).decode('utf-8').splitlines()]
+        # Буфер на 100 строк: позиции 1..104 уже вытеснены
+        assert objects[0] == {'lost': 104}
+        assert objects[1]['position'] == 105 and objects[1]['line'] == 'line 105'
+        assert objects[-1]['position'] == 204 and len(objects) == 101
+
+    def test_heartbeat(self, monkeypatch):
+        monkeypatch.setattr(http_server._Api, 'FOLLOW_HEARTBEAT', 0)
+        stub = _StubFFMpeg()
+        _, stream = self._follow(stub, '/last_stdout?follow=ndjson&count=0')
+        assert json.loads(next(stream).decode('utf-8')) == {'heartbeat': 5}
+        _, stream = self._follow(stub, '/last_stdout?follow=sse&count=0')
+        assert next(stream) == b': heartbeat 5\n\n'
+
+    def test_bad_mode_and_cursor(self):
+        api = http_server._Api(_StubFFMpeg())
+        assert api.handle('/last_stdout?follow=xml', {}).status == 400
+        assert api.handle('/last_stdout?follow=sse&cursor=x', {}).status == 400
+
+
+class TestAsyncServer:
+
+    def _start(self):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        server = AsyncHTTPServer(('127.0.0.1', port), http_server._Api(_StubFFMpeg()))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server, port
+
+    def _connect(self, port: int) -> socket.socket:
+        for _ in range(50):
+            try:
+                return socket.create_connection(('127.0.0.1', port), timeout=5)
+            except ConnectionRefusedError:
+                threading.Event().wait(0.05)
+        raise AssertionError('server did not start')
+
+    def test_keep_alive_pipelining(self):
+        server, port = self._start()
+        try:
+            conn = self._connect(port)
+            conn.sendall(b'GET /cmd HTTP/1.1\r\n\r\nGET /nope HTTP/1.1\r\nConnection: close\r\n\r\n')
+            data = b''
+            while True:
+                chunk = conn.recv(65536)
+                if not chunk:
+                    break
+                data += chunk
+            conn.close()
+        finally:
+            server.shutdown()
+        first, second = data.split(b'HTTP/1.1 ')[1:]
+        assert first.startswith(b'200 OK') and b'Connection: keep-alive' in first
+        assert first.endswith(b'-i x -f null -')
+        assert second.startswith(b'404 Not Found') and b'Connection: close' in second
+
+    def test_follow_stops_on_client_disconnect(self, monkeypatch):
+        closed = threading.Event()
+        follow_stream = http_server._Api._follow_stream
+
+        def _follow_stream(*args):
+            try:
+                yield from follow_stream(*args)
+            finally:
+                closed.set()
+
+        monkeypatch.setattr(http_server._Api, '_follow_stream', _follow_stream)
+        server, port = self._start()
+        try:
+            conn = self._connect(port)
+            conn.sendall(b'GET /last_stdout?follow=ndjson HTTP/1.1\r\n\r\n')
+            assert conn.recv(65536).startswith(b'HTTP/1.1 200 OK')
+            conn.close()
+            # Генератор закрывается сразу, а не при записи heartbeat (FOLLOW_HEARTBEAT)
+            assert closed.wait(2)
+        finally:
+            server.shutdown()
+
+
+class TestResponseCache:
+
+    def test_etag_not_modified(self):
+        stub = _StubFFMpeg()
+        api = http_server._Api(stub)
+        response = api.handle('/last_stdout?count=0', {})
+        etag = dict(response.headers)['ETag']
+        assert api.handle('/last_stdout?count=0', {'if-none-match': etag}).status == 304
+        assert dict(api.handle('/last_stdout?count=1', {}).headers)['ETag'] != etag
+        stub.stdout_buf.append_line(b'line 5')
+        response = api.handle('/last_stdout?count=0', {'if-none-match': etag})
+        assert response.status == 200 and response.body.endswith(b'> line 5\n')
+
+    def test_gzip(self):
+        stub = _StubFFMpeg()
+        for i in range(100):
+            stub.stdout_buf.append_line(b'repeated line ' * 20)
+        api = http_server._Api(stub)
+        plain = api.handle('/last_stdout?count=0', {})
+        response = api.handle('/last_stdout?count=0', {'accept-encoding': 'gzip, deflate'})
+        headers = dict(response.headers)
+        assert headers['Content-Encoding'] == 'gzip' and headers['ETag'] != dict(plain.headers)['ETag']
+        assert gzip.decompress(response.body) == plain.body
+        response = api.handle('/last_stdout?count=0', {'accept-encoding': 'gzip;q=0'})
+        assert 'Content-Encoding' not in dict(response.headers)
+
+    def test_handle_cached(self):
+        stub = _StubFFMpeg()
+        for i in range(100):
+            stub.stdout_buf.append_line(b'repeated line ' * 20)
+        api = http_server._Api(stub)
+        # Ответа в кэше нет - asyncio сервер выполнит запрос в пуле потоков
+        assert api.handle_cached('/last_stdout?count=0', {}) is None
+        assert api.handle_cached('/cmd', {}) is None
+        body = api.handle('/last_stdout?count=0', {}).body
+        assert api.handle_cached('/last_stdout?count=0', {}).body == body
+        # Сжатие - тоже не в цикле событий
+        assert api.handle_cached('/last_stdout?count=0', {'accept-encoding': 'gzip'}) is None
+        api.handle('/last_stdout?count=0', {'accept-encoding': 'gzip'})
+        assert dict(api.handle_cached('/last_stdout?count=0', {'accept-encoding': 'gzip'}).headers)[
+            'Content-Encoding'] == 'gzip'
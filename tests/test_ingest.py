@@ -0,0 +1,102 @@
+import logging
+import os
+import time
+from ff_wrapper import ingest
+
+
+def test_split_lines():
+    lines, carry = ingest.split_lines(b'a\nb\r\nc\rd')
+    assert lines == [b'a', b'b', b'c'] and carry == b'd', f"Wrong split ({lines}, {carry})"
+
+
+def test_split_lines_cr_at_chunk_end():
+    lines, carry = ingest.split_lines(b'a\r')
+    assert lines == [] and carry == b'a\r'
+    lines, carry = ingest.split_lines(carry + b'\nb\n')
+    assert lines == [b'a', b'b'] and carry == b''
+
+
+def test_pipe_ingest_reads_lines_across_chunks():
+    read_fd, write_fd = os.pipe()
+    received = []
+    pipe_ingest = ingest.PipeIngest('test', read_fd, lambda lines, _: received.extend(lines),
+                                    logging.getLogger('test'), read_size=4)
+    pipe_ingest.start()
+    os.write(write_fd, b'first line\nsecond\r\nthird')
+    os.close(write_fd)
+    pipe_ingest.join(5)
+    os.close(read_fd)
+    assert received == [b'first line', b'second', b'third'], f"Wrong lines ({received})"
+    assert pipe_ingest.stats['lines'] == 3 and pipe_ingest.stats['bytes_read'] == 24
+
+
+def test_pipe_ingest_on_data_gets_raw_chunks():
+    read_fd, write_fd = os.pipe()
+    received = []
+    pipe_ingest = ingest.PipeIngest('test', read_fd, None, logging.getLogger('test'),
+                                    on_data=lambda data, _: received.append(data))
+    pipe_ingest.start()
+    os.write(write_fd, b'a=1\r\nb')
+    os.close(write_fd)
+    pipe_ingest.join(5)
+    os.close(read_fd)
+    assert received == [b'a=1\r\nb', None] and pipe_ingest.stats['lines'] == 1
+
+
+def test_pipe_ingest_survives_handler_error(caplog):
+    read_fd, write_fd = os.pipe()
+    received = []
+
+    def on_lines(lines, _):
+        if b'bad' in lines:
+            raise ValueError('handler failed')
+        received.extend(lines)
+
+    pipe_ingest = ingest.PipeIngest('test', read_fd, on_lines, logging.getLogger('test'))
+    pipe_ingest.start()
+    os.write(write_fd, b'bad\n')
+    time.sleep(0.2)
+    os.write(write_fd, b'good\nlast')
+    os.close(write_fd)
+    pipe_ingest.join(5)
+    os.close(read_fd)
+    assert received == [b'good', b'last'], f"Wrong lines ({received})"
+    assert 'test ingest: parse error: handler failed' in caplog.text
+
+
+def test_pipe_ingest_drop_oldest_on_overload():
+    read_fd, write_fd = os.pipe()
+    pipe_ingest = ingest.PipeIngest('test', read_fd, lambda lines, _: None, logging.getLogger('test'),
+                                    max_buffered=8)
+    pipe_ingest._chunks.extend([(0, b'aaaa\n'), (0, b'bbbb\n')])
+    pipe_ingest._buffered = 10
+    pipe_ingest._handle_overload()
+    os.close(read_fd)
+    os.close(write_fd)
+    assert list(pipe_ingest._chunks) == [(0, b'bbbb\n')] and pipe_ingest.stats['dropped_bytes'] == 5
+    assert pipe_ingest._resync
+
+
+def test_ingest_hub_reads_many_pipes():
+    hub = ingest.IngestHub(logging.getLogger('test'))
+    hub.start()
+    pipes, received, ingests = [], {}, []
+    for name in ('a', 'b', 'c'):
+        read_fd, write_fd = os.pipe()
+        pipes.append((read_fd, write_fd))
+        received[name] = []
+        pipe_ingest = ingest.PipeIngest(name, read_fd, lambda lines, _, name=name: received[name].extend(lines),
+                                        logging.getLogger('test'))
+        pipe_ingest.start(hub)
+        ingests.append(pipe_ingest)
+    for i, (_, write_fd) in enumerate(pipes):
+        os.write(write_fd, b'line %d\npart' % i)
+        os.write(write_fd, b'ial\n')
+        os.close(write_fd)
+    deadline = time.monotonic() + 5
+    while any(not pipe_ingest._parse_finished for pipe_ingest in ingests) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    hub.stop()
+    for read_fd, _ in pipes:
+        os.close(read_fd)
+    assert received == {'a': [b'line 0', b'partial'], 'b': [b'line 1', b'partial'], 'c': [b'line 2', b'partial']}
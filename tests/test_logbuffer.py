@@ -1,3 +1,5 @@
+import datetime
+import threading
 from ff_wrapper import logbuffer
 import pytest
 
@@ -72,3 +74,57 @@ class TestLogBuffer:
         logbuf_append_range(logbuf, 1, 20)
         last_items, _ = logbuf.get_last_items(n)
         assert last_items == [16, 17, 18, 19], f"Wrong last items ({last_items})"
+
+
+class TestLogCursor:
+
+    def test_read_new_items(self, logbuf):
+        logbuf_append_range(logbuf, 1, 3)
+        cursor = logbuf.cursor()
+        logbuf_append_range(logbuf, 3, 5)
+        items, lost = cursor.read()
+        assert items == [3, 4] and lost == 0, f"Wrong items ({items}, lost {lost})"
+        items, lost = cursor.read()
+        assert items == [] and lost == 0
+
+    def test_read_batches(self, logbuf):
+        cursor = logbuf.cursor(0)
+        logbuf_append_range(logbuf, 1, 4)
+        assert cursor.read(2) == ([1, 2], 0)
+        assert cursor.read(2) == ([3], 0)
+
+    def test_lost_items(self, logbuf):
+        cursor = logbuf.cursor(0)
+        logbuf_append_range(logbuf, 1, 11)
+        items, lost = cursor.read()
+        assert items == [7, 8, 9, 10] and lost == 6, f"Wrong items ({items}, lost {lost})"
+        assert cursor.lost == 6 and cursor.position == 10
+
+    def test_wait_timeout(self, logbuf):
+        cursor = logbuf.cursor()
+        items, lost = cursor.read(timeout=0.01)
+        assert items == [] and lost == 0
+
+    def test_wait_wakes_on_append(self, logbuf):
+        cursor = logbuf.cursor()
+        timer = threading.Timer(0.05, logbuf.append, args=(1,))
+        timer.start()
+        items, _ = cursor.read(timeout=5)
+        timer.join()
+        assert items == [1]
+
+
+class TestPositionAtTime:
+
+    def test_position_at_time(self, logbuf):
+        for i in range(1, 7):
+            logbuf.append((datetime.datetime.fromtimestamp(i * 10), i))
+        assert logbuf.position_at_time(35) == 3
+        assert logbuf.position_at_time(40) == 3
+        assert logbuf.position_at_time(40, after=True) == 4
+        assert logbuf.position_at_time(0) == 2, "Position must not be older than first stored item"
+        assert logbuf.position_at_time(100) == 6
+
+    def test_read_from_clamps_future_position(self, logbuf):
+        logbuf_append_range(logbuf, 1, 3)
+        assert logbuf.read_from(10) == ([], 0, 2)
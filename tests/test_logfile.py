@@ -0,0 +1,47 @@
+import gzip
+import os
+from ff_wrapper import config
+from ff_wrapper import logfile
+
+
+def make_log_file(tmp_path, env: dict) -> logfile.LogFile:
+    (tmp_path / 'out').mkdir(exist_ok=True)
+    cfg = config.Config(dict({'WORKDIR': str(tmp_path), 'LOGS_PATH': str(tmp_path / 'logs')}, **env))
+    return logfile.LogFile(str(tmp_path / 'out' / 'ffmpeg.log'), cfg)
+
+
+def test_write_batches(tmp_path):
+    log_file = make_log_file(tmp_path, {})
+    log_file.write([b'<2026-01-01 00:00:00> a\n', b'<2026-01-01 00:00:00> b\n'])
+    log_file.write([])
+    log_file.close()
+    assert (tmp_path / 'out' / 'ffmpeg.log').read_bytes() == b'<2026-01-01 00:00:00> a\n<2026-01-01 00:00:00> b\n'
+    assert log_file.stats['writes'] == 1 and log_file.stats['lines'] == 2
+
+
+def test_size_rotation_keeps_backups(tmp_path):
+    out = tmp_path / 'out'
+    log_file = make_log_file(tmp_path, {'LOG_ROTATION_MODE': 'size', 'LOG_ROTATION_MAX_KBYTES': '1',
+                                        'LOG_ROTATION_BACKUP': '2'})
+    for i in range(5):
+        log_file.write([b'%d' % i * 700 + b'\n'])
+    log_file.close()
+    assert sorted(os.listdir(str(out))) == ['ffmpeg.log', 'ffmpeg.log.2', 'ffmpeg.log.3']
+    assert (out / 'ffmpeg.log.3').read_bytes().startswith(b'3')
+    assert (out / 'ffmpeg.log').read_bytes().startswith(b'4')
+
+
+def test_requested_rollover_compresses_in_background(tmp_path):
+    out = tmp_path / 'out'
+    out.mkdir()
+    (out / 'ffmpeg.log.4.gz').write_bytes(b'')
+    log_file = make_log_file(tmp_path, {'LOG_COMPRESSION': 'gzip', 'LOG_ROTATION_BACKUP': '0'})
+    log_file.write([b'first\n'])
+    log_file.request_rollover()
+    log_file.write([b'second\n'])
+    log_file.close()
+    logfile.compressor.join()
+    with gzip.open(str(out / 'ffmpeg.log.5.gz')) as f:
+        assert f.read() == b'first\n'
+    assert not (out / 'ffmpeg.log.5').exists()
+    assert (out / 'ffmpeg.log').read_bytes() == b'second\n'
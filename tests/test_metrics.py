@@ -0,0 +1,42 @@
+import logging
+from ff_wrapper import config
+from ff_wrapper import ffmpeg
+from ff_wrapper import http_server
+from ff_wrapper import metrics
+
+
+def test_histogram_buckets():
+    histogram = metrics.Histogram((1, 5, 10))
+    for value in (0.5, 1, 7, 100, float('nan')):
+        histogram.observe(value)
+    assert histogram.counts == [2, 0, 1, 1]
+    assert histogram.count == 4 and histogram.sum == 108.5
+    exposition = metrics.Exposition()
+    exposition.add_histogram('test', 'help', {'stream': 'cam1'}, histogram)
+    lines = exposition.render().decode('utf-8').splitlines()
+    assert lines[:2] == ['# HELP test help', '# TYPE test histogram']
+    assert 'test_bucket{stream="cam1",le="5.0"} 2' in lines
+    assert 'test_bucket{stream="cam1",le="+Inf"} 4' in lines
+    assert lines[-1] == 'test_count{stream="cam1"} 4'
+
+
+def test_metrics_endpoint(tmp_path, monkeypatch):
+    monkeypatch.setenv('WORKDIR', str(tmp_path))
+    monkeypatch.setenv('LOGS_PATH', str(tmp_path / 'logs'))
+    cfg = config.Config({}, stream_id='cam1')
+    proc = ffmpeg.FFMpegProc('-i x -f null -', cfg=cfg, logger=logging.getLogger('test_metrics'))
+    for fps in (b'25.00', b'N/A'):
+        proc._progress_on_data(b'frame=10\nfps=' + fps + b'\nbitrate=1000.0kbits/s\ndrop_frames=3\n'
+                               b'speed=1.01x\nprogress=continue\n', 1.0)
+    proc._stdout_on_lines([b'line 1', b'line 2'], 1.0)
+    response = http_server._Api(proc).handle('/metrics', {})
+    assert response.status == 200 and ('Content-type', metrics.CONTENT_TYPE) in response.headers
+    lines = response.body.decode('utf-8').splitlines()
+    assert 'ffwrapper_progress_blocks_total{stream="cam1"} 2' in lines
+    assert 'ffwrapper_stdout_lines_total{stream="cam1"} 2' in lines
+    assert 'ffwrapper_fps_count{stream="cam1"} 1' in lines
+    assert 'ffwrapper_speed_count{stream="cam1"} 2' in lines
+    assert 'ffwrapper_drop_frames_total{stream="cam1"} 3' in lines
+    assert 'ffwrapper_buffer_lines{stream="cam1",buffer="stdout"} 2' in lines
+    # fps последнего блока - N/A
+    assert not any(line.startswith('ffwrapper_fps_current') for line in lines)
@@ -0,0 +1,58 @@
+import json
+import logging
+import os
+import subprocess
+import sys
+from ff_wrapper import config
+from ff_wrapper import ffmpeg
+from ff_wrapper import http_server
+from ff_wrapper import procstat
+
+
+def test_read_proc_sample():
+    sample = procstat.read_proc_sample(os.getpid())
+    assert sample.state in ('R', 'S')
+    assert sample.rss > 0 and sample.threads >= 1 and sample.utime > 0
+    assert sample.voluntary_ctxt_switches >= 0
+    assert procstat.read_proc_sample(2 ** 22 + 1) is None
+
+
+def test_is_pid_alive():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    assert procstat.is_pid_alive(os.getpid())
+    assert not procstat.is_pid_alive(process.pid)
+
+
+def test_samples_ring():
+    samples = procstat.ProcSamples(3)
+    for i in range(5):
+        samples.append(procstat.ProcSample(float(i), 'S', i * 0.5, 0.0, 1024, 4, i, 0, procstat.NA, 0))
+    last = samples.get_last()
+    assert [s.time for s in last] == [2.0, 3.0, 4.0] and last[0].state == 'S'
+    assert [s.time for s in samples.get_last(2)] == [3.0, 4.0]
+    dicts = procstat.samples_to_dicts(last)
+    assert dicts[0]['cpu_percent'] is None and dicts[1]['cpu_percent'] == 50.0
+    assert dicts[1]['read_bytes'] is None
+
+
+def test_process_stats_endpoint(tmp_path, monkeypatch):
+    monkeypatch.setenv('WORKDIR', str(tmp_path))
+    monkeypatch.setenv('LOGS_PATH', str(tmp_path / 'logs'))
+    cfg = config.Config({}, stream_id='cam1')
+    proc = ffmpeg.FFMpegProc('-i x -f null -', cfg=cfg, logger=logging.getLogger('test_procstat'))
+    proc.process = subprocess.Popen([sys.executable, '-c', 'import time; print(1, flush=True); time.sleep(10)'],
+                                    stdout=subprocess.PIPE)
+    try:
+        # Снимок до exec показал бы еще не запущенный процесс (rss 0)
+        proc.process.stdout.readline()
+        pid, state = proc.get_process_status()
+        assert pid == str(proc.process.pid) and state in ('R', 'S')
+        proc.sample_process()
+        proc.sample_process()
+        samples = json.loads(http_server._Api(proc).handle('/process_stats?count=5', {}).body.decode('utf-8'))
+        assert len(samples) == 2 and samples[1]['rss'] > 0 and samples[1]['cpu_percent'] is not None
+    finally:
+        proc.process.kill()
+        proc.process.wait()
+        proc.process.stdout.close()
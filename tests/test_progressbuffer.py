@@ -0,0 +1,177 @@
+import datetime
+from ff_wrapper import progress, progressbuffer
+import pytest
+
+
+PROGRESS_LINE = ('frame={} fps=25.00 stream_0_0_q=28.0 bitrate=1024.5kbits/s total_size=123456 '
+                 'out_time_us=49360000 out_time_ms=49360000 out_time=00:00:49.360000 '
+                 'dup_frames=0 drop_frames=2 speed=1.01x progress=continue')
+
+
+@pytest.fixture
+def progressbuf(max_size=4):
+    return progressbuffer.ProgressBuffer(max_size)
+
+
+def progressbuf_append_range(progressbuf, num_from, num_to):
+    for i in range(num_from, num_to):
+        progressbuf.append((datetime.datetime.now(), PROGRESS_LINE.format(i)))
+
+
+def frames(items):
+    return [int(line_to_dict(line)['frame']) for _, line in items]
+
+
+def line_to_dict(line):
+    return dict(el.split('=') for el in line.split(' '))
+
+
+class TestProgressBuffer:
+
+    def test_render_same_as_source(self, progressbuf):
+        progressbuf_append_range(progressbuf, 1, 2)
+        items, position = progressbuf.get_last_items(1)
+        assert position == 1
+        assert items[0][1] == PROGRESS_LINE.format(1), f"Wrong rendered line ({items[0][1]})"
+
+    def test_not_available_values(self, progressbuf):
+        progressbuf.append((datetime.datetime.now(), 'frame=0 fps=0.00 bitrate=N/A speed=N/A progress=continue'))
+        items, _ = progressbuf.get_last_items(1)
+        parsed = line_to_dict(items[0][1])
+        assert parsed['bitrate'] == 'N/A' and parsed['speed'] == 'N/A' and parsed['total_size'] == 'N/A'
+
+    def test_get_last_items_overflow(self, progressbuf):
+        progressbuf_append_range(progressbuf, 1, 20)
+        items, position = progressbuf.get_last_items(2)
+        assert frames(items) == [18, 19] and position == 19
+
+    def test_get_last_items_n_more_than_max(self, progressbuf):
+        progressbuf_append_range(progressbuf, 1, 4)
+        items, _ = progressbuf.get_last_items(10)
+        assert frames(items) == [1, 2, 3]
+
+    def test_get_all_overflow(self, progressbuf):
+        progressbuf_append_range(progressbuf, 1, 7)
+        items, _ = progressbuf.get_all()
+        assert frames(items) == [3, 4, 5, 6]
+
+
+class TestProgressRecord:
+
+    def test_from_block_bytes(self):
+        block = dict(line.split(b'=') for line in PROGRESS_LINE.format(7).encode('utf-8').split(b' '))
+        record = progress.ProgressRecord.from_block(block, 1.0)
+        assert record.frame == 7 and record.fps == 25.0 and record.bitrate == 1024.5 and record.speed == 1.01
+        assert record.drop_frames == 2 and not record.ended
+        assert record.to_line() == PROGRESS_LINE.format(7)
+
+    def test_to_line_keeps_sent_keys_and_speed(self):
+        block = {b'frame': b'9', b'fps': b'25.00', b'stream_0_0_q': b'28.0', b'stream_1_0_q': b'30.0',
+                 b'bitrate': b'1000.0kbits/s', b'speed': b'123.4x', b'progress': b'continue'}
+        line = progress.ProgressRecord.from_block(block, 1.0).to_line()
+        assert 'stream_0_0_q=28.0 stream_1_0_q=30.0 bitrate=1000.0kbits/s' in line
+        assert line.endswith(' speed=123.4x progress=continue')
+        block[b'speed'] = b'1x'
+        assert ' speed=1x ' in progress.ProgressRecord.from_block(block, 1.0).to_line()
+
+    def test_not_available_to_dict(self):
+        record = progress.ProgressRecord.from_values({'frame': '0', 'speed': 'N/A', 'progress': 'end'}, 1.0)
+        dct = record.to_dict()
+        assert dct['speed'] is None and dct['bitrate'] is None and dct['frame'] == 0 and dct['ended'] is True
+
+    def test_buffer_records(self, progressbuf):
+        progressbuf_append_range(progressbuf, 1, 7)
+        records, position = progressbuf.get_last_records(2)
+        assert [r.frame for r in records] == [5, 6] and position == 6
+
+    @pytest.mark.parametrize('read', ['last_records', 'last_items'])
+    def test_append_during_read(self, progressbuf, read):
+        # Писатель дописывает блок между копированием колонок: вытесненная запись не отдается склеенной
+        progressbuf_append_range(progressbuf, 1, 5)
+        column_range = progressbuf._column_range
+        appended = []
+
+        def column_range_with_append(*args):
+            if not appended:
+                appended.append(True)
+                progressbuf_append_range(progressbuf, 5, 6)
+            return column_range(*args)
+
+        progressbuf._column_range = column_range_with_append
+        if read == 'last_records':
+            records, position = progressbuf.get_last_records(4)
+            assert [r.frame for r in records] == [2, 3, 4] and position == 4
+        else:
+            items, position = progressbuf.get_last_items(4)
+            assert frames(items) == [2, 3, 4] and position == 4
+        assert progressbuf.get_first_position() == 1
+
+    def test_read_during_append(self, progressbuf):
+        # Читатель между записью колонок одного блока: слот самой старой записи уже наполовину перезаписан,
+        #   она считается вытесненной (X-Log-Lost), а не отдается склеенной из двух блоков
+        progressbuf_append_range(progressbuf, 1, 5)
+        reads = []
+
+        class ReadOnWrite(list):
+            def __setitem__(self, slot, value):
+                reads.append((progressbuf.read_records_from(0), progressbuf.render_from(0)))
+                super().__setitem__(slot, value)
+
+        progressbuf._columns[-1] = ReadOnWrite(progressbuf._columns[-1])
+        progressbuf_append_range(progressbuf, 5, 6)
+        (records, lost, position), (lines, rendered_lost, _) = reads[0]
+        assert [r.frame for r in records] == [2, 3, 4] and lost == 1 and position == 4
+        assert len(lines) == 3 and rendered_lost == 1
+        records, lost, position = progressbuf.read_records_from(0)
+        assert [r.frame for r in records] == [2, 3, 4, 5] and lost == 1 and position == 5
+
+
+class TestProgressParser:
+
+    BLOCK = PROGRESS_LINE.replace(' ', '\n').replace('bitrate=', 'bitrate=  ').encode('utf-8') + b'\n'
+
+    def test_feed_split_at_every_byte(self):
+        parser = progress.ProgressParser()
+        data = self.BLOCK.replace(b'{}', b'1') + self.BLOCK.replace(b'{}', b'2')
+        records = []
+        for i in range(len(data)):
+            records.extend(parser.feed(data[i:i + 1], float(i)))
+        assert [r.frame for r in records] == [1, 2] and records[0].bitrate == 1024.5
+        assert records[0].to_line() == PROGRESS_LINE.format(1)
+
+    def test_any_number_of_keys(self):
+        extra = b''.join(b'stream_%d_0_q=%d.0\n' % (i, i) for i in range(1, 50))
+        records = progress.ProgressParser().feed(extra + self.BLOCK.replace(b'{}', b'3'), 1.0)
+        assert len(records) == 1 and records[0].frame == 3 and records[0].q == 28.0
+        assert len(records[0].extra) == 49 and records[0].extra[0] == (b'stream_1_0_q', b'1.0')
+        assert 'stream_49_0_q=49.0' in records[0].to_line().split(' ')
+        assert records[0].to_dict()['extra']['stream_2_0_q'] == '2.0'
+
+    def test_lines_without_and_with_two_separators(self):
+        # Строка без '=' и строка с двумя '=' - столько же '=', сколько строк, но ключи и значения не чередуются
+        block = b'frame=10\nfps=25.0\ngarbage\nstream_0_0_q=a=b\nspeed=1.5x\nprogress=continue\n'
+        record = progress.ProgressParser().feed(block, 1.0)[0]
+        assert record.frame == 10 and record.fps == 25.0 and record.speed == 1.5
+        assert record.extra == ((b'garbage', b''),)
+        block = block.replace(b'stream_0_0_q=', b'title=')
+        record = progress.ProgressParser().feed(block, 1.0)[0]
+        assert record.speed == 1.5 and record.extra == ((b'garbage', b''), (b'title', b'a=b'))
+
+    def test_extra_keys_in_buffer(self, progressbuf):
+        parser = progress.ProgressParser()
+        progressbuf.append_record(parser.feed(b'frame=1\nstream_1_0_q=30.0\nprogress=continue\n', 1.0)[0])
+        progressbuf.append_record(parser.feed(b'frame=2\nprogress=continue\n', 2.0)[0])
+        records, _ = progressbuf.get_last_records(2)
+        assert records[0].extra == ((b'stream_1_0_q', b'30.0'),) and records[1].extra == ()
+        items, _ = progressbuf.get_last_items(2)
+        assert 'stream_1_0_q=30.0' in items[0][1]
+
+    def test_flush_and_reset(self):
+        parser = progress.ProgressParser()
+        assert parser.feed(b'frame=5\nspeed=1x\nprogress=end', 1.0) == []
+        records = parser.flush(2.0)
+        assert len(records) == 1 and records[0].ended and records[0].wall_time == 2.0
+        parser.feed(b'frame=6\nfps=2', 3.0)
+        parser.reset()
+        records = parser.feed(b'5.00\nprogress=continue\n', 4.0)
+        assert records[0].frame == progress.NA_INT and parser.stats['dropped_bytes'] == 13
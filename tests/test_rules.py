@@ -0,0 +1,107 @@
+import json
+import logging
+import pytest
+from ff_wrapper import config
+from ff_wrapper import ffmpeg
+from ff_wrapper import ffmpeg_manager
+from ff_wrapper import http_server
+from ff_wrapper import progress
+from ff_wrapper import rules
+
+
+def make_record(wall_time: float, **values):
+    values = {key: str(value) for key, value in values.items()}
+    values['progress'] = 'continue'
+    return progress.ProgressRecord.from_values(values, wall_time)
+
+
+def test_load_rules_validation(tmp_path):
+    assert rules.load_rules(None) == []
+    path = tmp_path / 'rules.json'
+    path.write_text(json.dumps({'rules': [{'name': 'slow', 'field': 'speed', 'op': '<', 'value': 0.9}]}))
+    loaded = rules.load_rules(str(path))
+    assert loaded[0].describe() == 'speed last < 0.9' and loaded[0].action == rules.ACTION_LOG
+    for spec, error in (
+            ({'field': 'speed', 'op': '<', 'value': 1}, 'no name'),
+            ({'name': 'a', 'field': 'speed', 'stdout': 'x', 'op': '<', 'value': 1}, 'exactly one'),
+            ({'name': 'a', 'field': 'size', 'op': '<', 'value': 1}, 'unknown field'),
+            ({'name': 'a', 'field': 'speed', 'agg': 'p101', 'window': 5, 'op': '<', 'value': 1}, 'agg must be'),
+            ({'name': 'a', 'field': 'speed', 'agg': 'mean', 'op': '<', 'value': 1}, 'window'),
+            ({'name': 'a', 'stdout': '(', 'op': '>', 'value': 1, 'window': 5}, 'regex'),
+            ({'name': 'a', 'field': 'speed', 'op': '=<', 'value': 1}, 'op must be'),
+            ({'name': 'a', 'field': 'speed', 'op': '<', 'value': 1, 'action': 'restart'}, 'action must be'),
+    ):
+        with pytest.raises(ValueError, match=error):
+            rules.load_rules(json.dumps([spec]))
+    with pytest.raises(ValueError, match='Duplicate'):
+        rules.load_rules(json.dumps([{'name': 'a', 'field': 'fps', 'op': '<', 'value': 1}] * 2))
+
+
+def test_field_rules_windows_and_duration():
+    engine = rules.RuleEngine(rules.load_rules(json.dumps([
+        {'name': 'drops', 'field': 'drop_frames', 'agg': 'rate', 'window': 10, 'op': '>', 'value': 1,
+         'for': 3, 'action': 'degraded'},
+        {'name': 'slow', 'field': 'speed', 'agg': 'p50', 'window': 10, 'op': '<', 'value': 0.9},
+        {'name': 'grow', 'field': 'drop_frames', 'agg': 'delta', 'window': 10, 'op': '>=', 'value': 20},
+    ])))
+    for i in range(5):
+        engine.observe_progress(make_record(1000.0 + i, drop_frames=0, speed='1.0x'))
+    assert [rule.state for rule in engine.rules] == ['ok', 'ok', 'ok']
+    # Кадры теряются по 5 в секунду: наклон за окно растет, правило ждет for=3 секунды, прежде чем сработать
+    for i in range(5, 10):
+        engine.observe_progress(make_record(1000.0 + i, drop_frames=(i - 4) * 5, speed='N/A'))
+        if i < 9:
+            assert not engine.degraded
+    drops, slow, grow = engine.rules
+    assert drops.state == rules.STATE_FIRING and drops.fired == 1 and engine.degraded
+    assert grow.state == rules.STATE_FIRING and grow.value == 25
+    # speed=N/A не попадает в окно и не меняет состояние
+    assert slow.state == rules.STATE_OK and slow.value == 1.0
+    # Потери прекратились и вышли из окна
+    for i in range(10, 25):
+        engine.observe_progress(make_record(1000.0 + i, drop_frames=25, speed='0.5x'))
+    assert drops.state == rules.STATE_OK and grow.state == rules.STATE_OK and not engine.degraded
+    assert slow.state == rules.STATE_FIRING and slow.value < 0.9
+    assert engine.kill_reason is None
+
+
+def test_stdout_rules():
+    engine = rules.RuleEngine(rules.load_rules(json.dumps([
+        {'name': 'timeouts', 'stdout': 'timed out', 'window': 10, 'op': '>=', 'value': 3, 'action': 'kill'},
+        {'name': 'errors', 'stdout': '(?i)error', 'agg': 'rate', 'window': 10, 'op': '>', 'value': 0.5},
+    ])))
+    engine.observe_stdout([b'frame=1 fps=25', b'Connection timed out', b'Error while decoding'], 1000.0)
+    engine.observe_stdout([b'Connection timed out'], 1005.0)
+    timeouts, errors = engine.rules
+    assert (timeouts.value, timeouts.state, errors.value) == (2, rules.STATE_OK, 0.1)
+    # Окно stdout сдвигается и по блокам -progress
+    engine.observe_progress(make_record(1010.5, frame=1))
+    assert timeouts.value == 1 and errors.value == 0
+    engine.observe_stdout([b'Connection timed out'] * 2 + [b'ERROR'] * 6, 1011.0)
+    assert timeouts.state == errors.state == rules.STATE_FIRING
+    assert engine.kill_reason.startswith('Health rule timeouts fired (kill)')
+    assert engine.to_dict()['rules'][0]['fired'] == 1
+
+
+def test_manager_kill_rule_and_health_route(tmp_path, monkeypatch):
+    monkeypatch.setenv('WORKDIR', str(tmp_path))
+    monkeypatch.setenv('LOGS_PATH', str(tmp_path / 'logs'))
+    health_rules = json.dumps([{'name': 'stalled', 'field': 'fps', 'op': '<', 'value': 1, 'for': 2,
+                                'action': 'kill'}])
+    cfg = config.Config({'HEALTH_RULES': health_rules}, stream_id='cam1')
+    logger = logging.getLogger('test_rules')
+    proc = ffmpeg.FFMpegProc('-i rtsp://cam/1 -f null -', cfg=cfg, logger=logger)
+    manager = ffmpeg_manager.FFMpegManager(proc, cfg=cfg, logger=logger)
+    proc._progress_on_data(b'frame=10\nfps=0.0\nprogress=continue\n', 1000.0)
+    manager._check_health_rules()
+    assert not proc.finish
+    proc._progress_on_data(b'frame=10\nfps=0.0\nprogress=continue\n', 1002.0)
+    health = json.loads(http_server._Api(proc).handle('/health', {}).body.decode('utf-8'))
+    assert health['degraded'] and health['rules'][0]['state'] == 'firing'
+    manager._check_health_rules()
+    assert proc.finish and proc.metrics.encoding_check_failures == 1
+
+    # Ошибка в правилах не мешает запуску
+    cfg = config.Config({'HEALTH_RULES': '[{"name": "x"}]'}, stream_id='cam1')
+    proc = ffmpeg.FFMpegProc('-i rtsp://cam/1 -f null -', cfg=cfg, logger=logger)
+    assert proc.rules.rules == []
@@ -0,0 +1,63 @@
+import json
+import logging
+import pytest
+from ff_wrapper import config
+from ff_wrapper import ffmpeg
+from ff_wrapper import http_server
+from ff_wrapper import progress
+from ff_wrapper import series
+
+
+def make_record(wall_time: float, fps: str, speed: str = '1.0x'):
+    return progress.ProgressRecord.from_values({'fps': fps, 'speed': speed, 'progress': 'continue'}, wall_time)
+
+
+def test_rollups():
+    progress_series = series.ProgressSeries((10, 1, 60), 100, ('fps', 'speed'))
+    assert progress_series.resolutions == (1, 10, 60)
+    # 2 блока в секунду, 5 минут; fps равен секундам от начала
+    for i in range(600):
+        progress_series.observe_progress(make_record(6000.0 + i / 2, str(i / 2), 'N/A' if i < 20 else '1.0x'))
+    result = progress_series.to_dict(['fps', 'speed'], 10, 6000, 6029.9)
+    assert result['t'] == [6000, 6010, 6020]
+    fps = result['fields']['fps']
+    assert fps['min'] == [0, 10, 20] and fps['max'] == [9.5, 19.5, 29.5] and fps['last'] == [9.5, 19.5, 29.5]
+    assert fps['avg'] == [4.75, 14.75, 24.75]
+    assert result['fields']['speed']['avg'] == [None, 1.0, 1.0]
+    # Кольцо 1с хранит последние 100 интервалов
+    result = progress_series.to_dict(['fps'], 1)
+    assert len(result['t']) == 100 and result['t'][0] == 6200 and result['t'][-1] == 6299
+    assert progress_series.to_dict(['fps'], 60)['fields']['fps']['max'] == [59.5, 119.5, 179.5, 239.5, 299.5]
+    assert progress_series.choose_resolution(6250, 6300) == 1
+    assert progress_series.choose_resolution(6000, 6300) == 10
+    # Интервал, перезаписанный новым кругом кольца, начинается заново
+    progress_series.observe_progress(make_record(6300.0 + 60 * 100, '1'))
+    assert progress_series.to_dict(['fps'], 60, 12300, 12360)['fields']['fps']['max'] == [1]
+    with pytest.raises(ValueError):
+        series.ProgressSeries((1,), 10, ('fps', 'size'))
+
+
+def test_progress_series_route(tmp_path, monkeypatch):
+    monkeypatch.setenv('WORKDIR', str(tmp_path))
+    monkeypatch.setenv('LOGS_PATH', str(tmp_path / 'logs'))
+    cfg = config.Config({'PROGRESS_SERIES_POINTS': '50'}, stream_id='cam1')
+    proc = ffmpeg.FFMpegProc('-i rtsp://cam/1 -f null -', cfg=cfg, logger=logging.getLogger('test_series'))
+    for i in range(120):
+        proc._progress_on_data('fps={}\nspeed=1.0x\nprogress=continue\n'.format(25 + i % 2).encode('utf-8'),
+                               3000.0 + i)
+    api = http_server._Api(proc)
+
+    def get(query):
+        response = api.handle('/progress_series' + query, {})
+        return response.status, json.loads(response.body.decode('utf-8')) if response.status == 200 else None
+
+    status, result = get('?field=fps,speed&resolution=1m&from=3000&to=3119')
+    assert status == 200 and result['resolution'] == 60 and result['t'] == [3000, 3060]
+    assert result['fields']['fps'] == {'min': [25, 25], 'max': [26, 26], 'avg': [25.5, 25.5], 'last': [26, 26]}
+    status, result = get('?from=3080&to=3119')
+    assert result['resolution'] == 1 and len(result['t']) == 40
+    status, result = get('?from=3000&to=3119')
+    assert result['resolution'] == 10 and len(result['t']) == 12
+    assert get('?field=frame')[0] == 400
+    assert get('?resolution=5s')[0] == 400
+    assert get('?from=yesterday')[0] == 400
@@ -0,0 +1,51 @@
+import logging
+import os
+import sys
+import time
+from ff_wrapper import config
+from ff_wrapper import ffmpeg
+from ff_wrapper import startup
+
+FAKE_FFMPEG = '''#!{}
+import sys
+import time
+path = sys.argv[sys.argv.index('-progress') + 1]
+print('frame=1 fps=25', flush=True)
+with open(path, 'w') as f:
+    f.write('frame=1\\nfps=25.00\\nspeed=1.00x\\nprogress=continue\\n')
+    f.flush()
+    time.sleep(0.5)
+'''
+
+
+def test_startup_timings():
+    timings = startup.StartupTimings()
+    timings.started -= 0.01
+    timings.mark('config')
+    timings.mark('spawn')
+    stages = timings.to_dict()
+    assert list(stages) == ['config', 'spawn']
+    assert stages['config']['duration'] >= 0.01
+    assert stages['spawn']['at'] == stages['config']['at'] + stages['spawn']['duration']
+    assert timings.format().startswith('config ')
+
+
+def test_spawned_ffmpeg_adopted(tmp_path, monkeypatch):
+    monkeypatch.setenv('WORKDIR', str(tmp_path))
+    monkeypatch.setenv('LOGS_PATH', str(tmp_path / 'logs'))
+    bin_path = str(tmp_path / 'ffmpeg')
+    with open(bin_path, 'w') as f:
+        f.write(FAKE_FFMPEG.format(sys.executable))
+    os.chmod(bin_path, 0o755)
+    cfg = config.Config({'NO_FILE_LOG': '1'}, stream_id='cam1')
+    spawned = startup.spawn_ffmpeg(bin_path, '-i x -f null -', cfg.PROGRESS_FIFO_PATH)
+    # ffmpeg пишет в fifo, пока враппер еще не открыл его на чтение
+    time.sleep(0.2)
+    proc = ffmpeg.FFMpegProc('-i x -f null -', cfg=cfg, logger=logging.getLogger('test_startup'))
+    assert proc.run(spawned) is spawned.process
+    assert proc.start_time == spawned.start_time
+    spawned.process.wait(5)
+    proc.stop()
+    assert [line for _, line in proc.get_stdout_buf().get_last_items(10)[0]] == ['frame=1 fps=25']
+    records, _ = proc.get_progress_buf().get_last_records(10)
+    assert [record.fps for record in records] == [25.0]
@@ -0,0 +1,101 @@
+import datetime
+import json
+import logging
+import math
+import random
+import time
+from ff_wrapper import config
+from ff_wrapper import ffmpeg
+from ff_wrapper import http_server
+from ff_wrapper.ffmpeg_manager import FFMpegManager
+from ff_wrapper.progress import ProgressRecord
+from ff_wrapper.stats import EncodingStats, RollingStats
+
+
+def test_rolling_stats_matches_window():
+    rnd = random.Random(1)
+    stats = RollingStats(30)
+    values = []
+    for i in range(1000):
+        t = i * 0.5
+        value = 25 + rnd.uniform(-3, 3) + i * 0.01
+        stats.add(t, value)
+        values = [(vt, v) for vt, v in values + [(t, value)] if vt > t - 30]
+    window = sorted(v for _, v in values)
+    assert stats.count == len(window) == 60
+    assert stats.min == window[0] and stats.max == window[-1]
+    assert math.isclose(stats.mean, sum(window) / len(window))
+    for q in (0.1, 0.5, 0.9):
+        assert math.isclose(stats.quantile(q), window[int(math.ceil(q * len(window))) - 1], rel_tol=0.02)
+    assert math.isclose(stats.trend, 0.02, rel_tol=0.5)
+
+
+def test_rolling_stats_nan_and_zero():
+    stats = RollingStats(10)
+    stats.add(1, float('nan'))
+    assert stats.count == 0 and stats.to_dict()['p50'] is None
+    stats.add(2, 0.0)
+    stats.add(3, 1.0)
+    assert stats.quantile(0.5) == 0.0 and stats.quantile(1) == 1.0
+    stats.add(20, 2.0)
+    assert stats.count == 1 and stats.min == 2.0
+
+
+def test_encoding_stats_evicts_on_read():
+    stats = EncodingStats([10, 60])
+    now = time.time()
+    for t, speed in ((now - 30, 0.5), (now - 1, 1.0)):
+        stats.observe_progress(ProgressRecord.from_values({'speed': '{}x'.format(speed)}, t))
+    assert stats.get('speed', 10, lambda s: s.count) == 1
+    assert stats.get('speed', 10, lambda s: s.min) == 1.0
+    result = stats.to_dict()
+    assert result['speed']['10']['count'] == 1 and result['speed']['60']['count'] == 2
+    # Без новых блоков -progress окно пустеет со временем, а не хранит последние значения
+    stats = EncodingStats([10])
+    stats.observe_progress(ProgressRecord.from_values({'speed': '1.0x'}, now - 30))
+    assert stats.to_dict()['speed']['10']['count'] == 0
+    assert math.isnan(stats.get('speed', 10, lambda s: s.quantile(0.5)))
+
+
+def make_proc(tmp_path, monkeypatch, env: dict) -> ffmpeg.FFMpegProc:
+    monkeypatch.setenv('WORKDIR', str(tmp_path))
+    monkeypatch.setenv('LOGS_PATH', str(tmp_path / 'logs'))
+    cfg = config.Config(env, stream_id='cam1')
+    proc = ffmpeg.FFMpegProc('-i x -f null -', cfg=cfg, logger=logging.getLogger('test_stats'))
+    proc.start_time = datetime.datetime.now() - datetime.timedelta(minutes=1)
+    return proc
+
+
+def add_block(proc: ffmpeg.FFMpegProc, t: float, fps: float, speed: float):
+    proc._progress_on_data(b'fps=%.2f\nspeed=%.2fx\nprogress=continue\n' % (fps, speed), t)
+
+
+def test_windowed_check_ignores_single_bad_block(tmp_path, monkeypatch):
+    proc = make_proc(tmp_path, monkeypatch, {'ENCODING_CHECK_WINDOW': '30', 'ENCODING_CHECK_START_DELAY': '0'})
+    manager = FFMpegManager(proc, cfg=proc.cfg, logger=logging.getLogger('test_stats'))
+    # Окна статистики при чтении сдвигаются к текущему времени - проверка идет сразу после блока
+    clock = [0.0]
+    monkeypatch.setattr(time, 'time', lambda: clock[0])
+    for i in range(60):
+        clock[0] = 1000 + i * 0.5
+        add_block(proc, clock[0], 1 if i == 50 else 25, 0.1 if i == 50 else 1)
+        manager._check_encoding_state()
+    assert manager._enc_error_start_time is None and proc.metrics.encoding_check_failures == 0
+    for i in range(60, 120):
+        clock[0] = 1000 + i * 0.5
+        add_block(proc, clock[0], 1, 0.1)
+        manager._check_encoding_state()
+    assert manager._enc_error_start_time is not None
+
+
+def test_stats_endpoint(tmp_path, monkeypatch):
+    proc = make_proc(tmp_path, monkeypatch, {'STATS_WINDOWS': '10,60'})
+    start = time.time() - 19.5
+    for i in range(20):
+        add_block(proc, start + i, 25, 1)
+    api = http_server._Api(proc)
+    stats = json.loads(api.handle('/stats?window=10&q=50', {}).body.decode('utf-8'))
+    assert list(stats['fps']) == ['10']
+    assert stats['fps']['10']['count'] == 10 and math.isclose(stats['fps']['10']['p50'], 25)
+    assert stats['speed']['10']['trend'] == 0
+    assert api.handle('/stats?window=5', {}).status == 400
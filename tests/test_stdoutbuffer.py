@@ -0,0 +1,92 @@
+import datetime
+import json
+import time
+from ff_wrapper import stdoutbuffer
+import pytest
+
+
+@pytest.fixture
+def stdoutbuf(max_size=4, arena_size=64):
+    return stdoutbuffer.StdoutBuffer(max_size, arena_size)
+
+
+def stdoutbuf_append_range(stdoutbuf, num_from, num_to):
+    for i in range(num_from, num_to):
+        stdoutbuf.append_line(str(i).encode('utf-8'))
+
+
+def lines(items):
+    return [line for _, line in items]
+
+
+class TestStdoutBuffer:
+
+    def test_append(self, stdoutbuf):
+        stdoutbuf_append_range(stdoutbuf, 1, 6)
+        last_items, position = stdoutbuf.get_last_items(1)
+        assert lines(last_items) == ['5'] and position == 5, f"Wrong last items ({last_items})"
+
+    def test_get_last_items_n_more_than_max(self, stdoutbuf):
+        stdoutbuf_append_range(stdoutbuf, 1, 4)
+        last_items, _ = stdoutbuf.get_last_items(10)
+        assert lines(last_items) == ['1', '2', '3'], f"Wrong last items ({last_items})"
+
+    def test_get_all_overflow_by_count(self, stdoutbuf):
+        stdoutbuf_append_range(stdoutbuf, 1, 20)
+        last_items, _ = stdoutbuf.get_all()
+        assert lines(last_items) == ['16', '17', '18', '19'], f"Wrong last items ({last_items})"
+
+    def test_overflow_by_arena(self, stdoutbuf):
+        for ch in 'abcde':
+            stdoutbuf.append_line(ch.encode('utf-8') * 20)
+        last_items, position = stdoutbuf.get_all()
+        assert lines(last_items) == ['c' * 20, 'd' * 20, 'e' * 20] and position == 5, f"Wrong last items ({last_items})"
+
+    def test_empty_lines(self, stdoutbuf):
+        stdoutbuf.append_line(b'')
+        stdoutbuf.append_line(b'a')
+        stdoutbuf.append_line(b'')
+        last_items, _ = stdoutbuf.get_all()
+        assert lines(last_items) == ['', 'a', ''], f"Wrong last items ({last_items})"
+
+    def test_line_longer_than_arena(self, stdoutbuf):
+        stdoutbuf.append_line(b'x' * 100)
+        last_items, _ = stdoutbuf.get_last_items(1)
+        assert lines(last_items) == ['x' * 64]
+
+    def test_views_are_zero_copy(self, stdoutbuf):
+        stdoutbuf.append_line(b'first')
+        views, _ = stdoutbuf.get_last_views(1)
+        _, view = views[0]
+        assert isinstance(view, memoryview) and view.obj is stdoutbuf._arena and bytes(view) == b'first'
+        assert stdoutbuf.is_valid(0)
+        stdoutbuf_append_range(stdoutbuf, 1, 5)
+        assert not stdoutbuf.is_valid(0)
+
+    def test_cursor_lost_by_arena(self, stdoutbuf):
+        cursor = stdoutbuf.cursor(0)
+        for ch in 'abcde':
+            stdoutbuf.append_line(ch.encode('utf-8') * 20)
+        items, lost = cursor.read()
+        assert lines(items) == ['c' * 20, 'd' * 20, 'e' * 20] and lost == 2
+
+    def test_position_at_time(self, stdoutbuf):
+        stdoutbuf.append_line(b'old')
+        time.sleep(0.01)
+        middle = time.time()
+        time.sleep(0.01)
+        stdoutbuf.append_line(b'new')
+        assert stdoutbuf.position_at_time(middle) == 1
+        assert stdoutbuf.position_at_time(middle - 60) == 0
+        assert stdoutbuf.position_at_time(middle + 60) == 2
+
+    def test_render_from_cached(self, stdoutbuf):
+        stdoutbuf.append_line(b'a', 0)
+        stdoutbuf.append_line('ж'.encode('utf-8'), 0)
+        ts = datetime.datetime.fromtimestamp(0).strftime('%Y-%m-%d %H:%M:%S')
+        rendered, lost, position = stdoutbuf.render_from(0, fmt='json')
+        assert b'[' + b', '.join(rendered) + b']' == json.dumps([(ts, 'a'), (ts, 'ж')]).encode('utf-8')
+        assert stdoutbuf._line_caches['json'].get(1) is rendered[1]
+        stdoutbuf_append_range(stdoutbuf, 1, 5)
+        rendered, lost, position = stdoutbuf.render_from(0)
+        assert rendered[-1].endswith(b'> 4\n') and lost == 2 and position == 6
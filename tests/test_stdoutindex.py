@@ -0,0 +1,110 @@
+import json
+import logging
+import time
+from ff_wrapper import config
+from ff_wrapper import ffmpeg
+from ff_wrapper import http_server
+from ff_wrapper import stdoutbuffer
+from ff_wrapper import stdoutindex
+
+
+def test_line_classification():
+    assert stdoutindex.get_component(b'[h264 @ 0x55d0c6a3c240] error while decoding MB 12 34') == b'h264'
+    assert stdoutindex.get_component(b'[vist#0:0/h264 @ 0x55d0c6a3c240] Decoding error') == b'h264'
+    assert stdoutindex.get_component(b'[out#0/flv @ 0x1] video:100kB') == b'flv'
+    assert stdoutindex.get_component(b'Input #0, rtsp, from rtsp://cam/1:') is None
+    assert stdoutindex.get_level(b'[h264 @ 0x1] error while decoding MB 12 34') == 'error'
+    assert stdoutindex.get_level(b'[mpegts @ 0x1] Non-monotonous DTS in output stream 0:0') == 'warning'
+    assert stdoutindex.get_level(b'[hls @ 0x1] [warning] Opening seg1.ts failed') == 'warning'
+    assert stdoutindex.get_level(b'frame=  100 fps= 25 q=28.0 size=    1024kB errors=0') is None
+    assert stdoutindex.get_levels('warning') == ('error', 'warning')
+
+
+def test_index_follows_ring():
+    buf = stdoutbuffer.StdoutBuffer(64, 64 * 1024)
+    buf.index = index = stdoutindex.StdoutIndex(buf.max)
+    for i in range(200):
+        component = (b'h264', b'hls', b'aac')[i % 3]
+        buf.append_line(b'[%s @ 0x1] line %d%s' % (component, i, b' error' if i % 10 == 0 else b''), 1000.0 + i)
+        if i % 10 == 9:
+            index.update(buf)
+    first = buf.get_first_position()
+    assert first == 136 and index.indexed_position() == 200
+    assert index.get_components(first) == {'h264': 21, 'hls': 22, 'aac': 21}
+    # Вытесненные позиции отрезаны пачками по max/16 - в индексе не больше нескольких лишних
+    assert len(index._postings[(stdoutindex.COMPONENT, b'h264')]) <= 21 + 64 // 16
+    assert index.positions([b'h264'], ['error'], first, 200) == [150, 180]
+    assert index.positions([b'hls', b'aac'], [], 190, 200) == [190, 191, 193, 194, 196, 197, 199]
+    items, scanned, skipped = stdoutindex.search(buf, ['h264'], ['warning'], None, 0, 200)
+    assert [item[0] for item in items] == [150, 180] and scanned == 2
+    assert items[0][2] == b'[h264 @ 0x1] line 150 error'
+    # Строки после indexed_position просматриваются, update индексирует не больше max_lines за вызов
+    for i in range(200, 210):
+        buf.append_line(b'[h264 @ 0x1] line %d error' % i, 1000.0 + i)
+    items, scanned, skipped = stdoutindex.search(buf, ['h264'], ['error'], None, 0, 210)
+    assert [item[0] for item in items] == [150, 180] + list(range(200, 210)) and scanned == 12
+    assert index.update(buf, max_lines=4) == 4 and index.indexed_position() == 204
+    # Без индекса - тот же результат просмотром буфера
+    buf.index = None
+    items, scanned, skipped = stdoutindex.search(buf, ['h264'], ['warning'], None, 0, 210)
+    assert [item[0] for item in items] == [150, 180] + list(range(200, 210)) and scanned == 210
+
+
+def test_search_stdout_route(tmp_path, monkeypatch):
+    monkeypatch.setenv('WORKDIR', str(tmp_path))
+    monkeypatch.setenv('LOGS_PATH', str(tmp_path / 'logs'))
+    cfg = config.Config({'STDOUT_INDEX': '1'}, stream_id='cam1')
+    proc = ffmpeg.FFMpegProc('-i rtsp://cam/1 -f null -', cfg=cfg, logger=logging.getLogger('test_stdoutindex'))
+    for i in range(3000):
+        proc._stdout_on_lines([b'[hls @ 0x2] Opening seg%d.ts for writing\n' % i,
+                               b'frame=%5d fps= 25 q=28.0 size=    1024kB\n' % i], 1000.0 + i)
+        if i % 500 == 0:
+            proc._stdout_on_lines([b'[h264 @ 0x1] error while decoding MB %d 2\n' % i], 1000.0 + i)
+            proc.update_stdout_index()  # Проход менеджера
+    proc.update_stdout_index()
+    api = http_server._Api(proc)
+    response = api.handle('/search_stdout?component=h264&level=error&count=2&json', {})
+    assert response.status == 200
+    assert [line for _, line in json.loads(response.body.decode('utf-8'))] == [
+        '[h264 @ 0x1] error while decoding MB 2000 2', '[h264 @ 0x1] error while decoding MB 2500 2']
+    assert dict(response.headers)['X-Search-Scanned'] == '6' and dict(response.headers)['X-Search-Skipped'] == '0'
+    response = api.handle('/search_stdout?component=hls&regex=seg1%5Cd%5C.ts&count=0', {})
+    assert response.body.decode('utf-8').splitlines()[0].endswith('Opening seg10.ts for writing')
+    assert len(response.body.splitlines()) == 10
+    # Монотонное время строк - время добавления в буфер: строк позже текущего момента нет
+    assert api.handle('/search_stdout?component=hls&from={}'.format(time.time() + 60), {}).body == b''
+    assert api.handle('/search_stdout?component=mpegts', {}).body == b''
+    assert json.loads(api.handle('/search_stdout?components', {}).body.decode('utf-8')) == {'hls': 3000, 'h264': 6}
+    assert api.handle('/search_stdout?level=fatal', {}).status == 400
+    assert api.handle('/search_stdout?regex=(', {}).status == 400
+
+
+def test_appends_outpace_update(monkeypatch):
+    buf = stdoutbuffer.StdoutBuffer(100000, 16 * 1024 * 1024)
+    buf.index = index = stdoutindex.StdoutIndex(buf.max)
+    monkeypatch.setattr(stdoutindex, 'MAX_TAIL_SCAN', 1000)
+
+    def append(count):
+        for _ in range(count):
+            position = buf.get_current_position()
+            error = b' error' if position % 1000 == 0 else b''
+            buf.append_line(b'[h264 @ 0x1] line %d%s' % (position, error))
+
+    # Между проходами менеджера строк больше, чем update индексирует за вызов
+    append(3 * stdoutindex.UPDATE_MAX_LINES)
+    assert index.catch_up(buf, budget=0) == stdoutindex.UPDATE_MAX_LINES
+    # Хвост больше MAX_TAIL_SCAN: просматриваются только последние строки, остальные - в skipped
+    items, scanned, skipped = stdoutindex.search(buf, ['h264'], ['error'], None, 0, buf.get_current_position())
+    tail_from = buf.get_current_position() - 1000
+    assert skipped == tail_from - index.indexed_position()
+    assert [item[0] for item in items] == [0, 1000, 2000, 3000, 4000, 12000]
+    assert scanned == 5 + 1000
+    # Последних count строк хватило в хвосте - пропуск не влияет на результат
+    assert stdoutindex.search(buf, ['h264'], ['error'], None, 0, buf.get_current_position(), 1)[2] == 0
+    # catch_up догоняет буфер за несколько вызовов update
+    append(stdoutindex.UPDATE_MAX_LINES)
+    assert index.catch_up(buf, budget=60) == 3 * stdoutindex.UPDATE_MAX_LINES
+    assert index.indexed_position() == buf.get_current_position()
+    items, scanned, skipped = stdoutindex.search(buf, ['h264'], ['error'], None, 0, buf.get_current_position())
+    assert [item[0] for item in items] == list(range(0, 4 * stdoutindex.UPDATE_MAX_LINES, 1000))
+    assert skipped == 0 and scanned == len(items)
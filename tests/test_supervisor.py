@@ -0,0 +1,135 @@
+import json
+import os
+import pytest
+from ff_wrapper import config
+from ff_wrapper import history
+from ff_wrapper import http_server
+from ff_wrapper import supervisor
+from ff_wrapper.progressbuffer import ProgressBuffer
+from ff_wrapper.stdoutbuffer import StdoutBuffer
+
+
+def write_streams(tmp_path, streams) -> str:
+    path = os.path.join(str(tmp_path), 'streams.json')
+    with open(path, 'w') as f:
+        json.dump(streams, f)
+    return path
+
+
+class TestLoadStreams:
+
+    def test_load(self, tmp_path):
+        path = write_streams(tmp_path, {'streams': [{'id': 'cam1', 'args': '-i a'}, {'id': 'cam2', 'args': '-i b'}]})
+        assert [s['id'] for s in supervisor.load_streams(path)] == ['cam1', 'cam2']
+
+    @pytest.mark.parametrize('streams', [
+        [{'id': 'cam1', 'args': '-i a'}, {'id': 'cam1', 'args': '-i b'}],
+        [{'id': '../cam', 'args': '-i a'}],
+        [{'id': 'cam1'}],
+    ])
+    def test_wrong_streams(self, tmp_path, streams):
+        with pytest.raises(Exception):
+            supervisor.load_streams(write_streams(tmp_path, streams))
+
+
+def test_stream_config_is_separate(tmp_path, monkeypatch):
+    monkeypatch.setenv('WORKDIR', str(tmp_path))
+    monkeypatch.setenv('LOGS_PATH', str(tmp_path / 'logs'))
+    cfg1 = config.Config({'ENCODING_MIN_SPEED': '0.5'}, stream_id='cam1')
+    cfg2 = config.Config({}, stream_id='cam2')
+    assert cfg1 is not cfg2
+    assert cfg1.ENCODING_MIN_SPEED == 0.5 and cfg2.ENCODING_MIN_SPEED == 0.8
+    assert cfg1.WORKDIR == os.path.join(str(tmp_path), 'streams', 'cam1')
+    assert cfg2.LOGS_PATH.endswith(os.path.join('', 'cam2')) and os.path.isdir(cfg2.STATUS_PATH)
+
+
+class _StubFFMpeg:
+
+    def __init__(self):
+        self.stdout_buf = StdoutBuffer(10, 1024)
+        self.progress_buf = ProgressBuffer(10)
+        self.stdout_buf.append_line(b'line 4')
+
+    def get_stdout_buf(self):
+        return self.stdout_buf
+
+    def get_progress_buf(self):
+        return self.progress_buf
+
+
+class _StubStream:
+
+    def __init__(self, stream_id, ffmpeg):
+        self.id = stream_id
+        self.ffmpeg = ffmpeg
+
+    def to_dict(self):
+        return {'id': self.id}
+
+
+class _StubSupervisor:
+
+    def __init__(self, streams):
+        self.streams = {stream.id: stream for stream in streams}
+
+    def get_stream(self, stream_id):
+        return self.streams.get(stream_id)
+
+
+def test_streams_api_routes():
+    cam1 = _StubStream('cam1', _StubFFMpeg())
+    api = http_server._StreamsApi(_StubSupervisor([cam1, _StubStream('cam2', None)]))
+    assert json.loads(api.handle('/streams', {}).body.decode('utf-8')) == [{'id': 'cam1'}, {'id': 'cam2'}]
+    response = api.handle('/streams/cam1/last_stdout?count=1', {})
+    assert response.status == 200 and response.body.endswith(b'> line 4\n')
+    assert api.handle('/streams/cam2/last_stdout', {}).status == 503
+    assert api.handle('/streams/cam3/last_stdout', {}).status == 404
+    first_api = api._get_api(cam1)
+    cam1.ffmpeg = _StubFFMpeg()
+    assert api._get_api(cam1) is not first_api
+
+
+class _FakeProcess:
+    pid = 4321
+
+    def poll(self):
+        return None
+
+    def kill(self):
+        pass
+
+    def wait(self):
+        return 0
+
+
+def test_restart_keeps_previous_run(tmp_path, monkeypatch):
+    monkeypatch.setenv('WORKDIR', str(tmp_path))
+    monkeypatch.setenv('LOGS_PATH', str(tmp_path / 'logs'))
+
+    def run(self):
+        self.process = _FakeProcess()
+        return self.process
+
+    monkeypatch.setattr(supervisor.FFMpegProc, 'run', run)
+    sv = supervisor.Supervisor([{'id': 'cam1', 'args': '-i new -f null -', 'env': {'PERSISTENT_HISTORY': '1'}}])
+    stream = sv.get_stream('cam1')
+    # Файлы истории запуска до старта враппера
+    path = stream.cfg.HISTORY_PATH
+    os.makedirs(path, exist_ok=True)
+    buf = history.create_stdout_buffer(os.path.join(path, 'stdout.ring'), 10, 1024, {'args': '-i old'})
+    buf.append_line(b'old run', 1000.0)
+    buf.close_storage()
+    api = http_server._StreamsApi(sv)
+    for restart in range(2):
+        sv._start_stream(stream)
+        stream.ffmpeg._stdout_on_lines([b'run %d' % restart], 1000.0)
+        info = json.loads(api.handle('/streams/cam1/previous_run/info', {}).body.decode('utf-8'))
+        assert info['stdout']['args'] == '-i old'
+        # Падение ffmpeg: супервизор останавливает поток и запускает заново
+        sv._stop_stream(stream)
+        sv._schedule_restart(stream)
+    assert stream.restarts == 2
+    sv._start_stream(stream)
+    response = api.handle('/streams/cam1/previous_run/last_stdout?json', {})
+    assert [line for _, line in json.loads(response.body.decode('utf-8'))] == ['old run']
+    sv._stop_stream(stream)
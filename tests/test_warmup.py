@@ -0,0 +1,125 @@
+import logging
+from ff_wrapper import config
+from ff_wrapper import ffmpeg
+from ff_wrapper import ffmpeg_manager
+from ff_wrapper import progress
+from ff_wrapper import warmup
+
+
+def make_record(frame: int, wall_time: float):
+    return progress.ProgressRecord.from_values({'frame': str(frame), 'fps': '0.0', 'progress': 'continue'}, wall_time)
+
+
+def feed(model: warmup.WarmupModel, fps: float, seconds: float, start: float = 1000.0, frame: int = 0,
+         step: float = 0.5) -> int:
+    for i in range(int(seconds / step) + 1):
+        frame_at = frame + int(fps * i * step)
+        model.observe(make_record(frame_at, start + i * step))
+    return frame_at
+
+
+def test_warmup_converges_and_band_narrows():
+    model = warmup.WarmupModel(25.0, warmup.SOURCE_ARGS, min_tolerance=0.2, min_samples=4, max_error_time=5)
+    # Подключение к источнику: блоки без кадров не влияют на частоту
+    feed(model, 0, 2, start=1000.0)
+    assert model.tolerance() == 1.0
+    feed(model, 25, 3, start=1003.0, frame=1)
+    assert model.samples == 6 and 0.4 < model.tolerance() < 0.41
+    assert not model.is_converged()
+    feed(model, 25, 20, start=1006.5, frame=88)
+    assert abs(model.rate - 25) < 0.5
+    assert model.tolerance() == 0.2 and model.is_converged()
+    assert model.failure() is None
+
+
+def test_warmup_detects_dead_stream():
+    # Без кадров - дольше max_no_frames_time, а не max_error_time: подключение к источнику бывает долгим
+    model = warmup.WarmupModel(25.0, warmup.SOURCE_ARGS, min_tolerance=0.2, min_samples=4, max_error_time=5,
+                               max_no_frames_time=30)
+    feed(model, 0, 30, start=1000.0)
+    assert model.failure() is None
+    feed(model, 0, 1, start=1030.5)
+    assert model.failure().startswith('no frames')
+
+    # Кадры пошли и встали: частота падает ниже сужающегося допуска
+    model = warmup.WarmupModel(25.0, warmup.SOURCE_ARGS, min_tolerance=0.2, min_samples=4, max_error_time=5)
+    frame = feed(model, 25, 2, start=1000.0, frame=1)
+    feed(model, 0, 7, start=1002.5, frame=frame)
+    assert model.is_below_band()
+    assert 'expected 25 from args' in model.failure()
+
+
+def test_warmup_without_expected_fps_only_measures():
+    model = warmup.WarmupModel(None)
+    feed(model, 5, 10, frame=1)
+    assert abs(model.rate - 5) < 0.5
+    assert not model.is_below_band() and model.failure() is None and not model.is_converged()
+
+
+def test_output_fps_from_args():
+    assert warmup.get_output_fps('-i rtsp://cam/1 -r 25 -f null -') == 25.0
+    assert warmup.get_output_fps('-i rtsp://cam/1 -c:v libx264 -r 30000/1001 -f flv out') == 30000 / 1001
+    assert warmup.get_output_fps('-i rtsp://cam/1 -vf scale=640:360,fps=12.5 -f flv out') == 12.5
+    # -r до -i - частота входа, не выхода
+    assert warmup.get_output_fps('-r 30 -i rtsp://cam/1 -f flv out') is None
+    assert warmup.get_output_fps('-r 30 -i a.mp4 -i logo.png -filter_complex overlay -r 25 out.flv') == 25.0
+    assert warmup.get_output_fps('-i rtsp://cam/1 -c copy out.flv') is None
+
+
+def test_baselines(tmp_path):
+    assert warmup.get_inputs('-i rtsp://cam/1 -i logo.png -c copy out.flv') == ['rtsp://cam/1', 'logo.png']
+    baselines = warmup.Baselines(str(tmp_path / 'baselines'))
+    assert baselines.load('-i rtsp://cam/1 -f null -') is None
+    for fps in (25.0, 24.9, 12.0, 25.1, 25.0, 24.8):
+        baselines.save('-i rtsp://cam/1 -f null -', fps)
+    # Хранятся последние KEEP замеров, выброс не влияет на медиану
+    assert baselines.load('-r 30 -i rtsp://cam/1 -f flv out') == 24.9
+    assert baselines.load('-i rtsp://cam/2 -f null -') is None
+    baselines.save('-f lavfi testsrc', 25.0)
+    assert list(tmp_path.joinpath('baselines').iterdir())[0].name.endswith('.json')
+
+
+def test_manager_stops_dead_stream_during_warmup(tmp_path, monkeypatch):
+    monkeypatch.setenv('WORKDIR', str(tmp_path))
+    monkeypatch.setenv('LOGS_PATH', str(tmp_path / 'logs'))
+    cfg = config.Config({'ENCODING_WARMUP': '1', 'ENCODING_WARMUP_MAX_ERROR_TIME': '2'}, stream_id='cam1')
+    logger = logging.getLogger('test_warmup')
+    proc = ffmpeg.FFMpegProc('-i rtsp://cam/1 -r 25 -f null -', cfg=cfg, logger=logger)
+    manager = ffmpeg_manager.FFMpegManager(proc, cfg=cfg, logger=logger)
+    assert (manager.warmup.expected_fps, manager.warmup.source) == (25.0, warmup.SOURCE_ARGS)
+    buf = proc.get_progress_buf()
+    for i in range(8):
+        buf.append_record(make_record(100 + 25 * i if i < 4 else 175, 1000.0 + i))
+    manager._check_warmup()
+    assert not proc.finish
+    buf.append_record(make_record(175, 1009.0))
+    manager._check_warmup()
+    assert proc.finish and proc.metrics.encoding_check_failures == 1
+
+    # Замер разгона следующего запуска без -r сохраняется как baseline для тех же входов
+    proc = ffmpeg.FFMpegProc('-i rtsp://cam/1 -f null -', cfg=cfg, logger=logger)
+    manager = ffmpeg_manager.FFMpegManager(proc, cfg=cfg, logger=logger)
+    assert manager.warmup.expected_fps is None
+    buf = proc.get_progress_buf()
+    for i in range(10):
+        buf.append_record(make_record(1 + 25 * i, 1000.0 + i))
+    manager._check_warmup()
+    manager._finish_warmup()
+    manager = ffmpeg_manager.FFMpegManager(proc, cfg=cfg, logger=logger)
+    assert (manager.warmup.expected_fps, manager.warmup.source) == (25.0, warmup.SOURCE_BASELINE)
+
+
+def test_warmup_check_is_opt_in(tmp_path, monkeypatch):
+    monkeypatch.setenv('WORKDIR', str(tmp_path))
+    monkeypatch.setenv('LOGS_PATH', str(tmp_path / 'logs'))
+    cfg = config.Config({}, stream_id='cam1')
+    logger = logging.getLogger('test_warmup')
+    proc = ffmpeg.FFMpegProc('-i rtsp://cam/1 -r 25 -f null -', cfg=cfg, logger=logger)
+    manager = ffmpeg_manager.FFMpegManager(proc, cfg=cfg, logger=logger)
+    assert manager.warmup.max_no_frames_time == cfg.ENCODING_CHECK_START_DELAY
+    buf = proc.get_progress_buf()
+    # Частота ниже допуска: без ENCODING_WARMUP разгон только замеряется, поток не останавливается
+    for i in range(20):
+        buf.append_record(make_record(1 + 5 * i, 1000.0 + i))
+    manager._check_warmup()
+    assert manager.warmup.is_below_band() and not proc.finish